@@ -0,0 +1,101 @@
+"""
+Admission Control Load Test
+對 server.py 的 /api/search 同時送出帶圖片的請求，統計 200 / 降級 / 503 的比例與延遲，
+用來調整 ADMISSION_MAX_CONCURRENCY、ADMISSION_MAX_QUEUE、ADMISSION_QUEUE_TIMEOUT_MS、ADMISSION_DEGRADE_QUEUE_MS
+
+用法（需先啟動 server.py）：
+    python benchmark/admission_load.py --concurrency 64 --rounds 3
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+from collections import defaultdict
+import aiohttp
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "images")
+
+
+def load_images():
+    images = []
+    for name in sorted(os.listdir(IMAGE_DIR)):
+        with open(os.path.join(IMAGE_DIR, name), "rb") as f:
+            images.append("data:image/jpeg;base64," + base64.b64encode(f.read()).decode())
+    return images
+
+
+async def one_request(session, base_url: str, payload: dict, outcomes: dict, retry_after: list):
+    start = time.perf_counter()
+    try:
+        async with session.post(f"{base_url}/api/search", json=payload) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status == 503:
+                outcome = "rejected"
+                retry_after.append(int(resp.headers.get("Retry-After", 0)))
+            elif resp.status == 200:
+                outcome = "degraded" if body.get("degraded") else "ok"
+            else:
+                outcome = f"http_{resp.status}"
+    except aiohttp.ClientError:
+        outcome = "client_error"
+    outcomes[outcome].append(time.perf_counter() - start)
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": values[len(values) // 2] * 1000,
+        "p99_ms": values[int(len(values) * 0.99)] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+async def main(base_url: str, concurrency: int, rounds: int, query: str):
+    images = load_images()
+    outcomes = defaultdict(list)
+    retry_after = []
+    timeout = aiohttp.ClientTimeout(total=300)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout) as session:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            # 每個請求帶不同的文字，避免被結果快取或 single-flight 合併
+            await asyncio.gather(*(
+                one_request(session, base_url,
+                            {"query_text": f"{query} #{i}", "image_base64": images[i % len(images)]},
+                            outcomes, retry_after)
+                for i in range(concurrency)
+            ))
+        elapsed = time.perf_counter() - start
+
+        async with session.get(f"{base_url}/api/admission/stats") as resp:
+            admission = await resp.json()
+
+    print(json.dumps({
+        "requests": concurrency * rounds,
+        "elapsed_s": elapsed,
+        "outcomes": {name: summarize(values) for name, values in sorted(outcomes.items())},
+        "retry_after_s": sorted(set(retry_after)),
+        "admission": admission,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Burst /api/search to tune admission control limits')
+    parser.add_argument('--base_url', default="http://localhost:8000",
+                      help='Server base URL')
+    parser.add_argument('--concurrency', type=int, default=64,
+                      help='Simultaneous requests per round')
+    parser.add_argument('--rounds', type=int, default=3,
+                      help='Number of bursts')
+    parser.add_argument('--query', default="2000元以下的上衣",
+                      help='Base query text (a suffix makes each request unique)')
+
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.concurrency, args.rounds, args.query))
@@ -0,0 +1,80 @@
+"""
+Async Concurrency Demo
+同時送出大量慢請求（LLM 由 stub_llm.py 加上人工延遲），記錄完成時間與伺服器執行緒數
+
+用法：
+    python benchmark/stub_llm.py --latency_ms 2000 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 python server_async.py &
+    python benchmark/async_concurrency.py --concurrency 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+
+
+async def sample_threads(session, base_url: str, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            async with session.get(f"{base_url}/api/health") as resp:
+                samples.append((await resp.json())["threads"])
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+
+
+async def one_request(session, base_url: str, query: str, latencies: list, errors: list):
+    start = time.perf_counter()
+    try:
+        # 空圖片只走文字路徑，讓延遲集中在網路 I/O 上
+        async with session.post(f"{base_url}/api/search",
+                                json={"query_text": query, "image_base64": ""}) as resp:
+            await resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+    except aiohttp.ClientError as e:
+        errors.append(str(e))
+    latencies.append(time.perf_counter() - start)
+
+
+async def main(base_url: str, concurrency: int, query: str):
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    latencies, errors, thread_samples = [], [], []
+    stop = asyncio.Event()
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        sampler = asyncio.create_task(sample_threads(session, base_url, thread_samples, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(session, base_url, query, latencies, errors)
+                               for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+    latencies.sort()
+    print(json.dumps({
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "errors": len(errors),
+        "latency_s": {
+            "p50": latencies[len(latencies) // 2],
+            "p99": latencies[int(len(latencies) * 0.99)],
+            "max": latencies[-1],
+        },
+        "server_threads_max": max(thread_samples) if thread_samples else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Hold many concurrent slow searches against the async server')
+    parser.add_argument('--base_url', default="http://localhost:8000",
+                      help='Async server base URL')
+    parser.add_argument('--concurrency', type=int, default=1000,
+                      help='Number of simultaneous in-flight requests')
+    parser.add_argument('--query', default="2000元以下的上衣",
+                      help='Query text sent with every request')
+
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.concurrency, args.query))
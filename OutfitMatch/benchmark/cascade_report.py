@@ -0,0 +1,79 @@
+"""
+Cascade Embedding Report
+比較 dinov2-base 直接搜尋與 cascade（small 召回 + base 重排）的延遲與 top-1 貼文一致率
+
+用法：
+    python benchmark/cascade_report.py --image_dir test/images
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+import logging
+from PIL import Image
+import query.query_neo4j as qn
+from query.cascade import cascade_top_post
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main(image_dir: str, repeat: int, skip_margin: float):
+    paths = [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir))
+             if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    images = [Image.open(path).convert("RGB") for path in paths]
+
+    qn.init_neo4j()
+    rows = []
+    with qn.driver.session() as session:
+        # 暖機：載入兩個模型
+        qn.nearest_post_styles(session, images[0])
+        cascade_top_post(session, images[0], skip_margin=skip_margin)
+
+        for path, img in zip(paths, images):
+            for _ in range(repeat):
+                base, base_ms = timed(qn.nearest_post_styles, session, img)
+                cascade, cascade_ms = timed(cascade_top_post, session, img, skip_margin=skip_margin)
+                rows.append({
+                    "image": os.path.basename(path),
+                    "base_ms": base_ms,
+                    "cascade_ms": cascade_ms,
+                    "cascade_tier": cascade['tier'] if cascade else None,
+                    "top1_agree": bool(base and cascade and base['post_id'] == cascade['post_id']),
+                })
+    qn.close_neo4j()
+
+    n = len(rows)
+    report = {
+        "samples": n,
+        "skip_margin": skip_margin,
+        "avg_base_ms": sum(r['base_ms'] for r in rows) / n,
+        "avg_cascade_ms": sum(r['cascade_ms'] for r in rows) / n,
+        "top1_agreement": sum(r['top1_agree'] for r in rows) / n,
+        "small_tier_share": sum(r['cascade_tier'] == 'small' for r in rows) / n,
+        "rows": rows,
+    }
+    report["latency_saved_ms"] = report["avg_base_ms"] - report["avg_cascade_ms"]
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report cascade embedding latency and top-1 agreement')
+    parser.add_argument('--image_dir', default="test/images",
+                      help='Directory of query images')
+    parser.add_argument('--repeat', type=int, default=3,
+                      help='Timed runs per image')
+    parser.add_argument('--skip_margin', type=float, default=0.05,
+                      help='Top-1 margin above which the base model is skipped (0 = always rerank)')
+
+    args = parser.parse_args()
+    main(args.image_dir, args.repeat, args.skip_margin)
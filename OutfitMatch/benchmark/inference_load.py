@@ -0,0 +1,99 @@
+"""
+Inference Load Test
+比較「每個執行緒各自 forward」與「micro-batching worker」在併發下的吞吐量
+
+用法：
+    python benchmark/inference_load.py --concurrency 16 --requests 128
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from loader.instagram_neo4j import segment_and_crop_fashion, get_image_embedding
+from query.inference_worker import InferenceBatcher, _segment_and_embed_batch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "images")
+
+
+def load_images():
+    return [Image.open(os.path.join(IMAGE_DIR, name)).convert("RGB")
+            for name in sorted(os.listdir(IMAGE_DIR))]
+
+
+def per_thread_infer(img):
+    return get_image_embedding(segment_and_crop_fashion(img))
+
+
+def run_load(infer_fn, images, concurrency: int, total_requests: int):
+    """以固定併發數送出 total_requests 筆推論，回傳吞吐量與延遲"""
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        infer_fn(images[i % len(images)])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": total_requests / elapsed,
+        "latency_ms": {
+            "p50": latencies[len(latencies) // 2] * 1000,
+            "p95": latencies[int(len(latencies) * 0.95)] * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    }
+
+
+def main(concurrency: int, total_requests: int, max_batch_size: int, max_wait_ms: float):
+    images = load_images()
+
+    # 暖機，避免第一次 forward 的初始化成本算進結果
+    per_thread_infer(images[0])
+
+    logger.info(f"🧪 Per-thread mode: concurrency={concurrency}, requests={total_requests}")
+    per_thread = run_load(per_thread_infer, images, concurrency, total_requests)
+
+    batcher = InferenceBatcher(_segment_and_embed_batch, max_batch_size=max_batch_size,
+                               max_wait_ms=max_wait_ms, name="benchmark")
+    logger.info(f"🧪 Batched mode: max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}")
+    batched = run_load(lambda img: batcher.submit(img).result(), images, concurrency, total_requests)
+    batched["batcher"] = batcher.stats()
+
+    report = {
+        "per_thread": per_thread,
+        "batched": batched,
+        "speedup": batched["throughput_rps"] / per_thread["throughput_rps"],
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test query image inference')
+    parser.add_argument('--concurrency', type=int, default=16,
+                      help='Number of concurrent client threads')
+    parser.add_argument('--requests', type=int, default=128,
+                      help='Total number of inference requests per mode')
+    parser.add_argument('--max_batch_size', type=int, default=8,
+                      help='Maximum batch size for the batched mode')
+    parser.add_argument('--max_wait_ms', type=float, default=5.0,
+                      help='Maximum time to wait for a batch to fill')
+
+    args = parser.parse_args()
+    main(args.concurrency, args.requests, args.max_batch_size, args.max_wait_ms)
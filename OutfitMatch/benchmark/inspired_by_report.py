@@ -0,0 +1,106 @@
+"""
+INSPIRED_BY Report
+在目前的資料上比較兩種 INSPIRED_BY 建立方式，計時的是實際的寫入查詢：
+- 所有有共同風格的 (貼文, 商品) 組合（build_post_inspired_relationships 的 INSPIRED_BY_QUERY）
+- 每個商品只保留圖片最相似的 top-k 篇貼文（build_post_inspired_relationships_ranked 的
+  IMAGE_RANKED_QUERY / STYLE_RANKED_QUERY，每 RANK_BATCH_SIZE 個商品一批）
+每種方式在一個交易中先刪除現有的 INSPIRED_BY（不計時）再建立關係，量完後 rollback，資料庫不會改變；
+整個寫入放在同一個交易，資料量很大時需足夠的 transaction memory
+回報邊數與建立耗時的縮減比例
+
+用法（需先執行 loader/backfill_product_embeddings.py）：
+    python benchmark/inspired_by_report.py --top_k 10 --candidates 50
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List, Tuple
+from neo4j import GraphDatabase
+from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from database.build_relationships import INSPIRED_BY_QUERY
+from database.inspired_by_ranking import IMAGE_RANKED_QUERY, STYLE_RANKED_QUERY, RANK_BATCH_SIZE
+
+DELETE_INSPIRED_BY_QUERY = """
+MATCH (:Product)-[r:INSPIRED_BY]->(:Post)
+DELETE r
+"""
+
+COUNT_INSPIRED_BY_QUERY = """
+MATCH (:Product)-[r:INSPIRED_BY]->(:Post)
+RETURN count(r) as count, sum(CASE r.ranked_by WHEN 'image' THEN 1 ELSE 0 END) as by_image
+"""
+
+
+def timed_rollback(session, build: Callable) -> Tuple[Dict, float]:
+    """在交易中刪除舊關係、計時 build(tx)，統計建立的邊後 rollback"""
+    tx = session.begin_transaction()
+    try:
+        tx.run(DELETE_INSPIRED_BY_QUERY).consume()
+        start = time.perf_counter()
+        build(tx)
+        elapsed = time.perf_counter() - start
+        counts = tx.run(COUNT_INSPIRED_BY_QUERY).single().data()
+    finally:
+        tx.rollback()
+    return counts, elapsed
+
+
+def build_all_pairs(tx):
+    tx.run(INSPIRED_BY_QUERY).consume()
+
+
+def build_ranked(product_ids: List[str], top_k: int, candidates: int) -> Callable:
+    def build(tx):
+        for i in range(0, len(product_ids), RANK_BATCH_SIZE):
+            ids = product_ids[i:i + RANK_BATCH_SIZE]
+            tx.run(IMAGE_RANKED_QUERY, ids=ids, top_k=top_k, candidates=candidates).consume()
+            tx.run(STYLE_RANKED_QUERY, ids=ids, top_k=top_k).consume()
+    return build
+
+
+def main(top_k: int, candidates: int):
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        with driver.session() as session:
+            stats = session.run("""
+                MATCH (p:Product)
+                RETURN count(p) as products, count(p.img_embedding) as products_with_embedding
+            """).single().data()
+            stats["posts_with_embedding"] = session.run(
+                "MATCH (p:Post) RETURN count(p.img_embedding) as count").single()['count']
+            stats["stored_inspired_by"] = session.run(
+                "MATCH ()-[r:INSPIRED_BY]->() RETURN count(r) as count").single()['count']
+
+            all_pairs, all_pairs_s = timed_rollback(session, build_all_pairs)
+
+            # 與 build_post_inspired_relationships_ranked 相同的商品集合
+            product_ids = [r['id'] for r in session.run("MATCH (p:Product)-[:HAS_STYLE]->() RETURN DISTINCT p.id as id")]
+            ranked, ranked_s = timed_rollback(session, build_ranked(product_ids, top_k, candidates))
+    finally:
+        driver.close()
+
+    print(json.dumps({
+        **stats,
+        "top_k": top_k,
+        "candidates": candidates,
+        "all_pairs": {"edges": all_pairs["count"], "elapsed_s": all_pairs_s},
+        "ranked": {"edges": ranked["count"], "by_image": ranked["by_image"],
+                   "by_style": ranked["count"] - ranked["by_image"], "elapsed_s": ranked_s},
+        "edge_reduction": 1 - ranked["count"] / all_pairs["count"] if all_pairs["count"] else None,
+        "time_ratio": ranked_s / all_pairs_s if all_pairs_s else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare all-pairs and top-k image-ranked INSPIRED_BY')
+    parser.add_argument('--top_k', type=int, default=10,
+                      help='Posts kept per product')
+    parser.add_argument('--candidates', type=int, default=50,
+                      help='Posts fetched from post_image_index per product')
+
+    args = parser.parse_args()
+    main(args.top_k, args.candidates)
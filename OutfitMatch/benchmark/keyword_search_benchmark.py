@@ -0,0 +1,132 @@
+"""
+Keyword Search Benchmark
+比較同一組文字查詢走關鍵字搜尋（規則解析 + product_search 全文索引）與 LLM 翻譯路徑
+（nl_to_cypher_conditions + 文字條件查詢）的延遲，回報關鍵字型查詢的比例、兩條路徑的 p50 / p95
+以及前 10 筆結果的 Jaccard 重疊（只比較文字查詢，不含圖片推論）
+
+用法：
+    python benchmark/keyword_search_benchmark.py --rounds 5
+    python benchmark/stub_llm.py --latency_ms 800 --latency_sigma 0.5 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 python benchmark/keyword_search_benchmark.py --queries queries.txt
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+import query.query_neo4j as qn
+
+# 預設查詢集：前半為關鍵字型，後半為需要 LLM 理解的自然語言需求
+DEFAULT_QUERIES = [
+    "坑條 短版",
+    "2000元以下 韓系 上衣",
+    "寬褲 1000以內",
+    "針織 背心",
+    "牛仔 短褲 500-1200",
+    "洋裝 甜美",
+    "帽T",
+    "黑色 長裙",
+    "適合約會的洋裝",
+    "想要一件可以上班穿的襯衫",
+    "有什麼適合夏天去海邊的穿搭？",
+    "推薦一些不到一千的簡約外套",
+]
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+def summarize(values) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.5), 1),
+        "p95_ms": round(percentile(values, 0.95), 1),
+    }
+
+
+def run_llm_path(query_text: str, limit: int):
+    conditions = qn.nl_to_cypher_conditions(query_text)
+    return qn.search_products_by_style_and_conditions([], conditions, limit=limit)
+
+
+def run_keyword_path(query_text: str, limit: int):
+    parsed = qn.parse_keyword(query_text)
+    if parsed is None:
+        return None
+    return qn.search_products_by_keywords(parsed, [], limit=limit)
+
+
+def main(queries: list, rounds: int, limit: int, output: str):
+    qn.init_neo4j()
+    keyword_like = [q for q in queries if qn.parse_keyword(q) is not None]
+    print(f"=== {len(keyword_like)}/{len(queries)} queries are keyword-like, {rounds} rounds ===")
+
+    keyword_latency, llm_latency, llm_latency_keyword_like = [], [], []
+    rows = []
+    for query_text in queries:
+        row = {"query": query_text, "keyword_like": query_text in keyword_like}
+        for _ in range(rounds):
+            start = time.perf_counter()
+            llm_products = run_llm_path(query_text, limit)
+            elapsed = time.perf_counter() - start
+            llm_latency.append(elapsed)
+            if row["keyword_like"]:
+                llm_latency_keyword_like.append(elapsed)
+
+                start = time.perf_counter()
+                keyword_products = run_keyword_path(query_text, limit)
+                keyword_latency.append(time.perf_counter() - start)
+
+        if row["keyword_like"]:
+            a = {product[0] for product in keyword_products}
+            b = {product[0] for product in llm_products}
+            row["keyword_results"] = len(a)
+            row["llm_results"] = len(b)
+            row["jaccard_overlap"] = round(len(a & b) / max(len(a | b), 1), 3)
+            print(f"{query_text:<20} | keyword {len(a):>2} | llm {len(b):>2} | overlap {row['jaccard_overlap']:.2f}")
+        rows.append(row)
+
+    overlaps = [row["jaccard_overlap"] for row in rows if "jaccard_overlap" in row]
+    report = {
+        "queries": len(queries),
+        "keyword_like_share": round(len(keyword_like) / len(queries), 3) if queries else 0.0,
+        "keyword_path": summarize(keyword_latency),
+        "llm_path_keyword_like_queries": summarize(llm_latency_keyword_like),
+        "llm_path_all_queries": summarize(llm_latency),
+        "jaccard_overlap_avg": round(sum(overlaps) / len(overlaps), 3) if overlaps else None,
+        "rows": rows,
+    }
+    if keyword_latency and llm_latency_keyword_like:
+        report["p50_speedup"] = round(percentile(llm_latency_keyword_like, 0.5) /
+                                      max(percentile(keyword_latency, 0.5), 1e-6), 1)
+    print(json.dumps({k: v for k, v in report.items() if k != "rows"}, indent=2, ensure_ascii=False))
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare keyword (fulltext) search latency with the LLM translation path')
+    parser.add_argument('--queries', default=None,
+                      help='Text file with one query per line (default: built-in query set)')
+    parser.add_argument('--rounds', type=int, default=5,
+                      help='Times each query is run on each path')
+    parser.add_argument('--limit', type=int, default=10,
+                      help='Products returned per query')
+    parser.add_argument('--output', default=None,
+                      help='Optional JSON output path')
+
+    args = parser.parse_args()
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    try:
+        main(queries, args.rounds, args.limit, args.output)
+    finally:
+        qn.close_neo4j()
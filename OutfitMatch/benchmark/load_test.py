@@ -0,0 +1,287 @@
+"""
+HTTP Load Test
+以混合的請求（文字 + 圖片搜尋、純文字搜尋、串流搜尋、搭配推薦、穿搭組合）對 server.py / server_async.py 施壓，
+LLM 由 stub_llm.py 回放錄下的回覆，不會呼叫 OpenAI：
+- 固定併發（--concurrency）：每個 worker 完成一個請求後立刻送下一個（closed loop）
+- 固定到達率（--rate）：依 Poisson 過程送出請求，不等前一個完成（open loop，能看出排隊延遲）
+每個 endpoint 回報 throughput、p50 / p95 / p99 與錯誤率，--report 另存 JSON
+搜尋回 200 但內容是錯誤訊息、缺少 products 或為 fallback 結果時也算錯誤（statuses 中記為 200_error 等）
+server_async.py 只有 /api/search：混合流量依目標 server 的路由篩選（--server，預設以 /api/outfits/stats 是否存在判斷），
+避免不存在的 endpoint 回 404 被算成錯誤
+
+用法：
+    python benchmark/stub_llm.py --cassette benchmark/cassettes/llm.jsonl --latency_ms 800 --latency_sigma 0.4 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 python server.py &
+    python benchmark/load_test.py --concurrency 32 --duration 60
+    python benchmark/load_test.py --rate 20 --duration 60 --mix search=5 search_text=3 matches=2
+    python benchmark/load_test.py --base_url http://localhost:8001 --server async --concurrency 256
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from urllib.parse import quote
+import aiohttp
+from benchmark.admission_load import load_images
+
+# 常見的使用者查詢（先以 stub_llm.py --record 跑一輪，cassette 就會有對應的回覆）
+DEFAULT_QUERIES = [
+    "2000元以下的上衣",
+    "1000元以內的休閒褲子",
+    "適合約會的甜美洋裝",
+    "日系簡約風的配件",
+    "韓系寬鬆上衣 800元以下",
+    "街頭風格的下身",
+    "優雅的連身裙",
+    "便宜的休閒上衣",
+    "上班穿的簡約襯衫",
+    "500元以下的飾品",
+]
+
+DEFAULT_MIX = {"search": 4, "search_text": 3, "search_stream": 1, "matches": 1, "outfits": 1}
+
+# 各 server 支援的 endpoint
+SERVER_ENDPOINTS = {
+    "flask": {"search", "search_text", "search_stream", "matches", "outfits"},
+    "async": {"search", "search_text"},
+}
+
+# 只有 server.py 有的輕量 endpoint，用來判斷目標 server
+FLASK_ONLY_PROBE = "/api/outfits/stats"
+
+# user_query / user_query_stream 發生例外時回覆的文字
+QUERY_ERROR_TEXT = "查詢時發生錯誤"
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class RequestMix:
+    """依權重抽出 (endpoint 名稱, method, path, payload)"""
+
+    def __init__(self, weights: dict, queries: list, images: list, product_ids: list, styles: list):
+        if not product_ids:
+            weights = {k: v for k, v in weights.items() if k not in ("matches", "outfits")}
+        self.names = list(weights)
+        self.weights = [weights[name] for name in self.names]
+        self.queries, self.images = queries, images
+        self.product_ids, self.styles = product_ids, styles
+
+    def sample(self):
+        name = random.choices(self.names, self.weights)[0]
+        query = random.choice(self.queries)
+        if name == "search":
+            return name, "POST", "/api/search", {"query_text": query, "image_base64": random.choice(self.images)}
+        if name == "search_text":
+            return name, "POST", "/api/search", {"query_text": query, "image_base64": ""}
+        if name == "search_stream":
+            return name, "POST", "/api/search/stream", {"query_text": query, "image_base64": random.choice(self.images)}
+        if name == "matches":
+            return name, "GET", f"/api/products/{quote(random.choice(self.product_ids))}/matches", None
+        if name == "outfits":
+            if random.random() < 0.5:
+                return name, "GET", f"/api/products/{quote(random.choice(self.product_ids))}/outfits", None
+            return name, "GET", f"/api/styles/{quote(random.choice(self.styles))}/outfits", None
+        raise ValueError(f"Unknown endpoint in mix: {name}")
+
+
+def body_error(name: str, body: bytes):
+    """200 回應的內容檢查：搜尋失敗時回傳錯誤類別（error / no_products / incomplete / fallback），正常時回傳 None"""
+    text = body.decode("utf-8", errors="replace")
+    if name in ("search", "search_text"):
+        try:
+            result = json.loads(text)
+        except ValueError:
+            return "invalid_json"
+        if QUERY_ERROR_TEXT in str(result.get("text", "")):
+            return "error"
+        if "products" not in result:
+            return "no_products"
+        if result.get("fallback"):
+            return "fallback"
+    elif name == "search_stream":
+        events = {}
+        for block in text.split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+            if "event" in lines:
+                events[lines["event"]] = lines.get("data", "")
+        if "error" in events or QUERY_ERROR_TEXT in text:
+            return "error"
+        if "done" not in events:
+            return "incomplete"
+        try:
+            done = json.loads(events["done"])
+        except ValueError:
+            return "invalid_json"
+        if done.get("fallback"):
+            return "fallback"
+    return None
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name: str, status, latency_s: float):
+        self.latencies[name].append(latency_s)
+        self.statuses[name][str(status)] += 1
+
+    def summary(self, elapsed_s: float) -> dict:
+        endpoints = {}
+        for name, latencies in sorted(self.latencies.items()):
+            errors = sum(count for status, count in self.statuses[name].items() if status != "200")
+            endpoints[name] = {
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / elapsed_s, 2),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                "error_rate": round(errors / len(latencies), 4),
+                "statuses": dict(self.statuses[name]),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {"elapsed_s": round(elapsed_s, 2), "requests": total,
+                "throughput_rps": round(total / elapsed_s, 2), "endpoints": endpoints}
+
+
+async def one_request(session, base_url: str, request, recorder: Recorder):
+    name, method, path, payload = request
+    start = time.perf_counter()
+    try:
+        async with session.request(method, f"{base_url}{path}", json=payload) as resp:
+            # 串流回應要讀完整個 body 才算完成
+            body = await resp.read()
+            status = resp.status
+            if status == 200:
+                error = body_error(name, body)
+                status = f"200_{error}" if error else status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    recorder.add(name, status, time.perf_counter() - start)
+
+
+async def closed_loop(session, base_url: str, mix: RequestMix, recorder: Recorder,
+                      concurrency: int, deadline: float):
+    async def worker():
+        while time.perf_counter() < deadline:
+            await one_request(session, base_url, mix.sample(), recorder)
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(session, base_url: str, mix: RequestMix, recorder: Recorder,
+                    rate: float, deadline: float):
+    tasks = []
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(one_request(session, base_url, mix.sample(), recorder)))
+        await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*tasks)
+
+
+async def detect_server(session, base_url: str) -> str:
+    """FLASK_ONLY_PROBE 回 404 時為 server_async.py"""
+    async with session.get(f"{base_url}{FLASK_ONLY_PROBE}") as resp:
+        await resp.read()
+        return "async" if resp.status == 404 else "flask"
+
+
+def endpoint_weights(mix_args, server: str) -> dict:
+    """依目標 server 的路由篩選權重；明確指定了不支援的 endpoint 時結束"""
+    weights = dict(DEFAULT_MIX)
+    if mix_args:
+        weights = {name: float(weight) for name, weight in (item.split("=") for item in mix_args)}
+    unsupported = sorted(set(weights) - SERVER_ENDPOINTS[server])
+    if unsupported and mix_args:
+        raise SystemExit(f"{', '.join(unsupported)} not served by the {server} server")
+    if unsupported:
+        print(f"Skipping {', '.join(unsupported)}: not served by the {server} server", file=sys.stderr)
+    return {name: weight for name, weight in weights.items() if name not in unsupported}
+
+
+def load_product_ids(limit: int) -> list:
+    """從 Neo4j 取商品 id，供搭配推薦 / 穿搭 endpoint 使用"""
+    from neo4j import GraphDatabase
+    from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        with driver.session() as session:
+            return [r['id'] for r in session.run("MATCH (p:Product) RETURN p.id as id LIMIT $limit", limit=limit)]
+    finally:
+        driver.close()
+
+
+async def main(args):
+    random.seed(args.seed)
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        server = args.server or await detect_server(session, args.base_url)
+        weights = endpoint_weights(args.mix, server)
+        needs_products = {"matches", "outfits"} & set(weights)
+        product_ids = load_product_ids(args.products) if args.products and needs_products else []
+        mix = RequestMix(weights, queries, load_images(), product_ids, args.styles)
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.rate:
+            await open_loop(session, args.base_url, mix, recorder, args.rate, deadline)
+        else:
+            await closed_loop(session, args.base_url, mix, recorder, args.concurrency, deadline)
+        elapsed = time.perf_counter() - start
+
+    report = {
+        "mode": f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}",
+        "server": server,
+        "mix": {name: weight for name, weight in zip(mix.names, mix.weights)},
+        **recorder.summary(elapsed),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Drive the server with a realistic request mix and report per-endpoint latency')
+    parser.add_argument('--base_url', default="http://localhost:8000",
+                      help='Server base URL')
+    parser.add_argument('--server', choices=sorted(SERVER_ENDPOINTS), default=None,
+                      help='Target server routes: flask = server.py, async = server_async.py (default: detect)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                      help='Closed-loop workers (ignored when --rate is set)')
+    parser.add_argument('--rate', type=float, default=None,
+                      help='Open-loop arrival rate in requests per second (Poisson)')
+    parser.add_argument('--duration', type=float, default=60,
+                      help='Seconds to keep sending requests')
+    parser.add_argument('--mix', nargs='+', default=None,
+                      help='Endpoint weights, e.g. search=4 search_text=3 search_stream=1 matches=1 outfits=1 '
+                           '(server_async.py only serves search / search_text)')
+    parser.add_argument('--queries_file', default=None,
+                      help='One query per line (default: built-in list)')
+    parser.add_argument('--products', type=int, default=1000,
+                      help='Product ids read from Neo4j for matches / outfits (0 drops those endpoints)')
+    parser.add_argument('--styles', nargs='+', default=['休閒', '甜美', '日系', '簡約', '優雅', '韓系', '街頭'],
+                      help='Styles used for /api/styles/<style>/outfits')
+    parser.add_argument('--timeout', type=float, default=120,
+                      help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for the request mix')
+    parser.add_argument('--report', default=None,
+                      help='Optional JSON output path')
+
+    args = parser.parse_args()
+    asyncio.run(main(args))
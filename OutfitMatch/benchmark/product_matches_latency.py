@@ -0,0 +1,78 @@
+"""
+Product Matches Latency
+比較 GOES_WITH top-k 記憶體表與原本即時走 HAS_STYLE / IN_CATEGORY 的 get_matching_products_for_product
+
+用法：
+    python benchmark/product_matches_latency.py --samples 200 --limit 5
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import time
+from query.query_neo4j import get_matching_products_for_product, close_neo4j
+from query.product_matches import match_table
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "avg_ms": sum(values) / len(values) * 1000,
+        "p50_ms": values[len(values) // 2] * 1000,
+        "p99_ms": values[int(len(values) * 0.99)] * 1000,
+    }
+
+
+def main(samples: int, limit: int, seed: int):
+    start = time.perf_counter()
+    match_table.load()
+    load_seconds = time.perf_counter() - start
+
+    product_ids = sorted(match_table.matches)
+    if not product_ids:
+        print("No GOES_WITH relationships found, run database/build_relationships.py first")
+        return
+    random.seed(seed)
+    product_ids = random.sample(product_ids, min(samples, len(product_ids)))
+
+    table, live, overlap = [], [], []
+    for product_id in product_ids:
+        start = time.perf_counter()
+        precomputed = match_table.get(product_id, limit)
+        table.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        traversed = get_matching_products_for_product(product_id, limit)
+        live.append(time.perf_counter() - start)
+
+        a = {product[0] for product, _ in precomputed}
+        b = {product[0] for product in traversed}
+        overlap.append(len(a & b) / max(len(a | b), 1))
+
+    print(json.dumps({
+        "samples": len(product_ids),
+        "limit": limit,
+        "table_load_s": load_seconds,
+        "table": summarize(table),
+        "live_traversal": summarize(live),
+        "jaccard_overlap_avg": sum(overlap) / len(overlap),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare precomputed GOES_WITH lookups with live traversal')
+    parser.add_argument('--samples', type=int, default=200,
+                      help='Number of products to query')
+    parser.add_argument('--limit', type=int, default=5,
+                      help='Matches per product')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for product sampling')
+
+    args = parser.parse_args()
+    try:
+        main(args.samples, args.limit, args.seed)
+    finally:
+        close_neo4j()
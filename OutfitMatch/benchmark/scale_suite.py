@@ -0,0 +1,303 @@
+"""
+Scale Benchmark Suite
+在本機 Neo4j / Postgres 依序載入不同規模的合成目錄（benchmark/synthetic_data.py），
+每個規模量測查詢層與關係建構各階段的延遲，輸出 JSON 報告，並可與先前的報告比較：
+- neo4j：EXACT / PARTIAL / TEXT_ONLY 商品查詢模板、NEAREST_POST_QUERY（隨機 embedding，不含模型推論）
+- postgres：query.py 的精確與重疊風格 SQL
+- builder（--builder）：build_relationships 各階段的唯讀 Cypher，以及稀疏矩陣引擎的匯出與計算
+每個規模開始前只清除合成資料（Neo4j 的 synthetic = true、Postgres 的合成 image_url），請使用測試用資料庫
+
+用法：
+    python benchmark/scale_suite.py --scales 10000 100000 --posts_ratio 0.2 --builder
+    python benchmark/scale_suite.py --scales 1000000 --targets postgres --baseline benchmark/reports/scale-20261019-120000.json
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import platform
+import socket
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+import numpy as np
+from benchmark.synthetic_data import (
+    CatalogProfile,
+    DEFAULT_CSV,
+    EMBEDDING_DIM,
+    load_neo4j,
+    reset_neo4j,
+    load_postgres,
+    reset_postgres
+)
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+
+# 代表性的 LLM 條件（nl_to_cypher_conditions / nl_to_sql_where 的典型輸出）
+CYPHER_CONDITIONS = {
+    "price": "p.price <= 1000",
+    "category_price": "c.name = '上衣' AND p.price <= 800",
+    "none": "true",
+}
+SQL_WHERES = {
+    "price": "price <= 1000",
+    "category_price": "category = '上衣' AND price <= 800",
+    "none": "true",
+}
+
+
+def timed(fn: Callable, repeat: int, warmup: int = 1) -> Dict:
+    """執行 warmup + repeat 次，回傳延遲百分位數（ms）與最後一次的回傳筆數"""
+    for _ in range(warmup):
+        fn()
+    samples, rows = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(float(samples.mean()), 3),
+        "runs": repeat,
+        "rows": rows,
+    }
+
+
+def random_embeddings(n: int, seed: int) -> List[List[float]]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+
+def style_queries(profile: CatalogProfile, seed: int, n: int = 5) -> List[List[str]]:
+    """依目錄分佈抽出的風格組合，輪流作為查詢風格"""
+    rng = np.random.default_rng(seed)
+    return profile.sample_styles(rng, np.tile(profile.overall_style_p, (n, 1)))
+
+
+def cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return next_item
+
+
+def bench_neo4j(driver, profile: CatalogProfile, repeat: int, seed: int) -> Dict[str, Dict]:
+    from query.query_neo4j import (
+        EXACT_MATCH_QUERY,
+        PARTIAL_MATCH_QUERY,
+        TEXT_ONLY_QUERY,
+        NEAREST_POST_QUERY,
+        fetch_products
+    )
+    templates = {"exact": EXACT_MATCH_QUERY, "partial": PARTIAL_MATCH_QUERY, "text_only": TEXT_ONLY_QUERY}
+    next_styles = cycle(style_queries(profile, seed))
+    next_embedding = cycle(random_embeddings(repeat + 1, seed))
+    results = {}
+    with driver.session() as session:
+        for template_name, template in templates.items():
+            for condition_name, conditions in CYPHER_CONDITIONS.items():
+                results[f"{template_name}/{condition_name}"] = timed(
+                    lambda: len(fetch_products(session, template, next_styles(), conditions)), repeat)
+        results["nearest_post"] = timed(
+            lambda: len(session.run(NEAREST_POST_QUERY, k=5, embedding=next_embedding()).data()), repeat)
+    return results
+
+
+def bench_postgres(conn, profile: CatalogProfile, repeat: int, seed: int) -> Dict[str, Dict]:
+    """與 query.py search_products 相同的兩段 SQL"""
+    next_styles = cycle(style_queries(profile, seed))
+    results = {}
+    with conn.cursor() as cur:
+        def run(sql):
+            cur.execute(sql, (next_styles(),))
+            return len(cur.fetchall())
+
+        for condition_name, sql_where in SQL_WHERES.items():
+            for stage, operator in (("exact", "="), ("overlap", "&&")):
+                sql = (f"SELECT id, name, description, category, brand, price, predicted_style, image_url "
+                       f"FROM products WHERE ({sql_where}) AND (predicted_style {operator} %s::text[]) LIMIT 10")
+                results[f"{stage}/{condition_name}"] = timed(lambda: run(sql), repeat)
+    conn.rollback()
+    return results
+
+
+def bench_builder(builder, repeat: int, top_k: int) -> Dict[str, Dict]:
+    """關係建構：各階段的唯讀 Cypher，以及稀疏矩陣引擎（匯出 + 計算），都不寫入"""
+    from benchmark.sparse_engine_benchmark import (
+        GOES_WITH_QUERY,
+        OUTFIT_QUERY,
+        INSPIRED_BY_QUERY,
+        SIMILAR_TO_QUERY
+    )
+    from database.sparse_engine import goes_with_edges, outfit_edges, inspired_by_edges, style_similarity_edges
+    results = {}
+    with builder.driver.session() as session:
+        for stage, query, params in (("cypher/goes_with", GOES_WITH_QUERY, {"ids": None}),
+                                     ("cypher/outfit", OUTFIT_QUERY, {}),
+                                     ("cypher/inspired_by", INSPIRED_BY_QUERY, {}),
+                                     ("cypher/similar_to", SIMILAR_TO_QUERY, {})):
+            results[stage] = timed(lambda: len(session.run(query, **params).data()), repeat, warmup=0)
+
+    graph = {}
+
+    def export():
+        graph["g"] = builder.load_style_graph()
+        return len(graph["g"].catalog)
+    results["sparse/export"] = timed(export, repeat, warmup=0)
+    stages = {
+        "sparse/goes_with": lambda: goes_with_edges(graph["g"], top_k=top_k),
+        "sparse/outfit": lambda: outfit_edges(graph["g"]),
+        "sparse/inspired_by": lambda: inspired_by_edges(graph["g"], top_k=top_k),
+        "sparse/similar_to": lambda: [style_similarity_edges(graph["g"])],
+    }
+    for stage, fn in stages.items():
+        results[stage] = timed(lambda: sum(len(batch) for batch in fn()), repeat, warmup=0)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare_reports(baseline: Dict, report: Dict) -> List[Dict]:
+    """以 (scale, target, stage) 對齊，回傳 p50 / p95 的比值（> 1 表示變慢）"""
+    before = {(r["scale"], r["target"], r["stage"]): r for r in baseline["runs"]}
+    rows = []
+    for r in report["runs"]:
+        old = before.get((r["scale"], r["target"], r["stage"]))
+        if old is None:
+            continue
+        rows.append({
+            "scale": r["scale"], "target": r["target"], "stage": r["stage"],
+            "p50_ratio": round(r["p50_ms"] / old["p50_ms"], 3) if old["p50_ms"] else None,
+            "p95_ratio": round(r["p95_ms"] / old["p95_ms"], 3) if old["p95_ms"] else None,
+        })
+    return rows
+
+
+def main(args):
+    profile = CatalogProfile.from_csv(args.csv)
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "host": socket.gethostname(),
+            "args": vars(args),
+        },
+        "runs": [],
+        "loads": [],
+    }
+
+    driver = conn = builder = None
+    if "neo4j" in args.targets or args.builder:
+        from database.build_relationships import RecommendationBuilder
+        builder = RecommendationBuilder()
+        driver = builder.driver
+    if "postgres" in args.targets:
+        import psycopg2
+        from config.settings import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD
+        conn = psycopg2.connect(host=POSTGRES_HOST, dbname=POSTGRES_DB,
+                                user=POSTGRES_USER, password=POSTGRES_PASSWORD)
+
+    try:
+        for scale in args.scales:
+            n_posts = int(scale * args.posts_ratio)
+            print(f"\n=== scale {scale} products / {n_posts} posts ===")
+            benches = []
+            if driver is not None:
+                reset_neo4j(driver)
+                start = time.perf_counter()
+                load_neo4j(driver, profile, scale, n_posts, args.seed, args.batch_size)
+                with driver.session() as session:
+                    session.run("CALL db.awaitIndexes(600)").consume()
+                report["loads"].append({"scale": scale, "target": "neo4j", "posts": n_posts,
+                                        "load_s": round(time.perf_counter() - start, 2)})
+                if "neo4j" in args.targets:
+                    benches.append(("neo4j", lambda: bench_neo4j(driver, profile, args.repeat, args.seed)))
+                if args.builder:
+                    benches.append(("builder", lambda: bench_builder(builder, args.builder_repeat, args.top_k)))
+            if conn is not None:
+                reset_postgres(conn)
+                start = time.perf_counter()
+                load_postgres(conn, profile, scale, args.seed, args.batch_size)
+                report["loads"].append({"scale": scale, "target": "postgres", "posts": 0,
+                                        "load_s": round(time.perf_counter() - start, 2)})
+                benches.append(("postgres", lambda: bench_postgres(conn, profile, args.repeat, args.seed)))
+
+            for target, bench in benches:
+                for stage, result in bench().items():
+                    report["runs"].append({"scale": scale, "target": target, "stage": stage, **result})
+                    print(f"{target:8s} {stage:28s} p50 {result['p50_ms']:9.1f}ms  "
+                          f"p95 {result['p95_ms']:9.1f}ms  rows {result['rows']}")
+
+        if not args.keep:
+            if driver is not None:
+                reset_neo4j(driver)
+            if conn is not None:
+                reset_postgres(conn)
+    finally:
+        if builder is not None:
+            builder.close()
+        if conn is not None:
+            conn.close()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+        print(f"\n=== compared with {args.baseline} ===")
+        for row in report["comparison"]:
+            print(f"{row['scale']:>9} {row['target']:8s} {row['stage']:28s} "
+                  f"p50 x{row['p50_ratio']}  p95 x{row['p95_ratio']}")
+
+    path = args.report or os.path.join(REPORT_DIR, f"scale-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📝 Report written to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the query layer on synthetic catalogs of increasing size')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000],
+                      help='Synthetic product counts, loaded and measured in order')
+    parser.add_argument('--posts_ratio', type=float, default=0.2,
+                      help='Synthetic posts per product (default: 0.2)')
+    parser.add_argument('--targets', nargs='+', choices=['neo4j', 'postgres'], default=['neo4j', 'postgres'],
+                      help='Databases whose query templates are measured')
+    parser.add_argument('--builder', action='store_true',
+                      help='Also time relationship build stages (read-only Cypher and sparse engine)')
+    parser.add_argument('--top_k', type=int, default=None,
+                      help='Per-product top-k for the sparse engine stages')
+    parser.add_argument('--repeat', type=int, default=20,
+                      help='Timed runs per query template')
+    parser.add_argument('--builder_repeat', type=int, default=1,
+                      help='Timed runs per build stage')
+    parser.add_argument('--batch_size', type=int, default=2000,
+                      help='Rows written per transaction while loading')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for the generator and query parameters')
+    parser.add_argument('--csv', default=DEFAULT_CSV,
+                      help='Catalog whose distributions the generator follows')
+    parser.add_argument('--report', default=None,
+                      help='Output JSON path (default: benchmark/reports/scale-<timestamp>.json)')
+    parser.add_argument('--baseline', default=None,
+                      help='Earlier report to compare p50 / p95 against')
+    parser.add_argument('--keep', action='store_true',
+                      help='Keep the last synthetic catalog loaded instead of deleting it')
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,210 @@
+"""
+Sparse Engine Benchmark
+1. 在目前的 Neo4j 資料上，以唯讀版的 build_relationships Cypher 與稀疏矩陣引擎的結果逐階段比對
+2. 取不同大小的商品子集，比較 Cypher（GOES_WITH 階段）與「匯出 + 引擎計算」的耗時
+3. 合成目錄上只測引擎本身的耗時與記憶體
+
+用法：
+    python benchmark/sparse_engine_benchmark.py --sizes 500 1000 2000 --synthetic_sizes 2000 5000 10000
+    python benchmark/sparse_engine_benchmark.py --skip_neo4j --synthetic_sizes 10000 50000 --top_k 20
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import resource
+import time
+from database.build_relationships import RecommendationBuilder
+from database.sparse_engine import (
+    StyleGraph,
+    synthetic_graph,
+    goes_with_edges,
+    outfit_edges,
+    inspired_by_edges,
+    style_similarity_edges
+)
+
+# build_relationships.py 各階段的 MATCH / WHERE，只回傳配對不寫入；$ids 為 None 時不限制商品
+GOES_WITH_QUERY = """
+MATCH (p1:Product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(p2:Product)
+MATCH (p1)-[:IN_CATEGORY]->(c1:Category)
+MATCH (p2)-[:IN_CATEGORY]->(c2:Category)
+WHERE p1.id < p2.id
+  AND c1.name <> c2.name
+  AND abs(p1.price - p2.price) < 5000
+  AND ($ids IS NULL OR (p1.id IN $ids AND p2.id IN $ids))
+WITH p1, p2, count(DISTINCT s) as style_match_count
+WHERE style_match_count >= 1
+RETURN p1.id as src, p2.id as dst,
+       toFloat(style_match_count) / (abs(p1.price - p2.price) / 1000.0 + 1.0) as score
+"""
+
+OUTFIT_QUERY = """
+MATCH (top:Product)-[:IN_CATEGORY]->(c1:Category {name: '上衣'})
+MATCH (bottom:Product)-[:IN_CATEGORY]->(c2:Category {name: '下身'})
+MATCH (top)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(bottom)
+WHERE abs(top.price - bottom.price) < 3000
+WITH top, bottom, collect(DISTINCT s.name) as styles
+WHERE size(styles) >= 1
+RETURN top.id as src, bottom.id as dst, toFloat(size(styles)) * 1.5 as score
+"""
+
+INSPIRED_BY_QUERY = """
+MATCH (post:Post)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(product:Product)
+WITH post, product, count(DISTINCT s) as style_count
+WHERE style_count >= 1
+RETURN product.id as src, post.id as dst, toFloat(style_count) / 3.0 as score
+"""
+
+SIMILAR_TO_QUERY = """
+MATCH (s1:Style)<-[:HAS_STYLE]-(n)-[:HAS_STYLE]->(s2:Style)
+WHERE s1.name < s2.name
+WITH s1, s2, count(n) as co_occurrence
+WHERE co_occurrence >= 5
+RETURN s1.name as src, s2.name as dst, toFloat(co_occurrence) / 100.0 as score
+"""
+
+PRODUCTS_QUERY = """
+MATCH (p:Product)
+WHERE $ids IS NULL OR p.id IN $ids
+OPTIONAL MATCH (p)-[:IN_CATEGORY]->(c:Category)
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+WITH p, head(collect(DISTINCT c.name)) as category, collect(DISTINCT s.name) as styles
+RETURN p.id as id, p.price as price, category, styles
+"""
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def as_pairs(records, symmetric: bool = False):
+    """{(src, dst): score}；symmetric 時補上反方向（Cypher 只回傳 p1.id < p2.id 的一半）"""
+    pairs = {}
+    for r in records:
+        pairs[(r['src'], r['dst'])] = r['score']
+        if symmetric:
+            pairs[(r['dst'], r['src'])] = r['score']
+    return pairs
+
+
+def compare(expected, actual):
+    shared = expected.keys() & actual.keys()
+    score_mismatches = sum(1 for key in shared if abs(expected[key] - actual[key]) > 1e-6)
+    return {
+        "cypher": len(expected),
+        "engine": len(actual),
+        "missing": len(expected.keys() - actual.keys()),
+        "extra": len(actual.keys() - expected.keys()),
+        "score_mismatches": score_mismatches,
+    }
+
+
+def verify(builder: RecommendationBuilder):
+    """全部資料上逐階段比對 Cypher 與引擎"""
+    graph = builder.load_style_graph()
+    with builder.driver.session() as session:
+        cypher = {
+            "GOES_WITH": as_pairs(session.run(GOES_WITH_QUERY, ids=None).data(), symmetric=True),
+            "top-bottom GOES_WITH": as_pairs(session.run(OUTFIT_QUERY).data()),
+            "INSPIRED_BY": as_pairs(session.run(INSPIRED_BY_QUERY).data()),
+            "SIMILAR_TO": as_pairs(session.run(SIMILAR_TO_QUERY).data(), symmetric=True),
+        }
+    engine = {
+        "GOES_WITH": as_pairs(e for batch in goes_with_edges(graph) for e in batch),
+        "top-bottom GOES_WITH": as_pairs(e for batch in outfit_edges(graph) for e in batch),
+        "INSPIRED_BY": as_pairs({"src": e["product"], "dst": e["post"], "score": e["similarity"]}
+                                for batch in inspired_by_edges(graph) for e in batch),
+        "SIMILAR_TO": as_pairs({"src": e["src"], "dst": e["dst"], "score": e["similarity"]}
+                               for e in style_similarity_edges(graph)),
+    }
+    return {stage: compare(cypher[stage], engine[stage]) for stage in cypher}
+
+
+def time_subsets(builder: RecommendationBuilder, sizes, seed: int):
+    """商品子集上的 GOES_WITH：Cypher 與「匯出 + 引擎」的耗時"""
+    with builder.driver.session() as session:
+        all_ids = [r['id'] for r in session.run("MATCH (p:Product) RETURN p.id as id")]
+    random.seed(seed)
+    results = []
+    for size in sizes:
+        ids = random.sample(all_ids, min(size, len(all_ids)))
+        with builder.driver.session() as session:
+            start = time.perf_counter()
+            cypher_edges = len(session.run(GOES_WITH_QUERY, ids=ids).data()) * 2
+            cypher_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            products = session.run(PRODUCTS_QUERY, ids=ids).data()
+            export_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        graph = StyleGraph.from_records(products, [])
+        engine_edges = sum(len(batch) for batch in goes_with_edges(graph))
+        engine_s = time.perf_counter() - start
+
+        results.append({
+            "products": len(ids),
+            "cypher_s": cypher_s,
+            "export_s": export_s,
+            "engine_s": engine_s,
+            "speedup": cypher_s / max(export_s + engine_s, 1e-9),
+            "cypher_edges": cypher_edges,
+            "engine_edges": engine_edges,
+        })
+    return results
+
+
+def time_synthetic(sizes, top_k):
+    """合成目錄上各階段的引擎耗時"""
+    results = []
+    for size in sizes:
+        start = time.perf_counter()
+        graph = synthetic_graph(size)
+        row = {"products": size, "posts": len(graph.post_ids), "build_graph_s": time.perf_counter() - start}
+        stages = {
+            "goes_with": lambda: goes_with_edges(graph, top_k=top_k),
+            "outfit": lambda: outfit_edges(graph, 'category-0', 'category-1'),
+            "inspired_by": lambda: inspired_by_edges(graph, top_k=top_k),
+            "similar_to": lambda: [style_similarity_edges(graph)],
+        }
+        for name, stage in stages.items():
+            start = time.perf_counter()
+            row[f"{name}_edges"] = sum(len(batch) for batch in stage())
+            row[f"{name}_s"] = time.perf_counter() - start
+        row["peak_rss_mb"] = peak_rss_mb()
+        results.append(row)
+    return results
+
+
+def main(sizes, synthetic_sizes, top_k, seed: int, skip_neo4j: bool):
+    report = {}
+    if not skip_neo4j:
+        builder = RecommendationBuilder()
+        try:
+            report["verification"] = verify(builder)
+            report["neo4j_subsets"] = time_subsets(builder, sizes, seed)
+        finally:
+            builder.close()
+    report["synthetic"] = time_synthetic(synthetic_sizes, top_k)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Verify and benchmark the sparse relationship engine against Cypher')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000],
+                      help='Product subset sizes timed against Cypher')
+    parser.add_argument('--synthetic_sizes', type=int, nargs='+', default=[2000, 5000, 10000],
+                      help='Synthetic catalog sizes timed with the engine only')
+    parser.add_argument('--top_k', type=int, default=None,
+                      help='Top-k for GOES_WITH / INSPIRED_BY on synthetic catalogs (default: keep all)')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for product subsets')
+    parser.add_argument('--skip_neo4j', action='store_true',
+                      help='Only run the synthetic engine timings')
+
+    args = parser.parse_args()
+    main(args.sizes, args.synthetic_sizes, args.top_k, args.seed, args.skip_neo4j)
@@ -0,0 +1,91 @@
+"""
+SSE Latency Benchmark
+比較 /api/search/stream 的 time-to-first-byte（第一個事件）與完整回應時間，
+以及 /api/search 的完整回應時間
+
+用法（需先啟動 server.py）：
+    python benchmark/sse_latency.py --base_url http://localhost:8000 --runs 5
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import base64
+import json
+import time
+import requests
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test", "images")
+
+QUERIES = ["2000元以下的上衣", "韓系洋裝", "1000元以下的休閒褲子"]
+
+
+def load_payloads():
+    payloads = []
+    for name in sorted(os.listdir(IMAGE_DIR)):
+        with open(os.path.join(IMAGE_DIR, name), "rb") as f:
+            image_base64 = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+        for query in QUERIES:
+            payloads.append({"query_text": query, "image_base64": image_base64})
+    return payloads
+
+
+def time_blocking(base_url: str, payload: dict) -> float:
+    start = time.perf_counter()
+    resp = requests.post(f"{base_url}/api/search", json=payload)
+    resp.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+def time_stream(base_url: str, payload: dict) -> dict:
+    """回傳第一個事件、每種事件首次出現與串流結束的時間（ms）"""
+    start = time.perf_counter()
+    timings = {}
+    with requests.post(f"{base_url}/api/search/stream", json=payload, stream=True) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if line and line.startswith("event: "):
+                event = line[len("event: "):]
+                elapsed = (time.perf_counter() - start) * 1000
+                timings.setdefault("first_event", elapsed)
+                timings.setdefault(event, elapsed)
+    timings["complete"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "avg": sum(values) / len(values),
+        "p50": values[len(values) // 2],
+        "max": values[-1],
+    }
+
+
+def main(base_url: str, runs: int):
+    payloads = load_payloads()
+    blocking, streams = [], []
+    for _ in range(runs):
+        for payload in payloads:
+            blocking.append(time_blocking(base_url, payload))
+            streams.append(time_stream(base_url, payload))
+
+    event_names = sorted({name for timing in streams for name in timing})
+    report = {
+        "samples": len(blocking),
+        "blocking_complete_ms": summarize(blocking),
+        "stream_ms": {name: summarize([t[name] for t in streams if name in t]) for name in event_names},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark time-to-first-byte of the streaming search endpoint')
+    parser.add_argument('--base_url', default="http://localhost:8000",
+                      help='Server base URL')
+    parser.add_argument('--runs', type=int, default=3,
+                      help='Passes over the query/image set')
+
+    args = parser.parse_args()
+    main(args.base_url, args.runs)
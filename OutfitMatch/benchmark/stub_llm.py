@@ -0,0 +1,227 @@
+"""
+Stub LLM Server
+本機 OpenAI 相容的 /v1/chat/completions，用來在不呼叫 OpenAI 的情況下做負載測試：
+- replay：依 cassette（JSONL）回放先前錄下的回覆（nl_to_cypher_conditions、風格預測等），
+  先比對完整 messages，再比對最後一則 user message，都沒有時回傳 --reply
+- record：轉送到 --upstream 的真實 API 並把回覆附加到 cassette
+- 延遲為以 --latency_ms 為中位數的 lognormal 分佈（--latency_sigma 為 0 時固定），加上回覆長度 × --ms_per_output_char，
+  並可依比例注入 500 與 429（附 Retry-After）錯誤
+- --style_responder：cassette 沒有的風格預測 prompt（單筆或批次）依商品名稱 hash 產生固定的合法回覆，
+  --malformed_rate 讓批次回覆中部分商品的風格不合法或缺少，用來測試只重問格式錯誤的商品
+/stub/stats 回傳命中、未命中與注入錯誤的次數
+
+用法：
+    python benchmark/stub_llm.py --port 9000 --latency_ms 2000
+    python benchmark/stub_llm.py --record --upstream https://api.openai.com/v1 --cassette benchmark/cassettes/llm.jsonl
+    python benchmark/stub_llm.py --cassette benchmark/cassettes/llm.jsonl --latency_ms 800 --latency_sigma 0.5 --error_rate 0.01
+    python benchmark/stub_llm.py --style_responder --latency_ms 600 --ms_per_output_char 5 --malformed_rate 0.02
+    OPENAI_BASE_URL=http://localhost:9000/v1 python server_async.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from aiohttp import web, ClientSession, ClientTimeout
+
+DEFAULT_REPLY = "p.price <= 2000"
+
+STYLE_NAMES = ["日系", "韓系", "歐美", "街頭", "簡約", "運動風", "復古", "休閒",
+               "工裝", "優雅", "戶外", "都會", "甜美", "性感", "正裝", "華麗"]
+
+
+def completion_response(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def messages_key(messages) -> str:
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def last_user_message(messages) -> str:
+    for message in reversed(messages or []):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+    return ""
+
+
+class Cassette:
+    """錄下的 (messages, 回覆)；每行一筆 {"key", "model", "prompt", "content"}"""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.by_key, self.by_prompt = {}, {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry: dict):
+        self.by_key[entry["key"]] = entry["content"]
+        self.by_prompt[entry["prompt"]] = entry["content"]
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def lookup(self, messages):
+        content = self.by_key.get(messages_key(messages))
+        if content is None:
+            content = self.by_prompt.get(last_user_message(messages))
+        return content
+
+    def append(self, model: str, messages, content: str):
+        entry = {"key": messages_key(messages), "model": model,
+                 "prompt": last_user_message(messages), "content": content}
+        self._index(entry)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def styles_for(name: str) -> list:
+    """依商品名稱 hash 決定的 1~2 個風格（同一商品在單筆與批次模式得到相同結果）"""
+    digest = hashlib.sha256(name.strip().encode()).digest()
+    first, second = STYLE_NAMES[digest[0] % len(STYLE_NAMES)], STYLE_NAMES[digest[1] % len(STYLE_NAMES)]
+    return [first] if digest[2] % 4 == 0 or first == second else [first, second]
+
+
+def style_reply(prompt: str, malformed_rate: float = 0.0):
+    """shop_neo4j 的風格預測 prompt：批次（[id] 商品名稱：...）回 JSON，單筆回 Python list；其他 prompt 回傳 None"""
+    if "可選風格有" not in prompt:
+        return None
+    batch_items = re.findall(r"^\[(\w+)\] 商品名稱：([^｜\n]*)", prompt, flags=re.MULTILINE)
+    if batch_items:
+        results = []
+        for item_id, name in batch_items:
+            roll = random.random()
+            if roll < malformed_rate / 2:
+                continue
+            styles = ["不存在的風格"] if roll < malformed_rate else styles_for(name)
+            results.append({"id": item_id, "styles": styles})
+        return json.dumps({"results": results}, ensure_ascii=False)
+    match = re.search(r"商品名稱：(.*)", prompt)
+    return str(styles_for(match.group(1))) if match else None
+
+
+def sample_latency_s(latency_ms: float, sigma: float) -> float:
+    if sigma <= 0:
+        return latency_ms / 1000.0
+    return random.lognormvariate(0.0, sigma) * latency_ms / 1000.0
+
+
+def create_app(latency_ms: float, reply: str, cassette: Cassette = None, latency_sigma: float = 0.0,
+               error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+               record: bool = False, upstream: str = None, api_key: str = None,
+               style_responder: bool = False, malformed_rate: float = 0.0, ms_per_output_char: float = 0.0):
+    cassette = cassette or Cassette()
+    stats = Counter()
+    upstream_session = {}
+
+    async def forward(body: dict) -> dict:
+        if "session" not in upstream_session:
+            upstream_session["session"] = ClientSession(timeout=ClientTimeout(total=120))
+        async with upstream_session["session"].post(
+                f"{upstream.rstrip('/')}/chat/completions", json=body,
+                headers={"Authorization": f"Bearer {api_key}"}) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def chat_completions(request):
+        body = await request.json()
+        model, messages = body.get("model", "stub"), body.get("messages", [])
+
+        if record:
+            data = await forward(body)
+            cassette.append(model, messages, data["choices"][0]["message"]["content"])
+            stats["recorded"] += 1
+            return web.json_response(data)
+
+        roll = random.random()
+        if roll < error_rate + rate_limit_rate:
+            await asyncio.sleep(sample_latency_s(latency_ms, latency_sigma))
+            if roll < error_rate:
+                stats["error_500"] += 1
+                return web.json_response({"error": {"message": "stub injected error", "type": "server_error"}},
+                                         status=500)
+            stats["error_429"] += 1
+            return web.json_response({"error": {"message": "stub injected rate limit", "type": "rate_limit"}},
+                                     status=429, headers={"Retry-After": "1"})
+
+        content = cassette.lookup(messages)
+        if content is not None:
+            stats["hit"] += 1
+        elif style_responder and (content := style_reply(last_user_message(messages), malformed_rate)) is not None:
+            stats["styles"] += 1
+        else:
+            stats["miss"] += 1
+            content = reply
+        await asyncio.sleep(sample_latency_s(latency_ms, latency_sigma) + len(content) * ms_per_output_char / 1000.0)
+        return web.json_response(completion_response(model, content))
+
+    async def stub_stats(request):
+        return web.json_response({"cassette_entries": len(cassette), **stats})
+
+    async def close_upstream(app):
+        if "session" in upstream_session:
+            await upstream_session["session"].close()
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    app.router.add_get('/stub/stats', stub_stats)
+    app.on_cleanup.append(close_upstream)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a local OpenAI-compatible stub with record / replay and artificial latency')
+    parser.add_argument('--port', type=int, default=9000,
+                      help='Port to listen on')
+    parser.add_argument('--latency_ms', type=float, default=2000,
+                      help='Median artificial latency per completion')
+    parser.add_argument('--latency_sigma', type=float, default=0.0,
+                      help='Lognormal sigma of the latency (0 = fixed latency)')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                      help='Fraction of completions answered with HTTP 500')
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0,
+                      help='Fraction of completions answered with HTTP 429')
+    parser.add_argument('--reply', default=DEFAULT_REPLY,
+                      help='Completion content when the cassette has no matching entry')
+    parser.add_argument('--cassette', default=None,
+                      help='JSONL file of recorded completions to replay (appended to with --record)')
+    parser.add_argument('--record', action='store_true',
+                      help='Forward to --upstream and append every completion to the cassette')
+    parser.add_argument('--upstream', default="https://api.openai.com/v1",
+                      help='Real API base URL used with --record')
+    parser.add_argument('--style_responder', action='store_true',
+                      help='Answer style prediction prompts (single and batched) with deterministic valid styles')
+    parser.add_argument('--malformed_rate', type=float, default=0.0,
+                      help='Fraction of batched style items returned invalid or missing (with --style_responder)')
+    parser.add_argument('--ms_per_output_char', type=float, default=0.0,
+                      help='Extra latency per character of the completion, to model generation time')
+
+    args = parser.parse_args()
+    random.seed()
+    web.run_app(create_app(args.latency_ms, args.reply, Cassette(args.cassette), args.latency_sigma,
+                           args.error_rate, args.rate_limit_rate, args.record, args.upstream,
+                           os.getenv("OPENAI_API_KEY", ""), args.style_responder, args.malformed_rate,
+                           args.ms_per_output_char),
+                port=args.port)
@@ -0,0 +1,130 @@
+"""
+Style Batch Benchmark
+比較 shop_neo4j 的單筆（predict_style_llm）與批次（predict_styles_batch）風格預測，
+以相同併發數回報每 1,000 項商品的 LLM 呼叫數、wall time、重問的商品數，以及結果是否都在 STYLE_LIST 中
+（不使用本機分類器；LLM 以 stub_llm.py --style_responder 模擬，兩種模式對同一商品會得到相同風格）
+
+用法：
+    python benchmark/stub_llm.py --style_responder --latency_ms 600 --ms_per_output_char 5 --malformed_rate 0.02 &
+    OPENAI_BASE_URL=http://localhost:9000/v1 python benchmark/style_batch_benchmark.py --products 1000
+    OPENAI_BASE_URL=http://localhost:9000/v1 python benchmark/style_batch_benchmark.py --max_items 20 40 80
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import ast
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from config.settings import STYLE_BATCH_MAX_TOKENS
+from loader.shop_neo4j import (
+    STYLE_NAMES,
+    predict_style_llm,
+    predict_styles_batch,
+    style_prediction_stats
+)
+
+
+def load_products(path: str, n: int) -> list:
+    with open(path, encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    return list(islice(cycle(rows), n))
+
+
+def valid_share(results: list) -> float:
+    valid = 0
+    for value in results:
+        try:
+            styles = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            continue
+        valid += bool(styles) and all(style in STYLE_NAMES for style in styles)
+    return valid / len(results) if results else 0.0
+
+
+def run_mode(name: str, predict, n: int) -> dict:
+    # 統計由 shop_neo4j 加鎖更新，各模式結束後才在主執行緒讀取前後差值
+    before = dict(style_prediction_stats)
+    start = time.perf_counter()
+    results = predict()
+    elapsed = time.perf_counter() - start
+    delta = {key: style_prediction_stats[key] - before.get(key, 0) for key in style_prediction_stats}
+    calls = delta.get("llm", 0) + delta.get("llm_batch", 0)
+    report = {
+        "mode": name,
+        "products": n,
+        "llm_calls": calls,
+        "requeried_items": delta.get("requeried", 0),
+        "single_item_fallbacks": delta.get("llm", 0) if name != "single" else 0,
+        "wall_s": round(elapsed, 2),
+        "calls_per_1k": round(calls * 1000 / n, 1),
+        "wall_s_per_1k": round(elapsed * 1000 / n, 2),
+        "valid_share": round(valid_share(results), 4),
+    }
+    print(f"{name:>14} | calls/1k {report['calls_per_1k']:>7.1f} | wall/1k {report['wall_s_per_1k']:>8.2f}s | "
+          f"re-queried {report['requeried_items']:>4} | fallbacks {report['single_item_fallbacks']:>3} | "
+          f"valid {report['valid_share']:.1%}")
+    return {**report, "results": results}
+
+
+def main(csv_path: str, n: int, workers: int, max_items_list: list, max_tokens: int,
+         skip_single: bool, output: str):
+    rows = load_products(csv_path, n)
+    print(f"=== Style prediction for {n} products, {workers} concurrent requests ===")
+
+    reports = []
+    if not skip_single:
+        def single():
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(predict_style_llm, rows))
+        reports.append(run_mode("single", single, n))
+
+    for max_items in max_items_list:
+        reports.append(run_mode(
+            f"batch({max_items})",
+            lambda: predict_styles_batch(rows, max_items=max_items, max_tokens=max_tokens,
+                                         workers=workers, use_classifier=False),
+            n
+        ))
+
+    # 兩種模式結果一致（stub 對同一商品回傳固定風格），確認批次對應沒有錯位
+    if not skip_single:
+        baseline = reports[0]["results"]
+        for report in reports[1:]:
+            report["agreement_with_single"] = round(
+                sum(a == b for a, b in zip(baseline, report["results"])) / n, 4)
+            print(f"{report['mode']:>14} agrees with single-item mode on {report['agreement_with_single']:.1%}")
+        single_wall, single_calls = reports[0]["wall_s"], reports[0]["llm_calls"]
+        for report in reports[1:]:
+            print(f"{report['mode']:>14}: {single_calls / max(1, report['llm_calls']):.1f}x fewer calls, "
+                  f"{single_wall / max(report['wall_s'], 1e-9):.1f}x faster")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump([{k: v for k, v in r.items() if k != "results"} for r in reports],
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare single-item and batched LLM style prediction per 1,000 products')
+    parser.add_argument('--csv', default="data/queenshop_all_products.csv",
+                      help='Products CSV (rows are repeated when --products exceeds its size)')
+    parser.add_argument('--products', type=int, default=1000,
+                      help='Number of products to predict in each mode')
+    parser.add_argument('--workers', type=int, default=4,
+                      help='Concurrent LLM requests in both modes')
+    parser.add_argument('--max_items', type=int, nargs='+', default=[40],
+                      help='Batch size limits to compare')
+    parser.add_argument('--max_tokens', type=int, default=STYLE_BATCH_MAX_TOKENS,
+                      help='Estimated token budget per batch request')
+    parser.add_argument('--skip_single', action='store_true',
+                      help='Only run the batched modes')
+    parser.add_argument('--output', default=None,
+                      help='Optional JSON output path')
+
+    args = parser.parse_args()
+    main(args.csv, args.products, args.workers, args.max_items, args.max_tokens, args.skip_single, args.output)
@@ -0,0 +1,92 @@
+"""
+Style Vote Report
+比較只看 top-1 貼文與 k 篇貼文加權投票的風格穩定度：每張圖片產生幾個近乎相同的變體
+（JPEG 重新壓縮、縮放、微調亮度、裁掉邊緣），統計變體得到與原圖相同風格集合的比例
+（相同風格集合代表下游以風格為參數的查詢與快取可以共用）
+
+用法：
+    python benchmark/style_vote_report.py --image_dir test/images --k 3 5 10
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+from io import BytesIO
+from PIL import Image, ImageEnhance
+import query.query_neo4j as qn
+from query.inference_worker import embed_query_image
+from query.style_voting import vote_styles
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def variants(img: Image.Image) -> dict:
+    """近乎相同的圖片變體"""
+    def jpeg(quality):
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=quality)
+        return Image.open(BytesIO(buffer.getvalue())).convert("RGB")
+    w, h = img.size
+    return {
+        "jpeg_q70": jpeg(70),
+        "resize_90": img.resize((int(w * 0.9), int(h * 0.9))),
+        "brightness_105": ImageEnhance.Brightness(img).enhance(1.05),
+        "crop_2pct": img.crop((int(w * 0.02), int(h * 0.02), int(w * 0.98), int(h * 0.98))),
+    }
+
+
+def top1_styles(neighbors) -> tuple:
+    return tuple(sorted(style['name'] for style in neighbors[0]['styles'])) if neighbors else ()
+
+
+def main(image_dir: str, ks: list):
+    paths = [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir))
+             if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    max_k = max(ks)
+
+    qn.init_neo4j()
+    stable = {"top1": 0, **{f"vote_k{k}": 0 for k in ks}}
+    confidences = {f"vote_k{k}": [] for k in ks}
+    rows, total = [], 0
+    with qn.driver.session() as session:
+        for path in paths:
+            img = Image.open(path).convert("RGB")
+            # 一次取 max_k 篇，較小的 k 取前幾篇即可（與各自查詢的結果相同）
+            base = qn.nearest_posts(session, embed_query_image(img), max_k)
+            for name, variant in variants(img).items():
+                neighbors = qn.nearest_posts(session, embed_query_image(variant), max_k)
+                total += 1
+                row = {"image": os.path.basename(path), "variant": name,
+                       "top1_same": top1_styles(base) == top1_styles(neighbors)}
+                stable["top1"] += row["top1_same"]
+                for k in ks:
+                    original, voted = vote_styles(base[:k]), vote_styles(neighbors[:k])
+                    row[f"vote_k{k}_same"] = original["styles"] == voted["styles"]
+                    stable[f"vote_k{k}"] += row[f"vote_k{k}_same"]
+                    confidences[f"vote_k{k}"].append(voted["confidence"])
+                rows.append(row)
+    qn.close_neo4j()
+
+    report = {
+        "images": len(paths),
+        "variants": total,
+        "same_styles_share": {mode: round(count / total, 3) for mode, count in stable.items()} if total else {},
+        "avg_confidence": {mode: round(sum(v) / len(v), 3) for mode, v in confidences.items() if v},
+        "rows": rows,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report style stability of top-1 vs k-nearest voting under near-identical images')
+    parser.add_argument('--image_dir', default="test/images",
+                      help='Directory of query images')
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 5, 10],
+                      help='Numbers of neighbor posts to vote with')
+
+    args = parser.parse_args()
+    main(args.image_dir, args.k)
@@ -0,0 +1,309 @@
+"""
+Synthetic Data Generator
+依 data/queenshop_all_products_with_style.csv 的分佈產生任意數量的 Product 與 Post，
+並載入本機 Neo4j / Postgres 做規模測試：
+- 商品：類別比例、各類別的價格分佈、每個商品的風格數與各類別的風格比例都取自 CSV；品牌依 Zipf 分佈
+- 貼文：風格依同樣的比例抽樣，768 / 384 維 embedding 為「風格中心 + 雜訊」後正規化，讓向量查詢的鄰居與風格相關
+所有合成節點（含 SynBrand 品牌）帶 synthetic = true（Postgres 以 image_url 前綴辨識），reset 只刪除合成資料
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ast
+import csv
+import logging
+from collections import Counter
+from typing import Dict, Iterator, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "data", "queenshop_all_products_with_style.csv")
+
+# Postgres 的合成商品以這個 image_url 前綴辨識
+SYNTHETIC_IMAGE_PREFIX = "https://synthetic.invalid/"
+# 合成的品牌名稱（CSV 中的真實品牌也會被抽到，只有這些 Brand 節點標為 synthetic）
+SYNTHETIC_BRAND_PREFIX = "SynBrand"
+
+EMBEDDING_DIM = 768
+SMALL_EMBEDDING_DIM = 384
+
+
+def parse_price(value) -> float:
+    text = str(value).replace('NT.', '').replace('NT', '').replace('$', '').replace(',', '').strip()
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+class CatalogProfile:
+    """從 CSV 統計出的分佈"""
+
+    def __init__(self, rows: List[Dict], n_brands: int = 200):
+        rows = [{**row, "price": parse_price(row.get("price")),
+                 "styles": ast.literal_eval(row["predicted_style"]) if row.get("predicted_style") else []}
+                for row in rows]
+        rows = [row for row in rows if not np.isnan(row["price"]) and row.get("category")]
+
+        by_category: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_category.setdefault(row["category"], []).append(row)
+        self.categories = sorted(by_category, key=lambda c: -len(by_category[c]))
+        counts = np.array([len(by_category[c]) for c in self.categories], dtype=np.float64)
+        self.category_p = counts / counts.sum()
+        self.prices = {c: np.array([r["price"] for r in by_category[c]]) for c in self.categories}
+        self.names = {c: [r["name"] for r in by_category[c]] for c in self.categories}
+        self.descriptions = {c: [r.get("description") or "" for r in by_category[c]] for c in self.categories}
+
+        self.styles = sorted({s for row in rows for s in row["styles"]})
+        style_index = {s: i for i, s in enumerate(self.styles)}
+        self.style_p = {}
+        for c in self.categories:
+            freq = np.ones(len(self.styles))  # 平滑，罕見風格仍有機會出現
+            for row in by_category[c]:
+                for s in row["styles"]:
+                    freq[style_index[s]] += 1
+            self.style_p[c] = freq / freq.sum()
+        style_counts = Counter(max(1, len(row["styles"])) for row in rows)
+        self.style_count_values = np.array(sorted(style_counts))
+        self.style_count_p = np.array([style_counts[k] for k in self.style_count_values], dtype=np.float64)
+        self.style_count_p /= self.style_count_p.sum()
+        self.overall_style_p = np.sum([self.style_p[c] * p for c, p in zip(self.categories, self.category_p)], axis=0)
+
+        self.brands = sorted({row["brand"] for row in rows if row.get("brand")}) + \
+            [f"{SYNTHETIC_BRAND_PREFIX}{i:03d}" for i in range(n_brands)]
+        weights = 1.0 / np.arange(1, len(self.brands) + 1)
+        self.brand_p = weights / weights.sum()
+
+    @classmethod
+    def from_csv(cls, path: str = DEFAULT_CSV, **kwargs) -> "CatalogProfile":
+        with open(path, newline='', encoding='utf-8') as f:
+            return cls(list(csv.DictReader(f)), **kwargs)
+
+    def sample_styles(self, rng, p: np.ndarray) -> List[List[str]]:
+        """p: (n, 風格數) 機率矩陣；以 Gumbel top-k 一次為 n 個項目做不重複抽樣"""
+        k = rng.choice(self.style_count_values, size=len(p), p=self.style_count_p)
+        keys = np.log(p) + rng.gumbel(size=p.shape)
+        order = np.argsort(-keys, axis=1)
+        return [[self.styles[j] for j in order[i, :k[i]]] for i in range(len(p))]
+
+
+def _style_centroids(styles: List[str], dim: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((len(styles), dim)).astype(np.float32)
+    return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+
+def _embed(rng, centroids: np.ndarray, styles: List[List[int]], noise: float = 0.8) -> np.ndarray:
+    vectors = noise * rng.standard_normal((len(styles), centroids.shape[1])).astype(np.float32)
+    for i, ids in enumerate(styles):
+        vectors[i] += centroids[ids].sum(axis=0)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def generate_products(profile: CatalogProfile, n: int, seed: int = 0, batch_size: int = 5000,
+                      with_embeddings: bool = False) -> Iterator[List[Dict]]:
+    """每批 batch_size 個商品（id 為 syn-product-<i>），同樣的 seed 產生同樣的目錄"""
+    rng = np.random.default_rng(seed)
+    centroids = _style_centroids(profile.styles, EMBEDDING_DIM, seed) if with_embeddings else None
+    style_index = {s: i for i, s in enumerate(profile.styles)}
+    style_p = np.array([profile.style_p[c] for c in profile.categories])
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        categories = rng.choice(len(profile.categories), size=size, p=profile.category_p)
+        brands = rng.choice(len(profile.brands), size=size, p=profile.brand_p)
+        picks = rng.random(size)
+        # 以 CSV 同類別的價格為基礎加上 ±20% 的擾動，四捨五入到 10 元
+        jitter = rng.uniform(0.8, 1.2, size)
+        markup = rng.uniform(1.0, 2.5, size)
+        styles = profile.sample_styles(rng, style_p[categories])
+        embeddings = _embed(rng, centroids, [[style_index[s] for s in x] for x in styles]) \
+            if with_embeddings else None
+
+        batch = []
+        for k in range(size):
+            i = start + k
+            category = profile.categories[categories[k]]
+            j = int(picks[k] * len(profile.names[category]))
+            price = float(round(profile.prices[category][j] * jitter[k], -1))
+            product = {
+                "id": f"syn-product-{i}",
+                "name": f"{profile.names[category][j]} #{i}",
+                "description": profile.descriptions[category][j],
+                "category": category,
+                "brand": profile.brands[brands[k]],
+                "price": price,
+                "original_price": float(round(price * markup[k], -1)),
+                "image_url": f"{SYNTHETIC_IMAGE_PREFIX}products/{i}.jpg",
+                "styles": styles[k],
+            }
+            if with_embeddings:
+                product["img_embedding"] = embeddings[k].tolist()
+            batch.append(product)
+        yield batch
+
+
+def generate_posts(profile: CatalogProfile, n: int, seed: int = 0, batch_size: int = 1000,
+                   n_users: int = None) -> Iterator[List[Dict]]:
+    """每批 batch_size 篇貼文（id 為 syn-post-<i>），附 768 / 384 維 embedding"""
+    rng = np.random.default_rng(seed + 1)
+    centroids = _style_centroids(profile.styles, EMBEDDING_DIM, seed)
+    small_centroids = _style_centroids(profile.styles, SMALL_EMBEDDING_DIM, seed)
+    style_index = {s: i for i, s in enumerate(profile.styles)}
+    n_users = n_users or max(1, n // 20)
+    for start in range(0, n, batch_size):
+        size = min(batch_size, n - start)
+        styles = profile.sample_styles(rng, np.tile(profile.overall_style_p, (size, 1)))
+        ids = [[style_index[s] for s in x] for x in styles]
+        users = rng.integers(n_users, size=size)
+        embeddings = _embed(rng, centroids, ids)
+        small_embeddings = _embed(rng, small_centroids, ids)
+        batch = []
+        for k in range(size):
+            i = start + k
+            batch.append({
+                "id": f"syn-post-{i}",
+                "user_id": f"syn-user-{users[k]}",
+                "url": f"{SYNTHETIC_IMAGE_PREFIX}posts/{i}",
+                "caption": " ".join(f"#{s}" for s in styles[k]),
+                "description": "、".join(styles[k]),
+                "image_url": f"{SYNTHETIC_IMAGE_PREFIX}posts/{i}.jpg",
+                "styles": styles[k],
+                "img_embedding": embeddings[k].tolist(),
+                "img_embedding_small": small_embeddings[k].tolist(),
+            })
+        yield batch
+
+
+# ---------------------------------------------------------------------------
+# Neo4j
+
+def write_products_neo4j(tx, rows: List[Dict]):
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (p:Product {id: row.id})
+        SET p.name = row.name,
+            p.description = row.description,
+            p.price = row.price,
+            p.original_price = row.original_price,
+            p.image_url = row.image_url,
+            p.img_embedding = row.img_embedding,
+            p.synthetic = true,
+            p.created_at = datetime(),
+            p.updated_at = datetime()
+        MERGE (b:Brand {name: row.brand})
+        FOREACH (_ IN CASE WHEN row.brand STARTS WITH $brand_prefix THEN [1] ELSE [] END |
+            SET b.synthetic = true)
+        MERGE (p)-[:OF_BRAND]->(b)
+        MERGE (c:Category {name: row.category})
+        MERGE (p)-[:IN_CATEGORY]->(c)
+        WITH p, row
+        UNWIND row.styles AS style_name
+        MERGE (s:Style {name: style_name})
+        MERGE (p)-[r:HAS_STYLE]->(s)
+        SET r.confidence = 0.8
+    """, rows=[{"img_embedding": None, **row} for row in rows], brand_prefix=SYNTHETIC_BRAND_PREFIX)
+
+
+def write_posts_neo4j(tx, rows: List[Dict]):
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        SET u.synthetic = true
+        MERGE (p:Post {id: row.id})
+        SET p.caption = row.caption,
+            p.url = row.url,
+            p.description = row.description,
+            p.image = row.image_url,
+            p.timestamp = datetime(),
+            p.img_embedding = row.img_embedding,
+            p.img_embedding_small = row.img_embedding_small,
+            p.synthetic = true,
+            p.updated_at = datetime()
+        MERGE (u)-[:POSTED]->(p)
+        WITH p, row
+        UNWIND row.styles AS style_name
+        MERGE (s:Style {name: style_name})
+        MERGE (p)-[:HAS_STYLE]->(s)
+    """, rows=rows)
+
+
+def load_neo4j(driver, profile: CatalogProfile, n_products: int, n_posts: int, seed: int = 0,
+               batch_size: int = 2000, product_embeddings: bool = False):
+    with driver.session() as session:
+        done = 0
+        for rows in generate_products(profile, n_products, seed, batch_size, product_embeddings):
+            session.execute_write(write_products_neo4j, rows)
+            done += len(rows)
+            logger.info(f"Progress: {done}/{n_products} synthetic products loaded into Neo4j")
+        done = 0
+        for rows in generate_posts(profile, n_posts, seed, batch_size):
+            session.execute_write(write_posts_neo4j, rows)
+            done += len(rows)
+            logger.info(f"Progress: {done}/{n_posts} synthetic posts loaded into Neo4j")
+
+
+def reset_neo4j(driver, batch_size: int = 10000) -> int:
+    """分批刪除 synthetic = true 的節點與其關係（舊版載入的合成 Brand 未帶旗標，以名稱前綴辨識）"""
+    deleted = 0
+    with driver.session() as session:
+        while True:
+            count = session.run("""
+                MATCH (n)
+                WHERE n.synthetic = true OR (n:Brand AND n.name STARTS WITH $brand_prefix)
+                WITH n LIMIT $batch_size
+                DETACH DELETE n
+                RETURN count(n) as count
+            """, batch_size=batch_size, brand_prefix=SYNTHETIC_BRAND_PREFIX).single()['count']
+            deleted += count
+            if count < batch_size:
+                break
+    logger.info(f"🧹 Deleted {deleted} synthetic nodes from Neo4j")
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Postgres（與 loader/shop_postgres.py 相同的 products 資料表）
+
+def load_postgres(conn, profile: CatalogProfile, n_products: int, seed: int = 0, batch_size: int = 5000):
+    from psycopg2.extras import execute_values
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id SERIAL PRIMARY KEY,
+            name TEXT,
+            description TEXT,
+            category TEXT,
+            brand TEXT,
+            price NUMERIC,
+            predicted_style TEXT[],
+            image_url TEXT
+        )
+        """)
+        done = 0
+        for rows in generate_products(profile, n_products, seed, batch_size):
+            execute_values(cur, """
+                INSERT INTO products (name, description, category, brand, price, predicted_style, image_url)
+                VALUES %s
+            """, [(r['name'], r['description'], r['category'], r['brand'], r['price'], r['styles'], r['image_url'])
+                  for r in rows])
+            conn.commit()
+            done += len(rows)
+            logger.info(f"Progress: {done}/{n_products} synthetic products loaded into Postgres")
+        cur.execute("ANALYZE products")
+    conn.commit()
+
+
+def reset_postgres(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('products') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("DELETE FROM products WHERE image_url LIKE %s", (SYNTHETIC_IMAGE_PREFIX + '%',))
+        deleted = cur.rowcount
+    conn.commit()
+    logger.info(f"🧹 Deleted {deleted} synthetic products from Postgres")
+    return deleted
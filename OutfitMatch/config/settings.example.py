@@ -19,6 +19,7 @@ NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', '')
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')  # 留空使用官方 API，可指向本機 stub
 
 # PostgreSQL Configuration (Legacy - will be removed)
 POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'localhost')
@@ -40,7 +41,80 @@ EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'facebook/dinov2-base')
 DEFAULT_LLM_MODEL = os.getenv('DEFAULT_LLM_MODEL', 'gpt-4o-mini')  # Use cheaper model by default
 STYLE_PREDICTION_MODEL = os.getenv('STYLE_PREDICTION_MODEL', 'gpt-4o-mini')
 NL2CYPHER_MODEL = os.getenv('NL2CYPHER_MODEL', 'gpt-4o')  # Use better model for query generation
+POST_STYLE_CACHE_PATH = os.getenv('POST_STYLE_CACHE_PATH', 'cache/post_styles.json')  # 貼文風格預測的 LLM 回覆快取
+STYLE_CLASSIFIER_PATH = os.getenv('STYLE_CLASSIFIER_PATH', 'models/style_classifier.joblib')  # 本機風格分類器，留空或檔案不存在時只用 LLM
+STYLE_CLASSIFIER_THRESHOLD = float(os.getenv('STYLE_CLASSIFIER_THRESHOLD', '0.6'))  # 分類器 confidence 低於此值時改呼叫 LLM
+STYLE_BATCH_MAX_ITEMS = int(os.getenv('STYLE_BATCH_MAX_ITEMS', '40'))  # 批次風格預測每個請求的商品數上限
+STYLE_BATCH_MAX_TOKENS = int(os.getenv('STYLE_BATCH_MAX_TOKENS', '6000'))  # 每個批次請求估計的 prompt + 回覆 token 上限
+STYLE_BATCH_WORKERS = int(os.getenv('STYLE_BATCH_WORKERS', '4'))  # 同時送出的批次請求數
 
 # Cache Configuration
 ENABLE_QUERY_CACHE = os.getenv('ENABLE_QUERY_CACHE', 'true').lower() == 'true'
 CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', '3600'))  # 1 hour
+RESULT_CACHE_BACKEND = os.getenv('RESULT_CACHE_BACKEND', 'memory')  # memory / sqlite（多 worker 共用）
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', 'cache/results.sqlite')
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv('CATALOG_VERSION_CHECK_SECONDS', '5'))  # 目錄版本的查詢間隔
+
+# Inference Batching Configuration
+INFERENCE_BATCHING = os.getenv('INFERENCE_BATCHING', 'true').lower() == 'true'
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '8'))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', '5'))  # 最多等待湊 batch 的時間
+
+# Cascade Embedding Configuration
+CASCADE_EMBEDDING = os.getenv('CASCADE_EMBEDDING', 'false').lower() == 'true'
+SMALL_EMBEDDING_MODEL = os.getenv('SMALL_EMBEDDING_MODEL', 'facebook/dinov2-small')
+CASCADE_CANDIDATES = int(os.getenv('CASCADE_CANDIDATES', '20'))  # 小模型召回的候選貼文數
+CASCADE_SKIP_MARGIN = float(os.getenv('CASCADE_SKIP_MARGIN', '0.05'))  # top-1 領先幅度超過此值時略過 base 模型
+
+# Image Style Voting（以最相似的 k 篇貼文投票決定風格）
+STYLE_VOTE_K = int(os.getenv('STYLE_VOTE_K', '5'))  # 參與投票的貼文數
+STYLE_VOTE_TEMPERATURE = float(os.getenv('STYLE_VOTE_TEMPERATURE', '0.05'))  # 相似度差距的權重衰減，越小越偏向 top-1
+STYLE_VOTE_MIN_SHARE = float(os.getenv('STYLE_VOTE_MIN_SHARE', '0.25'))  # 第二個風格至少要有的票數佔比
+STYLE_VOTE_MAX_STYLES = int(os.getenv('STYLE_VOTE_MAX_STYLES', '2'))
+
+# Keyword Search Configuration（關鍵字型查詢走 product_search 全文索引，不呼叫 LLM）
+KEYWORD_SEARCH = os.getenv('KEYWORD_SEARCH', 'true').lower() == 'true'
+KEYWORD_SEARCH_CANDIDATES = int(os.getenv('KEYWORD_SEARCH_CANDIDATES', '200'))  # 全文索引召回的候選商品數
+KEYWORD_SEARCH_STYLE_WEIGHT = float(os.getenv('KEYWORD_SEARCH_STYLE_WEIGHT', '0.3'))  # 排序時風格重疊的權重（其餘為全文分數）
+
+# Visual Search Configuration（以圖片 embedding 直接查 product_image_index）
+IMAGE_SEARCH_MODE = os.getenv('IMAGE_SEARCH_MODE', 'style')  # style（貼文風格）或 visual（商品圖片相似度），請求的 mode 欄位可覆蓋
+VISUAL_SEARCH_OVERSAMPLE = int(os.getenv('VISUAL_SEARCH_OVERSAMPLE', '5'))  # 向量索引召回 limit 的幾倍候選再過濾
+VISUAL_SEARCH_MAX_CANDIDATES = int(os.getenv('VISUAL_SEARCH_MAX_CANDIDATES', '1000'))  # 過濾後不足時加倍召回的上限
+VISUAL_SEARCH_STYLE_WEIGHT = float(os.getenv('VISUAL_SEARCH_STYLE_WEIGHT', '0'))  # 排序時風格重疊的權重，0 為只看視覺相似度
+
+# Logging Configuration
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv('REQUEST_LOG_SAMPLE_RATE', '0.01'))  # 記錄請求的抽樣比例
+REQUEST_LOG_HEADERS = os.getenv('REQUEST_LOG_HEADERS', 'false').lower() == 'true'
+
+# Profiling Configuration
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # 0 = 只 profile 帶 X-Profile header（與 X-Admin-Token）的請求
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'collapsed')  # collapsed 或 speedscope
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # admin endpoint 與 X-Profile 需帶相同的 X-Admin-Token；未設定時停用
+
+# Streaming Search Configuration
+STREAM_STAGE_WORKERS = int(os.getenv('STREAM_STAGE_WORKERS', '16'))  # LLM / 圖片推論並行用的執行緒數
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '5'))  # 每個 products 事件的商品數
+
+# Async Server Configuration
+ASYNC_INFERENCE_WORKERS = int(os.getenv('ASYNC_INFERENCE_WORKERS', '4'))  # async 路徑中 CPU 推論使用的執行緒數
+
+# Admission Control (/api/search, /api/search/stream)
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '8'))  # 同時執行的搜尋數
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))  # 排隊上限，超過直接回 503
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_MS', '3000'))  # 排隊超過此時間回 503
+ADMISSION_DEGRADE_QUEUE_MS = float(os.getenv('ADMISSION_DEGRADE_QUEUE_MS', '1000'))  # 排隊超過此時間改為純文字搜尋，0 為停用
+# server_async.py 的 admission control（等待中的請求不佔用執行緒，上限遠高於 server.py）
+ASYNC_ADMISSION_MAX_CONCURRENCY = int(os.getenv('ASYNC_ADMISSION_MAX_CONCURRENCY', '1000'))  # 同時執行的搜尋數
+ASYNC_ADMISSION_MAX_QUEUE = int(os.getenv('ASYNC_ADMISSION_MAX_QUEUE', '4000'))  # 排隊上限，超過直接回 503
+ASYNC_ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv('ASYNC_ADMISSION_QUEUE_TIMEOUT_MS', '5000'))  # 排隊超過此時間回 503
+ASYNC_ADMISSION_DEGRADE_QUEUE_MS = float(os.getenv('ASYNC_ADMISSION_DEGRADE_QUEUE_MS', '2000'))  # 排隊超過此時間改為純文字搜尋，0 為停用
+
+# Product Matches (/api/products/<id>/matches)
+PRODUCT_MATCHES_TOP_K = int(os.getenv('PRODUCT_MATCHES_TOP_K', '20'))  # 每個商品在記憶體中保留的 GOES_WITH 數
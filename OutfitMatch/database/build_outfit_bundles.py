@@ -0,0 +1,120 @@
+"""
+Build Outfit Bundles
+讀出商品與 GOES_WITH 關係，離線組合完整穿搭（outfit_composer），
+以 (:OutfitBundles {key, bundles}) 儲存：key 為 'product:<id>' 或 'style:<name>'，bundles 為 JSON 字串，
+/api/products/<id>/outfits 與 /api/styles/<name>/outfits 只需一次 key lookup
+需先執行 build_relationships.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neo4j import GraphDatabase
+from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from database.catalog_version import bump_catalog_version
+from database.outfit_composer import OutfitComposer
+import argparse
+import json
+import time
+import uuid
+import logging
+from typing import Dict, List
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def product_key(product_id: str) -> str:
+    return f"product:{product_id}"
+
+
+def style_key(style: str) -> str:
+    return f"style:{style}"
+
+
+def load_products(session) -> Dict[str, Dict]:
+    return {
+        r['id']: {"price": r['price'], "category": r['category'], "styles": r['styles']}
+        for r in session.run("""
+            MATCH (p:Product)-[:IN_CATEGORY]->(c:Category)
+            OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+            WITH p, head(collect(DISTINCT c.name)) as category, collect(DISTINCT s.name) as styles
+            RETURN p.id as id, p.price as price, category, styles
+        """)
+    }
+
+
+def load_goes_with(session) -> Dict[str, Dict[str, float]]:
+    edges = {}
+    for r in session.run("""
+        MATCH (a:Product)-[r:GOES_WITH]->(b:Product)
+        RETURN a.id as src, b.id as dst, r.score as score
+    """):
+        edges.setdefault(r['src'], {})[r['dst']] = r['score'] or 0.0
+    return edges
+
+
+def write_bundles(tx, rows: List[Dict], build_id: str):
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (b:OutfitBundles {key: row.key})
+        SET b.bundles = row.bundles,
+            b.build_id = $build_id,
+            b.updated_at = datetime()
+    """, rows=rows, build_id=build_id)
+
+
+def main(top_n: int = 5, beam_width: int = 8, budget: float = None,
+         coherence_weight: float = 1.0, batch_size: int = 1000):
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        start = time.perf_counter()
+        with driver.session() as session:
+            products = load_products(session)
+            edges = load_goes_with(session)
+        logger.info(f"📦 Loaded {len(products)} products and {sum(len(e) for e in edges.values())} GOES_WITH edges")
+
+        composer = OutfitComposer(products, edges, budget=budget, beam_width=beam_width,
+                                  coherence_weight=coherence_weight)
+        by_product, by_style = composer.compose_all(top_n)
+
+        rows = [{"key": product_key(pid), "bundles": json.dumps(bundles, ensure_ascii=False)}
+                for pid, bundles in by_product.items()]
+        rows += [{"key": style_key(style), "bundles": json.dumps(bundles, ensure_ascii=False)}
+                 for style, bundles in by_style.items()]
+
+        # 先寫入新的 bundles 再刪掉舊的，重建期間查詢不會落空
+        build_id = uuid.uuid4().hex
+        with driver.session() as session:
+            for i in range(0, len(rows), batch_size):
+                session.execute_write(write_bundles, rows[i:i + batch_size], build_id)
+            stale = session.run("""
+                MATCH (b:OutfitBundles)
+                WHERE b.build_id <> $build_id
+                DELETE b
+                RETURN count(b) as count
+            """, build_id=build_id).single()['count']
+
+        size_kb = sum(len(r['bundles'].encode()) for r in rows) / 1024
+        logger.info(f"✅ Stored {len(rows)} bundle records ({size_kb:.0f}KB, {stale} stale removed) "
+                    f"in {time.perf_counter() - start:.1f}s")
+        bump_catalog_version(driver, "build_outfit_bundles")
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Materialize top-N complete outfits per product and per style')
+    parser.add_argument('--top_n', type=int, default=5,
+                      help='Outfits kept per product and per style (default: 5)')
+    parser.add_argument('--beam_width', type=int, default=8,
+                      help='Partial outfits kept after each category slot (default: 8)')
+    parser.add_argument('--budget', type=float, default=None,
+                      help='Maximum total price of an outfit (default: no limit)')
+    parser.add_argument('--coherence_weight', type=float, default=1.0,
+                      help='Weight of the shared-style ratio in the outfit score (default: 1.0)')
+    parser.add_argument('--batch_size', type=int, default=1000,
+                      help='Bundle records written per transaction (default: 1000)')
+
+    args = parser.parse_args()
+    main(args.top_n, args.beam_width, args.budget, args.coherence_weight, args.batch_size)
@@ -9,12 +9,188 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from neo4j import GraphDatabase
 from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from database.catalog_version import (
+    bump_catalog_version,
+    get_relationships_watermark,
+    set_relationships_watermark,
+    get_relationships_config,
+    set_relationships_config
+)
+from database.inspired_by_ranking import rank_inspired_by
+from database.incremental_relationships import (
+    changed_since,
+    update_relationships,
+    index_style_co_occurrence,
+    verify_relationships,
+    synthetic_changes,
+    simulate_incremental,
+    drop_nodes
+)
+from database.goes_with_engine import ProductCatalog, synthetic_catalog, build_topk, iter_edge_batches
+from database.sparse_engine import (
+    StyleGraph,
+    synthetic_graph,
+    goes_with_edges,
+    outfit_edges,
+    inspired_by_edges,
+    style_similarity_edges,
+    rebatch
+)
+import argparse
+import resource
+import time
 import logging
 from typing import List, Dict
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# build_style_based_recommendations：有共同風格、不同類別、價格差距 5000 內的商品雙向建立 GOES_WITH
+STYLE_BASED_QUERY = """
+MATCH (p1:Product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(p2:Product)
+MATCH (p1)-[:IN_CATEGORY]->(c1:Category)
+MATCH (p2)-[:IN_CATEGORY]->(c2:Category)
+
+WHERE p1.id < p2.id  // 避免重複配對
+  AND c1.name <> c2.name  // 不同類別
+  AND abs(p1.price - p2.price) < 5000  // 價格差距在 5000 內
+
+WITH p1, p2, 
+     collect(DISTINCT s.name) as common_styles,
+     count(DISTINCT s) as style_match_count
+
+WHERE style_match_count >= $min_common_styles
+
+// 創建雙向推薦關係
+MERGE (p1)-[r1:GOES_WITH]->(p2)
+SET r1.style_match = toFloat(style_match_count),
+    r1.common_styles = common_styles,
+    r1.score = toFloat(style_match_count) / 
+              (abs(p1.price - p2.price) / 1000.0 + 1.0),
+    r1.created_at = datetime()
+
+MERGE (p2)-[r2:GOES_WITH]->(p1)
+SET r2.style_match = toFloat(style_match_count),
+    r2.common_styles = common_styles,
+    r2.score = toFloat(style_match_count) / 
+              (abs(p1.price - p2.price) / 1000.0 + 1.0),
+    r2.created_at = datetime()
+
+RETURN count(DISTINCT r1) as relationships_created
+"""
+
+# 離線計算結果的分批寫入（稀疏矩陣引擎、分區計算）
+WRITE_GOES_WITH_QUERY = """
+UNWIND $rows AS row
+MATCH (p1:Product {id: row.src})
+MATCH (p2:Product {id: row.dst})
+MERGE (p1)-[r:GOES_WITH]->(p2)
+SET r.style_match = row.style_match,
+    r.common_styles = row.common_styles,
+    r.score = row.score,
+    r.created_at = datetime()
+"""
+
+WRITE_OUTFIT_QUERY = """
+UNWIND $rows AS row
+MATCH (top:Product {id: row.src})
+MATCH (bottom:Product {id: row.dst})
+MERGE (top)-[r:GOES_WITH]->(bottom)
+SET r.outfit_type = 'top_bottom',
+    r.common_styles = row.common_styles,
+    r.score = row.score
+"""
+
+WRITE_INSPIRED_BY_QUERY = """
+UNWIND $rows AS row
+MATCH (product:Product {id: row.product})
+MATCH (post:Post {id: row.post})
+MERGE (product)-[r:INSPIRED_BY]->(post)
+SET r.common_styles = row.common_styles,
+    r.similarity = row.similarity,
+    r.created_at = datetime()
+"""
+
+WRITE_SIMILAR_TO_QUERY = """
+UNWIND $rows AS row
+MATCH (s1:Style {name: row.src})
+MATCH (s2:Style {name: row.dst})
+MERGE (s1)-[r:SIMILAR_TO]->(s2)
+SET r.similarity = row.similarity,
+    r.co_occurrence = row.co_occurrence
+"""
+
+# 稀疏矩陣引擎 / 分區計算匯出的商品與貼文風格
+EXPORT_PRODUCTS_QUERY = """
+MATCH (p:Product)
+OPTIONAL MATCH (p)-[:IN_CATEGORY]->(c:Category)
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+WITH p, head(collect(DISTINCT c.name)) as category, collect(DISTINCT s.name) as styles
+RETURN p.id as id, p.price as price, category, styles
+"""
+
+EXPORT_POSTS_QUERY = """
+MATCH (post:Post)
+OPTIONAL MATCH (post)-[:HAS_STYLE]->(s:Style)
+RETURN post.id as id, collect(DISTINCT s.name) as styles
+"""
+
+# build_complete_outfit_recommendations：上衣 + 下身
+OUTFIT_QUERY = """
+MATCH (top:Product)-[:IN_CATEGORY]->(c1:Category {name: '上衣'})
+MATCH (bottom:Product)-[:IN_CATEGORY]->(c2:Category {name: '下身'})
+MATCH (top)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(bottom)
+
+WHERE abs(top.price - bottom.price) < 3000
+
+WITH top, bottom, collect(DISTINCT s.name) as styles
+WHERE size(styles) >= 1
+
+MERGE (top)-[r:GOES_WITH]->(bottom)
+SET r.outfit_type = 'top_bottom',
+    r.common_styles = styles,
+    r.score = toFloat(size(styles)) * 1.5  // 上下身搭配給更高分數
+
+RETURN count(r) as relationships_created
+"""
+
+# build_post_inspired_relationships：有共同風格的貼文與商品
+INSPIRED_BY_QUERY = """
+MATCH (post:Post)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(product:Product)
+
+WITH post, product, 
+     collect(DISTINCT s.name) as common_styles,
+     count(DISTINCT s) as style_count
+
+WHERE style_count >= 1
+
+MERGE (product)-[r:INSPIRED_BY]->(post)
+SET r.common_styles = common_styles,
+    r.similarity = toFloat(style_count) / 3.0,  // 假設最多 3 個共同風格
+    r.created_at = datetime()
+
+RETURN count(r) as relationships_created
+"""
+
+# create_style_similarity_graph：依共同出現次數建立風格相似度
+SIMILAR_TO_QUERY = """
+MATCH (s1:Style)<-[:HAS_STYLE]-(n)-[:HAS_STYLE]->(s2:Style)
+WHERE s1.name < s2.name
+
+WITH s1, s2, count(n) as co_occurrence
+WHERE co_occurrence >= 5  // 至少共同出現 5 次
+
+MERGE (s1)-[r:SIMILAR_TO]->(s2)
+SET r.similarity = toFloat(co_occurrence) / 100.0,
+    r.co_occurrence = co_occurrence
+
+MERGE (s2)-[r2:SIMILAR_TO]->(s1)
+SET r2.similarity = toFloat(co_occurrence) / 100.0,
+    r2.co_occurrence = co_occurrence
+
+RETURN count(DISTINCT r) as relationships_created
+"""
+
 
 class RecommendationBuilder:
     def __init__(self):
@@ -32,44 +208,171 @@ class RecommendationBuilder:
         3. 價格差距不要太大
         """
         with self.driver.session() as session:
-            query = """
-            MATCH (p1:Product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(p2:Product)
-            MATCH (p1)-[:IN_CATEGORY]->(c1:Category)
-            MATCH (p2)-[:IN_CATEGORY]->(c2:Category)
-            
-            WHERE p1.id < p2.id  // 避免重複配對
-              AND c1.name <> c2.name  // 不同類別
-              AND abs(p1.price - p2.price) < 5000  // 價格差距在 5000 內
-            
-            WITH p1, p2, 
-                 collect(DISTINCT s.name) as common_styles,
-                 count(DISTINCT s) as style_match_count
-            
-            WHERE style_match_count >= $min_common_styles
-            
-            // 創建雙向推薦關係
-            MERGE (p1)-[r1:GOES_WITH]->(p2)
-            SET r1.style_match = toFloat(style_match_count),
-                r1.common_styles = common_styles,
-                r1.score = toFloat(style_match_count) / 
-                          (abs(p1.price - p2.price) / 1000.0 + 1.0),
-                r1.created_at = datetime()
-            
-            MERGE (p2)-[r2:GOES_WITH]->(p1)
-            SET r2.style_match = toFloat(style_match_count),
-                r2.common_styles = common_styles,
-                r2.score = toFloat(style_match_count) / 
-                          (abs(p1.price - p2.price) / 1000.0 + 1.0),
-                r2.created_at = datetime()
-            
-            RETURN count(DISTINCT r1) as relationships_created
-            """
-            
-            result = session.run(query, min_common_styles=min_common_styles)
+            result = session.run(STYLE_BASED_QUERY, min_common_styles=min_common_styles)
             count = result.single()['relationships_created']
             logger.info(f"✅ Created {count} GOES_WITH relationships based on style similarity")
             return count
     
+    def export_products(self) -> List[Dict]:
+        """讀出所有商品的價格、類別與風格"""
+        with self.driver.session() as session:
+            return session.run(EXPORT_PRODUCTS_QUERY).data()
+    
+    def export_posts(self) -> List[Dict]:
+        """讀出所有貼文的風格"""
+        with self.driver.session() as session:
+            return session.run(EXPORT_POSTS_QUERY).data()
+    
+    def load_product_catalog(self) -> ProductCatalog:
+        """商品目錄，供分區計算使用"""
+        records = self.export_products()
+        logger.info(f"📦 Loaded {len(records)} products for partitioned build")
+        return ProductCatalog.from_records(records)
+    
+    def load_style_graph(self) -> StyleGraph:
+        """Product / Post – Style 二分圖，供稀疏矩陣引擎使用"""
+        start = time.perf_counter()
+        graph = StyleGraph.from_records(self.export_products(), self.export_posts())
+        logger.info(f"📦 Exported {len(graph.catalog)} products, {len(graph.post_ids)} posts and "
+                    f"{len(graph.style_names)} styles in {time.perf_counter() - start:.1f}s")
+        return graph
+    
+    def _delete_in_batches(self, match_clause: str, batch_size: int) -> int:
+        """match_clause 需綁定關係變數 r；每個交易最多刪除 batch_size 條"""
+        deleted = 0
+        with self.driver.session() as session:
+            while True:
+                count = session.run(f"""
+                    {match_clause}
+                    WITH r LIMIT $batch_size
+                    DELETE r
+                    RETURN count(r) as count
+                """, batch_size=batch_size).single()['count']
+                deleted += count
+                if count < batch_size:
+                    break
+        return deleted
+    
+    def delete_style_based_recommendations(self, batch_size: int = 10000) -> int:
+        """分批刪除舊的風格搭配關係（上下身搭配的 outfit_type 關係保留）"""
+        deleted = self._delete_in_batches("""
+            MATCH (:Product)-[r:GOES_WITH]->(:Product)
+            WHERE r.outfit_type IS NULL
+        """, batch_size)
+        logger.info(f"🧹 Deleted {deleted} existing style-based GOES_WITH relationships")
+        return deleted
+    
+    def delete_outfit_recommendations(self, batch_size: int = 10000) -> int:
+        """分批刪除舊的上下身搭配關係（top-k 模式重建前使用）"""
+        deleted = self._delete_in_batches("""
+            MATCH (:Product)-[r:GOES_WITH]->(:Product)
+            WHERE r.outfit_type = 'top_bottom'
+        """, batch_size)
+        logger.info(f"🧹 Deleted {deleted} existing top-bottom GOES_WITH relationships")
+        return deleted
+    
+    def delete_inspired_by_relationships(self, batch_size: int = 10000) -> int:
+        """分批刪除舊的 INSPIRED_BY 關係"""
+        deleted = self._delete_in_batches("MATCH (:Product)-[r:INSPIRED_BY]->(:Post)", batch_size)
+        logger.info(f"🧹 Deleted {deleted} existing INSPIRED_BY relationships")
+        return deleted
+    
+    @staticmethod
+    def _write_goes_with_batch(tx, rows):
+        tx.run(WRITE_GOES_WITH_QUERY, rows=rows)
+    
+    @staticmethod
+    def _write_outfit_batch(tx, rows):
+        tx.run(WRITE_OUTFIT_QUERY, rows=rows)
+    
+    @staticmethod
+    def _write_inspired_by_batch(tx, rows):
+        tx.run(WRITE_INSPIRED_BY_QUERY, rows=rows)
+    
+    @staticmethod
+    def _write_similar_to_batch(tx, rows):
+        tx.run(WRITE_SIMILAR_TO_QUERY, rows=rows)
+    
+    def _write_batches(self, write_fn, batches, label: str) -> int:
+        """每批一個交易寫入，回傳寫入筆數"""
+        start = time.perf_counter()
+        written = 0
+        with self.driver.session() as session:
+            for rows in batches:
+                session.execute_write(write_fn, rows)
+                written += len(rows)
+                logger.debug(f"Progress: {written} {label} relationships written")
+        logger.info(f"✅ Wrote {written} {label} relationships in {time.perf_counter() - start:.1f}s")
+        return written
+    
+    def build_all_sparse(self, top_k: int = None, batch_size: int = 5000,
+                         inspired_top_k: int = None, inspired_candidates: int = 50):
+        """
+        以稀疏矩陣引擎離線計算全部四個階段，再以 UNWIND 分批寫回
+        top_k 為 None 時結果與 Cypher 版本相同；指定時 GOES_WITH（每個商品）與 INSPIRED_BY（每篇貼文）只保留 top_k
+        inspired_top_k 指定時 INSPIRED_BY 改用圖片相似度排序（build_post_inspired_relationships_ranked）
+        """
+        graph = self.load_style_graph()
+        if top_k is not None:
+            self.delete_style_based_recommendations(batch_size)
+            self.delete_outfit_recommendations(batch_size)
+            self.delete_inspired_by_relationships(batch_size)
+        
+        logger.info("1️⃣ Style-based GOES_WITH (sparse engine)...")
+        self._write_batches(self._write_goes_with_batch,
+                            rebatch(goes_with_edges(graph, top_k=top_k), batch_size), "GOES_WITH")
+        
+        logger.info("2️⃣ Top-bottom outfit GOES_WITH (sparse engine)...")
+        self._write_batches(self._write_outfit_batch,
+                            rebatch(outfit_edges(graph, top_k=top_k), batch_size), "top-bottom GOES_WITH")
+        
+        if inspired_top_k:
+            logger.info("3️⃣ INSPIRED_BY (ranked by image similarity)...")
+            self.build_post_inspired_relationships_ranked(inspired_top_k, inspired_candidates, batch_size)
+        else:
+            logger.info("3️⃣ INSPIRED_BY (sparse engine)...")
+            self._write_batches(self._write_inspired_by_batch,
+                                rebatch(inspired_by_edges(graph, top_k=top_k), batch_size), "INSPIRED_BY")
+        
+        logger.info("4️⃣ SIMILAR_TO (sparse engine)...")
+        self._write_batches(self._write_similar_to_batch,
+                            rebatch([style_similarity_edges(graph)], batch_size), "SIMILAR_TO")
+    
+    def build_style_based_recommendations_partitioned(self, top_k: int = 20, batch_size: int = 5000,
+                                                      min_common_styles: int = 1):
+        """
+        build_style_based_recommendations 的分區版本：
+        以 (類別組合, 風格) 分區在記憶體中計算，每個商品只保留 score 最高的 top_k 個搭配，
+        再以每批 batch_size 筆的交易寫入，避免單一交易 MERGE O(n²) 條邊
+        """
+        catalog = self.load_product_catalog()
+        table, partitions = run_partitioned_engine(catalog, top_k, min_common_styles)
+        
+        self.delete_style_based_recommendations(batch_size)
+        
+        start = time.perf_counter()
+        written = 0
+        with self.driver.session() as session:
+            for rows in iter_edge_batches(catalog, table, batch_size):
+                session.execute_write(self._write_goes_with_batch, rows)
+                written += len(rows)
+                logger.info(f"Progress: {written}/{table.edge_count()} GOES_WITH relationships written")
+        
+        logger.info(f"✅ Created {written} GOES_WITH relationships (top-{top_k} per product) "
+                    f"in {time.perf_counter() - start:.1f}s")
+        return written
+    
+    def build_complete_outfit_recommendations_partitioned(self, top_k: int = 20, batch_size: int = 5000) -> int:
+        """
+        build_complete_outfit_recommendations 的 top-k 版本（--partitioned）：
+        在記憶體中計算，每件上衣只保留 score 最高的 top_k 件下身，分批寫入
+        舊的上下身搭配需在寫入風格搭配之前刪除（見 run_full_build），否則會刪到覆寫在其上的風格搭配
+        """
+        graph = StyleGraph(self.load_product_catalog(), [], [])
+        return self._write_batches(self._write_outfit_batch,
+                                   rebatch(outfit_edges(graph, top_k=top_k), batch_size),
+                                   f"top-bottom GOES_WITH (top-{top_k} per top)")
+    
     def build_complete_outfit_recommendations(self):
         """
         建立完整穿搭推薦（上衣 + 下身 + 配件）
@@ -77,25 +380,7 @@ class RecommendationBuilder:
         """
         with self.driver.session() as session:
             # 找上衣 + 下身的組合
-            query = """
-            MATCH (top:Product)-[:IN_CATEGORY]->(c1:Category {name: '上衣'})
-            MATCH (bottom:Product)-[:IN_CATEGORY]->(c2:Category {name: '下身'})
-            MATCH (top)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(bottom)
-            
-            WHERE abs(top.price - bottom.price) < 3000
-            
-            WITH top, bottom, collect(DISTINCT s.name) as styles
-            WHERE size(styles) >= 1
-            
-            MERGE (top)-[r:GOES_WITH]->(bottom)
-            SET r.outfit_type = 'top_bottom',
-                r.common_styles = styles,
-                r.score = toFloat(size(styles)) * 1.5  // 上下身搭配給更高分數
-            
-            RETURN count(r) as relationships_created
-            """
-            
-            result = session.run(query)
+            result = session.run(OUTFIT_QUERY)
             count = result.single()['relationships_created']
             logger.info(f"✅ Created {count} top-bottom outfit relationships")
             return count
@@ -106,53 +391,37 @@ class RecommendationBuilder:
         將相似風格的貼文與商品關聯起來
         """
         with self.driver.session() as session:
-            query = """
-            MATCH (post:Post)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(product:Product)
-            
-            WITH post, product, 
-                 collect(DISTINCT s.name) as common_styles,
-                 count(DISTINCT s) as style_count
-            
-            WHERE style_count >= 1
-            
-            MERGE (product)-[r:INSPIRED_BY]->(post)
-            SET r.common_styles = common_styles,
-                r.similarity = toFloat(style_count) / 3.0,  // 假設最多 3 個共同風格
-                r.created_at = datetime()
-            
-            RETURN count(r) as relationships_created
-            """
-            
-            result = session.run(query)
+            result = session.run(INSPIRED_BY_QUERY)
             count = result.single()['relationships_created']
             logger.info(f"✅ Created {count} INSPIRED_BY relationships (Post → Product)")
             return count
     
+    def build_post_inspired_relationships_ranked(self, top_k: int = 10, candidates: int = 50,
+                                                 batch_size: int = 10000):
+        """
+        每個商品只連到圖片最相似的 top_k 篇有共同風格的貼文（由 post_image_index 取 candidates 篇候選）
+        沒有 img_embedding 的商品改以共同風格數排序；先刪除舊的 INSPIRED_BY 再分批建立
+        """
+        start = time.perf_counter()
+        deleted = self.delete_inspired_by_relationships(batch_size)
+        with self.driver.session() as session:
+            product_ids = [r['id'] for r in session.run("MATCH (p:Product)-[:HAS_STYLE]->() RETURN DISTINCT p.id as id")]
+            counts = rank_inspired_by(session, product_ids, top_k, candidates)
+        
+        created = counts['image'] + counts['style']
+        logger.info(f"✅ Created {created} INSPIRED_BY relationships (top-{top_k} per product: "
+                    f"{counts['image']} by image similarity, {counts['style']} by shared styles) "
+                    f"for {len(product_ids)} products in {time.perf_counter() - start:.1f}s, "
+                    f"replacing {deleted}")
+        return created
+    
     def create_style_similarity_graph(self):
         """
         創建風格之間的相似度關係
         基於共同出現在同一商品/貼文中的頻率
         """
         with self.driver.session() as session:
-            query = """
-            MATCH (s1:Style)<-[:HAS_STYLE]-(n)-[:HAS_STYLE]->(s2:Style)
-            WHERE s1.name < s2.name
-            
-            WITH s1, s2, count(n) as co_occurrence
-            WHERE co_occurrence >= 5  // 至少共同出現 5 次
-            
-            MERGE (s1)-[r:SIMILAR_TO]->(s2)
-            SET r.similarity = toFloat(co_occurrence) / 100.0,
-                r.co_occurrence = co_occurrence
-            
-            MERGE (s2)-[r2:SIMILAR_TO]->(s1)
-            SET r2.similarity = toFloat(co_occurrence) / 100.0,
-                r2.co_occurrence = co_occurrence
-            
-            RETURN count(DISTINCT r) as relationships_created
-            """
-            
-            result = session.run(query)
+            result = session.run(SIMILAR_TO_QUERY)
             count = result.single()['relationships_created']
             logger.info(f"✅ Created {count} SIMILAR_TO relationships between styles")
             return count
@@ -205,39 +474,268 @@ class RecommendationBuilder:
                 logger.warning(f"\n⚠️  Warning: {isolated} products have no recommendations")
                 logger.info("Consider relaxing matching criteria or adding more diverse styles")
     
-    def run_full_build(self):
+    def database_now(self) -> str:
+        """資料庫目前時間（ISO 字串），作為 watermark 避免本機與資料庫時鐘不同步"""
+        with self.driver.session() as session:
+            return session.run("RETURN toString(datetime()) as now").single()['now']
+    
+    def run_full_build(self, partitioned: bool = False, sparse: bool = False,
+                       top_k: int = None, batch_size: int = 5000,
+                       inspired_top_k: int = None, inspired_candidates: int = 50):
         """執行完整的推薦關係建立流程"""
         logger.info("🚀 Starting recommendation relationship building...\n")
         
         try:
-            logger.info("1️⃣ Building style-based product recommendations...")
-            self.build_style_based_recommendations(min_common_styles=1)
-            
-            logger.info("\n2️⃣ Building complete outfit recommendations (top + bottom)...")
-            self.build_complete_outfit_recommendations()
-            
-            logger.info("\n3️⃣ Building post-inspired relationships...")
-            self.build_post_inspired_relationships()
-            
-            logger.info("\n4️⃣ Creating style similarity graph...")
-            self.create_style_similarity_graph()
+            started_at = self.database_now()
+            if sparse:
+                self.build_all_sparse(top_k=top_k, batch_size=batch_size,
+                                      inspired_top_k=inspired_top_k, inspired_candidates=inspired_candidates)
+            else:
+                logger.info("1️⃣ Building style-based product recommendations...")
+                if partitioned:
+                    # 上下身搭配也改為 top-k，舊的全配對關係先刪除
+                    self.delete_outfit_recommendations(batch_size)
+                    self.build_style_based_recommendations_partitioned(top_k=top_k or 20, batch_size=batch_size)
+                else:
+                    self.build_style_based_recommendations(min_common_styles=1)
+                
+                logger.info("\n2️⃣ Building complete outfit recommendations (top + bottom)...")
+                if partitioned:
+                    self.build_complete_outfit_recommendations_partitioned(top_k=top_k or 20, batch_size=batch_size)
+                else:
+                    self.build_complete_outfit_recommendations()
+                
+                logger.info("\n3️⃣ Building post-inspired relationships...")
+                if inspired_top_k:
+                    self.build_post_inspired_relationships_ranked(inspired_top_k, inspired_candidates)
+                else:
+                    self.build_post_inspired_relationships()
+                
+                logger.info("\n4️⃣ Creating style similarity graph...")
+                self.create_style_similarity_graph()
             
             logger.info("\n5️⃣ Analyzing recommendation network...")
             self.analyze_and_report()
             
+            logger.info("\n6️⃣ Indexing style co-occurrence for incremental updates...")
+            index_style_co_occurrence(self.driver, self.export_products(), self.export_posts(), batch_size)
+            set_relationships_watermark(self.driver, started_at)
+            # 增量維護依上次完整建立的 top-k 決定重算方式
+            set_relationships_config(
+                self.driver,
+                goes_with_top_k=top_k if sparse else (top_k or 20 if partitioned else None),
+                post_inspired_top_k=top_k if sparse and not inspired_top_k else None,
+                inspired_top_k=inspired_top_k
+            )
+            
             logger.info("\n✅ Recommendation relationship building completed!")
+            bump_catalog_version(self.driver, "build_relationships")
             
         except Exception as e:
             logger.error(f"\n❌ Error during build: {e}")
             raise
         finally:
             self.close()
+    
+    def run_incremental_build(self, product_ids: List[str] = None, post_ids: List[str] = None,
+                              since: str = None, inspired_top_k: int = None, inspired_candidates: int = 50,
+                              deleted_product_ids: List[str] = None, deleted_post_ids: List[str] = None):
+        """
+        只重算變更的商品 / 貼文相關的關係
+        未指定 id 時，取 updated_at 晚於 since（預設為上次建立的 watermark）的節點，完成後推進 watermark
+        top-k 沿用上次完整建立的設定；inspired_top_k 指定時覆蓋記錄的值
+        deleted_product_ids / deleted_post_ids 的節點在更新關係時一併刪除
+        """
+        try:
+            watermark = get_relationships_watermark(self.driver)
+            if watermark is None:
+                logger.error("❌ No relationships watermark found, run a full build first")
+                return
+            
+            started_at = self.database_now()
+            explicit = product_ids is not None or post_ids is not None
+            if not explicit:
+                since = since or watermark
+                product_ids, post_ids = changed_since(self.driver, since)
+                logger.info(f"🔍 Changes since {since}: {len(product_ids)} products, {len(post_ids)} posts")
+            product_ids, post_ids = product_ids or [], post_ids or []
+            deleted_product_ids, deleted_post_ids = deleted_product_ids or [], deleted_post_ids or []
+            
+            if product_ids or post_ids or deleted_product_ids or deleted_post_ids:
+                logger.info(f"🚀 Updating relationships for {len(product_ids)} products and {len(post_ids)} posts...")
+                start = time.perf_counter()
+                config = get_relationships_config(self.driver)
+                inspired_top_k = inspired_top_k or config['inspired_top_k']
+                goes_with_top_k, post_inspired_top_k = config['goes_with_top_k'], config['post_inspired_top_k']
+                # top-k 模式需要目前的完整圖，才能判斷哪些商品 / 貼文的 top-k 受影響
+                graph = None
+                if goes_with_top_k or (post_inspired_top_k and not inspired_top_k):
+                    logger.info(f"📐 Top-k mode: GOES_WITH {goes_with_top_k}, post INSPIRED_BY {post_inspired_top_k}")
+                    graph = drop_nodes(self.load_style_graph(), deleted_product_ids, deleted_post_ids)
+                update_relationships(self.driver, product_ids, post_ids, inspired_top_k, inspired_candidates,
+                                     goes_with_top_k, post_inspired_top_k, graph,
+                                     deleted_product_ids, deleted_post_ids)
+                logger.info(f"✅ Incremental update completed in {time.perf_counter() - start:.1f}s")
+                bump_catalog_version(self.driver, "build_relationships_incremental")
+            else:
+                logger.info("✅ Nothing changed")
+            
+            # 只有依 watermark 找變更時才推進，手動指定 id 時其他變更仍待處理
+            if not explicit:
+                set_relationships_watermark(self.driver, started_at)
+        finally:
+            self.close()
+    
+    def verify(self, check_inspired_by: bool = True) -> bool:
+        """
+        與從頭完整計算的結果比對（不寫入），全部一致時回傳 True
+        top-k 的關係同分時可能選到不同的節點，無法逐條比對而略過（改用 --synthetic --incremental 驗證）
+        """
+        try:
+            config = get_relationships_config(self.driver)
+            check_goes_with = not config['goes_with_top_k']
+            check_inspired_by = (check_inspired_by and not config['inspired_top_k']
+                                 and not config['post_inspired_top_k'])
+            if not check_goes_with or not check_inspired_by:
+                logger.warning("⚠️  Skipping top-k / ranked relationships: "
+                               f"GOES_WITH {'checked' if check_goes_with else 'skipped'}, "
+                               f"INSPIRED_BY {'checked' if check_inspired_by else 'skipped'}")
+            report = verify_relationships(self.driver, self.load_style_graph(), check_inspired_by, check_goes_with)
+        finally:
+            self.close()
+        
+        return report_consistency(report)
+
+
+def report_consistency(report: Dict[str, Dict]) -> bool:
+    """輸出 _diff 格式的比對結果，全部一致時回傳 True"""
+    consistent = True
+    for name, diff in report.items():
+        ok = diff['missing'] == 0 and diff['extra'] == 0 and diff['mismatched'] == 0
+        consistent = consistent and ok
+        logger.info(f"  {'✅' if ok else '❌'} {name}: {diff['stored']} stored / {diff['expected']} expected, "
+                    f"{diff['missing']} missing, {diff['extra']} extra, {diff['mismatched']} mismatched")
+    return consistent
+
+
+def run_partitioned_engine(catalog: ProductCatalog, top_k: int, min_common_styles: int = 1):
+    """執行分區計算並輸出每個分區的邊數與耗時"""
+    start = time.perf_counter()
+    table, partitions = build_topk(catalog, k=top_k, min_common_styles=min_common_styles)
+    
+    for stats in partitions:
+        logger.info(f"  - {stats['style']} | {' × '.join(stats['categories'])} "
+                    f"({stats['products'][0]} × {stats['products'][1]}): "
+                    f"{stats['candidate_pairs']} candidates, {stats['edges']} edges kept, "
+                    f"{stats['elapsed_s'] * 1000:.0f}ms")
+    
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info(f"📊 {len(partitions)} partitions, {table.edge_count()} edges for {len(catalog)} products "
+                f"in {time.perf_counter() - start:.1f}s "
+                f"(top-k table {table.nbytes() / 1024 / 1024:.1f}MB, peak RSS {peak_mb:.0f}MB)")
+    return table, partitions
+
+
+def run_sparse_engine(graph: StyleGraph, top_k: int = None) -> Dict:
+    """只計算不寫入：回傳每個階段的關係數與耗時"""
+    stages = {
+        "GOES_WITH": lambda: goes_with_edges(graph, top_k=top_k),
+        "top-bottom GOES_WITH": lambda: outfit_edges(graph, top_k=top_k),
+        "INSPIRED_BY": lambda: inspired_by_edges(graph, top_k=top_k),
+        "SIMILAR_TO": lambda: [style_similarity_edges(graph)],
+    }
+    report = {}
+    for name, stage in stages.items():
+        start = time.perf_counter()
+        count = sum(len(batch) for batch in stage())
+        report[name] = {"relationships": count, "elapsed_s": time.perf_counter() - start}
+        logger.info(f"  - {name}: {count} relationships in {report[name]['elapsed_s']:.2f}s")
+    return report
+
 
+def run_incremental_check(n_products: int, goes_with_top_k: int = None, post_inspired_top_k: int = None,
+                          seed: int = 0) -> bool:
+    """
+    不連資料庫驗證增量維護：在合成圖上模擬一次資料更新，比對增量維護與完整重建的結果
+    類別 0 / 1 命名為上衣 / 下身，讓上下身搭配也納入比對；變更包含修改、新增與刪除的節點
+    """
+    graph = synthetic_graph(n_products, seed=seed)
+    graph.catalog.category_names[:2] = ['上衣', '下身']
+    new_graph, product_ids, post_ids = synthetic_changes(graph, max(1, n_products // 50), max(1, n_products // 100),
+                                                         max(1, n_products // 100), seed=seed + 1)
+    logger.info(f"🧪 Incremental check: {len(product_ids)} changed products, {len(post_ids)} changed posts "
+                f"(GOES_WITH top-k {goes_with_top_k}, post INSPIRED_BY top-k {post_inspired_top_k})")
+    start = time.perf_counter()
+    report = simulate_incremental(graph, new_graph, product_ids, post_ids, goes_with_top_k, post_inspired_top_k)
+    logger.info(f"⏱️  Simulated in {time.perf_counter() - start:.1f}s")
+    return report_consistency(report)
 
-def main():
+
+def main(partitioned: bool = False, sparse: bool = False, top_k: int = None,
+         batch_size: int = 5000, synthetic: int = None, incremental: bool = False,
+         product_ids: List[str] = None, post_ids: List[str] = None, since: str = None,
+         verify: bool = False, inspired_top_k: int = None, inspired_candidates: int = 50,
+         deleted_product_ids: List[str] = None, deleted_post_ids: List[str] = None):
+    if synthetic:
+        # 只在記憶體中計算，不寫入 Neo4j
+        logger.info(f"🧪 Dry run on a synthetic catalog of {synthetic} products")
+        if incremental:
+            # 與完整建立相同的 top-k 規則：--partitioned 只限制 GOES_WITH，--sparse 兩者都限制
+            goes_with_top_k = top_k if sparse else (top_k or 20 if partitioned else None)
+            if not run_incremental_check(synthetic, goes_with_top_k, top_k if sparse else None):
+                sys.exit(1)
+        elif sparse:
+            run_sparse_engine(synthetic_graph(synthetic), top_k)
+        else:
+            run_partitioned_engine(synthetic_catalog(synthetic), top_k or 20)
+        return
+    
     builder = RecommendationBuilder()
-    builder.run_full_build()
+    if verify:
+        if not builder.verify(check_inspired_by=not inspired_top_k):
+            sys.exit(1)
+    elif incremental:
+        builder.run_incremental_build(product_ids, post_ids, since, inspired_top_k, inspired_candidates,
+                                      deleted_product_ids, deleted_post_ids)
+    else:
+        builder.run_full_build(partitioned=partitioned, sparse=sparse, top_k=top_k, batch_size=batch_size,
+                               inspired_top_k=inspired_top_k, inspired_candidates=inspired_candidates)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Build product recommendation relationships')
+    parser.add_argument('--partitioned', action='store_true',
+                      help='Build style-based GOES_WITH per (category pair, style) partition with top-k pruning')
+    parser.add_argument('--sparse', action='store_true',
+                      help='Compute all stages offline with the SciPy sparse engine and write back in UNWIND batches')
+    parser.add_argument('--top_k', type=int, default=None,
+                      help='Partners kept per product / post (partitioned default: 20; sparse default: keep all, same as Cypher)')
+    parser.add_argument('--batch_size', type=int, default=5000,
+                      help='Relationships written per transaction in partitioned / sparse mode (default: 5000)')
+    parser.add_argument('--synthetic', type=int, default=None,
+                      help='Dry run the partitioned (or --sparse) engine on N synthetic products without touching Neo4j; '
+                           'with --incremental, check incremental updates against a full rebuild (exit 1 on mismatch)')
+    
+    parser.add_argument('--incremental', action='store_true',
+                      help='Only recompute relationships of changed products / posts (default: changed since the last build)')
+    parser.add_argument('--product_ids', nargs='+', default=None,
+                      help='Changed product ids for --incremental')
+    parser.add_argument('--post_ids', nargs='+', default=None,
+                      help='Changed post ids for --incremental')
+    parser.add_argument('--deleted_product_ids', nargs='+', default=None,
+                      help='Product ids to delete (with their relationships) during --incremental')
+    parser.add_argument('--deleted_post_ids', nargs='+', default=None,
+                      help='Post ids to delete (with their relationships) during --incremental')
+    parser.add_argument('--since', default=None,
+                      help='ISO datetime for --incremental (default: stored watermark of the last build)')
+    parser.add_argument('--verify', action='store_true',
+                      help='Compare stored relationships with a from-scratch computation without writing (exit 1 on mismatch)')
+    parser.add_argument('--inspired_top_k', type=int, default=None,
+                      help='Keep only the K most image-similar style-sharing posts per product as INSPIRED_BY')
+    parser.add_argument('--inspired_candidates', type=int, default=50,
+                      help='Posts fetched from post_image_index per product before style filtering (default: 50)')
+    
+    args = parser.parse_args()
+    main(args.partitioned, args.sparse, args.top_k, args.batch_size, args.synthetic,
+         args.incremental, args.product_ids, args.post_ids, args.since, args.verify,
+         args.inspired_top_k, args.inspired_candidates, args.deleted_product_ids, args.deleted_post_ids)
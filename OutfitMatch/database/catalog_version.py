@@ -0,0 +1,84 @@
+"""
+Catalog Version
+以單一 (:CatalogVersion) 節點記錄商品目錄版本與推薦關係的建立時間點，
+loader 與 build_relationships 寫入後遞增，查詢端用它讓結果快取失效
+"""
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def bump_catalog_version(driver, source: str) -> int:
+    """目錄內容變更後呼叫，回傳新版本號"""
+    with driver.session() as session:
+        record = session.run("""
+            MERGE (v:CatalogVersion {id: 'catalog'})
+            SET v.version = coalesce(v.version, 0) + 1,
+                v.source = $source,
+                v.updated_at = datetime()
+            RETURN v.version as version
+        """, source=source).single()
+    logger.info(f"🏷️  Catalog version bumped to {record['version']} by {source}")
+    return record['version']
+
+
+def get_catalog_version(driver) -> int:
+    """目前的目錄版本（尚未建立時為 0）"""
+    with driver.session() as session:
+        record = session.run("""
+            MATCH (v:CatalogVersion {id: 'catalog'})
+            RETURN v.version as version
+        """).single()
+    return record['version'] if record else 0
+
+
+def get_relationships_watermark(driver):
+    """上次完整 / 增量建立推薦關係時的資料時間點（ISO 字串，尚未建立時為 None）"""
+    with driver.session() as session:
+        record = session.run("""
+            MATCH (v:CatalogVersion {id: 'catalog'})
+            RETURN toString(v.relationships_built_at) as watermark
+        """).single()
+    return record['watermark'] if record else None
+
+
+def set_relationships_watermark(driver, watermark: str):
+    """watermark 為建立開始時的資料庫時間；之後 updated_at 較新的節點視為已變更"""
+    with driver.session() as session:
+        session.run("""
+            MERGE (v:CatalogVersion {id: 'catalog'})
+            SET v.relationships_built_at = datetime($watermark)
+        """, watermark=watermark)
+    logger.info(f"🏷️  Relationships watermark set to {watermark}")
+
+
+def get_relationships_config(driver) -> Dict[str, Optional[int]]:
+    """上次完整建立的 top-k 設定（None 表示保留全部關係），增量維護依此決定重算方式"""
+    with driver.session() as session:
+        record = session.run("""
+            MATCH (v:CatalogVersion {id: 'catalog'})
+            RETURN v.goes_with_top_k as goes_with_top_k,
+                   v.post_inspired_top_k as post_inspired_top_k,
+                   v.inspired_top_k as inspired_top_k
+        """).single()
+    return record.data() if record else {"goes_with_top_k": None, "post_inspired_top_k": None, "inspired_top_k": None}
+
+
+def set_relationships_config(driver, goes_with_top_k: Optional[int] = None,
+                             post_inspired_top_k: Optional[int] = None, inspired_top_k: Optional[int] = None):
+    """
+    goes_with_top_k：每個商品保留的 GOES_WITH 數（--partitioned / --sparse --top_k）
+    post_inspired_top_k：每篇貼文保留的 INSPIRED_BY 數（--sparse --top_k）
+    inspired_top_k：每個商品依圖片相似度保留的 INSPIRED_BY 數（--inspired_top_k）
+    """
+    with driver.session() as session:
+        session.run("""
+            MERGE (v:CatalogVersion {id: 'catalog'})
+            SET v.goes_with_top_k = $goes_with_top_k,
+                v.post_inspired_top_k = $post_inspired_top_k,
+                v.inspired_top_k = $inspired_top_k
+        """, goes_with_top_k=goes_with_top_k, post_inspired_top_k=post_inspired_top_k,
+                    inspired_top_k=inspired_top_k)
+    logger.info(f"🏷️  Relationships config: GOES_WITH top-k {goes_with_top_k}, "
+                f"post INSPIRED_BY top-k {post_inspired_top_k}, ranked INSPIRED_BY top-k {inspired_top_k}")
@@ -0,0 +1,243 @@
+"""
+GOES_WITH Partitioned Build Engine
+以 (類別組合, 風格) 分區計算商品搭配分數，每個商品只保留 score 最高的 top-k 個搭配：
+- 每個分區再切成固定大小的 block 用 numpy 計算，記憶體與 catalog 大小呈線性（n × k）而非 n²
+- 一組商品共同擁有多個風格時，只在編號最小的共同風格分區計算一次
+- score 與 build_style_based_recommendations 相同：共同風格數 / (價差 / 1000 + 1)
+"""
+import time
+import logging
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ProductCatalog:
+    """
+    ids: 商品 id
+    prices: (n,) float32
+    categories: (n,) 類別編號（對應 category_names）
+    styles: (n, S) bool，multi-hot（對應 style_names）
+    """
+
+    def __init__(self, ids: List[str], prices, categories, styles,
+                 category_names: List[str], style_names: List[str]):
+        self.ids = list(ids)
+        self.prices = np.asarray(prices, dtype=np.float32)
+        self.categories = np.asarray(categories, dtype=np.int32)
+        self.styles = np.asarray(styles, dtype=bool)
+        self.category_names = list(category_names)
+        self.style_names = list(style_names)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_records(cls, records: List[Dict], style_names: List[str] = None) -> "ProductCatalog":
+        """records: [{'id', 'price', 'category', 'styles'}]，來自 Neo4j；style_names 可指定風格編號"""
+        category_names = sorted({r['category'] for r in records if r['category'] is not None})
+        if style_names is None:
+            style_names = sorted({s for r in records for s in (r['styles'] or [])})
+        category_index = {name: i for i, name in enumerate(category_names)}
+        style_index = {name: i for i, name in enumerate(style_names)}
+
+        styles = np.zeros((len(records), len(style_names)), dtype=bool)
+        for row, record in enumerate(records):
+            for style in record['styles'] or []:
+                styles[row, style_index[style]] = True
+
+        return cls(
+            ids=[r['id'] for r in records],
+            prices=[r['price'] if r['price'] is not None else np.nan for r in records],
+            categories=[category_index.get(r['category'], -1) for r in records],
+            styles=styles,
+            category_names=category_names,
+            style_names=style_names
+        )
+
+
+def synthetic_catalog(n: int, n_styles: int = 12, n_categories: int = 6,
+                      max_styles_per_product: int = 3, seed: int = 0) -> ProductCatalog:
+    """產生測試用的商品目錄（價格 100–6000，每個商品 1–max_styles_per_product 個風格）"""
+    rng = np.random.default_rng(seed)
+    styles = np.zeros((n, n_styles), dtype=bool)
+    counts = rng.integers(1, max_styles_per_product + 1, size=n)
+    for k in range(1, max_styles_per_product + 1):
+        rows = np.nonzero(counts == k)[0]
+        # 每列隨機挑 k 個不重複的風格
+        picks = np.argsort(rng.random((len(rows), n_styles)), axis=1)[:, :k]
+        styles[rows[:, None], picks] = True
+
+    return ProductCatalog(
+        ids=[f"synthetic-{i}" for i in range(n)],
+        prices=rng.uniform(100, 6000, size=n).round(),
+        categories=rng.integers(0, n_categories, size=n),
+        styles=styles,
+        category_names=[f"category-{i}" for i in range(n_categories)],
+        style_names=[f"style-{i}" for i in range(n_styles)]
+    )
+
+
+class TopKTable:
+    """每個商品保留 score 最高的 k 個搭配；partner = -1 表示空位"""
+
+    def __init__(self, n: int, k: int):
+        self.k = k
+        self.partners = np.full((n, k), -1, dtype=np.int64)
+        self.scores = np.full((n, k), -np.inf, dtype=np.float32)
+        self.partitions = np.full((n, k), -1, dtype=np.int32)
+
+    def merge(self, rows, partners, scores, partition: int):
+        """rows: (m,) 商品編號；partners / scores: (m, c) 候選搭配"""
+        all_partners = np.concatenate([self.partners[rows], partners], axis=1)
+        all_scores = np.concatenate([self.scores[rows], scores], axis=1)
+        all_partitions = np.concatenate(
+            [self.partitions[rows], np.full(partners.shape, partition, dtype=np.int32)], axis=1)
+
+        keep = np.argpartition(-all_scores, self.k - 1, axis=1)[:, :self.k]
+        self.partners[rows] = np.take_along_axis(all_partners, keep, axis=1)
+        self.scores[rows] = np.take_along_axis(all_scores, keep, axis=1)
+        self.partitions[rows] = np.take_along_axis(all_partitions, keep, axis=1)
+
+    def edge_count(self) -> int:
+        return int(np.isfinite(self.scores).sum())
+
+    def nbytes(self) -> int:
+        return self.partners.nbytes + self.scores.nbytes + self.partitions.nbytes
+
+
+def iter_partitions(catalog: ProductCatalog) -> Iterator[Tuple[int, int, int, np.ndarray, np.ndarray]]:
+    """依 (風格, 類別 a < 類別 b) 產生 (style, cat_a, cat_b, a 的商品編號, b 的商品編號)"""
+    n_categories = len(catalog.category_names)
+    for style in range(len(catalog.style_names)):
+        members = np.nonzero(catalog.styles[:, style] & (catalog.categories >= 0))[0]
+        by_category = [members[catalog.categories[members] == c] for c in range(n_categories)]
+        for cat_a in range(n_categories):
+            for cat_b in range(cat_a + 1, n_categories):
+                if len(by_category[cat_a]) and len(by_category[cat_b]):
+                    yield style, cat_a, cat_b, by_category[cat_a], by_category[cat_b]
+
+
+def _block_candidates(catalog: ProductCatalog, a_rows, b_rows, style: int,
+                      min_common_styles: int, max_price_diff: float):
+    """a_rows × b_rows 的分數矩陣；不成立的組合為 -inf"""
+    sa = catalog.styles[a_rows].astype(np.float32)
+    sb = catalog.styles[b_rows].astype(np.float32)
+    common = sa @ sb.T
+    # 在更小編號的風格分區已經算過的組合不重複計算
+    earlier = sa[:, :style] @ sb[:, :style].T if style else np.zeros_like(common)
+    diff = np.abs(catalog.prices[a_rows][:, None] - catalog.prices[b_rows][None, :])
+
+    valid = (earlier == 0) & (common >= min_common_styles) & (diff < max_price_diff)
+    scores = np.where(valid, common / (diff / 1000.0 + 1.0), -np.inf).astype(np.float32)
+    return scores, int(valid.sum())
+
+
+def _top_candidates(scores, k: int):
+    """每列取分數最高的 k 個欄位，回傳 (欄位編號, 分數)"""
+    k = min(k, scores.shape[1])
+    cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return cols, np.take_along_axis(scores, cols, axis=1)
+
+
+def build_topk(catalog: ProductCatalog, k: int = 20, min_common_styles: int = 1,
+               max_price_diff: float = 5000.0, block_cells: int = 4_000_000):
+    """
+    計算每個商品的 top-k 搭配
+    回傳 (TopKTable, partitions)，partitions 為每個分區的統計：
+    style / categories / products / candidate_pairs / elapsed_s / edges（最後留在 top-k 的邊數）
+    """
+    table = TopKTable(len(catalog), k)
+    partitions = []
+
+    for partition, (style, cat_a, cat_b, a_members, b_members) in enumerate(iter_partitions(catalog)):
+        start = time.perf_counter()
+        candidate_pairs = 0
+        rows_per_block = max(1, block_cells // len(b_members))
+
+        for i in range(0, len(a_members), rows_per_block):
+            a_rows = a_members[i:i + rows_per_block]
+            scores, valid = _block_candidates(catalog, a_rows, b_members, style,
+                                              min_common_styles, max_price_diff)
+            if not valid:
+                continue
+            candidate_pairs += valid
+
+            # a → b：a 的每一列取 top-k
+            cols, top_scores = _top_candidates(scores, k)
+            table.merge(a_rows, b_members[cols], top_scores, partition)
+
+            # b → a：對轉置後的矩陣取 top-k，跨 block 的結果由 merge 累積
+            cols, top_scores = _top_candidates(scores.T, k)
+            table.merge(b_members, a_rows[cols], top_scores, partition)
+
+        partitions.append({
+            "style": catalog.style_names[style],
+            "categories": [catalog.category_names[cat_a], catalog.category_names[cat_b]],
+            "products": [len(a_members), len(b_members)],
+            "candidate_pairs": candidate_pairs,
+            "elapsed_s": time.perf_counter() - start,
+        })
+
+    # 每個分區最後留下的邊數
+    kept = np.bincount(table.partitions[np.isfinite(table.scores)], minlength=len(partitions))
+    for partition, stats in enumerate(partitions):
+        stats["edges"] = int(kept[partition])
+
+    return table, partitions
+
+
+def _row_scores(catalog: ProductCatalog, rows, min_common_styles: int, max_price_diff: float):
+    """rows × 全部商品的分數矩陣（語意同 _block_candidates，不分風格分區）；不成立的組合為 -inf"""
+    common = catalog.styles[rows].astype(np.float32) @ catalog.styles.T.astype(np.float32)
+    diff = np.abs(catalog.prices[rows][:, None] - catalog.prices[None, :])
+    row_categories = catalog.categories[rows][:, None]
+    valid = ((row_categories >= 0) & (catalog.categories[None, :] >= 0)
+             & (row_categories != catalog.categories[None, :])
+             & (common >= max(min_common_styles, 1)) & (diff < max_price_diff))
+    return np.where(valid, common / (diff / 1000.0 + 1.0), -np.inf).astype(np.float32)
+
+
+def build_topk_rows(catalog: ProductCatalog, rows, k: int = 20, min_common_styles: int = 1,
+                    max_price_diff: float = 5000.0, block_cells: int = 4_000_000) -> TopKTable:
+    """只計算指定商品（增量維護時變更與受影響的商品）的 top-k，分數與 build_topk 相同，其餘列為空"""
+    table = TopKTable(len(catalog), k)
+    rows = np.asarray(rows, dtype=np.int64)
+    block_rows = max(1, block_cells // max(len(catalog), 1))
+    for i in range(0, len(rows), block_rows):
+        block = rows[i:i + block_rows]
+        cols, top_scores = _top_candidates(_row_scores(catalog, block, min_common_styles, max_price_diff), k)
+        table.merge(block, cols, top_scores, -1)
+    return table
+
+
+def partner_mask(catalog: ProductCatalog, rows, min_common_styles: int = 1, max_price_diff: float = 5000.0,
+                 block_cells: int = 4_000_000) -> np.ndarray:
+    """(n,) bool：與 rows 中任一商品的搭配成立（分數可能進入 top-k）的商品"""
+    mask = np.zeros(len(catalog), dtype=bool)
+    rows = np.asarray(rows, dtype=np.int64)
+    block_rows = max(1, block_cells // max(len(catalog), 1))
+    for i in range(0, len(rows), block_rows):
+        mask |= np.isfinite(_row_scores(catalog, rows[i:i + block_rows], min_common_styles, max_price_diff)).any(axis=0)
+    return mask
+
+
+def iter_edge_batches(catalog: ProductCatalog, table: TopKTable, batch_size: int = 5000) -> Iterator[List[Dict]]:
+    """把 top-k 表轉成寫入 Neo4j 用的 rows，每批最多 batch_size 筆"""
+    src, slot = np.nonzero(np.isfinite(table.scores))
+    for i in range(0, len(src), batch_size):
+        rows_src = src[i:i + batch_size]
+        rows_dst = table.partners[rows_src, slot[i:i + batch_size]]
+        rows_score = table.scores[rows_src, slot[i:i + batch_size]]
+        common = catalog.styles[rows_src] & catalog.styles[rows_dst]
+        yield [
+            {
+                "src": catalog.ids[s],
+                "dst": catalog.ids[d],
+                "score": float(score),
+                "style_match": float(shared.sum()),
+                "common_styles": [catalog.style_names[j] for j in np.nonzero(shared)[0]],
+            }
+            for s, d, score, shared in zip(rows_src, rows_dst, rows_score, common)
+        ]
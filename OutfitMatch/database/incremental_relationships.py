@@ -0,0 +1,701 @@
+"""
+Incremental Relationship Maintenance
+只針對新增 / 變更的商品與貼文重算推薦關係，不必每次 run_full_build：
+- GOES_WITH / INSPIRED_BY 只取決於兩端節點，刪掉變更節點的舊關係後，以變更節點為起點重跑同樣的 Cypher 條件
+- 上次完整建立使用 top-k（--partitioned / --sparse --top_k，記錄在 CatalogVersion）時，
+  變更商品也可能擠進 / 退出其他商品（貼文）的 top-k：以 goes_with_topk_plan / inspired_by_topk_plan
+  在記憶體中找出新舊 top-k 含有變更節點的商品（貼文），只重寫這些節點的 top-k
+- SIMILAR_TO 由 (:Style)-[:CO_OCCURS {count}]->(:Style) 的共現次數決定；
+  每個節點記錄上次計入的風格（indexed_styles），變更時只對新舊風格組合的差異加減次數
+- 刪除的節點（deleted_product_ids / deleted_post_ids）先以舊關係找出受影響的節點、扣掉計入的共現次數，
+  再 DETACH DELETE，其餘與變更節點相同
+完整建立後的結果可用 verify_relationships 與稀疏矩陣引擎的全量計算比對；
+simulate_incremental 不連資料庫，在合成圖上比對增量維護與完整重建的結果
+"""
+import logging
+from collections import Counter, defaultdict
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from database.goes_with_engine import ProductCatalog, build_topk_rows, partner_mask, iter_edge_batches
+from database.sparse_engine import StyleGraph, goes_with_edges, outfit_edges, inspired_by_edges, style_similarity_edges
+from database.inspired_by_ranking import rank_inspired_by, products_affected_by_posts
+
+logger = logging.getLogger(__name__)
+
+# 每個交易處理的變更節點數
+IDS_BATCH_SIZE = 500
+# top-k 模式在記憶體中算好的關係，每個交易寫入的筆數
+WRITE_BATCH_SIZE = 5000
+
+# SIMILAR_TO 的共現次數門檻（與 create_style_similarity_graph 相同）
+MIN_CO_OCCURRENCE = 5
+
+DELETE_GOES_WITH_QUERY = """
+UNWIND $ids as id
+MATCH (:Product {id: id})-[r:GOES_WITH]-(:Product)
+WITH DISTINCT r
+DELETE r
+RETURN count(r) as count
+"""
+
+DELETE_INSPIRED_BY_QUERY = """
+UNWIND $ids as id
+MATCH (:{label} {{id: id}})-[r:INSPIRED_BY]-()
+WITH DISTINCT r
+DELETE r
+RETURN count(r) as count
+"""
+
+# top-k 模式：目前有 GOES_WITH 指向變更商品的商品（舊的 top-k 含有變更商品）
+GOES_WITH_SOURCES_QUERY = """
+UNWIND $ids as id
+MATCH (q:Product)-[:GOES_WITH]->(:Product {id: id})
+RETURN collect(DISTINCT q.id) as ids
+"""
+
+# top-k 模式：重寫的商品只刪除自己發出的 GOES_WITH（指向它的關係屬於其他商品的 top-k）
+DELETE_OUTGOING_GOES_WITH_QUERY = """
+UNWIND $ids as id
+MATCH (:Product {id: id})-[r:GOES_WITH]->(:Product)
+DELETE r
+RETURN count(r) as count
+"""
+
+# 每篇貼文 top-k 模式：目前連到變更商品的貼文
+INSPIRED_BY_POSTS_QUERY = """
+UNWIND $ids as id
+MATCH (:Product {id: id})-[:INSPIRED_BY]->(post:Post)
+RETURN collect(DISTINCT post.id) as ids
+"""
+
+# build_style_based_recommendations，以變更商品為起點；兩端都變更時只由 id 較小的一端建立
+STYLE_BASED_QUERY = """
+MATCH (p1:Product)
+WHERE p1.id IN $ids
+MATCH (p1)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(p2:Product)
+MATCH (p1)-[:IN_CATEGORY]->(c1:Category)
+MATCH (p2)-[:IN_CATEGORY]->(c2:Category)
+
+WHERE p1 <> p2
+  AND NOT (p2.id IN $ids AND p2.id < p1.id)
+  AND c1.name <> c2.name
+  AND abs(p1.price - p2.price) < 5000
+
+WITH p1, p2,
+     collect(DISTINCT s.name) as common_styles,
+     count(DISTINCT s) as style_match_count
+
+WHERE style_match_count >= 1
+
+MERGE (p1)-[r1:GOES_WITH]->(p2)
+SET r1.style_match = toFloat(style_match_count),
+    r1.common_styles = common_styles,
+    r1.score = toFloat(style_match_count) /
+              (abs(p1.price - p2.price) / 1000.0 + 1.0),
+    r1.created_at = datetime()
+
+MERGE (p2)-[r2:GOES_WITH]->(p1)
+SET r2.style_match = toFloat(style_match_count),
+    r2.common_styles = common_styles,
+    r2.score = toFloat(style_match_count) /
+              (abs(p1.price - p2.price) / 1000.0 + 1.0),
+    r2.created_at = datetime()
+
+RETURN count(DISTINCT r1) as count
+"""
+
+# build_complete_outfit_recommendations，變更商品可能是上衣或下身
+OUTFIT_QUERY = """
+MATCH (p:Product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(q:Product)
+WHERE p.id IN $ids
+MATCH (p)-[:IN_CATEGORY]->(cp:Category)
+MATCH (q)-[:IN_CATEGORY]->(cq:Category)
+WHERE (cp.name = '上衣' AND cq.name = '下身') OR (cp.name = '下身' AND cq.name = '上衣')
+
+WITH CASE WHEN cp.name = '上衣' THEN p ELSE q END as top,
+     CASE WHEN cp.name = '上衣' THEN q ELSE p END as bottom,
+     s
+WHERE abs(top.price - bottom.price) < 3000
+
+WITH top, bottom, collect(DISTINCT s.name) as styles
+WHERE size(styles) >= 1
+
+MERGE (top)-[r:GOES_WITH]->(bottom)
+SET r.outfit_type = 'top_bottom',
+    r.common_styles = styles,
+    r.score = toFloat(size(styles)) * 1.5
+
+RETURN count(r) as count
+"""
+
+# build_post_inspired_relationships，分別以變更商品 / 變更貼文為起點
+INSPIRED_BY_QUERY = """
+MATCH (post:Post)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(product:Product)
+WHERE {anchor}.id IN $ids
+
+WITH post, product,
+     collect(DISTINCT s.name) as common_styles,
+     count(DISTINCT s) as style_count
+
+WHERE style_count >= 1
+
+MERGE (product)-[r:INSPIRED_BY]->(post)
+SET r.common_styles = common_styles,
+    r.similarity = toFloat(style_count) / 3.0,
+    r.created_at = datetime()
+
+RETURN count(r) as count
+"""
+
+NODE_STYLES_QUERY = """
+UNWIND $ids as id
+MATCH (n:{label} {{id: id}})
+OPTIONAL MATCH (n)-[:HAS_STYLE]->(s:Style)
+RETURN n.id as id, n.indexed_styles as indexed_styles, collect(DISTINCT s.name) as styles
+"""
+
+SET_INDEXED_STYLES_QUERY = """
+UNWIND $rows as row
+MATCH (n:{label} {{id: row.id}})
+SET n.indexed_styles = row.styles
+"""
+
+APPLY_CO_OCCURRENCE_DELTA_QUERY = """
+UNWIND $rows as row
+MATCH (s1:Style {name: row.a})
+MATCH (s2:Style {name: row.b})
+MERGE (s1)-[c:CO_OCCURS]->(s2)
+SET c.count = coalesce(c.count, 0) + row.delta
+"""
+
+# 依最新的共現次數同步 SIMILAR_TO（兩個方向），次數歸零的 CO_OCCURS 一併刪除
+SYNC_SIMILAR_TO_QUERY = """
+UNWIND $pairs as pair
+MATCH (s1:Style {name: pair[0]})
+MATCH (s2:Style {name: pair[1]})
+OPTIONAL MATCH (s1)-[c:CO_OCCURS]->(s2)
+OPTIONAL MATCH (s1)-[old:SIMILAR_TO]-(s2)
+DELETE old
+WITH DISTINCT s1, s2, c, coalesce(c.count, 0) as co_occurrence
+FOREACH (_ IN CASE WHEN co_occurrence >= $min_co_occurrence THEN [1] ELSE [] END |
+    MERGE (s1)-[r1:SIMILAR_TO]->(s2)
+    SET r1.similarity = toFloat(co_occurrence) / 100.0,
+        r1.co_occurrence = co_occurrence
+    MERGE (s2)-[r2:SIMILAR_TO]->(s1)
+    SET r2.similarity = toFloat(co_occurrence) / 100.0,
+        r2.co_occurrence = co_occurrence
+)
+FOREACH (_ IN CASE WHEN c IS NOT NULL AND co_occurrence <= 0 THEN [1] ELSE [] END | DELETE c)
+"""
+
+# 刪除節點：扣掉共現次數後與所有關係一併刪除
+DELETE_NODES_QUERY = """
+UNWIND $ids as id
+MATCH (n:{label} {{id: id}})
+DETACH DELETE n
+"""
+
+CHANGED_SINCE_QUERY = """
+MATCH (n:{label})
+WHERE n.updated_at > datetime($since)
+RETURN collect(n.id) as ids
+"""
+
+
+def _chunks(ids: List[str], size: int = IDS_BATCH_SIZE) -> Iterable[List[str]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _style_pairs(styles: Iterable[str]) -> Set[Tuple[str, str]]:
+    """同一節點上的風格組合（名稱小的在前，與 create_style_similarity_graph 的 s1.name < s2.name 一致）"""
+    return set(combinations(sorted(set(styles)), 2))
+
+
+def style_pair_delta(records: List[Dict]) -> Counter:
+    """records: [{'indexed_styles': 上次計入的風格, 'styles': 目前的風格}] -> 每個風格組合的共現次數變化"""
+    delta = Counter()
+    for record in records:
+        old_pairs = _style_pairs(record['indexed_styles'] or [])
+        new_pairs = _style_pairs(record['styles'] or [])
+        for pair in new_pairs - old_pairs:
+            delta[pair] += 1
+        for pair in old_pairs - new_pairs:
+            delta[pair] -= 1
+    return Counter({pair: d for pair, d in delta.items() if d})
+
+
+def goes_with_topk_plan(graph: StyleGraph, changed_ids: Iterable[str], old_sources: Iterable[str],
+                        top_k: int) -> Tuple[List[str], List[Dict], List[Dict]]:
+    """
+    top-k 模式下需要重寫 GOES_WITH 的商品，與它們新的 top-k 風格搭配、上下身搭配
+    只有變更商品的分數會變，其他商品的 top-k 只有在新舊 top-k 含有變更商品時才會不同，因此重寫：
+    變更商品 ∪ old_sources（目前指向變更商品的商品）∪ 新 top-k（風格或上下身）含有變更商品的商品
+    """
+    catalog = graph.catalog
+    index = {product_id: i for i, product_id in enumerate(catalog.ids)}
+    changed = np.array(sorted({index[i] for i in changed_ids if i in index}), dtype=np.int64)
+    old = np.array(sorted({index[i] for i in old_sources if i in index}), dtype=np.int64)
+    # 與變更商品的搭配成立的商品，新的 top-k 才可能含有變更商品
+    candidates = np.flatnonzero(partner_mask(catalog, changed)) if len(changed) else changed
+    rows = np.union1d(np.union1d(changed, old), candidates)
+    table = build_topk_rows(catalog, rows, top_k)
+
+    is_changed = np.zeros(len(catalog), dtype=bool)
+    is_changed[changed] = True
+    partners = table.partners[rows]
+    to_changed = ((partners >= 0) & is_changed[np.maximum(partners, 0)]).any(axis=1)
+    # 上下身搭配成立的組合必定也是風格搭配的候選（共同風格 >= 1、不同類別、價差更小），rows 已涵蓋
+    changed_set = {catalog.ids[i] for i in changed}
+    outfit = [edge for batch in outfit_edges(graph, top_k=top_k, top_rows=rows) for edge in batch]
+    outfit_to_changed = {edge['src'] for edge in outfit if edge['dst'] in changed_set}
+    rewrite = rows[is_changed[rows] | to_changed | np.isin(rows, old)
+                   | np.isin([catalog.ids[i] for i in rows], list(outfit_to_changed))]
+
+    # 只輸出重寫商品的 top-k
+    skipped = np.setdiff1d(rows, rewrite)
+    table.scores[skipped] = -np.inf
+    table.partners[skipped] = -1
+    edges = [edge for batch in iter_edge_batches(catalog, table) for edge in batch]
+    rewrite_ids = [catalog.ids[i] for i in rewrite]
+    rewrite_set = set(rewrite_ids)
+    return rewrite_ids, edges, [edge for edge in outfit if edge['src'] in rewrite_set]
+
+
+def inspired_by_topk_plan(graph: StyleGraph, changed_product_ids: Iterable[str], changed_post_ids: Iterable[str],
+                          old_posts: Iterable[str], top_k: int) -> Tuple[List[str], List[Dict]]:
+    """
+    每篇貼文 top-k 模式下需要重寫 INSPIRED_BY 的貼文與它們新的 top-k 關係：
+    變更貼文 ∪ old_posts（目前連到變更商品的貼文）∪ 新 top-k 含有變更商品的貼文
+    """
+    catalog = graph.catalog
+    product_index = {product_id: i for i, product_id in enumerate(catalog.ids)}
+    post_index = {post_id: i for i, post_id in enumerate(graph.post_ids)}
+    changed_products = sorted({product_index[i] for i in changed_product_ids if i in product_index})
+    fixed = {post_index[i] for i in list(changed_post_ids) + list(old_posts) if i in post_index}
+    candidates = set()
+    if changed_products:
+        shared = graph.post_matrix @ graph.product_matrix[changed_products].T
+        candidates = set(np.flatnonzero(shared.getnnz(axis=1)).tolist())
+    rows = np.array(sorted(fixed | candidates), dtype=np.int64)
+
+    changed_set = {catalog.ids[i] for i in changed_products}
+    edges = [edge for batch in inspired_by_edges(graph, top_k=top_k, post_rows=rows) for edge in batch]
+    rewrite = {graph.post_ids[i] for i in fixed} | {edge['post'] for edge in edges if edge['product'] in changed_set}
+    return sorted(rewrite), [edge for edge in edges if edge['post'] in rewrite]
+
+
+def changed_since(driver, since: str) -> Tuple[List[str], List[str]]:
+    """updated_at 晚於 since 的商品與貼文 id"""
+    with driver.session() as session:
+        product_ids = session.run(CHANGED_SINCE_QUERY.format(label="Product"), since=since).single()['ids']
+        post_ids = session.run(CHANGED_SINCE_QUERY.format(label="Post"), since=since).single()['ids']
+    return product_ids, post_ids
+
+
+def _run_count(tx, query: str, **params) -> int:
+    return tx.run(query, **params).single()['count']
+
+
+def _apply_co_occurrence_delta(tx, label: str, ids: List[str], delete: bool = False) -> Set[Tuple[str, str]]:
+    """
+    以節點上次計入的風格與目前風格的差異更新 CO_OCCURS，回傳受影響的風格組合
+    delete=True 時視為沒有風格（扣掉上次計入的次數）並刪除節點
+    """
+    records = tx.run(NODE_STYLES_QUERY.format(label=label), ids=ids).data()
+    if delete:
+        records = [{**r, "styles": []} for r in records]
+    delta = style_pair_delta(records)
+
+    rows = [{"a": a, "b": b, "delta": d} for (a, b), d in delta.items()]
+    if rows:
+        tx.run(APPLY_CO_OCCURRENCE_DELTA_QUERY, rows=rows)
+    if delete:
+        tx.run(DELETE_NODES_QUERY.format(label=label), ids=ids)
+        return set(delta)
+    tx.run(SET_INDEXED_STYLES_QUERY.format(label=label),
+           rows=[{"id": r['id'], "styles": sorted(r['styles'])} for r in records])
+
+    missing = len(ids) - len(records)
+    if missing:
+        logger.warning(f"⚠️  {missing} {label} ids not found; pass deleted nodes as deleted ids before removing them")
+    return set(delta)
+
+
+def _sync_similar_to(tx, pairs: List[Tuple[str, str]]):
+    tx.run(SYNC_SIMILAR_TO_QUERY, pairs=[list(pair) for pair in pairs], min_co_occurrence=MIN_CO_OCCURRENCE)
+
+
+def _collect_ids(session, query: str, ids_all: List[str]) -> List[str]:
+    found = set()
+    for ids in _chunks(ids_all):
+        found |= set(session.run(query, ids=ids).single()['ids'])
+    return sorted(found)
+
+
+def _write_rows(tx, query: str, rows: List[Dict]):
+    tx.run(query, rows=rows).consume()
+
+
+def update_relationships(driver, product_ids: List[str], post_ids: List[str],
+                         inspired_top_k: int = None, inspired_candidates: int = 50,
+                         goes_with_top_k: int = None, post_inspired_top_k: int = None,
+                         graph: Optional[StyleGraph] = None, deleted_product_ids: List[str] = None,
+                         deleted_post_ids: List[str] = None) -> Dict[str, int]:
+    """
+    重算變更商品 / 貼文相關的 GOES_WITH、INSPIRED_BY，並以差異更新 SIMILAR_TO
+    inspired_top_k 指定時 INSPIRED_BY 改用圖片相似度排序（見 inspired_by_ranking），
+    變更貼文附近與目前連到它的商品也一併重新排序
+    goes_with_top_k / post_inspired_top_k 為上次完整建立的 top-k（見 get_relationships_config），
+    指定時需傳入目前的 graph，以 goes_with_topk_plan / inspired_by_topk_plan 只重寫受影響節點的 top-k
+    deleted_product_ids / deleted_post_ids 為要刪除的節點（graph 需已排除，見 drop_nodes）
+    """
+    deleted_products, deleted_posts = sorted(set(deleted_product_ids or [])), sorted(set(deleted_post_ids or []))
+    product_ids = sorted(set(product_ids) - set(deleted_products))
+    post_ids = sorted(set(post_ids) - set(deleted_posts))
+    # 刪除的節點與變更節點一樣要找出舊關係的另一端
+    all_product_ids, all_post_ids = sorted(product_ids + deleted_products), sorted(post_ids + deleted_posts)
+    counts = Counter()
+    if (goes_with_top_k or (post_inspired_top_k and not inspired_top_k)) and graph is None:
+        raise ValueError("graph is required when the relationships were built with top-k")
+    # 避免與 build_relationships 循環 import
+    from database.build_relationships import WRITE_GOES_WITH_QUERY, WRITE_OUTFIT_QUERY, WRITE_INSPIRED_BY_QUERY
+
+    with driver.session() as session:
+        ranked_product_ids = product_ids
+        if inspired_top_k:
+            ranked_product_ids = sorted((set(product_ids) | set(
+                products_affected_by_posts(session, all_post_ids, inspired_candidates))) - set(deleted_products))
+
+        # top-k 模式：先在記憶體中決定要重寫哪些節點的 top-k
+        goes_with_ids, goes_with_rows, outfit_rows = product_ids, None, None
+        if goes_with_top_k:
+            old_sources = _collect_ids(session, GOES_WITH_SOURCES_QUERY, all_product_ids)
+            rewrite_ids, goes_with_rows, outfit_rows = goes_with_topk_plan(
+                graph, all_product_ids, set(old_sources) - set(deleted_products), goes_with_top_k)
+            goes_with_ids = sorted(set(rewrite_ids) | set(product_ids))
+        inspired_post_ids, inspired_rows = post_ids, None
+        if post_inspired_top_k and not inspired_top_k:
+            old_posts = _collect_ids(session, INSPIRED_BY_POSTS_QUERY, all_product_ids)
+            rewrite_posts, inspired_rows = inspired_by_topk_plan(
+                graph, all_product_ids, post_ids, set(old_posts) - set(deleted_posts), post_inspired_top_k)
+            inspired_post_ids = sorted(set(rewrite_posts) | set(post_ids))
+
+        # 刪除的節點連同所有關係一起刪除（先扣掉它們計入的共現次數）
+        touched = set()
+        for label, ids_all in (("Product", deleted_products), ("Post", deleted_posts)):
+            for ids in _chunks(ids_all):
+                touched |= session.execute_write(_apply_co_occurrence_delta, label, ids, True)
+            counts[f"{label} deleted"] += len(ids_all)
+
+        # 先刪掉所有變更節點的舊關係，再重建（避免後面的批次刪掉前面剛建立的關係）
+        for ids in _chunks(product_ids):
+            counts["GOES_WITH deleted"] += session.execute_write(_run_count, DELETE_GOES_WITH_QUERY, ids=ids)
+        for ids in _chunks(sorted(set(goes_with_ids) - set(product_ids))):
+            counts["GOES_WITH deleted"] += session.execute_write(
+                _run_count, DELETE_OUTGOING_GOES_WITH_QUERY, ids=ids)
+        for label, ids_all in (("Product", ranked_product_ids), ("Post", inspired_post_ids)):
+            for ids in _chunks(ids_all):
+                counts["INSPIRED_BY deleted"] += session.execute_write(
+                    _run_count, DELETE_INSPIRED_BY_QUERY.format(label=label), ids=ids)
+
+        # 與完整建立相同的順序：風格搭配 → 上下身搭配（同一條 GOES_WITH 由後者覆寫 score）
+        if goes_with_rows is not None:
+            for rows in _chunks(goes_with_rows, WRITE_BATCH_SIZE):
+                session.execute_write(_write_rows, WRITE_GOES_WITH_QUERY, rows)
+            counts["GOES_WITH"] += len(goes_with_rows)
+            for rows in _chunks(outfit_rows, WRITE_BATCH_SIZE):
+                session.execute_write(_write_rows, WRITE_OUTFIT_QUERY, rows)
+            counts["top-bottom GOES_WITH"] += len(outfit_rows)
+        else:
+            for ids in _chunks(product_ids):
+                counts["GOES_WITH"] += session.execute_write(_run_count, STYLE_BASED_QUERY, ids=ids)
+            for ids in _chunks(product_ids):
+                counts["top-bottom GOES_WITH"] += session.execute_write(_run_count, OUTFIT_QUERY, ids=ids)
+
+        if inspired_top_k:
+            ranked = rank_inspired_by(session, ranked_product_ids, inspired_top_k, inspired_candidates)
+            counts["INSPIRED_BY"] += ranked["image"] + ranked["style"]
+        elif inspired_rows is not None:
+            for rows in _chunks(inspired_rows, WRITE_BATCH_SIZE):
+                session.execute_write(_write_rows, WRITE_INSPIRED_BY_QUERY, rows)
+            counts["INSPIRED_BY"] += len(inspired_rows)
+        else:
+            for ids in _chunks(product_ids):
+                counts["INSPIRED_BY"] += session.execute_write(
+                    _run_count, INSPIRED_BY_QUERY.format(anchor="product"), ids=ids)
+            for ids in _chunks(post_ids):
+                counts["INSPIRED_BY"] += session.execute_write(
+                    _run_count, INSPIRED_BY_QUERY.format(anchor="post"), ids=ids)
+
+        for label, ids_all in (("Product", product_ids), ("Post", post_ids)):
+            for ids in _chunks(ids_all):
+                touched |= session.execute_write(_apply_co_occurrence_delta, label, ids)
+        if touched:
+            session.execute_write(_sync_similar_to, sorted(touched))
+        counts["style pairs updated"] = len(touched)
+
+    for name, count in counts.items():
+        logger.info(f"  - {name}: {count}")
+    return dict(counts)
+
+
+def index_style_co_occurrence(driver, products: List[Dict], posts: List[Dict], batch_size: int = 5000):
+    """
+    完整建立後重設增量維護的基準：
+    CO_OCCURS 為全部共現次數（含未達 SIMILAR_TO 門檻的組合），indexed_styles 為每個節點目前的風格
+    """
+    with driver.session() as session:
+        while session.run("""
+            MATCH (:Style)-[c:CO_OCCURS]->(:Style)
+            WITH c LIMIT $batch_size
+            DELETE c
+            RETURN count(c) as count
+        """, batch_size=batch_size).single()['count']:
+            pass
+
+        pairs = session.run("""
+            MATCH (s1:Style)<-[:HAS_STYLE]-(n)-[:HAS_STYLE]->(s2:Style)
+            WHERE s1.name < s2.name
+            WITH s1, s2, count(n) as co_occurrence
+            MERGE (s1)-[c:CO_OCCURS]->(s2)
+            SET c.count = co_occurrence
+            RETURN count(c) as count
+        """).single()['count']
+
+        for label, records in (("Product", products), ("Post", posts)):
+            rows = [{"id": r['id'], "styles": sorted(r['styles'] or [])} for r in records]
+            for i in range(0, len(rows), batch_size):
+                session.run(SET_INDEXED_STYLES_QUERY.format(label=label), rows=rows[i:i + batch_size]).consume()
+
+    logger.info(f"✅ Indexed {pairs} style co-occurrence pairs for {len(products)} products and {len(posts)} posts")
+
+
+def drop_nodes(graph: StyleGraph, product_ids: Iterable[str], post_ids: Iterable[str]) -> StyleGraph:
+    """移除指定商品 / 貼文後的圖（增量維護刪除節點時，top-k 的計算需排除它們）"""
+    catalog = graph.catalog
+    product_ids, post_ids = set(product_ids), set(post_ids)
+    keep = np.array([i not in product_ids for i in catalog.ids], dtype=bool)
+    keep_posts = np.array([i not in post_ids for i in graph.post_ids], dtype=bool)
+    return StyleGraph(ProductCatalog([i for i, k in zip(catalog.ids, keep) if k], catalog.prices[keep],
+                                     catalog.categories[keep], catalog.styles[keep],
+                                     catalog.category_names, catalog.style_names),
+                      [i for i, k in zip(graph.post_ids, keep_posts) if k], graph.post_styles[keep_posts])
+
+
+def synthetic_changes(graph: StyleGraph, n_changed: int, n_new: int = 0, n_deleted: int = 0,
+                      seed: int = 0) -> Tuple[StyleGraph, List[str], List[str]]:
+    """
+    在合成圖上模擬一次資料更新：隨機改掉 n_changed 個商品的風格 / 價格 / 類別與 n_changed // 10 篇貼文的風格，
+    新增 n_new 個商品與 n_new // 10 篇貼文，並刪除 n_deleted 個商品與 n_deleted // 10 篇貼文；
+    回傳 (新的圖, 變更商品 id, 變更貼文 id)，刪除的節點也列在變更 id 中（不在新的圖中）
+    """
+    rng = np.random.default_rng(seed)
+    catalog = graph.catalog
+    n_styles = len(catalog.style_names)
+    n_products, n_posts = len(catalog), len(graph.post_ids)
+
+    def random_styles(rows: int):
+        styles = rng.random((rows, n_styles)) < 2.0 / n_styles
+        styles[np.arange(rows), rng.integers(0, n_styles, size=rows)] = True
+        return styles
+
+    product_rows = rng.choice(n_products, size=min(n_changed, n_products), replace=False)
+    styles = np.vstack([catalog.styles, random_styles(n_new)])
+    styles[product_rows] = random_styles(len(product_rows))
+    prices = np.concatenate([catalog.prices, rng.uniform(100, 6000, size=n_new).round()])
+    prices[product_rows] = rng.uniform(100, 6000, size=len(product_rows)).round()
+    categories = np.concatenate([catalog.categories, rng.integers(0, len(catalog.category_names), size=n_new)])
+    categories[product_rows] = rng.integers(0, len(catalog.category_names), size=len(product_rows))
+    ids = catalog.ids + [f"synthetic-new-{i}" for i in range(n_new)]
+
+    post_rows = rng.choice(n_posts, size=min(n_changed // 10, n_posts), replace=False)
+    post_styles = np.vstack([graph.post_styles, random_styles(n_new // 10)])
+    post_styles[post_rows] = random_styles(len(post_rows))
+    post_ids = graph.post_ids + [f"synthetic-new-post-{i}" for i in range(n_new // 10)]
+
+    # 刪除的節點不與變更的重複
+    deleted_rows = rng.choice(np.setdiff1d(np.arange(n_products), product_rows),
+                              size=min(n_deleted, n_products - len(product_rows)), replace=False)
+    deleted_post_rows = rng.choice(np.setdiff1d(np.arange(n_posts), post_rows),
+                                   size=min(n_deleted // 10, n_posts - len(post_rows)), replace=False)
+    deleted = [ids[i] for i in deleted_rows]
+    deleted_posts = [post_ids[i] for i in deleted_post_rows]
+
+    new_graph = drop_nodes(StyleGraph(ProductCatalog(ids, prices, categories, styles, catalog.category_names,
+                                                     catalog.style_names), post_ids, post_styles),
+                           deleted, deleted_posts)
+    changed_products = [ids[i] for i in product_rows] + ids[n_products:] + deleted
+    changed_posts = [post_ids[i] for i in post_rows] + post_ids[n_posts:] + deleted_posts
+    return new_graph, changed_products, changed_posts
+
+
+def expected_relationships(graph: StyleGraph, goes_with_top_k: int = None,
+                           post_inspired_top_k: int = None) -> Dict[str, Dict]:
+    """完整建立的結果（記憶體中）：風格 GOES_WITH、上下身 GOES_WITH、INSPIRED_BY 與 CO_OCCURS 共現次數"""
+    return {
+        "GOES_WITH": {(e['src'], e['dst']): e['score']
+                      for batch in goes_with_edges(graph, top_k=goes_with_top_k) for e in batch},
+        "top_bottom": {(e['src'], e['dst']): e['score']
+                       for batch in outfit_edges(graph, top_k=goes_with_top_k) for e in batch},
+        "INSPIRED_BY": {(e['product'], e['post']): e['similarity']
+                        for batch in inspired_by_edges(graph, top_k=post_inspired_top_k) for e in batch},
+        "CO_OCCURS": {(e['src'], e['dst']): e['co_occurrence']
+                      for e in style_similarity_edges(graph, min_co_occurrence=1) if e['src'] < e['dst']},
+    }
+
+
+def _node_styles(graph: StyleGraph) -> Dict[Tuple[str, str], List[str]]:
+    names = graph.style_names
+    nodes = {("Product", i): [names[j] for j in np.flatnonzero(row)]
+             for i, row in zip(graph.catalog.ids, graph.catalog.styles)}
+    nodes.update({("Post", i): [names[j] for j in np.flatnonzero(row)]
+                  for i, row in zip(graph.post_ids, graph.post_styles)})
+    return nodes
+
+
+def _scores_by_node(edges: Dict, position: int) -> Dict[str, Tuple]:
+    """top-k 同分時兩邊可能選到不同的節點，改以每個節點保留的分數清單比對"""
+    grouped = defaultdict(list)
+    for key, score in edges.items():
+        grouped[key[position]].append(score)
+    return {node: tuple(sorted(scores, reverse=True)) for node, scores in grouped.items()}
+
+
+def simulate_incremental(old_graph: StyleGraph, new_graph: StyleGraph, product_ids: List[str], post_ids: List[str],
+                         goes_with_top_k: int = None, post_inspired_top_k: int = None) -> Dict[str, Dict]:
+    """
+    不連資料庫驗證增量維護：以 old_graph 的完整建立結果為起點，
+    套用與 update_relationships 相同的刪除 / 重建規則，再與 new_graph 的完整建立結果比對（_diff 格式）
+    不在 new_graph 中的變更 id 視為刪除的節點
+    top-k 的關係以每個起點（GOES_WITH 的商品、INSPIRED_BY 的貼文）保留的分數清單比對
+    """
+    state = expected_relationships(old_graph, goes_with_top_k, post_inspired_top_k)
+    rebuilt = expected_relationships(new_graph, goes_with_top_k, post_inspired_top_k)
+    changed_products, changed_posts = set(product_ids), set(post_ids)
+
+    # GOES_WITH：刪除變更商品的所有關係與重寫商品發出的關係，再寫入風格搭配與重寫商品的上下身搭配
+    if goes_with_top_k:
+        old_sources = {src for name in ("GOES_WITH", "top_bottom")
+                       for src, dst in state[name] if dst in changed_products}
+        rewrite_ids, rows, outfit_rows = goes_with_topk_plan(new_graph, changed_products, old_sources,
+                                                             goes_with_top_k)
+        rewrite = set(rewrite_ids) | changed_products
+        style_edges = {(e['src'], e['dst']): e['score'] for e in rows}
+        outfit = {(e['src'], e['dst']): e['score'] for e in outfit_rows}
+    else:
+        rewrite = changed_products
+        style_edges = {key: score for key, score in rebuilt["GOES_WITH"].items()
+                       if key[0] in rewrite or key[1] in rewrite}
+        outfit = {key: score for key, score in rebuilt["top_bottom"].items()
+                  if key[0] in rewrite or key[1] in rewrite}
+    for name in ("GOES_WITH", "top_bottom"):
+        state[name] = {key: score for key, score in state[name].items()
+                       if key[0] not in rewrite and key[1] not in changed_products}
+    state["GOES_WITH"].update(style_edges)
+    state["top_bottom"].update(outfit)
+
+    # INSPIRED_BY：刪除變更商品與重寫貼文的所有關係再重建
+    if post_inspired_top_k:
+        old_posts = {post for product, post in state["INSPIRED_BY"] if product in changed_products}
+        rewrite_posts, rows = inspired_by_topk_plan(new_graph, changed_products, changed_posts,
+                                                    old_posts, post_inspired_top_k)
+        rewrite_posts = set(rewrite_posts) | changed_posts
+        inspired_edges = {(e['product'], e['post']): e['similarity'] for e in rows}
+    else:
+        rewrite_posts = changed_posts
+        inspired_edges = {key: score for key, score in rebuilt["INSPIRED_BY"].items()
+                          if key[0] in changed_products or key[1] in rewrite_posts}
+    state["INSPIRED_BY"] = {key: score for key, score in state["INSPIRED_BY"].items()
+                            if key[0] not in changed_products and key[1] not in rewrite_posts}
+    state["INSPIRED_BY"].update(inspired_edges)
+
+    # CO_OCCURS：與 _apply_co_occurrence_delta 相同，以新舊風格組合的差異加減次數
+    old_styles, new_styles = _node_styles(old_graph), _node_styles(new_graph)
+    changed_nodes = [("Product", i) for i in changed_products] + [("Post", i) for i in changed_posts]
+    delta = style_pair_delta([{"indexed_styles": old_styles.get(node), "styles": new_styles.get(node)}
+                              for node in changed_nodes])
+    co_occurrence = Counter(state["CO_OCCURS"])
+    co_occurrence.update(delta)
+    state["CO_OCCURS"] = {pair: count for pair, count in co_occurrence.items() if count > 0}
+
+    if goes_with_top_k:
+        for name in ("GOES_WITH", "top_bottom"):
+            state[name], rebuilt[name] = _scores_by_node(state[name], 0), _scores_by_node(rebuilt[name], 0)
+    if post_inspired_top_k:
+        state["INSPIRED_BY"], rebuilt["INSPIRED_BY"] = (_scores_by_node(state["INSPIRED_BY"], 1),
+                                                        _scores_by_node(rebuilt["INSPIRED_BY"], 1))
+    return {name: _diff({key: _as_tuple(value) for key, value in rebuilt[name].items()},
+                        {key: _as_tuple(value) for key, value in state[name].items()})
+            for name in rebuilt}
+
+
+def _as_tuple(value) -> Tuple:
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _same(a, b, tolerance: float = 1e-6) -> bool:
+    if isinstance(a, float) and isinstance(b, (int, float)):
+        return abs(a - b) <= tolerance
+    return a == b
+
+
+def _diff(expected: Dict, stored: Dict) -> Dict:
+    shared = expected.keys() & stored.keys()
+    return {
+        "expected": len(expected),
+        "stored": len(stored),
+        "missing": len(expected.keys() - stored.keys()),
+        "extra": len(stored.keys() - expected.keys()),
+        "mismatched": sum(1 for key in shared
+                          if len(expected[key]) != len(stored[key])
+                          or not all(_same(a, b) for a, b in zip(expected[key], stored[key]))),
+    }
+
+
+def verify_relationships(driver, graph: StyleGraph, check_inspired_by: bool = True,
+                         check_goes_with: bool = True) -> Dict[str, Dict]:
+    """
+    以稀疏矩陣引擎從頭計算（語意與完整的 Cypher 建立相同），逐一比對 Neo4j 中的關係
+    只適用於未使用 top-k 的關係；top-k / 圖片相似度排序的關係設 check_goes_with / check_inspired_by=False 略過
+    """
+    goes_with = {(e['src'], e['dst']): (e['score'], None)
+                 for batch in goes_with_edges(graph) for e in batch}
+    for batch in outfit_edges(graph):
+        for e in batch:
+            goes_with[(e['src'], e['dst'])] = (e['score'], 'top_bottom')
+    inspired_by = {(e['product'], e['post']): (e['similarity'],)
+                   for batch in inspired_by_edges(graph) for e in batch}
+    co_occurrence = {(e['src'], e['dst']): (e['co_occurrence'],)
+                     for e in style_similarity_edges(graph, min_co_occurrence=1) if e['src'] < e['dst']}
+    similar_to = {(e['src'], e['dst']): (e['co_occurrence'],)
+                  for e in style_similarity_edges(graph, min_co_occurrence=MIN_CO_OCCURRENCE)}
+
+    with driver.session() as session:
+        stored = {
+            "GOES_WITH": {(r['src'], r['dst']): (r['score'], r['outfit_type']) for r in session.run("""
+                MATCH (a:Product)-[r:GOES_WITH]->(b:Product)
+                RETURN a.id as src, b.id as dst, r.score as score, r.outfit_type as outfit_type
+            """)},
+            "INSPIRED_BY": {(r['src'], r['dst']): (r['similarity'],) for r in session.run("""
+                MATCH (a:Product)-[r:INSPIRED_BY]->(b:Post)
+                RETURN a.id as src, b.id as dst, r.similarity as similarity
+            """)},
+            "CO_OCCURS": {(r['src'], r['dst']): (r['count'],) for r in session.run("""
+                MATCH (a:Style)-[r:CO_OCCURS]->(b:Style)
+                RETURN a.name as src, b.name as dst, r.count as count
+            """)},
+            "SIMILAR_TO": {(r['src'], r['dst']): (r['co_occurrence'],) for r in session.run("""
+                MATCH (a:Style)-[r:SIMILAR_TO]->(b:Style)
+                RETURN a.name as src, b.name as dst, r.co_occurrence as co_occurrence
+            """)},
+        }
+
+    expected = {"GOES_WITH": goes_with, "INSPIRED_BY": inspired_by,
+                "CO_OCCURS": co_occurrence, "SIMILAR_TO": similar_to}
+    if not check_inspired_by:
+        del expected["INSPIRED_BY"]
+    if not check_goes_with:
+        del expected["GOES_WITH"]
+    return {name: _diff(expected[name], stored[name]) for name in expected}
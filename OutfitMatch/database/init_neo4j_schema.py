@@ -8,6 +8,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from neo4j import GraphDatabase
 from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from loader.color_palette import COLOR_BUCKETS
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -44,6 +45,12 @@ class Neo4jSchemaInitializer:
             
             # 單品
             "CREATE CONSTRAINT item_name IF NOT EXISTS FOR (i:Item) REQUIRE i.name IS UNIQUE",
+            
+            # 主色（loader/extract_colors.py）
+            "CREATE CONSTRAINT color_name IF NOT EXISTS FOR (c:Color) REQUIRE c.name IS UNIQUE",
+            
+            # 預先組合的完整穿搭（以 key 查詢）
+            "CREATE CONSTRAINT outfit_bundles_key IF NOT EXISTS FOR (b:OutfitBundles) REQUIRE b.key IS UNIQUE",
         ]
         
         with self.driver.session() as session:
@@ -63,9 +70,11 @@ class Neo4jSchemaInitializer:
             # 商品相關索引
             "CREATE INDEX product_price IF NOT EXISTS FOR (p:Product) ON (p.price)",
             "CREATE INDEX product_name IF NOT EXISTS FOR (p:Product) ON (p.name)",
+            "CREATE INDEX product_updated_at IF NOT EXISTS FOR (p:Product) ON (p.updated_at)",
             
             # 貼文相關索引
             "CREATE INDEX post_timestamp IF NOT EXISTS FOR (p:Post) ON (p.timestamp)",
+            "CREATE INDEX post_updated_at IF NOT EXISTS FOR (p:Post) ON (p.updated_at)",
             
             # 全文搜索索引
             "CREATE FULLTEXT INDEX product_search IF NOT EXISTS FOR (p:Product) ON EACH [p.name, p.description]",
@@ -99,6 +108,14 @@ class Neo4jSchemaInitializer:
                 "property": "img_embedding",
                 "dimensions": 768,
                 "similarity": "cosine"
+            },
+            {
+                # dinov2-small embedding，cascade 模式的第一階段召回
+                "name": "post_image_small_index",
+                "label": "Post",
+                "property": "img_embedding_small",
+                "dimensions": 384,
+                "similarity": "cosine"
             }
         ]
         
@@ -132,7 +149,7 @@ class Neo4jSchemaInitializer:
                         logger.error(f"❌ Error creating vector index {idx['name']}: {e}")
     
     def initialize_base_data(self):
-        """初始化基礎資料：風格和類別"""
+        """初始化基礎資料：風格、類別和顏色"""
         with self.driver.session() as session:
             # 風格節點
             styles = [
@@ -176,6 +193,14 @@ class Neo4jSchemaInitializer:
                     SET c.description = $description
                 """, **category)
             logger.info(f"✅ Initialized {len(categories)} category nodes")
+            
+            # 顏色節點（主色量化後的顏色）
+            for name, hex_code in COLOR_BUCKETS.items():
+                session.run("""
+                    MERGE (c:Color {name: $name})
+                    SET c.hex = $hex
+                """, name=name, hex=hex_code)
+            logger.info(f"✅ Initialized {len(COLOR_BUCKETS)} color nodes")
     
     def verify_setup(self):
         """驗證設置"""
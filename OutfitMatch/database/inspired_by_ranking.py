@@ -0,0 +1,102 @@
+"""
+Ranked INSPIRED_BY
+每個商品只連到圖片最相似的 top-k 篇貼文，而不是所有有共同風格的貼文：
+- 以商品的 img_embedding 查 post_image_index 取 candidates 篇候選，保留有共同風格者中 score 最高的 top_k
+- 沒有 embedding 的商品改以共同風格數排序（ranked_by = 'style'）
+- 貼文變更時，以貼文的 embedding 查 product_image_index 找出可能受影響的商品重新排序
+r.similarity 為 cosine 相似度（依風格排序時為共同風格數 / 3），r.common_styles 與原本相同
+"""
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# 每個交易處理的商品數
+RANK_BATCH_SIZE = 200
+
+IMAGE_RANKED_QUERY = """
+UNWIND $ids as id
+MATCH (product:Product {id: id})
+WHERE product.img_embedding IS NOT NULL
+CALL db.index.vector.queryNodes('post_image_index', $candidates, product.img_embedding)
+YIELD node as post, score
+MATCH (product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(post)
+
+WITH product, post, score, collect(DISTINCT s.name) as common_styles
+ORDER BY score DESC
+WITH product, collect({post: post, score: score, common_styles: common_styles})[..$top_k] as ranked
+
+UNWIND ranked as candidate
+WITH product, candidate.post as post, candidate
+MERGE (product)-[r:INSPIRED_BY]->(post)
+SET r.common_styles = candidate.common_styles,
+    r.similarity = candidate.score,
+    r.ranked_by = 'image',
+    r.created_at = datetime()
+
+RETURN count(r) as count
+"""
+
+STYLE_RANKED_QUERY = """
+UNWIND $ids as id
+MATCH (product:Product {id: id})
+WHERE product.img_embedding IS NULL
+MATCH (product)-[:HAS_STYLE]->(s:Style)<-[:HAS_STYLE]-(post:Post)
+
+WITH product, post, collect(DISTINCT s.name) as common_styles
+ORDER BY size(common_styles) DESC, post.id
+WITH product, collect({post: post, common_styles: common_styles})[..$top_k] as ranked
+
+UNWIND ranked as candidate
+WITH product, candidate.post as post, candidate
+MERGE (product)-[r:INSPIRED_BY]->(post)
+SET r.common_styles = candidate.common_styles,
+    r.similarity = toFloat(size(candidate.common_styles)) / 3.0,
+    r.ranked_by = 'style',
+    r.created_at = datetime()
+
+RETURN count(r) as count
+"""
+
+# 變更貼文在 product_image_index 中的鄰近商品
+NEAR_POST_PRODUCTS_QUERY = """
+UNWIND $ids as id
+MATCH (post:Post {id: id})
+WHERE post.img_embedding IS NOT NULL
+CALL db.index.vector.queryNodes('product_image_index', $candidates, post.img_embedding)
+YIELD node
+RETURN collect(DISTINCT node.id) as ids
+"""
+
+# 目前連到變更貼文的商品（貼文的風格改變後可能不再符合）
+LINKED_PRODUCTS_QUERY = """
+UNWIND $ids as id
+MATCH (product:Product)-[:INSPIRED_BY]->(:Post {id: id})
+RETURN collect(DISTINCT product.id) as ids
+"""
+
+
+def _write_count(tx, query: str, **params) -> int:
+    return tx.run(query, **params).single()['count']
+
+
+def rank_inspired_by(session, product_ids: List[str], top_k: int, candidates: int) -> Dict[str, int]:
+    """為 product_ids 建立 top-k INSPIRED_BY（呼叫前需先刪除這些商品的舊關係）"""
+    counts = {"image": 0, "style": 0}
+    for i in range(0, len(product_ids), RANK_BATCH_SIZE):
+        ids = product_ids[i:i + RANK_BATCH_SIZE]
+        counts["image"] += session.execute_write(_write_count, IMAGE_RANKED_QUERY,
+                                                 ids=ids, top_k=top_k, candidates=candidates)
+        counts["style"] += session.execute_write(_write_count, STYLE_RANKED_QUERY, ids=ids, top_k=top_k)
+        logger.debug(f"Progress: {min(i + RANK_BATCH_SIZE, len(product_ids))}/{len(product_ids)} products ranked")
+    return counts
+
+
+def products_affected_by_posts(session, post_ids: List[str], candidates: int) -> List[str]:
+    """貼文變更後需要重新排序的商品（必須在刪除貼文的舊關係之前呼叫）"""
+    affected = set()
+    for i in range(0, len(post_ids), RANK_BATCH_SIZE):
+        ids = post_ids[i:i + RANK_BATCH_SIZE]
+        affected.update(session.run(NEAR_POST_PRODUCTS_QUERY, ids=ids, candidates=candidates).single()['ids'])
+        affected.update(session.run(LINKED_PRODUCTS_QUERY, ids=ids).single()['ids'])
+    return sorted(affected)
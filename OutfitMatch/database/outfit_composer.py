@@ -0,0 +1,130 @@
+"""
+Outfit Composer
+離線組合完整穿搭（上衣 + 下身 + 配件、連身 + 配件）：
+- 以每個商品為起點，依類別順序做 beam search，下一個位置的候選為目前成員的 GOES_WITH 搭配
+- 分數 = 成員兩兩 GOES_WITH score 的平均 + coherence_weight × 風格一致度（共同風格 / 全部風格）
+- 總價超過 budget 的組合不保留
+結果為精簡的 bundle record（商品 id、分數、總價、共同風格、模板），依商品與依風格各保留 top-N
+"""
+import logging
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 一套完整穿搭的類別組合（依序填入）
+OUTFIT_TEMPLATES = [
+    ("上衣", "下身", "配件"),
+    ("連身", "配件"),
+]
+
+
+class OutfitComposer:
+    """
+    products: product_id -> {"price", "category", "styles"}
+    edges: product_id -> {partner_id: GOES_WITH score}
+    """
+
+    def __init__(self, products: Dict[str, Dict], edges: Dict[str, Dict[str, float]],
+                 budget: Optional[float] = None, beam_width: int = 8, coherence_weight: float = 1.0,
+                 partners_per_slot: int = 20, templates: List[Tuple[str, ...]] = None):
+        self.products = {pid: {**p, "styles": set(p["styles"] or [])} for pid, p in products.items()}
+        self.edges = edges
+        self.budget = budget
+        self.beam_width = beam_width
+        self.coherence_weight = coherence_weight
+        self.partners_per_slot = partners_per_slot
+        self.templates = templates or OUTFIT_TEMPLATES
+        self._partners = self._index_partners()
+
+    def _index_partners(self) -> Dict[str, Dict[str, List[str]]]:
+        """product_id -> 類別 -> score 最高的 partners_per_slot 個搭配"""
+        index = {}
+        for pid, partners in self.edges.items():
+            by_category = {}
+            for partner, score in sorted(partners.items(), key=lambda kv: -kv[1]):
+                product = self.products.get(partner)
+                if product is None:
+                    continue
+                slot = by_category.setdefault(product["category"], [])
+                if len(slot) < self.partners_per_slot:
+                    slot.append(partner)
+            index[pid] = by_category
+        return index
+
+    def pair_score(self, a: str, b: str) -> float:
+        return max(self.edges.get(a, {}).get(b, 0.0), self.edges.get(b, {}).get(a, 0.0))
+
+    def common_styles(self, items: Iterable[str]) -> Set[str]:
+        styles = [self.products[i]["styles"] for i in items]
+        return set.intersection(*styles) if styles else set()
+
+    def score(self, items: List[str]) -> float:
+        pairs = list(combinations(items, 2))
+        matching = sum(self.pair_score(a, b) for a, b in pairs) / len(pairs) if pairs else 0.0
+        union = set.union(*(self.products[i]["styles"] for i in items))
+        coherence = len(self.common_styles(items)) / len(union) if union else 0.0
+        return matching + self.coherence_weight * coherence
+
+    def _price(self, items: List[str]) -> float:
+        return sum(self.products[i]["price"] or 0.0 for i in items)
+
+    def _beam_search(self, seed: str, template: Tuple[str, ...]) -> List[List[str]]:
+        seed_category = self.products[seed]["category"]
+        beam = [[seed]]
+        for category in template:
+            if category == seed_category:
+                continue
+            extended = {}
+            for items in beam:
+                candidates = {c for member in items for c in self._partners.get(member, {}).get(category, [])}
+                for candidate in candidates - set(items):
+                    outfit = items + [candidate]
+                    if self.budget is not None and self._price(outfit) > self.budget:
+                        continue
+                    extended[frozenset(outfit)] = outfit
+            if not extended:
+                return []
+            beam = sorted(extended.values(), key=self.score, reverse=True)[:self.beam_width]
+        return beam
+
+    def compose(self, seed: str) -> List[Dict]:
+        """以 seed 為起點的所有完整穿搭（依分數由高到低）"""
+        category = self.products[seed]["category"]
+        bundles = []
+        for template in self.templates:
+            if category not in template:
+                continue
+            order = {c: i for i, c in enumerate(template)}
+            for items in self._beam_search(seed, template):
+                items = sorted(items, key=lambda i: order[self.products[i]["category"]])
+                bundles.append(self.bundle(items, template))
+        return sorted(bundles, key=lambda b: -b["score"])
+
+    def bundle(self, items: List[str], template: Tuple[str, ...]) -> Dict:
+        return {
+            "items": items,
+            "score": round(self.score(items), 4),
+            "price": self._price(items),
+            "styles": sorted(self.common_styles(items)),
+            "template": "+".join(template),
+        }
+
+    def compose_all(self, top_n: int = 5) -> Tuple[Dict[str, List[Dict]], Dict[str, List[Dict]]]:
+        """回傳 (依商品, 依風格) 的 top-N bundles"""
+        by_product, pool = {}, {}
+        for seed in self.products:
+            bundles = self.compose(seed)
+            if bundles:
+                by_product[seed] = bundles[:top_n]
+            for bundle in bundles:
+                pool[frozenset(bundle["items"])] = bundle
+
+        by_style = {}
+        for bundle in sorted(pool.values(), key=lambda b: -b["score"]):
+            for style in bundle["styles"]:
+                slot = by_style.setdefault(style, [])
+                if len(slot) < top_n:
+                    slot.append(bundle)
+        logger.info(f"🧩 Composed {len(pool)} distinct outfits: {len(by_product)} products, {len(by_style)} styles")
+        return by_product, by_style
@@ -0,0 +1,228 @@
+"""
+Profile Queries
+對 query_registry.py 登記的每個 Cypher 模板以代表性參數執行 PROFILE，記錄 db hits、rows 與使用的 operator
+（NodeIndexSeek / NodeByLabelScan / 向量索引的 ProcedureCall ...），存成 baseline 供查詢或 schema 變更後比對：
+- 每個模板在自己的交易中執行後 rollback，寫入型模板不會改動資料
+- --explain_full_graph 時整張圖的建構查詢只做 EXPLAIN（只有計畫，沒有 db hits），避免在大資料上完整執行
+- 執行前檢查每個 *_QUERY 常數都已登記在 query_registry.py，有遺漏時結束並回傳 1（--check_registry 只做這項檢查）
+
+用法：
+    python database/profile_queries.py --save database/query_plans_baseline.json
+    python database/profile_queries.py --baseline database/query_plans_baseline.json --fail_on_regression
+    python database/profile_queries.py --only search. matches. --verbose
+    python database/profile_queries.py --check_registry
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from neo4j import GraphDatabase
+from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from database.query_registry import TEMPLATES, QueryTemplate, representative_fixtures, unregistered_queries
+import argparse
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plans_baseline.json")
+
+# 掃描整個 label / 整張圖的 operator
+SCAN_OPERATORS = {"AllNodesScan", "NodeByLabelScan", "DirectedAllRelationshipsScan",
+                  "UndirectedAllRelationshipsScan"}
+
+
+def _operator_type(plan: Dict) -> str:
+    # Neo4j 5 的 operatorType 帶有 runtime 後綴，例如 NodeIndexSeek@neo4j
+    return plan.get("operatorType", "").split("@")[0]
+
+
+def _walk(plan: Dict):
+    yield plan
+    for child in plan.get("children", []):
+        yield from _walk(child)
+
+
+def _db_hits(plan: Dict) -> int:
+    return plan.get("dbHits", plan.get("args", {}).get("DbHits", 0)) or 0
+
+
+def summarize_plan(plan: Dict, profiled: bool) -> Dict:
+    operators, index_operators, scans = [], [], []
+    for node in _walk(plan):
+        operator = _operator_type(node)
+        details = str(node.get("args", {}).get("Details", ""))
+        operators.append(f"{operator}: {details}" if details else operator)
+        if "Index" in operator or "db.index." in details:
+            index_operators.append(f"{operator}: {details}" if details else operator)
+        if operator in SCAN_OPERATORS:
+            scans.append(f"{operator}: {details}" if details else operator)
+    return {
+        "mode": "profile" if profiled else "explain",
+        "db_hits": sum(_db_hits(node) for node in _walk(plan)) if profiled else None,
+        "rows": (plan.get("rows", plan.get("args", {}).get("Rows")) if profiled else None),
+        "operator_types": sorted({_operator_type(node) for node in _walk(plan)}),
+        "index_operators": index_operators,
+        "scans": scans,
+        "operators": operators,
+    }
+
+
+def profile_template(session, template: QueryTemplate, fixtures: Dict, explain: bool) -> Dict:
+    """在交易中執行 PROFILE / EXPLAIN 後 rollback"""
+    keyword = "EXPLAIN" if explain else "PROFILE"
+    tx = session.begin_transaction()
+    try:
+        start = time.perf_counter()
+        summary = tx.run(f"{keyword} {template.query}", **template.params(fixtures)).consume()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        tx.rollback()
+    plan = summary.profile if not explain else summary.plan
+    result = summarize_plan(plan or {}, profiled=not explain)
+    result.update({"source": template.source, "writes": template.writes,
+                   "elapsed_ms": round(elapsed_ms, 1) if not explain else None})
+    return result
+
+
+def profile_all(driver, only: List[str] = None, explain_full_graph: bool = False) -> Dict[str, Dict]:
+    results = {}
+    with driver.session() as session:
+        fixtures = representative_fixtures(session)
+        for template in TEMPLATES:
+            if only and not any(template.name.startswith(prefix) for prefix in only):
+                continue
+            try:
+                results[template.name] = profile_template(session, template, fixtures,
+                                                          explain_full_graph and template.full_graph)
+            except Exception as e:
+                logger.error(f"❌ {template.name}: {e}")
+                results[template.name] = {"source": template.source, "error": str(e)}
+                continue
+            r = results[template.name]
+            logger.info(f"📋 {template.name}: db hits {r['db_hits']}, rows {r['rows']}, "
+                        f"index {len(r['index_operators'])}, scans {len(r['scans'])}")
+    return results
+
+
+def diff_plans(baseline: Dict[str, Dict], current: Dict[str, Dict], tolerance: float) -> List[Dict]:
+    """
+    與 baseline 比對：db hits 增加超過 tolerance、新出現的全掃描 operator、不再使用的索引視為退步
+    operator 類型的增減一併列出
+    """
+    changes = []
+    for name in sorted(baseline.keys() | current.keys()):
+        old, new = baseline.get(name), current.get(name)
+        if old is None or new is None:
+            changes.append({"name": name, "change": "added" if old is None else "removed", "regression": False})
+            continue
+        if "error" in old or "error" in new:
+            changes.append({"name": name, "change": "error", "error": new.get("error"),
+                            "regression": "error" in new})
+            continue
+
+        entry = {"name": name, "regression": False, "notes": []}
+        if old.get("db_hits") and new.get("db_hits") is not None:
+            ratio = new["db_hits"] / old["db_hits"]
+            entry["db_hits"] = [old["db_hits"], new["db_hits"]]
+            if ratio > 1 + tolerance:
+                entry["regression"] = True
+                entry["notes"].append(f"db hits x{ratio:.2f}")
+            elif ratio < 1 - tolerance:
+                entry["notes"].append(f"db hits x{ratio:.2f}")
+        added = sorted(set(new["operator_types"]) - set(old["operator_types"]))
+        removed = sorted(set(old["operator_types"]) - set(new["operator_types"]))
+        if added:
+            entry["notes"].append(f"+ {', '.join(added)}")
+        if removed:
+            entry["notes"].append(f"- {', '.join(removed)}")
+        new_scans = sorted(set(new["scans"]) - set(old["scans"]))
+        if new_scans:
+            entry["regression"] = True
+            entry["notes"].append(f"new scans: {'; '.join(new_scans)}")
+        if old["index_operators"] and not new["index_operators"]:
+            entry["regression"] = True
+            entry["notes"].append("no longer uses an index")
+        if entry["notes"]:
+            changes.append(entry)
+    return changes
+
+
+def check_registry() -> bool:
+    """所有 *_QUERY 常數都已登記時回傳 True"""
+    missing = unregistered_queries()
+    for name in missing:
+        logger.error(f"❌ {name} is not registered in database/query_registry.py")
+    if not missing:
+        logger.info(f"✅ All query constants registered ({len(TEMPLATES)} templates)")
+    return not missing
+
+
+def main(save: str = None, baseline: str = None, only: List[str] = None, explain_full_graph: bool = False,
+         tolerance: float = 0.2, fail_on_regression: bool = False, verbose: bool = False,
+         registry_only: bool = False) -> int:
+    if not check_registry():
+        return 1
+    if registry_only:
+        return 0
+
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        results = profile_all(driver, only, explain_full_graph)
+    finally:
+        driver.close()
+
+    if verbose:
+        for name, r in results.items():
+            print(f"\n=== {name} ({r['source']}) ===")
+            for operator in r.get("operators", []):
+                print(f"  {operator}")
+
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump({"created_at": datetime.now().isoformat(timespec="seconds"), "plans": results},
+                      f, ensure_ascii=False, indent=2, sort_keys=True)
+        logger.info(f"💾 Saved {len(results)} query plans to {save}")
+
+    if not baseline:
+        return 0
+    with open(baseline, encoding="utf-8") as f:
+        old = json.load(f)["plans"]
+    if only:
+        old = {name: plan for name, plan in old.items() if any(name.startswith(p) for p in only)}
+    changes = diff_plans(old, results, tolerance)
+    regressions = [c for c in changes if c["regression"]]
+    print(f"\n=== Compared with {baseline}: {len(changes)} changed, {len(regressions)} regressions ===")
+    for c in changes:
+        marker = "❌" if c["regression"] else "•"
+        detail = c.get("change") or "; ".join(c["notes"])
+        print(f"{marker} {c['name']}: {detail}")
+    return 1 if regressions and fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PROFILE every registered Cypher template and diff against a baseline')
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, default=None,
+                      help=f'Write the plans as a baseline (default path: {os.path.relpath(DEFAULT_BASELINE)})')
+    parser.add_argument('--baseline', default=None,
+                      help='Baseline JSON to diff the current plans against')
+    parser.add_argument('--only', nargs='+', default=None,
+                      help='Template name prefixes to profile, e.g. search. matches.')
+    parser.add_argument('--explain_full_graph', action='store_true',
+                      help='EXPLAIN instead of PROFILE for full-graph build queries (plan only, no db hits)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                      help='Relative db hits increase reported as a regression (default: 0.2)')
+    parser.add_argument('--fail_on_regression', action='store_true',
+                      help='Exit with status 1 when the diff contains regressions')
+    parser.add_argument('--verbose', action='store_true',
+                      help='Print every operator of every plan')
+    parser.add_argument('--check_registry', action='store_true',
+                      help='Only check that every *_QUERY constant is registered (no database needed)')
+
+    args = parser.parse_args()
+    sys.exit(main(args.save, args.baseline, args.only, args.explain_full_graph,
+                  args.tolerance, args.fail_on_regression, args.verbose, args.check_registry))
@@ -0,0 +1,272 @@
+"""
+Query Registry
+所有手寫 Cypher 模板的清單（查詢層、關係建構、增量維護、loader），以及以目前資料庫內容產生的代表性參數，
+供 profile_queries.py 逐一執行 PROFILE / EXPLAIN
+新增或修改模板時請一併登記，baseline 比對才會涵蓋它；unregistered_queries 列出 SCANNED_MODULES 中
+尚未登記的 *_QUERY 常數（profile_queries.py 執行前會檢查）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+import re
+from string import Formatter
+from typing import Callable, Dict, List
+import numpy as np
+import query.query_neo4j as qn
+import query.product_matches as pm
+import query.cascade as cascade
+import query.outfit_bundles as ob
+import query.keyword_search as ks
+import query.visual_search as vs
+import database.build_relationships as br
+import database.incremental_relationships as inc
+import database.inspired_by_ranking as ranking
+import loader.shop_neo4j as shop
+import loader.instagram_neo4j as ig
+import loader.extract_colors as colors
+import loader.post_styles as ps
+
+logger = logging.getLogger(__name__)
+
+# 代表性的 LLM 條件（nl_to_cypher_conditions 的典型輸出）
+REPRESENTATIVE_CONDITIONS = "p.price <= 1000 AND c.name = '上衣'"
+
+# 代表性的關鍵字查詢（parse_keyword_query 的典型輸出）
+REPRESENTATIVE_KEYWORDS = ks.KeywordQuery(keywords=["短版"], max_price=1000, category="上衣", colors=["黑"])
+
+# 代表性參數中 $ids 的數量
+SAMPLE_IDS = 50
+
+
+class QueryTemplate:
+    """
+    name: 唯一名稱（baseline 以此對齊）
+    source: 定義模板的模組
+    params: fixtures -> 查詢參數
+    writes: 會寫入資料（PROFILE 在交易中執行後 rollback）
+    full_graph: 掃描整張圖的建構查詢（可改用 EXPLAIN 只看計畫）
+    """
+
+    def __init__(self, name: str, source: str, query: str, params: Callable[[Dict], Dict],
+                 writes: bool = False, full_graph: bool = False):
+        self.name = name
+        self.source = source
+        self.query = query
+        self.params = params
+        self.writes = writes
+        self.full_graph = full_graph
+
+
+def _search(template: str) -> str:
+    return template.format(conditions=REPRESENTATIVE_CONDITIONS)
+
+
+def _edge_rows(f: Dict) -> List[Dict]:
+    """分批寫入的一筆代表性資料（GOES_WITH / 上下身 / INSPIRED_BY 共用）"""
+    return [{"src": f["product_ids"][0], "dst": f["product_ids"][-1],
+             "product": f["product_id"], "post": f["post_id"],
+             "style_match": 1.0, "common_styles": f["styles"][:1], "score": 1.0, "similarity": 0.5}]
+
+
+TEMPLATES: List[QueryTemplate] = [
+    # 查詢層
+    QueryTemplate("search.exact_match", "query/query_neo4j.py", _search(qn.EXACT_MATCH_QUERY),
+                  lambda f: {"styles": f["styles"], "skip": 0, "limit": 10}),
+    QueryTemplate("search.partial_match", "query/query_neo4j.py", _search(qn.PARTIAL_MATCH_QUERY),
+                  lambda f: {"styles": f["styles"], "skip": 0, "limit": 10}),
+    QueryTemplate("search.text_only", "query/query_neo4j.py", _search(qn.TEXT_ONLY_QUERY),
+                  lambda f: {"styles": f["styles"], "skip": 0, "limit": 10}),
+    QueryTemplate("search.keyword_fulltext", "query/keyword_search.py", ks.FULLTEXT_SEARCH_QUERY,
+                  lambda f: {**REPRESENTATIVE_KEYWORDS.params(f["styles"]), "skip": 0, "limit": 10}),
+    QueryTemplate("search.keyword_structured", "query/keyword_search.py", ks.STRUCTURED_SEARCH_QUERY,
+                  lambda f: {**REPRESENTATIVE_KEYWORDS.params(f["styles"]), "skip": 0, "limit": 10}),
+    QueryTemplate("search.color_data", "query/keyword_search.py", ks.COLOR_DATA_QUERY, lambda f: {}),
+    QueryTemplate("search.brands", "query/keyword_search.py", ks.BRANDS_QUERY, lambda f: {}),
+    QueryTemplate("search.visual_knn", "query/visual_search.py", _search(vs.VISUAL_SEARCH_QUERY),
+                  lambda f: vs.search_params(np.asarray(f["embedding"]), None, f["styles"], 10,
+                                             vs.initial_candidates(10), style_weight=0.3)),
+    QueryTemplate("search.nearest_post", "query/query_neo4j.py", qn.NEAREST_POST_QUERY,
+                  lambda f: {"k": 5, "embedding": f["embedding"]}),
+    QueryTemplate("search.cascade_candidates", "query/cascade.py", cascade.CANDIDATE_QUERY,
+                  lambda f: {"k": 20, "embedding": f["small_embedding"]}),
+    QueryTemplate("matches.live", "query/query_neo4j.py", qn.MATCHING_PRODUCTS_QUERY,
+                  lambda f: {"product_id": f["product_id"], "limit": 5}),
+    QueryTemplate("matches.top_k_table", "query/product_matches.py", pm.TOP_K_MATCHES_QUERY,
+                  lambda f: {"k": 20}),
+    QueryTemplate("matches.product_details", "query/product_matches.py", pm.PRODUCT_DETAILS_QUERY,
+                  lambda f: {"ids": f["product_ids"]}),
+    QueryTemplate("outfits.all_bundles", "query/outfit_bundles.py", ob.ALL_BUNDLES_QUERY,
+                  lambda f: {}),
+    QueryTemplate("outfits.bundle_by_key", "query/outfit_bundles.py", ob.BUNDLE_BY_KEY_QUERY,
+                  lambda f: {"key": f["bundle_key"]}),
+
+    # 完整建構
+    QueryTemplate("build.style_based", "database/build_relationships.py", br.STYLE_BASED_QUERY,
+                  lambda f: {"min_common_styles": 1}, writes=True, full_graph=True),
+    QueryTemplate("build.outfit", "database/build_relationships.py", br.OUTFIT_QUERY,
+                  lambda f: {}, writes=True, full_graph=True),
+    QueryTemplate("build.inspired_by", "database/build_relationships.py", br.INSPIRED_BY_QUERY,
+                  lambda f: {}, writes=True, full_graph=True),
+    QueryTemplate("build.similar_to", "database/build_relationships.py", br.SIMILAR_TO_QUERY,
+                  lambda f: {}, writes=True, full_graph=True),
+    QueryTemplate("build.export_products", "database/build_relationships.py", br.EXPORT_PRODUCTS_QUERY,
+                  lambda f: {}, full_graph=True),
+    QueryTemplate("build.export_posts", "database/build_relationships.py", br.EXPORT_POSTS_QUERY,
+                  lambda f: {}, full_graph=True),
+    QueryTemplate("build.write_goes_with", "database/build_relationships.py", br.WRITE_GOES_WITH_QUERY,
+                  lambda f: {"rows": _edge_rows(f)}, writes=True),
+    QueryTemplate("build.write_outfit", "database/build_relationships.py", br.WRITE_OUTFIT_QUERY,
+                  lambda f: {"rows": _edge_rows(f)}, writes=True),
+    QueryTemplate("build.write_inspired_by", "database/build_relationships.py", br.WRITE_INSPIRED_BY_QUERY,
+                  lambda f: {"rows": _edge_rows(f)}, writes=True),
+    QueryTemplate("build.write_similar_to", "database/build_relationships.py", br.WRITE_SIMILAR_TO_QUERY,
+                  lambda f: {"rows": [{"src": f["styles"][0], "dst": f["styles"][-1],
+                                      "similarity": 0.05, "co_occurrence": 5}]},
+                  writes=True),
+    QueryTemplate("build.inspired_by_image_ranked", "database/inspired_by_ranking.py", ranking.IMAGE_RANKED_QUERY,
+                  lambda f: {"ids": f["product_ids"], "candidates": 50, "top_k": 10}, writes=True),
+    QueryTemplate("build.inspired_by_style_ranked", "database/inspired_by_ranking.py", ranking.STYLE_RANKED_QUERY,
+                  lambda f: {"ids": f["product_ids"], "top_k": 10}, writes=True),
+
+    # 增量維護
+    QueryTemplate("incremental.changed_products", "database/incremental_relationships.py",
+                  inc.CHANGED_SINCE_QUERY.format(label="Product"), lambda f: {"since": f["since"]}),
+    QueryTemplate("incremental.changed_posts", "database/incremental_relationships.py",
+                  inc.CHANGED_SINCE_QUERY.format(label="Post"), lambda f: {"since": f["since"]}),
+    QueryTemplate("incremental.delete_goes_with", "database/incremental_relationships.py",
+                  inc.DELETE_GOES_WITH_QUERY, lambda f: {"ids": f["product_ids"]}, writes=True),
+    QueryTemplate("incremental.goes_with_sources", "database/incremental_relationships.py",
+                  inc.GOES_WITH_SOURCES_QUERY, lambda f: {"ids": f["product_ids"]}),
+    QueryTemplate("incremental.delete_outgoing_goes_with", "database/incremental_relationships.py",
+                  inc.DELETE_OUTGOING_GOES_WITH_QUERY, lambda f: {"ids": f["product_ids"]}, writes=True),
+    QueryTemplate("incremental.inspired_by_posts_of_products", "database/incremental_relationships.py",
+                  inc.INSPIRED_BY_POSTS_QUERY, lambda f: {"ids": f["product_ids"]}),
+    QueryTemplate("incremental.delete_nodes", "database/incremental_relationships.py",
+                  inc.DELETE_NODES_QUERY.format(label="Product"), lambda f: {"ids": f["product_ids"][:1]},
+                  writes=True),
+    QueryTemplate("incremental.delete_inspired_by", "database/incremental_relationships.py",
+                  inc.DELETE_INSPIRED_BY_QUERY.format(label="Product"), lambda f: {"ids": f["product_ids"]},
+                  writes=True),
+    QueryTemplate("incremental.style_based", "database/incremental_relationships.py", inc.STYLE_BASED_QUERY,
+                  lambda f: {"ids": f["product_ids"]}, writes=True),
+    QueryTemplate("incremental.outfit", "database/incremental_relationships.py", inc.OUTFIT_QUERY,
+                  lambda f: {"ids": f["product_ids"]}, writes=True),
+    QueryTemplate("incremental.inspired_by_products", "database/incremental_relationships.py",
+                  inc.INSPIRED_BY_QUERY.format(anchor="product"), lambda f: {"ids": f["product_ids"]},
+                  writes=True),
+    QueryTemplate("incremental.inspired_by_posts", "database/incremental_relationships.py",
+                  inc.INSPIRED_BY_QUERY.format(anchor="post"), lambda f: {"ids": f["post_ids"]}, writes=True),
+    QueryTemplate("incremental.node_styles", "database/incremental_relationships.py",
+                  inc.NODE_STYLES_QUERY.format(label="Product"), lambda f: {"ids": f["product_ids"]}),
+    QueryTemplate("incremental.set_indexed_styles", "database/incremental_relationships.py",
+                  inc.SET_INDEXED_STYLES_QUERY.format(label="Product"),
+                  lambda f: {"rows": [{"id": f["product_id"], "styles": f["styles"]}]}, writes=True),
+    QueryTemplate("incremental.co_occurrence_delta", "database/incremental_relationships.py",
+                  inc.APPLY_CO_OCCURRENCE_DELTA_QUERY,
+                  lambda f: {"rows": [{"a": f["styles"][0], "b": f["styles"][-1], "delta": 1}]}, writes=True),
+    QueryTemplate("incremental.sync_similar_to", "database/incremental_relationships.py",
+                  inc.SYNC_SIMILAR_TO_QUERY,
+                  lambda f: {"pairs": [[f["styles"][0], f["styles"][-1]]], "min_co_occurrence": 5}, writes=True),
+    QueryTemplate("incremental.near_post_products", "database/inspired_by_ranking.py",
+                  ranking.NEAR_POST_PRODUCTS_QUERY, lambda f: {"ids": f["post_ids"], "candidates": 50}),
+    QueryTemplate("incremental.linked_products", "database/inspired_by_ranking.py",
+                  ranking.LINKED_PRODUCTS_QUERY, lambda f: {"ids": f["post_ids"]}),
+
+    # loader
+    QueryTemplate("loader.create_product", "loader/shop_neo4j.py", shop.CREATE_PRODUCT_QUERY,
+                  lambda f: {"id": f["product_id"], "name": "profile probe", "description": "", "price": 490.0,
+                             "original_price": 990.0, "image_url": "", "brand": "QueenShop", "category": "上衣"},
+                  writes=True),
+    QueryTemplate("loader.create_style_relationships", "loader/shop_neo4j.py", shop.CREATE_STYLE_RELATIONSHIPS_QUERY,
+                  lambda f: {"product_id": f["product_id"], "styles": f["styles"]}, writes=True),
+    QueryTemplate("loader.insert_post", "loader/instagram_neo4j.py", ig.INSERT_POST_QUERY,
+                  lambda f: {"user_id": "profile-probe", "user_name": "profile probe", "post_id": f["post_id"],
+                             "caption": "", "url": "", "description": "", "image_url": "",
+                             "timestamp": "2025-01-01T00:00:00", "img_embedding": f["embedding"],
+                             "img_embedding_small": f["small_embedding"]},
+                  writes=True),
+    QueryTemplate("loader.fetch_colorless", "loader/extract_colors.py",
+                  colors.FETCH_QUERY.format(label="Product", image=colors.IMAGE_PROPERTY["Product"]),
+                  lambda f: {"force": False}, full_graph=True),
+    QueryTemplate("loader.fetch_posts_for_styles", "loader/post_styles.py", ps.FETCH_POSTS_QUERY,
+                  lambda f: {"force": False}, full_graph=True),
+    QueryTemplate("loader.write_post_styles", "loader/post_styles.py", ps.WRITE_POST_STYLES_QUERY,
+                  lambda f: {"rows": [{"id": f["post_id"], "source": "profile-probe",
+                                       "styles": [{"name": f["styles"][0], "confidence": 0.9}]}]},
+                  writes=True),
+    QueryTemplate("loader.write_colors", "loader/extract_colors.py", colors.WRITE_COLORS_QUERY.format(label="Product"),
+                  lambda f: {"rows": [{"id": f["product_id"], "palette": ["#1a1a1a", "#f5f5f5"],
+                                       "palette_shares": [0.7, 0.3],
+                                       "colors": [{"name": "黑", "share": 0.7}, {"name": "白", "share": 0.3}]}]},
+                  writes=True),
+]
+
+
+# 檢查是否全部登記的模組（benchmark/ 的查詢只用於量測，不列入）
+SCANNED_MODULES = [qn, pm, cascade, ob, ks, vs, br, inc, ranking, shop, ig, colors, ps]
+
+
+def _template_pattern(template: str) -> "re.Pattern":
+    """模板常數 -> 比對登記查詢的 regex；.format 的欄位（{label}、{conditions} ...）可為任意內容"""
+    parts = []
+    for literal, field, _, _ in Formatter().parse(template):
+        parts.append(re.escape(literal))
+        if field is not None:
+            parts.append(".*?")
+    return re.compile("".join(parts), re.S)
+
+
+def unregistered_queries() -> List[str]:
+    """SCANNED_MODULES 中沒有任何登記模板對應的 *_QUERY 常數（module.NAME）"""
+    registered = [template.query for template in TEMPLATES]
+    missing = []
+    for module in SCANNED_MODULES:
+        for name, value in vars(module).items():
+            if not name.endswith("_QUERY") or not isinstance(value, str):
+                continue
+            pattern = _template_pattern(value)
+            if not any(pattern.fullmatch(query) for query in registered):
+                missing.append(f"{module.__name__}.{name}")
+    return missing
+
+
+def _random_unit(dim: int, seed: int) -> List[float]:
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def representative_fixtures(session, seed: int = 0) -> Dict:
+    """由目前的資料取出查詢參數：有風格的商品 / 貼文 id、最常見的風格組合、真實的 embedding"""
+    product_ids = [r['id'] for r in session.run("""
+        MATCH (p:Product)-[:HAS_STYLE]->()
+        RETURN DISTINCT p.id as id LIMIT $n
+    """, n=SAMPLE_IDS)] or ["profile-probe"]
+    post = session.run("""
+        MATCH (p:Post)-[:HAS_STYLE]->()
+        WITH DISTINCT p LIMIT $n
+        RETURN collect(p.id) as ids,
+               head(collect(coalesce(p.img_embedding, p.img_emb))) as embedding,
+               head(collect(p.img_embedding_small)) as small_embedding
+    """, n=SAMPLE_IDS).single()
+    styles = [r['name'] for r in session.run("""
+        MATCH (s:Style)<-[:HAS_STYLE]-(:Product)
+        RETURN s.name as name, count(*) as n
+        ORDER BY n DESC LIMIT 2
+    """)] or ['休閒']
+    bundle = session.run("MATCH (b:OutfitBundles) RETURN b.key as key LIMIT 1").single()
+    since = session.run("RETURN toString(datetime() - duration('P1D')) as since").single()['since']
+
+    post_ids = post['ids'] if post and post['ids'] else ["profile-probe"]
+    return {
+        "product_id": product_ids[0],
+        "product_ids": product_ids,
+        "post_id": post_ids[0],
+        "post_ids": post_ids,
+        "styles": styles,
+        "embedding": (post and post['embedding']) or _random_unit(768, seed),
+        "small_embedding": (post and post['small_embedding']) or _random_unit(384, seed),
+        "bundle_key": bundle['key'] if bundle else f"product:{product_ids[0]}",
+        "since": since,
+    }
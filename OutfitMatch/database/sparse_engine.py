@@ -0,0 +1,237 @@
+"""
+Sparse Relationship Engine
+把 Product / Post – Style 二分圖一次匯出成 SciPy 稀疏矩陣，離線計算 build_relationships 的所有階段：
+- GOES_WITH（風格搭配）、上下身搭配、INSPIRED_BY、SIMILAR_TO
+共同風格數由稀疏矩陣乘法 S · Sᵀ 取得，類別 / 價差條件以 numpy 向量化過濾；
+以固定列數的 block 計算並逐批 yield 結果，記憶體不隨 n² 成長
+語意與 build_relationships.py 中的 Cypher 相同（top_k=None 時保留全部關係）；
+GOES_WITH 的 top-k 交給 goes_with_engine 的分區引擎（build_topk），兩種建立模式共用同一份 top-k 結果
+"""
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+import numpy as np
+from scipy import sparse
+from database.goes_with_engine import ProductCatalog, synthetic_catalog, build_topk, iter_edge_batches
+
+logger = logging.getLogger(__name__)
+
+
+class StyleGraph:
+    """
+    catalog: 商品（價格、類別、風格）
+    post_ids / post_styles: 貼文與其風格（(m, S) bool，風格編號與 catalog 相同）
+    """
+
+    def __init__(self, catalog: ProductCatalog, post_ids: List[str], post_styles):
+        self.catalog = catalog
+        self.post_ids = list(post_ids)
+        self.post_styles = np.asarray(post_styles, dtype=bool).reshape(len(self.post_ids), len(catalog.style_names))
+        self.prices = catalog.prices.astype(np.float64)
+        self.product_matrix = sparse.csr_matrix(catalog.styles, dtype=np.float32)
+        self.post_matrix = sparse.csr_matrix(self.post_styles, dtype=np.float32)
+
+    @property
+    def style_names(self) -> List[str]:
+        return self.catalog.style_names
+
+    @classmethod
+    def from_records(cls, products: List[Dict], posts: List[Dict]) -> "StyleGraph":
+        """products: [{'id', 'price', 'category', 'styles'}]；posts: [{'id', 'styles'}]"""
+        style_names = sorted({s for r in products + posts for s in (r['styles'] or [])})
+        style_index = {name: i for i, name in enumerate(style_names)}
+        catalog = ProductCatalog.from_records(products, style_names)
+
+        post_styles = np.zeros((len(posts), len(style_names)), dtype=bool)
+        for row, record in enumerate(posts):
+            for style in record['styles'] or []:
+                post_styles[row, style_index[style]] = True
+        return cls(catalog, [r['id'] for r in posts], post_styles)
+
+
+def synthetic_graph(n_products: int, n_posts: int = None, seed: int = 0, **kwargs) -> StyleGraph:
+    """合成商品目錄加上貼文（預設貼文數為商品數的 1/10）"""
+    catalog = synthetic_catalog(n_products, seed=seed, **kwargs)
+    n_posts = n_products // 10 if n_posts is None else n_posts
+    rng = np.random.default_rng(seed + 1)
+    post_styles = rng.random((n_posts, len(catalog.style_names))) < 2.0 / len(catalog.style_names)
+    return StyleGraph(catalog, [f"synthetic-post-{i}" for i in range(n_posts)], post_styles)
+
+
+def _common_style_names(style_names: List[str], a_styles, b_styles) -> List[List[str]]:
+    """逐列取 a、b 共同的風格名稱（相同的風格組合只轉換一次）"""
+    common = a_styles & b_styles
+    if not len(common):
+        return []
+    patterns, inverse = np.unique(np.packbits(common, axis=1), axis=0, return_inverse=True)
+    names = [[style_names[j] for j in np.nonzero(row)[0]]
+             for row in np.unpackbits(patterns, axis=1, count=len(style_names)).astype(bool)]
+    return [names[i] for i in inverse.ravel()]
+
+
+def _dense_top_k(scores, k: int):
+    """scores: (block, n) dense，不成立的組合為 -inf；回傳每列 top-k 中成立的 (列, 欄)"""
+    k = min(k, scores.shape[1])
+    cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    rows = np.repeat(np.arange(scores.shape[0]), k)
+    cols = cols.ravel()
+    keep = np.isfinite(scores[rows, cols])
+    return rows[keep], cols[keep]
+
+
+def _rows_per_block(left_styles, right_styles, block_nnz: int) -> int:
+    """依平均每列的非零項數（共同風格的配對數上限）決定 block 列數，讓每個 block 約 block_nnz 項"""
+    per_row = left_styles.astype(np.float64) @ right_styles.sum(axis=0)
+    return max(1, int(block_nnz / max(per_row.mean() if len(per_row) else 1.0, 1.0)))
+
+
+def _block_pairs(left, right_t, start: int):
+    """left[start:start+block] · rightᵀ 的非零項：(left 列, right 列, 共同風格數)"""
+    product = (left @ right_t).tocoo()
+    return product.row + start, product.col, product.data.astype(np.float64)
+
+
+def goes_with_edges(graph: StyleGraph, min_common_styles: int = 1, max_price_diff: float = 5000.0,
+                    top_k: Optional[int] = None, block_nnz: int = 2_000_000,
+                    block_cells: int = 4_000_000) -> Iterator[List[Dict]]:
+    """
+    build_style_based_recommendations：不同類別、價差 < max_price_diff、共同風格數 >= min_common_styles
+    每個方向各一條（p1 → p2 與 p2 → p1），score = 共同風格數 / (價差 / 1000 + 1)
+    top_k 指定時每個商品只保留 score 最高的 top_k 個，由 goes_with_engine.build_topk 分區計算
+    """
+    catalog = graph.catalog
+    if top_k is not None:
+        table, _ = build_topk(catalog, k=top_k, min_common_styles=min_common_styles,
+                              max_price_diff=max_price_diff, block_cells=block_cells)
+        yield from iter_edge_batches(catalog, table)
+        return
+
+    matrix = graph.product_matrix
+    matrix_t = matrix.T.tocsr()
+    block_rows = _rows_per_block(catalog.styles, catalog.styles, block_nnz)
+    for start in range(0, len(catalog), block_rows):
+        rows, cols, common = _block_pairs(matrix[start:start + block_rows], matrix_t, start)
+        diff = np.abs(graph.prices[rows] - graph.prices[cols])
+        valid = ((catalog.categories[rows] >= 0) & (catalog.categories[cols] >= 0)
+                 & (catalog.categories[rows] != catalog.categories[cols])
+                 & (diff < max_price_diff) & (common >= min_common_styles))
+        rows, cols, common, diff = rows[valid], cols[valid], common[valid], diff[valid]
+        if not len(rows):
+            continue
+
+        scores = common / (diff / 1000.0 + 1.0)
+        names = _common_style_names(graph.style_names, catalog.styles[rows], catalog.styles[cols])
+        yield [
+            {"src": catalog.ids[r], "dst": catalog.ids[c], "score": float(score),
+             "style_match": float(match), "common_styles": shared}
+            for r, c, score, match, shared in zip(rows, cols, scores, common, names)
+        ]
+
+
+def outfit_edges(graph: StyleGraph, top_category: str = '上衣', bottom_category: str = '下身',
+                 max_price_diff: float = 3000.0, block_nnz: int = 2_000_000, top_k: Optional[int] = None,
+                 block_cells: int = 4_000_000, top_rows=None) -> Iterator[List[Dict]]:
+    """
+    build_complete_outfit_recommendations：上衣 → 下身，共同風格 >= 1、價差 < max_price_diff，score = 共同風格數 × 1.5
+    top_k 指定時每件上衣只保留 score 最高的 top_k 件下身（與 GOES_WITH 的 top-k 相同，避免上下身搭配撐大每個商品的關係數）
+    top_rows 指定時只計算這些商品中的上衣（增量維護用）
+    """
+    catalog = graph.catalog
+    if top_category not in catalog.category_names or bottom_category not in catalog.category_names:
+        return
+    tops = np.flatnonzero(catalog.categories == catalog.category_names.index(top_category))
+    if top_rows is not None:
+        tops = np.intersect1d(tops, np.asarray(top_rows, dtype=np.int64))
+    bottoms = np.flatnonzero(catalog.categories == catalog.category_names.index(bottom_category))
+    if not len(tops) or not len(bottoms):
+        return
+    bottom_t = graph.product_matrix[bottoms].T.tocsr()
+    if top_k is None:
+        block_rows = _rows_per_block(catalog.styles[tops], catalog.styles[bottoms], block_nnz)
+    else:
+        block_rows = max(1, block_cells // max(len(bottoms), 1))
+
+    for start in range(0, len(tops), block_rows):
+        block = tops[start:start + block_rows]
+        if top_k is None:
+            rows, cols, common = _block_pairs(graph.product_matrix[block], bottom_t, 0)
+            rows, cols = block[rows], bottoms[cols]
+            valid = np.abs(graph.prices[rows] - graph.prices[cols]) < max_price_diff
+            rows, cols, common = rows[valid], cols[valid], common[valid]
+        else:
+            dense = (graph.product_matrix[block] @ bottom_t).toarray()
+            valid = (dense > 0) & (np.abs(graph.prices[block][:, None] - graph.prices[bottoms][None, :]) < max_price_diff)
+            local_rows, local_cols = _dense_top_k(np.where(valid, dense, -np.inf), top_k)
+            common = dense[local_rows, local_cols]
+            rows, cols = block[local_rows], bottoms[local_cols]
+        if not len(rows):
+            continue
+
+        names = _common_style_names(graph.style_names, catalog.styles[rows], catalog.styles[cols])
+        yield [
+            {"src": catalog.ids[r], "dst": catalog.ids[c], "score": float(match) * 1.5, "common_styles": shared}
+            for r, c, match, shared in zip(rows, cols, common, names)
+        ]
+
+
+def inspired_by_edges(graph: StyleGraph, top_k: Optional[int] = None,
+                      block_nnz: int = 2_000_000, block_cells: int = 4_000_000,
+                      post_rows=None) -> Iterator[List[Dict]]:
+    """
+    build_post_inspired_relationships：貼文與商品有共同風格即建立，similarity = 共同風格數 / 3
+    top_k 指定時每篇貼文只保留 similarity 最高的 top_k 個商品
+    post_rows 指定時只計算這些貼文（增量維護用）
+    """
+    catalog = graph.catalog
+    product_t = graph.product_matrix.T.tocsr()
+    post_rows = np.arange(len(graph.post_ids)) if post_rows is None else np.asarray(post_rows, dtype=np.int64)
+    if top_k is None:
+        block_rows = _rows_per_block(graph.post_styles[post_rows], catalog.styles, block_nnz)
+    else:
+        block_rows = max(1, block_cells // max(len(catalog), 1))
+
+    for start in range(0, len(post_rows), block_rows):
+        block = post_rows[start:start + block_rows]
+        if top_k is None:
+            rows, cols, common = _block_pairs(graph.post_matrix[block], product_t, 0)
+            rows = block[rows]
+            similarity = common / 3.0
+        else:
+            dense = (graph.post_matrix[block] @ product_t).toarray()
+            local_rows, cols = _dense_top_k(np.where(dense > 0, dense, -np.inf), top_k)
+            rows = block[local_rows]
+            similarity = dense[local_rows, cols].astype(np.float64) / 3.0
+        if not len(rows):
+            continue
+
+        names = _common_style_names(graph.style_names, graph.post_styles[rows], catalog.styles[cols])
+        yield [
+            {"post": graph.post_ids[r], "product": catalog.ids[c], "similarity": float(sim), "common_styles": shared}
+            for r, c, sim, shared in zip(rows, cols, similarity, names)
+        ]
+
+
+def style_similarity_edges(graph: StyleGraph, min_co_occurrence: int = 5) -> List[Dict]:
+    """create_style_similarity_graph：商品與貼文中共同出現 >= min_co_occurrence 次的風格，兩個方向各一條"""
+    incidence = sparse.vstack([graph.product_matrix, graph.post_matrix]).tocsc()
+    co_occurrence = (incidence.T @ incidence).toarray()
+    s1, s2 = np.nonzero(np.triu(co_occurrence, k=1) >= min_co_occurrence)
+    edges = []
+    for a, b in zip(s1, s2):
+        count = int(co_occurrence[a, b])
+        for src, dst in ((a, b), (b, a)):
+            edges.append({"src": graph.style_names[src], "dst": graph.style_names[dst],
+                          "similarity": count / 100.0, "co_occurrence": count})
+    return edges
+
+
+def rebatch(batches: Iterable[List[Dict]], batch_size: int) -> Iterator[List[Dict]]:
+    """把 engine 依 block 產生的結果重新切成每批 batch_size 筆（寫入 Neo4j 用）"""
+    pending = []
+    for batch in batches:
+        pending.extend(batch)
+        full = len(pending) // batch_size * batch_size
+        for i in range(0, full, batch_size):
+            yield pending[i:i + batch_size]
+        pending = pending[full:]
+    if pending:
+        yield pending
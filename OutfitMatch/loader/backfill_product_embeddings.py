@@ -0,0 +1,124 @@
+"""
+Backfill Product Embeddings
+為商品補上 dinov2-base embedding（img_embedding），供 product_image_index 與依圖片相似度排序的 INSPIRED_BY 使用；
+並把舊版 instagram_neo4j 只寫在 img_emb 的貼文 embedding 複製到 post_image_index 使用的 img_embedding（新貼文寫入時兩者都會寫）
+同一次分割順便計算商品主色（HAS_COLOR，見 loader/extract_colors.py）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import requests
+from PIL import Image
+from loader.instagram_neo4j import (
+    init_neo4j,
+    close_neo4j,
+    crop_with_mask,
+    segment_fashion_regions_batch,
+    get_image_embeddings_batch
+)
+import loader.instagram_neo4j as ig
+from loader.extract_colors import palette_for_region, write_colors
+from database.catalog_version import bump_catalog_version
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def fetch_products_missing_embedding(session, limit: int = None):
+    query = """
+    MATCH (p:Product)
+    WHERE p.img_embedding IS NULL AND p.image_url IS NOT NULL AND p.image_url <> ''
+    RETURN p.id AS id, p.image_url AS image_url
+    """
+    if limit:
+        query += " LIMIT $limit"
+    return [record.data() for record in session.run(query, limit=limit)]
+
+
+def write_product_embeddings(tx, rows):
+    tx.run("""
+    UNWIND $rows AS row
+    MATCH (p:Product {id: row.id})
+    SET p.img_embedding = row.embedding
+    """, rows=rows)
+
+
+def copy_post_embeddings(session) -> int:
+    return session.run("""
+    MATCH (p:Post)
+    WHERE p.img_embedding IS NULL AND p.img_emb IS NOT NULL
+    SET p.img_embedding = p.img_emb
+    RETURN count(p) AS count
+    """).single()['count']
+
+
+def embed_batch(products):
+    """
+    下載並分割一批商品圖片，一次 forward 產生 embedding；分割不到服飾區域時用原圖
+    回傳 (embedding rows, color rows)，分割失敗的商品沒有 color row
+    """
+    images, ids = [], []
+    for product in products:
+        try:
+            images.append(Image.open(requests.get(product['image_url'], stream=True, timeout=30).raw).convert("RGB"))
+            ids.append(product['id'])
+        except Exception as e:
+            logger.error(f"Error downloading product {product['id']}: {e}")
+    if not images:
+        return [], []
+
+    regions = segment_fashion_regions_batch(images)
+    crops = [image if isinstance(region, Exception) else crop_with_mask(*region)
+             for image, region in zip(images, regions)]
+    embeddings = get_image_embeddings_batch(crops)
+    color_rows = []
+    for product_id, region in zip(ids, regions):
+        row = palette_for_region(region)
+        if row:
+            color_rows.append({'id': product_id, **row})
+    return ([{'id': product_id, 'embedding': embedding.tolist()} for product_id, embedding in zip(ids, embeddings)],
+            color_rows)
+
+
+def main(batch_size: int = 16, limit: int = None):
+    init_neo4j()
+    try:
+        with ig.driver_neo4j.session() as session:
+            copied = copy_post_embeddings(session)
+            logger.info(f"📋 Copied img_emb to img_embedding for {copied} posts")
+
+            products = fetch_products_missing_embedding(session, limit)
+            logger.info(f"🔍 {len(products)} products need embeddings")
+
+            done = 0
+            for i in range(0, len(products), batch_size):
+                rows, color_rows = embed_batch(products[i:i + batch_size])
+                if rows:
+                    session.execute_write(write_product_embeddings, rows)
+                    done += len(rows)
+                if color_rows:
+                    write_colors(session, "Product", color_rows)
+                logger.info(f"Progress: {done}/{len(products)} products backfilled")
+
+            logger.info(f"✅ Backfilled embeddings for {done} products")
+        if done or copied:
+            bump_catalog_version(ig.driver_neo4j, "backfill_product_embeddings")
+    finally:
+        close_neo4j()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backfill dinov2-base embeddings for products')
+    parser.add_argument('--batch_size', type=int, default=16,
+                      help='Number of product images embedded per forward pass and transaction')
+    parser.add_argument('--limit', type=int, default=None,
+                      help='Maximum number of products to process (optional, for testing)')
+
+    args = parser.parse_args()
+    main(args.batch_size, args.limit)
@@ -0,0 +1,91 @@
+"""
+Backfill Small Embeddings
+為既有貼文補上 dinov2-small embedding（img_embedding_small），供 cascade 模式的 post_image_small_index 使用
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import requests
+from PIL import Image
+from loader.instagram_neo4j import (
+    init_neo4j,
+    close_neo4j,
+    segment_and_crop_fashion,
+    get_image_embedding_small
+)
+import loader.instagram_neo4j as ig
+from database.catalog_version import bump_catalog_version
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def fetch_posts_missing_small_embedding(session, limit: int = None):
+    query = """
+    MATCH (p:Post)
+    WHERE p.img_embedding_small IS NULL AND p.image IS NOT NULL
+    RETURN p.id AS id, p.image AS image_url
+    """
+    if limit:
+        query += " LIMIT $limit"
+    return [record.data() for record in session.run(query, limit=limit)]
+
+
+def write_small_embeddings(tx, rows):
+    tx.run("""
+    UNWIND $rows AS row
+    MATCH (p:Post {id: row.id})
+    SET p.img_embedding_small = row.embedding
+    """, rows=rows)
+
+
+def main(batch_size: int = 50, limit: int = None):
+    init_neo4j()
+    try:
+        with ig.driver_neo4j.session() as session:
+            posts = fetch_posts_missing_small_embedding(session, limit)
+            logger.info(f"🔍 {len(posts)} posts need small embeddings")
+
+            rows = []
+            done = 0
+            for post in posts:
+                try:
+                    image = Image.open(requests.get(post['image_url'], stream=True).raw)
+                    seg_img = segment_and_crop_fashion(image)
+                    rows.append({'id': post['id'], 'embedding': get_image_embedding_small(seg_img).tolist()})
+                except Exception as e:
+                    logger.error(f"Error embedding post {post['id']}: {e}")
+                    continue
+
+                if len(rows) >= batch_size:
+                    session.execute_write(write_small_embeddings, rows)
+                    done += len(rows)
+                    rows = []
+                    logger.info(f"Progress: {done}/{len(posts)} posts backfilled")
+
+            if rows:
+                session.execute_write(write_small_embeddings, rows)
+                done += len(rows)
+
+            logger.info(f"✅ Backfilled small embeddings for {done} posts")
+        if done:
+            bump_catalog_version(ig.driver_neo4j, "backfill_small_embeddings")
+    finally:
+        close_neo4j()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backfill dinov2-small embeddings for posts')
+    parser.add_argument('--batch_size', type=int, default=50,
+                      help='Number of posts written per transaction')
+    parser.add_argument('--limit', type=int, default=None,
+                      help='Maximum number of posts to process (optional, for testing)')
+
+    args = parser.parse_args()
+    main(args.batch_size, args.limit)
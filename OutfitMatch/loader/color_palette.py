@@ -0,0 +1,211 @@
+"""
+Color Palette
+以分割遮罩內的服飾像素計算主色（只依賴 numpy，查詢層解析顏色詞時不需載入模型）：
+- 遮罩內像素抽樣後轉成 CIE Lab，以向量化的 k-means（k-means++ 初始化、固定 seed）分群
+- 每個群的中心量化到 COLOR_BUCKETS 中的一個顏色（黑、白、灰、米、棕、紅、橘、黃、綠、藍、紫、粉），
+  同一顏色的群合併
+- palette 為依佔比排序的 hex 與佔比；佔比 >= COLOR_MIN_SHARE 的顏色寫成 (:Product|Post)-[:HAS_COLOR {share}]->(:Color)
+查詢中的顏色詞（「黑色」、「米白」、「酒紅」）以 COLOR_WORDS 直接對應到顏色節點
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import colorsys
+import re
+from typing import Dict, List, Tuple
+import numpy as np
+
+# 顏色節點：名稱 -> 代表色（init_neo4j_schema 建立節點時使用）
+COLOR_BUCKETS = {
+    "黑": "#1a1a1a",
+    "白": "#f5f5f5",
+    "灰": "#8c8c8c",
+    "米": "#e8dcc4",
+    "棕": "#7b5236",
+    "紅": "#c0392b",
+    "橘": "#e67e22",
+    "黃": "#f1c40f",
+    "綠": "#3c8d3c",
+    "藍": "#2e5c9e",
+    "紫": "#7d3c98",
+    "粉": "#f4a6c1",
+}
+
+# 查詢中的顏色詞 -> 顏色節點（比對時長的詞優先，「米白」不會被當成白）
+COLOR_WORDS = {
+    "黑色": "黑", "黑": "黑", "墨黑": "黑",
+    "白色": "白", "白": "白", "純白": "白",
+    "灰色": "灰", "灰": "灰", "淺灰": "灰", "深灰": "灰", "麻灰": "灰",
+    "米白": "米", "米色": "米", "杏色": "米", "奶油色": "米", "奶茶色": "米", "卡其": "米", "燕麥色": "米",
+    "棕色": "棕", "咖啡色": "棕", "咖啡": "棕", "駝色": "棕", "焦糖色": "棕", "深棕": "棕",
+    "紅色": "紅", "紅": "紅", "酒紅": "紅", "磚紅": "紅",
+    "橘色": "橘", "橘": "橘", "橙色": "橘",
+    "黃色": "黃", "黃": "黃", "芥末黃": "黃", "鵝黃": "黃",
+    "綠色": "綠", "綠": "綠", "軍綠": "綠", "墨綠": "綠", "橄欖綠": "綠", "薄荷綠": "綠",
+    "藍色": "藍", "藍": "藍", "深藍": "藍", "海軍藍": "藍", "淺藍": "藍", "天空藍": "藍", "丹寧": "藍",
+    "紫色": "紫", "紫": "紫", "薰衣草紫": "紫",
+    "粉色": "粉", "粉紅": "粉", "粉紅色": "粉", "淺粉": "粉", "玫瑰粉": "粉",
+}
+
+# 含顏色字但不是指顏色的詞，這些詞裡的顏色字不解析成顏色（「網紅」、「抗紫外線」、「蛋白色」）
+NON_COLOR_WORDS = (
+    "網紅", "紅人", "爆紅", "走紅", "紅利", "紅包", "紅毯",
+    "紫外線", "抗紫",
+    "蛋白", "小白鞋", "白領", "白金",
+    "黑科技", "灰姑娘", "藍牙", "藍芽",
+)
+# 單字的顏色詞（「黑」、「紅」）只在前後都是分隔符號時才算顏色，避免拆開一般詞彙
+COLOR_WORD_SEPARATORS = r"\s,，、。.!！/"
+
+# 計算主色時最多使用的像素數（均勻抽樣）
+MAX_PIXELS = 4096
+PALETTE_SIZE = 5
+KMEANS_ITERATIONS = 12
+# 寫成 HAS_COLOR 的最低佔比
+COLOR_MIN_SHARE = 0.15
+
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """(N, 3) 0~255 sRGB -> (N, 3) CIE Lab（D65）"""
+    c = rgb.astype(np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([[0.4124564, 0.2126729, 0.0193339],
+                             [0.3575761, 0.7151522, 0.1191920],
+                             [0.1804375, 0.0721750, 0.9503041]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def sample_pixels(pixels: np.ndarray, max_pixels: int = MAX_PIXELS) -> np.ndarray:
+    """均勻間隔抽樣（結果固定，同一張圖每次得到相同的主色）"""
+    if len(pixels) <= max_pixels:
+        return pixels
+    return pixels[np.linspace(0, len(pixels) - 1, max_pixels).astype(np.int64)]
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS,
+           seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """向量化 k-means，回傳 (centers (k', D), labels (N,))；相同的點少於 k 個時 k' < k"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(np.unique(points, axis=0)))
+    # k-means++ 初始化
+    centers = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = ((points[:, None, :] - np.asarray(centers)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        centers.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centers = np.asarray(centers)
+
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+    return centers, labels
+
+
+def color_bucket(rgb) -> str:
+    """把一個顏色量化到 COLOR_BUCKETS 的名稱（依 HSV 的明度、彩度與色相）"""
+    h, s, v = colorsys.rgb_to_hsv(*(float(x) / 255.0 for x in rgb))
+    hue = h * 360
+    if v < 0.2 or (v < 0.3 and s < 0.35):
+        return "黑"
+    if s < 0.12:
+        return "白" if v > 0.85 else "灰"
+    if 15 <= hue < 50 and s < 0.35 and v > 0.6:
+        return "米"
+    if 10 <= hue < 45 and v < 0.6:
+        return "棕"
+    if hue >= 345 or hue < 15:
+        return "粉" if s < 0.45 and v > 0.7 else "紅"
+    if hue < 40:
+        return "橘"
+    if hue < 70:
+        return "黃"
+    if hue < 170:
+        return "綠"
+    if hue < 255:
+        return "藍"
+    if hue < 290:
+        return "紫"
+    return "粉"
+
+
+def to_hex(rgb) -> str:
+    return "#" + "".join(f"{int(round(x)):02x}" for x in np.clip(rgb, 0, 255))
+
+
+def extract_palette(pixels: np.ndarray, k: int = PALETTE_SIZE) -> List[Dict]:
+    """
+    pixels: (N, 3) 遮罩內的 RGB 像素
+    回傳 [{'hex', 'color', 'share'}]，依佔比由高到低；同一顏色的群合併為一筆（hex 為合併後的平均色）
+    """
+    pixels = sample_pixels(np.asarray(pixels, dtype=np.uint8).reshape(-1, 3))
+    if len(pixels) == 0:
+        return []
+    _, labels = kmeans(srgb_to_lab(pixels), k)
+
+    # 以每群的 RGB 平均量化（Lab 中心轉回 RGB 需要反轉換，直接取像素平均即可）
+    counts = np.bincount(labels)
+    sums = np.zeros((len(counts), 3))
+    np.add.at(sums, labels, pixels.astype(np.float64))
+    merged: Dict[str, np.ndarray] = {}
+    for cluster in np.nonzero(counts)[0]:
+        mean = sums[cluster] / counts[cluster]
+        bucket = color_bucket(mean)
+        merged.setdefault(bucket, np.zeros(4))
+        merged[bucket] += np.append(sums[cluster], counts[cluster])
+
+    total = len(pixels)
+    palette = [{"hex": to_hex(acc[:3] / acc[3]), "color": bucket, "share": round(float(acc[3] / total), 3)}
+               for bucket, acc in merged.items()]
+    return sorted(palette, key=lambda entry: -entry["share"])
+
+
+def masked_pixels(image, mask: np.ndarray) -> np.ndarray:
+    """分割結果（裁切後的圖片與遮罩）中屬於服飾的像素"""
+    image_np = np.asarray(image.convert("RGB"))
+    return image_np[mask.astype(bool)]
+
+
+def palette_row(palette: List[Dict], min_share: float = COLOR_MIN_SHARE) -> Dict:
+    """寫入 Neo4j 的欄位：palette（hex list）、palette_shares 與佔比足夠的顏色（至少保留主色）"""
+    colors = [entry for i, entry in enumerate(palette) if i == 0 or entry["share"] >= min_share]
+    return {
+        "palette": [entry["hex"] for entry in palette],
+        "palette_shares": [entry["share"] for entry in palette],
+        "colors": [{"name": entry["color"], "share": entry["share"]} for entry in colors],
+    }
+
+
+def _color_word_pattern(word: str) -> str:
+    if len(word) > 1:
+        return re.escape(word)
+    return rf"(?<![^{COLOR_WORD_SEPARATORS}]){re.escape(word)}(?![^{COLOR_WORD_SEPARATORS}])"
+
+
+def parse_color_words(text: str) -> Tuple[List[str], List[str], str]:
+    """
+    找出文字中的顏色詞，回傳 (顏色節點名稱, 找到的顏色詞, 移除顏色詞後的文字)
+    多字的顏色詞（「黑色」、「米白」）直接比對；單字的顏色詞必須獨立成詞；NON_COLOR_WORDS 內的字不算顏色
+    """
+    blocked = [match.span() for word in NON_COLOR_WORDS for match in re.finditer(re.escape(word), text)]
+    colors, words = [], []
+    for word in sorted(COLOR_WORDS, key=len, reverse=True):
+        for match in list(re.finditer(_color_word_pattern(word), text)):
+            start, end = match.span()
+            if any(start < b_end and b_start < end for b_start, b_end in blocked):
+                continue
+            if word not in words:
+                words.append(word)
+            if COLOR_WORDS[word] not in colors:
+                colors.append(COLOR_WORDS[word])
+            # 以等長空白取代，blocked 的位置不變
+            text = text[:start] + " " * (end - start) + text[end:]
+    return colors, words, text
@@ -0,0 +1,137 @@
+"""
+Extract Colors
+以 SegFormer 分割遮罩內的服飾像素計算商品與貼文圖片的主色（loader/color_palette.py），寫成：
+- n.palette / n.palette_shares：依佔比排序的 hex 與佔比
+- (n)-[:HAS_COLOR {share}]->(:Color)：量化後的顏色，查詢以顏色節點過濾
+爬蟲與 backfill_product_embeddings 在寫入時就會計算，這裡補上尚未有 palette 的節點
+分割找不到服飾區域的圖片不寫入顏色（商品圖的白色背景會被當成主色）
+
+用法：
+    python loader/extract_colors.py                        # 商品與貼文都補上
+    python loader/extract_colors.py --labels Product --force --limit 100
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import time
+from typing import Dict, List, Optional
+import requests
+from PIL import Image
+from loader.instagram_neo4j import init_neo4j, close_neo4j, segment_fashion_regions_batch
+import loader.instagram_neo4j as ig
+from loader.color_palette import extract_palette, masked_pixels, palette_row
+from database.catalog_version import bump_catalog_version
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 各節點的圖片網址屬性
+IMAGE_PROPERTY = {"Product": "image_url", "Post": "image"}
+
+FETCH_QUERY = """
+MATCH (n:{label})
+WHERE ($force OR n.palette IS NULL) AND n.{image} IS NOT NULL AND n.{image} <> ''
+RETURN n.id AS id, n.{image} AS image_url
+ORDER BY n.id
+"""
+
+# 先移除舊的 HAS_COLOR 再寫入；顏色不影響推薦關係，不更新 updated_at
+WRITE_COLORS_QUERY = """
+UNWIND $rows AS row
+MATCH (n:{label} {{id: row.id}})
+OPTIONAL MATCH (n)-[old:HAS_COLOR]->(:Color)
+DELETE old
+WITH DISTINCT n, row
+SET n.palette = row.palette,
+    n.palette_shares = row.palette_shares,
+    n.colors_extracted_at = datetime()
+WITH n, row
+UNWIND row.colors AS color
+MERGE (c:Color {{name: color.name}})
+MERGE (n)-[r:HAS_COLOR]->(c)
+SET r.share = color.share
+"""
+
+
+def palette_for_region(region) -> Optional[Dict]:
+    """segment_fashion_regions_batch 的一筆結果 -> 寫入用的 palette row；分割失敗時回傳 None"""
+    if isinstance(region, Exception):
+        return None
+    palette = extract_palette(masked_pixels(*region))
+    return palette_row(palette) if palette else None
+
+
+def palettes_for_images(images: List[Image.Image]) -> List[Optional[Dict]]:
+    """一次分割 forward，回傳與輸入等長的 palette row"""
+    return [palette_for_region(region) for region in segment_fashion_regions_batch(images)]
+
+
+def write_colors(session, label: str, rows: List[Dict]):
+    """rows: [{'id', 'palette', 'palette_shares', 'colors'}]"""
+    session.execute_write(lambda tx: tx.run(WRITE_COLORS_QUERY.format(label=label), rows=rows).consume())
+
+
+def download_image(url: str) -> Image.Image:
+    return Image.open(requests.get(url, stream=True, timeout=30).raw).convert("RGB")
+
+
+def extract_batch(nodes: List[Dict]) -> List[Dict]:
+    images, ids = [], []
+    for node in nodes:
+        try:
+            images.append(download_image(node['image_url']))
+            ids.append(node['id'])
+        except Exception as e:
+            logger.error(f"Error downloading image for {node['id']}: {e}")
+    if not images:
+        return []
+    return [{"id": node_id, **row} for node_id, row in zip(ids, palettes_for_images(images)) if row]
+
+
+def main(labels: List[str], batch_size: int = 16, limit: int = None, force: bool = False):
+    init_neo4j()
+    written = 0
+    try:
+        with ig.driver_neo4j.session() as session:
+            for label in labels:
+                query = FETCH_QUERY.format(label=label, image=IMAGE_PROPERTY[label])
+                nodes = session.run(query, force=force).data()
+                if limit:
+                    nodes = nodes[:limit]
+                logger.info(f"🔍 {len(nodes)} {label} nodes need colors")
+
+                start, done = time.perf_counter(), 0
+                for i in range(0, len(nodes), batch_size):
+                    rows = extract_batch(nodes[i:i + batch_size])
+                    if rows:
+                        write_colors(session, label, rows)
+                        done += len(rows)
+                    logger.info(f"Progress: {min(i + batch_size, len(nodes))}/{len(nodes)} {label} nodes")
+                logger.info(f"✅ Extracted colors for {done}/{len(nodes)} {label} nodes "
+                            f"in {time.perf_counter() - start:.1f}s")
+                written += done
+        if written:
+            bump_catalog_version(ig.driver_neo4j, "extract_colors")
+    finally:
+        close_neo4j()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract dominant colors from segmented product and post images')
+    parser.add_argument('--labels', nargs='+', choices=list(IMAGE_PROPERTY), default=list(IMAGE_PROPERTY),
+                      help='Node labels to process')
+    parser.add_argument('--batch_size', type=int, default=16,
+                      help='Images segmented per forward pass and written per transaction')
+    parser.add_argument('--limit', type=int, default=None,
+                      help='Maximum number of nodes per label (optional, for testing)')
+    parser.add_argument('--force', action='store_true',
+                      help='Recompute nodes that already have a palette')
+
+    args = parser.parse_args()
+    main(args.labels, args.batch_size, args.limit, args.force)
@@ -7,7 +7,8 @@ from config.settings import (
     NEO4J_USER,
     NEO4J_PASSWORD,
     INSTAGRAM_USERNAME,
-    INSTAGRAM_PASSWORD
+    INSTAGRAM_PASSWORD,
+    SMALL_EMBEDDING_MODEL
 )
 
 # i.連接IG
@@ -28,6 +29,8 @@ import numpy as np
 import torch
 from sklearn.metrics.pairwise import cosine_similarity
 from torchvision import transforms
+from database.catalog_version import bump_catalog_version
+from loader.color_palette import extract_palette, masked_pixels, palette_row
 
 # Initialize Neo4j connection
 driver_neo4j = None
@@ -39,6 +42,10 @@ dino_processor = None
 dino_model = None
 device = None
 
+# Small DINOv2 for cascade recall (lazy loaded)
+dino_small_processor = None
+dino_small_model = None
+
 def init_neo4j():
     global driver_neo4j
     if driver_neo4j is None:
@@ -119,11 +126,8 @@ def crop_fashion_region(image: Image.Image, mask: np.ndarray):
     x1, y1, x2, y2 = bbox
     return image.crop((x1, y1, x2 + 1, y2 + 1)), mask[y1:y2+1, x1:x2+1]
 
-def segment_and_crop_fashion(image: Image.Image, bg_color = (255, 255, 255)):
-    inputs = seg_processor(images=image, return_tensors="pt")
-    outputs = seg_model(**inputs)
-    logits = outputs.logits.cpu()
-
+def _region_from_logits(image: Image.Image, logits):
+    """服飾區域的裁切圖與遮罩 (patch, mask_patch)"""
     upsampled_logits = nn.functional.interpolate(
         logits,
         size=image.size[::-1],
@@ -134,9 +138,52 @@ def segment_and_crop_fashion(image: Image.Image, bg_color = (255, 255, 255)):
     pred_seg_np = pred_seg.numpy()
     fashion_labels = [4, 5, 6, 7, 8, 16, 17]
     fashion_mask = np.isin(pred_seg_np, fashion_labels).astype(np.uint8)
-    patch, mask_patch = crop_fashion_region(image, fashion_mask)
+    return crop_fashion_region(image, fashion_mask)
+
+def _crop_from_logits(image: Image.Image, logits, bg_color=(255, 255, 255)):
+    patch, mask_patch = _region_from_logits(image, logits)
     return crop_with_mask(patch, mask_patch, bg_color)
 
+def segment_and_crop_fashion(image: Image.Image, bg_color = (255, 255, 255)):
+    inputs = seg_processor(images=image, return_tensors="pt")
+    outputs = seg_model(**inputs)
+    logits = outputs.logits.cpu()
+    return _crop_from_logits(image, logits, bg_color)
+
+def segment_fashion_regions_batch(images):
+    """
+    一次 forward 分割多張圖片，回傳 (patch, mask_patch)（主色計算需要遮罩本身）
+    找不到服飾區域的位置為例外物件
+    """
+    inputs = seg_processor(images=images, return_tensors="pt")
+    with torch.no_grad():
+        outputs = seg_model(**inputs)
+    logits = outputs.logits.cpu()
+
+    results = []
+    for i, image in enumerate(images):
+        try:
+            results.append(_region_from_logits(image, logits[i:i + 1]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def segment_and_crop_fashion_batch(images, bg_color=(255, 255, 255)):
+    """
+    一次 forward 分割多張圖片
+    回傳與輸入等長的 list，找不到服飾區域的位置為例外物件
+    """
+    results = []
+    for region in segment_fashion_regions_batch(images):
+        if isinstance(region, Exception):
+            results.append(region)
+            continue
+        try:
+            results.append(crop_with_mask(*region, bg_color))
+        except Exception as e:
+            results.append(e)
+    return results
+
 # Embedding
 def get_image_embedding(image: Image.Image):
     inputs = dino_processor(images=image, return_tensors="pt").to(device)
@@ -145,6 +192,31 @@ def get_image_embedding(image: Image.Image):
         embedding = outputs.last_hidden_state[:, 0].cpu().numpy()  # CLS token
     return embedding.squeeze()
 
+def init_small_embedding_model():
+    global dino_small_processor, dino_small_model
+    if dino_small_model is None:
+        dino_small_processor = AutoImageProcessor.from_pretrained(SMALL_EMBEDDING_MODEL)
+        dino_small_model = AutoModel.from_pretrained(SMALL_EMBEDDING_MODEL)
+        dino_small_model.eval()
+        dino_small_model = dino_small_model.to(device)
+
+def get_image_embedding_small(image: Image.Image):
+    """dinov2-small embedding（384 維），用於 cascade 的第一階段召回"""
+    init_small_embedding_model()
+    inputs = dino_small_processor(images=image, return_tensors="pt").to(device)
+    with torch.no_grad():
+        outputs = dino_small_model(**inputs)
+        embedding = outputs.last_hidden_state[:, 0].cpu().numpy()  # CLS token
+    return embedding.squeeze()
+
+def get_image_embeddings_batch(images):
+    """一次 forward 產生多張圖片的 embedding，回傳 shape (N, 768)"""
+    inputs = dino_processor(images=images, return_tensors="pt").to(device)
+    with torch.no_grad():
+        outputs = dino_model(**inputs)
+        embeddings = outputs.last_hidden_state[:, 0].cpu().numpy()  # CLS token
+    return embeddings
+
 # Parse caption
 def parse_caption(caption_text):
     item_pattern = r"(Top|Pants|Skirt|Shoes|Cap|Jacket|Coat|Sneakers|Shoe|Hat|Belt|Bag|Outer|Accessories)[：:]\s*([\w\-\d@\. ]+)"
@@ -182,23 +254,29 @@ def get_full_image_url(soup):
 
 
 # Insert data into Neo4j
-def insert_post(tx, user_id, user_name, post_id, url, caption, description, timestamp, items, image_url, hashtags, img_embedding):
-    tx.run("""
-        MERGE (u:User {id: $user_id})
-        SET u.name = $user_name
-
-        MERGE (p:Post {id: $post_id})
-        SET p.caption = $caption,
-            p.url = $url,
-            p.description = $description,
-            p.image = $image_url,
-            p.timestamp = datetime($timestamp),
-            p.img_emb = $img_embedding
-
-        MERGE (u)-[:POSTED]->(p)
-    """, user_id=user_id, user_name=user_name,
+INSERT_POST_QUERY = """
+MERGE (u:User {id: $user_id})
+SET u.name = $user_name
+
+MERGE (p:Post {id: $post_id})
+SET p.caption = $caption,
+    p.url = $url,
+    p.description = $description,
+    p.image = $image_url,
+    p.timestamp = datetime($timestamp),
+    p.img_emb = $img_embedding,
+    p.img_embedding = $img_embedding,
+    p.img_embedding_small = $img_embedding_small,
+    p.updated_at = datetime()
+
+MERGE (u)-[:POSTED]->(p)
+"""
+
+def insert_post(tx, user_id, user_name, post_id, url, caption, description, timestamp, items, image_url, hashtags, img_embedding, img_embedding_small=None):
+    tx.run(INSERT_POST_QUERY, user_id=user_id, user_name=user_name,
             post_id=post_id, caption=caption, url=url, description=description, 
-            image_url=image_url, timestamp=timestamp, img_embedding=img_embedding)
+            image_url=image_url, timestamp=timestamp, img_embedding=img_embedding,
+            img_embedding_small=img_embedding_small)
 
     tx.run("""
         MERGE (p:Post {url: $url})
@@ -227,10 +305,14 @@ def insert_post(tx, user_id, user_name, post_id, url, caption, description, time
 # =====================================================
 
 def fetch_all_post_embeddings_and_info():
+    # styles 為寫入時預測的 HAS_STYLE（loader/post_styles.py），依 confidence 排序
     query = """
     MATCH (p:Post)
+    OPTIONAL MATCH (p)-[r:HAS_STYLE]->(s:Style)
+    WITH p, r, s ORDER BY r.confidence DESC
+    WITH p, [name IN collect(s.name) WHERE name IS NOT NULL] AS styles
     RETURN p.id AS id, p.caption AS caption, p.description AS description, 
-           p.image AS image_url, p.img_emb AS img_emb
+           p.image AS image_url, p.img_emb AS img_emb, styles
     """
     with driver_neo4j.session() as session:
         result = session.run(query)
@@ -285,6 +367,8 @@ def scroll_and_get_posts(driver, max_posts=50):
 def run_scraper(max_posts=50):
     init_ml_models()  # Initialize ML models before scraping
     
+    new_posts = []  # 爬完後一次預測風格（HAS_STYLE）
+    new_colors = []  # 分割遮罩內的主色，爬完後一次寫入 HAS_COLOR
     driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
     try:
         # Go to login interface
@@ -332,8 +416,13 @@ def run_scraper(max_posts=50):
                 try:
                     # Embedding
                     image = Image.open(requests.get(image_url, stream=True).raw)
-                    seg_img = segment_and_crop_fashion(image)
+                    region = segment_fashion_regions_batch([image])[0]
+                    if isinstance(region, Exception):
+                        raise region
+                    seg_img = crop_with_mask(*region)
+                    colors = palette_row(extract_palette(masked_pixels(*region)))
                     img_embedding = get_image_embedding(seg_img)
+                    img_embedding_small = get_image_embedding_small(seg_img).tolist()
                 except Exception as e:
                     print(f"Error processing image for post {link}: {e}")
                     continue
@@ -369,10 +458,15 @@ def run_scraper(max_posts=50):
                             items=items,
                             image_url=image_url,
                             hashtags=hashtags,
-                            img_embedding=img_embedding
+                            img_embedding=img_embedding,
+                            img_embedding_small=img_embedding_small
                         )
 
                     print(f"Saved post to Neo4j: {post_id}")
+                    new_posts.append({"id": post_id, "description": description, "caption": caption,
+                                      "embedding": img_embedding})
+                    if colors["palette"]:
+                        new_colors.append({"id": post_id, **colors})
                 
                 # Add delay between posts to avoid rate limiting
                 time.sleep(1)
@@ -385,6 +479,23 @@ def run_scraper(max_posts=50):
         print(f"Error during scraping: {e}")
     finally:
         driver.quit()
+        if new_posts:
+            # 寫入時就預測風格，查詢時只需讀 HAS_STYLE，不再呼叫 LLM
+            from loader.post_styles import style_posts
+            try:
+                stats = style_posts(driver_neo4j, new_posts)
+                print(f"Styled {stats['styled']}/{stats['posts']} posts ({stats['llm_calls']} LLM calls, {stats['cached']} cached)")
+            except Exception as e:
+                print(f"Error predicting post styles (run loader/post_styles.py to backfill): {e}")
+        if new_colors:
+            from loader.extract_colors import write_colors
+            try:
+                with driver_neo4j.session() as session:
+                    write_colors(session, "Post", new_colors)
+                print(f"Saved colors for {len(new_colors)} posts")
+            except Exception as e:
+                print(f"Error saving post colors (run loader/extract_colors.py to backfill): {e}")
+        bump_catalog_version(driver_neo4j, "instagram_neo4j")
 
 # Initialize Neo4j connection when imported
 init_neo4j()
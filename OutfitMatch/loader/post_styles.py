@@ -0,0 +1,257 @@
+"""
+Post Styles
+在寫入貼文時（或以 backfill 補上）預測貼文風格，寫成 (Post)-[:HAS_STYLE {confidence, source}]->(Style)，
+查詢時的風格判斷只需查圖，不再呼叫 LLM：
+- 每篇貼文一次 LLM 呼叫（本機風格分類器以商品文字訓練、沒有在貼文上評估過，不用於貼文），回覆為 JSON（風格 + confidence），只保留 STYLE_LIST 中的風格
+- 以描述與 caption 的內容 hash 快取 LLM 回覆（POST_STYLE_CACHE_PATH），重跑或內容相同的貼文不會重複呼叫
+- 一批貼文並行預測後以 UNWIND 一次寫入，並更新 updated_at 讓增量建立推薦關係時會重算
+
+用法：
+    python loader/post_styles.py                  # 補上尚未有風格的貼文
+    python loader/post_styles.py --force --limit 100
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import openai
+from neo4j import GraphDatabase
+from config.settings import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    NEO4J_URI,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    STYLE_PREDICTION_MODEL,
+    POST_STYLE_CACHE_PATH
+)
+from loader.shop_neo4j import STYLE_LIST
+from database.catalog_version import bump_catalog_version
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
+
+VALID_STYLES = set(STYLE_LIST.split("、"))
+
+# 舊格式（只回傳 list）時依順序給的 confidence
+RANK_CONFIDENCE = [0.8, 0.6]
+
+POST_STYLE_PROMPT = """
+你是一個時尚穿搭風格專家。根據以下資訊，請判斷這篇 IG 穿搭貼文最符合的 1~2 個風格（從下列風格選，最多2個），
+並給出每個風格的信心分數（0~1）。只回傳 JSON，不需解釋、不需補充。
+
+可選風格有：{style_list}
+
+格式：{{"styles": [{{"name": "風格1", "confidence": 0.9}}, {{"name": "風格2", "confidence": 0.6}}]}}
+
+---
+穿搭描述：{desc}
+商品資訊：{items}
+---
+"""
+
+FETCH_POSTS_QUERY = """
+MATCH (p:Post)
+WHERE $force OR NOT (p)-[:HAS_STYLE]->(:Style)
+RETURN p.id AS id, p.description AS description, p.caption AS caption
+ORDER BY p.id
+"""
+
+# 先移除舊的 HAS_STYLE 再寫入新的預測；updated_at 讓 build_relationships --incremental 重算這些貼文
+WRITE_POST_STYLES_QUERY = """
+UNWIND $rows AS row
+MATCH (p:Post {id: row.id})
+OPTIONAL MATCH (p)-[old:HAS_STYLE]->(:Style)
+DELETE old
+WITH DISTINCT p, row
+SET p.styles_predicted_at = datetime(),
+    p.updated_at = datetime()
+WITH p, row
+UNWIND row.styles AS style
+MERGE (s:Style {name: style.name})
+MERGE (p)-[r:HAS_STYLE]->(s)
+SET r.confidence = style.confidence,
+    r.source = row.source
+"""
+
+
+def parse_styles(content: str) -> List[Tuple[str, float]]:
+    """解析 LLM 回覆為 [(風格, confidence)]；接受 JSON 或舊的 Python list 格式，不在 STYLE_LIST 中的風格捨棄"""
+    text = content.strip().replace('```json', '').replace('```', '').strip()
+    styles = []
+    try:
+        data = json.loads(text)
+        entries = data.get("styles", []) if isinstance(data, dict) else data
+        for entry in entries:
+            if isinstance(entry, dict):
+                styles.append((entry.get("name"), entry.get("confidence")))
+            else:
+                styles.append((entry, None))
+    except (json.JSONDecodeError, AttributeError):
+        try:
+            styles = [(name, None) for name in ast.literal_eval(text)]
+        except (ValueError, SyntaxError):
+            return []
+
+    result, seen = [], set()
+    for rank, (name, confidence) in enumerate(styles):
+        if name not in VALID_STYLES or name in seen:
+            continue
+        seen.add(name)
+        try:
+            confidence = min(1.0, max(0.0, float(confidence)))
+        except (TypeError, ValueError):
+            confidence = RANK_CONFIDENCE[min(rank, len(RANK_CONFIDENCE) - 1)]
+        result.append((name, confidence))
+    return result[:2]
+
+
+class StyleCache:
+    """prompt hash -> [(風格, confidence)]，存成 JSON 檔"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, List] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key: str, styles: List[Tuple[str, float]]):
+        with self._lock:
+            self.entries[key] = [list(s) for s in styles]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+
+def build_prompt(post: Dict) -> str:
+    return POST_STYLE_PROMPT.format(style_list=STYLE_LIST,
+                                    desc=post.get('description') or '',
+                                    items=post.get('caption') or '')
+
+
+def predict_post_styles(post: Dict, cache: StyleCache,
+                        model: str = STYLE_PREDICTION_MODEL) -> Tuple[List[Tuple[str, float]], str, Optional[str]]:
+    """
+    單篇貼文的風格、來源與結果（"cached" / "llm_calls"，LLM 全部失敗時為 None）；
+    先查快取，LLM 失敗時重試 3 次，仍失敗回傳空 list。結果由呼叫端在主執行緒統計，worker 不共用計數
+    """
+    source = f"llm:{model}"
+    prompt = build_prompt(post)
+    key = StyleCache.key(model, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return [tuple(s) for s in cached], source, "cached"
+
+    for retry in range(3):
+        try:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "你是時尚風格專家"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.2,
+            )
+            styles = parse_styles(resp.choices[0].message.content)
+            if styles:
+                cache.put(key, styles)
+            return styles, source, "llm_calls"
+        except Exception as e:
+            logger.error(f"Error predicting styles for post {post.get('id')} (attempt {retry + 1}/3): {e}")
+            time.sleep(2)
+    return [], source, None
+
+
+def style_posts(driver, posts: List[Dict], cache: StyleCache = None, workers: int = 4,
+                batch_size: int = 20, model: str = STYLE_PREDICTION_MODEL) -> Dict:
+    """並行預測一批貼文的風格並寫入 HAS_STYLE，回傳統計"""
+    cache = cache or StyleCache(POST_STYLE_CACHE_PATH)
+    stats = {"posts": len(posts), "styled": 0, "cached": 0, "llm_calls": 0, "empty": 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post-styles") as executor, \
+            driver.session() as session:
+        for i in range(0, len(posts), batch_size):
+            batch = posts[i:i + batch_size]
+            predictions = list(executor.map(lambda p: predict_post_styles(p, cache, model), batch))
+            for _, _, outcome in predictions:
+                if outcome:
+                    stats[outcome] += 1
+            rows = [
+                {"id": post['id'], "source": source,
+                 "styles": [{"name": name, "confidence": confidence} for name, confidence in styles]}
+                for post, (styles, source, _) in zip(batch, predictions) if styles
+            ]
+            stats["empty"] += len(batch) - len(rows)
+            if rows:
+                session.execute_write(lambda tx: tx.run(WRITE_POST_STYLES_QUERY, rows=rows).consume())
+                stats["styled"] += len(rows)
+            cache.save()
+            logger.info(f"Progress: {min(i + batch_size, len(posts))}/{len(posts)} posts styled")
+    return stats
+
+
+def main(limit: int = None, force: bool = False, workers: int = 4, batch_size: int = 20):
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        with driver.session() as session:
+            posts = session.run(FETCH_POSTS_QUERY, force=force).data()
+        if limit:
+            posts = posts[:limit]
+        logger.info(f"🔍 {len(posts)} posts need style prediction")
+        if not posts:
+            return
+
+        start = time.perf_counter()
+        stats = style_posts(driver, posts, workers=workers, batch_size=batch_size)
+        logger.info(f"✅ Styled {stats['styled']}/{stats['posts']} posts in {time.perf_counter() - start:.1f}s "
+                    f"({stats['llm_calls']} LLM calls, {stats['cached']} cached, "
+                    f"{stats['empty']} without valid styles)")
+        if stats['styled']:
+            bump_catalog_version(driver, "post_styles")
+    finally:
+        driver.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Predict Instagram post styles once and store them as HAS_STYLE edges')
+    parser.add_argument('--limit', type=int, default=None,
+                      help='Maximum number of posts to process (optional, for testing)')
+    parser.add_argument('--force', action='store_true',
+                      help='Re-predict posts that already have HAS_STYLE edges')
+    parser.add_argument('--workers', type=int, default=4,
+                      help='Concurrent LLM requests')
+    parser.add_argument('--batch_size', type=int, default=20,
+                      help='Posts written per transaction')
+
+    args = parser.parse_args()
+    main(args.limit, args.force, args.workers, args.batch_size)
@@ -10,17 +10,28 @@ import pandas as pd
 import openai
 from neo4j import GraphDatabase
 import ast
+import json
+import re
+import threading
 import time
 import argparse
 import logging
-from typing import List, Dict
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from config.settings import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     NEO4J_URI,
     NEO4J_USER,
     NEO4J_PASSWORD,
-    STYLE_PREDICTION_MODEL
+    STYLE_PREDICTION_MODEL,
+    STYLE_CLASSIFIER_THRESHOLD,
+    STYLE_BATCH_MAX_ITEMS,
+    STYLE_BATCH_MAX_TOKENS,
+    STYLE_BATCH_WORKERS
 )
+from database.catalog_version import bump_catalog_version
 
 # Configure logging
 logging.basicConfig(
@@ -29,13 +40,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client（OPENAI_BASE_URL 可指向本機 stub）
+client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 # Initialize Neo4j driver
 driver = None
 
+# 風格預測統計：classifier（本機分類器）/ llm（單筆呼叫）/ llm_batch（批次呼叫）/ requeried（格式錯誤重問的商品數）
+# 單筆預測可能在多個執行緒中呼叫（例如 benchmark/style_batch_benchmark.py），一律經由 count_style_prediction 加鎖更新
+style_prediction_stats = Counter()
+_style_stats_lock = threading.Lock()
+
 STYLE_LIST = "日系、韓系、歐美、街頭、簡約、運動風、復古、休閒、工裝、優雅、戶外、都會、甜美、性感、正裝、華麗"
+STYLE_NAMES = STYLE_LIST.split("、")
 
 PROMPT = """
 你是一個時尚穿搭風格專家。根據以下資訊，請判斷這項商品最符合的 1~2 個風格（從下列風格選，最多2個），只回傳 Python list 格式，不需解釋、不需補充。
@@ -50,6 +67,30 @@ PROMPT = """
 ---
 """
 
+# 批次模式：一次送多項商品，回覆以商品編號對應
+BATCH_PROMPT = """
+你是一個時尚穿搭風格專家。以下有 {count} 項商品，請判斷每項商品最符合的 1~2 個風格（從下列風格選，最多2個）。
+可選風格有：{style_list}
+只回傳 JSON，不需解釋、不要用 markdown code block，每項商品都要回傳，id 為方括號中的編號：
+{{"results": [{{"id": "0", "styles": ["風格1", "風格2"]}}, {{"id": "1", "styles": ["風格1"]}}]}}
+
+---
+{items}
+---
+"""
+
+BATCH_ITEM = "[{id}] 商品名稱：{item}｜商品描述：{desc}｜類別：{category}｜品牌：{brand}"
+
+# 每項商品回覆約需的 token 數（{"id": "12", "styles": ["風格1", "風格2"]}）
+BATCH_OUTPUT_TOKENS_PER_ITEM = 30
+# 格式錯誤的商品以批次重問的輪數，之後改為單筆
+BATCH_REQUERY_ROUNDS = 2
+
+
+def count_style_prediction(key: str, n: int = 1):
+    with _style_stats_lock:
+        style_prediction_stats[key] += n
+
 
 def init_neo4j():
     """初始化 Neo4j 連線"""
@@ -68,8 +109,27 @@ def close_neo4j():
         logger.info("🔌 Disconnected from Neo4j")
 
 
+def classify_style(row) -> Optional[str]:
+    """本機分類器的預測；沒有分類器或 confidence 不足時回傳 None"""
+    # 延遲 import：style_classifier 會從本模組取得 STYLE_LIST
+    from loader.style_classifier import get_style_classifier, product_text
+    classifier = get_style_classifier()
+    if classifier is not None and classifier.accepts(has_embedding=False):
+        styles, confidence = classifier.predict_one(product_text(row))
+        if confidence >= STYLE_CLASSIFIER_THRESHOLD:
+            count_style_prediction("classifier")
+            return str([name for name, _ in styles])
+    return None
+
+
 def predict_style(row: pd.Series) -> str:
-    """使用 LLM 預測商品風格"""
+    """預測商品風格：本機分類器 confidence 足夠時直接採用，否則使用 LLM"""
+    return classify_style(row) or predict_style_llm(row)
+
+
+def predict_style_llm(row) -> str:
+    """使用 LLM 預測單項商品風格"""
+    count_style_prediction("llm")
     prompt = PROMPT.format(
         style_list=STYLE_LIST,
         item=row['name'],
@@ -92,8 +152,131 @@ def predict_style(row: pd.Series) -> str:
     return "[]"
 
 
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓文字約 1 字 1 token，其他約 4 字元 1 token"""
+    cjk = len(re.findall(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def format_batch_item(item_id: str, row) -> str:
+    return BATCH_ITEM.format(
+        id=item_id,
+        item=row.get('name', ''),
+        desc=str(row.get('description', '') or '').replace('\n', ' '),
+        category=row.get('category', '未知'),
+        brand=row.get('brand', '未知')
+    )
+
+
+def plan_batches(items: List[Tuple[str, str]], max_items: int, max_tokens: int) -> List[List[Tuple[str, str]]]:
+    """依估計的 prompt + 回覆 token 數把 (id, 商品文字) 切成批次，每批不超過 max_items 與 max_tokens"""
+    overhead = estimate_tokens(BATCH_PROMPT.format(count=max_items, style_list=STYLE_LIST, items=""))
+    batches, current, used = [], [], overhead
+    for item in items:
+        cost = estimate_tokens(item[1]) + BATCH_OUTPUT_TOKENS_PER_ITEM
+        if current and (len(current) >= max_items or used + cost > max_tokens):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(content: str, ids: List[str]) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    解析批次回覆，回傳 ({id: 風格 list}, 格式錯誤的 id)
+    風格必須是 1~2 個 STYLE_LIST 中不重複的值；缺少、多出或無法解析的商品都算格式錯誤
+    """
+    text = content.strip().replace('```json', '').replace('```', '').strip()
+    try:
+        data = json.loads(text)
+        entries = data.get("results", []) if isinstance(data, dict) else data
+    except (json.JSONDecodeError, AttributeError):
+        return {}, list(ids)
+
+    wanted, parsed = set(ids), {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        item_id, styles = str(entry.get("id", "")), entry.get("styles")
+        if item_id not in wanted or not isinstance(styles, list):
+            continue
+        if 1 <= len(styles) <= 2 and len(set(styles)) == len(styles) and all(s in STYLE_NAMES for s in styles):
+            parsed[item_id] = styles
+    return parsed, [item_id for item_id in ids if item_id not in parsed]
+
+
+def request_batch(batch: List[Tuple[str, str]]) -> Tuple[Optional[str], bool]:
+    """送出一個批次，回傳 (回覆內容, 是否因 max_tokens 被截斷)；失敗重試 3 次後回傳 (None, False)"""
+    prompt = BATCH_PROMPT.format(count=len(batch), style_list=STYLE_LIST,
+                                 items="\n".join(text for _, text in batch))
+    for retry in range(3):
+        try:
+            resp = client.chat.completions.create(
+                model=STYLE_PREDICTION_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                max_tokens=BATCH_OUTPUT_TOKENS_PER_ITEM * len(batch) + 50
+            )
+            choice = resp.choices[0]
+            return choice.message.content or "", choice.finish_reason == "length"
+        except Exception as e:
+            logger.error(f"Error predicting styles for a batch of {len(batch)} (attempt {retry + 1}/3): {e}")
+            time.sleep(2)
+    return None, False
+
+
+def predict_styles_batch(rows: List[Dict], max_items: int = STYLE_BATCH_MAX_ITEMS,
+                         max_tokens: int = STYLE_BATCH_MAX_TOKENS, workers: int = STYLE_BATCH_WORKERS,
+                         use_classifier: bool = True) -> List[str]:
+    """
+    批次預測多項商品的風格，回傳與 rows 對應的 Python list 字串（與 predict_style 相同格式）
+    1. 本機分類器 confidence 足夠的商品直接採用
+    2. 其餘依 token 預算切成批次並行送出
+    3. 只有格式錯誤 / 缺少的商品重問；回覆被截斷時縮小之後的批次
+    4. 重問 BATCH_REQUERY_ROUNDS 輪後仍錯誤的商品改為單筆預測
+    """
+    results: Dict[str, str] = {}
+    pending = []
+    for i, row in enumerate(rows):
+        style = classify_style(row) if use_classifier else None
+        if style is not None:
+            results[str(i)] = style
+        else:
+            pending.append((str(i), format_batch_item(str(i), row)))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="style-batch") as executor:
+        for round_number in range(BATCH_REQUERY_ROUNDS + 1):
+            if not pending:
+                break
+            batches = plan_batches(pending, max_items, max_tokens)
+            count_style_prediction("llm_batch", len(batches))
+            if round_number:
+                count_style_prediction("requeried", len(pending))
+                logger.info(f"🔁 Re-querying {len(pending)} malformed items in {len(batches)} batches")
+
+            pending, truncated = [], False
+            for batch, (content, was_truncated) in zip(batches, executor.map(request_batch, batches)):
+                parsed, malformed = parse_batch_response(content, [item_id for item_id, _ in batch]) \
+                    if content is not None else ({}, [item_id for item_id, _ in batch])
+                results.update({item_id: str(styles) for item_id, styles in parsed.items()})
+                malformed = set(malformed)
+                pending += [item for item in batch if item[0] in malformed]
+                truncated = truncated or was_truncated
+            if truncated:
+                max_items = max(1, max_items // 2)
+                logger.info(f"✂️ Batch output truncated, reducing batch size to {max_items}")
+
+    for item_id, _ in pending:
+        results[item_id] = predict_style_llm(rows[int(item_id)])
+    return [results[str(i)] for i in range(len(rows))]
+
+
 def process_products(products_csv: str, products_csv_with_style: str, 
-                    nrows: int = None, skip_prediction: bool = False) -> pd.DataFrame:
+                    nrows: int = None, skip_prediction: bool = False,
+                    single_item_prediction: bool = False) -> pd.DataFrame:
     """處理商品資料並預測風格"""
     
     if skip_prediction and os.path.exists(products_csv_with_style):
@@ -105,7 +288,16 @@ def process_products(products_csv: str, products_csv_with_style: str,
         
         # 批次處理風格預測
         logger.info(f"🔮 Predicting styles for {len(df)} products...")
-        df['predicted_style'] = df.apply(predict_style, axis=1)
+        start = time.perf_counter()
+        if single_item_prediction:
+            df['predicted_style'] = df.apply(predict_style, axis=1)
+        else:
+            df['predicted_style'] = predict_styles_batch(df.to_dict('records'))
+        logger.info(f"🤖 Styles for {len(df)} products in {time.perf_counter() - start:.1f}s: "
+                    f"{style_prediction_stats['classifier']} by classifier, "
+                    f"{style_prediction_stats['llm_batch']} batch calls "
+                    f"({style_prediction_stats['requeried']} items re-queried), "
+                    f"{style_prediction_stats['llm']} single-item calls")
         
         # 儲存結果
         df.to_csv(products_csv_with_style, index=False)
@@ -114,47 +306,48 @@ def process_products(products_csv: str, products_csv_with_style: str,
     return df
 
 
+# 商品節點與品牌、類別關係
+CREATE_PRODUCT_QUERY = """
+MERGE (p:Product {id: $id})
+SET p.name = $name,
+    p.description = $description,
+    p.price = $price,
+    p.original_price = $original_price,
+    p.image_url = $image_url,
+    p.created_at = datetime(),
+    p.updated_at = datetime()
+
+// 創建品牌關係
+MERGE (b:Brand {name: $brand})
+MERGE (p)-[:OF_BRAND]->(b)
+
+// 創建類別關係
+MERGE (c:Category {name: $category})
+MERGE (p)-[:IN_CATEGORY]->(c)
+
+RETURN p.id as product_id
+"""
+
+# 商品與風格的關係
+CREATE_STYLE_RELATIONSHIPS_QUERY = """
+MATCH (p:Product {id: $product_id})
+UNWIND $styles as style_name
+MERGE (s:Style {name: style_name})
+MERGE (p)-[r:HAS_STYLE]->(s)
+SET r.confidence = 0.8
+RETURN count(r) as relationships_created
+"""
+
+
 def create_product_node(tx, product_data: Dict):
     """在 Neo4j 中創建商品節點及其關係"""
-    
-    # 創建商品節點
-    query = """
-    MERGE (p:Product {id: $id})
-    SET p.name = $name,
-        p.description = $description,
-        p.price = $price,
-        p.original_price = $original_price,
-        p.image_url = $image_url,
-        p.created_at = datetime()
-    
-    // 創建品牌關係
-    MERGE (b:Brand {name: $brand})
-    MERGE (p)-[:OF_BRAND]->(b)
-    
-    // 創建類別關係
-    MERGE (c:Category {name: $category})
-    MERGE (p)-[:IN_CATEGORY]->(c)
-    
-    RETURN p.id as product_id
-    """
-    
-    result = tx.run(query, **product_data)
+    result = tx.run(CREATE_PRODUCT_QUERY, **product_data)
     return result.single()['product_id']
 
 
 def create_style_relationships(tx, product_id: str, styles: List[str]):
     """創建商品與風格的關係"""
-    
-    query = """
-    MATCH (p:Product {id: $product_id})
-    UNWIND $styles as style_name
-    MERGE (s:Style {name: style_name})
-    MERGE (p)-[r:HAS_STYLE]->(s)
-    SET r.confidence = 0.8
-    RETURN count(r) as relationships_created
-    """
-    
-    result = tx.run(query, product_id=product_id, styles=styles)
+    result = tx.run(CREATE_STYLE_RELATIONSHIPS_QUERY, product_id=product_id, styles=styles)
     return result.single()['relationships_created']
 
 
@@ -229,6 +422,7 @@ def import_to_neo4j(df: pd.DataFrame):
                 continue
     
     logger.info(f"✅ Import completed: {imported_rows} products imported, {skipped_rows} skipped")
+    bump_catalog_version(driver, "shop_neo4j")
     
     # 驗證導入
     verify_import()
@@ -274,12 +468,13 @@ def verify_import():
 
 
 def main(products_csv: str, products_csv_with_style: str, 
-         nrows: int = None, skip_prediction: bool = False):
+         nrows: int = None, skip_prediction: bool = False, single_item_prediction: bool = False):
     """主函數"""
     
     try:
         # 處理 CSV 文件
-        df = process_products(products_csv, products_csv_with_style, nrows, skip_prediction)
+        df = process_products(products_csv, products_csv_with_style, nrows, skip_prediction,
+                              single_item_prediction)
         
         # 匯入到 Neo4j
         import_to_neo4j(df)
@@ -305,7 +500,10 @@ if __name__ == "__main__":
                       help='Number of rows to process (optional, for testing)')
     parser.add_argument('--skip_prediction', action='store_true',
                       help='Skip style prediction and use existing processed CSV')
+    parser.add_argument('--single_item_prediction', action='store_true',
+                      help='Send one product per LLM request instead of batched JSON prompts')
     
     args = parser.parse_args()
     
-    main(args.products_csv, args.products_csv_with_style, args.nrows, args.skip_prediction)
+    main(args.products_csv, args.products_csv_with_style, args.nrows, args.skip_prediction,
+         args.single_item_prediction)
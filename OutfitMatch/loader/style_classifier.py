@@ -0,0 +1,431 @@
+"""
+Style Classifier
+以 queenshop_all_products_with_style.csv 中 LLM 標註的 predicted_style 訓練本機多標籤風格分類器，
+新商品先用分類器預測，只有信心不足時才呼叫 LLM（IG 貼文的文字與商品不同、沒有標註資料評估，一律交給 LLM）：
+- 特徵：商品名稱 + 描述 + 類別的字元 n-gram TF-IDF（text）、DINOv2 圖片 embedding（image），或兩者合併（both）
+- 每個風格一個 LogisticRegression，以 out-of-fold 分數做 Platt scaling 校正成機率；樣本太少的風格不訓練
+- 訓練後只保留權重矩陣與校正參數，預測是一次稀疏矩陣乘法，CPU 上每筆約 1~2 ms
+- 預測取機率最高的風格（第二名機率夠高時一併回傳，最多 2 個），top-1 機率即為 confidence
+- 訓練時保留一部分資料評估：與 LLM 標籤的一致率、校正誤差（ECE），以及各 threshold 下可省下的 LLM 呼叫比例
+- 同一商品的顏色 / 尺寸款（「…-黑 S/M」）名稱與描述幾乎相同，依去掉變體後的商品名分組切分，避免同款同時出現在訓練與測試集
+- --split group：依商品名分組隨機切分（text 特徵 top-1 約 0.88；threshold 0.6 省下約 94% LLM 呼叫、一致率約 0.90）
+  --split contiguous：以 CSV 最後的商品（較新上架）為測試集，較接近實際新商品的情況
+  （top-1 約 0.65；threshold 0.6 省下約 73% LLM 呼叫、一致率約 0.79），調整 STYLE_CLASSIFIER_THRESHOLD 時以此為準
+
+用法：
+    python loader/style_classifier.py
+    python loader/style_classifier.py --features both --thresholds 0.4 0.5 0.6 0.7 0.8
+    python loader/style_classifier.py --split contiguous
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import ast
+import csv
+import json
+import logging
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import joblib
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GroupShuffleSplit, StratifiedKFold, cross_val_predict
+from config.settings import STYLE_CLASSIFIER_PATH
+from loader.shop_neo4j import STYLE_LIST
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+STYLE_NAMES = STYLE_LIST.split("、")
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "data", "queenshop_all_products_with_style.csv")
+DEFAULT_THRESHOLDS = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+
+# 商品名稱的變體後綴：尺寸（S/M/L、S-XL、S/S+/M）、顏色（-黑、-杏灰）、「四色售」
+SIZE_SUFFIX = re.compile(r"\s*(?:XS|S|M|L|XL|XXL|F)\+?(?:\s*[/\-~]\s*(?:XS|S|M|L|XL|XXL|F)\+?)*\s*$")
+COLOR_SUFFIX = re.compile(r"\s*-\s*[^\s\-]{1,4}$")
+COLOR_COUNT = re.compile(r"\s*[一二兩三四五六七八九十\d]+色售\s*")
+
+
+def product_text(row: Dict) -> str:
+    """商品的文字特徵：名稱 + 描述 + 類別（與 LLM prompt 使用的欄位相同）"""
+    return " ".join(str(row.get(key) or "") for key in ("name", "description", "category"))
+
+
+def base_product_name(name: str) -> str:
+    """去掉尺寸、顏色與「N色售」後的商品名，同款不同顏色 / 尺寸的商品得到相同名稱"""
+    name = SIZE_SUFFIX.sub("", (name or "").strip())
+    name = COLOR_SUFFIX.sub("", name)
+    return COLOR_COUNT.sub(" ", name).strip()
+
+
+def parse_labels(value: str) -> List[str]:
+    """CSV 中的 predicted_style（Python list 字串），只保留 STYLE_LIST 中的風格"""
+    try:
+        labels = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return []
+    if not isinstance(labels, (list, tuple)):
+        return []
+    return [label for label in labels if label in STYLE_NAMES]
+
+
+class StyleClassifier:
+    """多標籤風格分類器，predict_proba 回傳每個風格校正後的機率"""
+
+    def __init__(self, features: str = "text", C: float = 4.0, min_positives: int = 5,
+                 calibration_folds: int = 3, second_style_min_prob: float = 0.5, image_weight: float = 1.0):
+        if features not in ("text", "image", "both"):
+            raise ValueError(f"Unknown features: {features}")
+        self.features = features
+        self.C = C
+        self.min_positives = min_positives
+        self.calibration_folds = calibration_folds
+        self.second_style_min_prob = second_style_min_prob
+        self.image_weight = image_weight
+        self.vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(1, 3), min_df=2,
+                                          sublinear_tf=True, max_features=50000)
+        self.styles: List[str] = []
+        # 分數 = X @ coef + intercept，機率 = sigmoid(calib_a * 分數 + calib_b)
+        self.coef = None
+        self.intercept = None
+        self.calib_a = None
+        self.calib_b = None
+
+    @property
+    def uses_text(self) -> bool:
+        return self.features in ("text", "both")
+
+    @property
+    def uses_image(self) -> bool:
+        return self.features in ("image", "both")
+
+    def accepts(self, has_embedding: bool) -> bool:
+        """沒有圖片 embedding 時，需要圖片特徵的模型無法預測"""
+        return has_embedding or not self.uses_image
+
+    def _matrix(self, texts: Sequence[str], embeddings=None, fit: bool = False):
+        parts = []
+        if self.uses_text:
+            parts.append(self.vectorizer.fit_transform(texts) if fit else self.vectorizer.transform(texts))
+        if self.uses_image:
+            emb = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+            emb = emb / np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            parts.append(sparse.csr_matrix(emb * self.image_weight))
+        return sparse.hstack(parts).tocsr() if len(parts) > 1 else sparse.csr_matrix(parts[0])
+
+    def fit(self, texts: Sequence[str], labels: Sequence[List[str]], embeddings=None) -> "StyleClassifier":
+        counts = Counter(style for row in labels for style in row)
+        self.styles = [style for style in STYLE_NAMES if counts[style] >= self.min_positives]
+        skipped = [style for style in STYLE_NAMES if style not in self.styles]
+        if skipped:
+            logger.info(f"Skipping styles with fewer than {self.min_positives} examples: {', '.join(skipped)}")
+
+        X = self._matrix(texts, embeddings, fit=True)
+        n_styles = len(self.styles)
+        self.coef = np.zeros((X.shape[1], n_styles), dtype=np.float32)
+        self.intercept = np.zeros(n_styles, dtype=np.float32)
+        self.calib_a = np.ones(n_styles, dtype=np.float32)
+        self.calib_b = np.zeros(n_styles, dtype=np.float32)
+        folds = StratifiedKFold(n_splits=self.calibration_folds, shuffle=True, random_state=0)
+        for j, style in enumerate(self.styles):
+            y = np.array([style in row for row in labels], dtype=int)
+            model = LogisticRegression(C=self.C, max_iter=2000, class_weight="balanced")
+            # class_weight 讓分數偏向少數類，以 out-of-fold 分數擬合 Platt scaling 還原成機率
+            oof_scores = cross_val_predict(model, X, y, cv=folds, method="decision_function")
+            platt = LogisticRegression(C=1e4).fit(oof_scores.reshape(-1, 1), y)
+            self.calib_a[j], self.calib_b[j] = platt.coef_[0, 0], platt.intercept_[0]
+            model.fit(X, y)
+            self.coef[:, j], self.intercept[j] = model.coef_[0], model.intercept_[0]
+        return self
+
+    def predict_proba(self, texts: Sequence[str], embeddings=None) -> np.ndarray:
+        """shape (N, len(self.styles))"""
+        scores = self._matrix(texts, embeddings) @ self.coef + self.intercept
+        return expit(self.calib_a * np.asarray(scores) + self.calib_b)
+
+    def decide(self, probs: np.ndarray) -> List[Tuple[List[Tuple[str, float]], float]]:
+        """每列機率 -> ([(風格, 機率)] 最多 2 個, confidence)"""
+        results = []
+        for row in probs:
+            order = np.argsort(row)[::-1]
+            styles = [(self.styles[order[0]], float(row[order[0]]))]
+            if len(order) > 1 and row[order[1]] >= self.second_style_min_prob:
+                styles.append((self.styles[order[1]], float(row[order[1]])))
+            results.append((styles, float(row[order[0]])))
+        return results
+
+    def predict(self, texts: Sequence[str], embeddings=None) -> List[Tuple[List[Tuple[str, float]], float]]:
+        return self.decide(self.predict_proba(texts, embeddings))
+
+    def predict_one(self, text: str, embedding=None) -> Tuple[List[Tuple[str, float]], float]:
+        return self.predict([text], None if embedding is None else [embedding])[0]
+
+    def state(self) -> Dict:
+        """只含 numpy 陣列與基本型別的模型狀態（不 pickle 類別本身，從 __main__ 訓練的模型才能在其他程序載入）"""
+        state = {
+            "params": {
+                "features": self.features,
+                "C": self.C,
+                "min_positives": self.min_positives,
+                "calibration_folds": self.calibration_folds,
+                "second_style_min_prob": self.second_style_min_prob,
+                "image_weight": self.image_weight,
+            },
+            "styles": list(self.styles),
+            "coef": self.coef,
+            "intercept": self.intercept,
+            "calib_a": self.calib_a,
+            "calib_b": self.calib_b,
+        }
+        if self.uses_text:
+            state["vocabulary"] = {term: int(index) for term, index in self.vectorizer.vocabulary_.items()}
+            state["idf"] = np.asarray(self.vectorizer.idf_)
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "StyleClassifier":
+        classifier = cls(**state["params"])
+        classifier.styles = list(state["styles"])
+        classifier.coef = state["coef"]
+        classifier.intercept = state["intercept"]
+        classifier.calib_a = state["calib_a"]
+        classifier.calib_b = state["calib_b"]
+        if classifier.uses_text:
+            classifier.vectorizer.vocabulary_ = state["vocabulary"]
+            classifier.vectorizer.idf_ = state["idf"]
+        return classifier
+
+    def save(self, path: str, report: Dict = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        joblib.dump({"state": self.state(), "report": report}, path)
+
+    @classmethod
+    def load(cls, path: str) -> "StyleClassifier":
+        return cls.from_state(joblib.load(path)["state"])
+
+
+_classifier = None
+_classifier_loaded = False
+
+
+def get_style_classifier() -> Optional[StyleClassifier]:
+    """載入 STYLE_CLASSIFIER_PATH 的分類器；未設定、尚未訓練或檔案無法載入時回傳 None（全部改用 LLM）"""
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        _classifier_loaded = True
+        if STYLE_CLASSIFIER_PATH and os.path.exists(STYLE_CLASSIFIER_PATH):
+            try:
+                _classifier = StyleClassifier.load(STYLE_CLASSIFIER_PATH)
+            except Exception as e:
+                logger.error(f"❌ Failed to load style classifier from {STYLE_CLASSIFIER_PATH}, using LLM only "
+                             f"(retrain with loader/style_classifier.py): {e}")
+                return None
+            logger.info(f"✅ Loaded style classifier ({_classifier.features}, {len(_classifier.styles)} styles) "
+                        f"from {STYLE_CLASSIFIER_PATH}")
+        elif STYLE_CLASSIFIER_PATH:
+            logger.info(f"No style classifier at {STYLE_CLASSIFIER_PATH}, using LLM only "
+                        f"(train one with loader/style_classifier.py)")
+    return _classifier
+
+
+def load_labelled_products(path: str) -> List[Dict]:
+    """讀取有 predicted_style 的商品，略過沒有合法風格的列"""
+    with open(path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    products = []
+    for row in rows:
+        labels = parse_labels(row.get("predicted_style", ""))
+        if labels:
+            products.append({**row, "labels": labels})
+    logger.info(f"📄 {len(products)}/{len(rows)} products with valid style labels")
+    return products
+
+
+def attach_image_embeddings(products: List[Dict]) -> List[Dict]:
+    """從 Neo4j 讀取商品的 dinov2-base embedding（loader/backfill_product_embeddings.py），依 image_url 對應"""
+    from neo4j import GraphDatabase
+    from config.settings import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        with driver.session() as session:
+            result = session.run("""
+                MATCH (p:Product)
+                WHERE p.img_embedding IS NOT NULL AND p.image_url IS NOT NULL
+                RETURN p.image_url AS image_url, p.img_embedding AS embedding
+            """)
+            embeddings = {record["image_url"]: record["embedding"] for record in result}
+    finally:
+        driver.close()
+    matched = [{**product, "embedding": embeddings[product["image_url"]]}
+               for product in products if product.get("image_url") in embeddings]
+    logger.info(f"🖼️ {len(matched)}/{len(products)} products have image embeddings")
+    return matched
+
+
+def expected_calibration_error(confidences: np.ndarray, correct: np.ndarray, bins: int = 10) -> float:
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    ece = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        mask = (confidences > low) & (confidences <= high)
+        if mask.any():
+            ece += mask.mean() * abs(confidences[mask].mean() - correct[mask].mean())
+    return float(ece)
+
+
+def evaluate(classifier: StyleClassifier, texts: List[str], labels: List[List[str]], embeddings=None,
+             thresholds: Sequence[float] = DEFAULT_THRESHOLDS) -> Dict:
+    """
+    與 LLM 標籤比較：
+    - top1_accuracy：機率最高的風格在 LLM 標籤中
+    - jaccard / exact_match：預測的風格集合與 LLM 標籤
+    - 每個 threshold：confidence >= threshold 時採用分類器（llm_calls_avoided），
+      其餘呼叫 LLM；accuracy_on_classified 為採用分類器的那部分的 top-1 一致率
+    """
+    start = time.perf_counter()
+    probs = classifier.predict_proba(texts, embeddings)
+    batch_ms = (time.perf_counter() - start) * 1000
+    decisions = classifier.decide(probs)
+
+    confidences = np.array([confidence for _, confidence in decisions])
+    top1_correct = np.array([styles[0][0] in truth for (styles, _), truth in zip(decisions, labels)], dtype=float)
+    predicted_sets = [{name for name, _ in styles} for styles, _ in decisions]
+    jaccard = np.array([len(p & set(t)) / len(p | set(t)) for p, t in zip(predicted_sets, labels)])
+    exact = np.array([p == set(t) for p, t in zip(predicted_sets, labels)], dtype=float)
+
+    per_style = {}
+    for style in classifier.styles:
+        tp = sum(1 for p, t in zip(predicted_sets, labels) if style in p and style in t)
+        predicted = sum(1 for p in predicted_sets if style in p)
+        actual = sum(1 for t in labels if style in t)
+        per_style[style] = {
+            "support": actual,
+            "precision": round(tp / predicted, 3) if predicted else None,
+            "recall": round(tp / actual, 3) if actual else None,
+        }
+
+    by_threshold = []
+    for threshold in thresholds:
+        covered = confidences >= threshold
+        by_threshold.append({
+            "threshold": threshold,
+            "llm_calls_avoided": round(float(covered.mean()), 3),
+            "accuracy_on_classified": round(float(top1_correct[covered].mean()), 3) if covered.any() else None,
+            "jaccard_on_classified": round(float(jaccard[covered].mean()), 3) if covered.any() else None,
+        })
+
+    # 單筆延遲（實際載入商品時一次預測一筆）
+    start = time.perf_counter()
+    for i in range(min(50, len(texts))):
+        classifier.predict_one(texts[i], None if embeddings is None else embeddings[i])
+    single_ms = (time.perf_counter() - start) * 1000 / max(1, min(50, len(texts)))
+
+    return {
+        "test_size": len(texts),
+        "top1_accuracy": round(float(top1_correct.mean()), 3),
+        "jaccard": round(float(jaccard.mean()), 3),
+        "exact_match": round(float(exact.mean()), 3),
+        "ece": round(expected_calibration_error(confidences, top1_correct), 3),
+        "latency_ms_per_item": round(single_ms, 3),
+        "latency_ms_per_item_batched": round(batch_ms / max(1, len(texts)), 4),
+        "by_threshold": by_threshold,
+        "per_style": per_style,
+    }
+
+
+def split_by_product(products: List[Dict], test_size: float, split: str = "group",
+                     seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    訓練 / 測試切分，同款的顏色 / 尺寸（base_product_name 相同）只會在其中一邊，否則測試分數會被同款洩漏灌高：
+    - group：依商品名分組隨機切分
+    - contiguous：CSV 最後 test_size 比例的商品（連同它們的同款）為測試集
+    """
+    groups = [base_product_name(p.get("name")) for p in products]
+    indices = np.arange(len(products))
+    if split == "group":
+        splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+        return next(splitter.split(indices, groups=groups))
+    cutoff = int(len(products) * (1 - test_size))
+    test_groups = {groups[i] for i in indices[cutoff:]}
+    is_test = np.array([group in test_groups for group in groups])
+    return indices[~is_test], indices[is_test]
+
+
+def main(csv_path: str, output: str, features: str, test_size: float, thresholds: List[float],
+         C: float, min_positives: int, seed: int, split: str = "group"):
+    products = load_labelled_products(csv_path)
+    if features != "text":
+        products = attach_image_embeddings(products)
+    texts = [product_text(p) for p in products]
+    labels = [p["labels"] for p in products]
+    embeddings = np.array([p["embedding"] for p in products], dtype=np.float32) if features != "text" else None
+
+    train_idx, test_idx = split_by_product(products, test_size, split, seed)
+
+    def take(idx):
+        return ([texts[i] for i in idx], [labels[i] for i in idx],
+                embeddings[idx] if embeddings is not None else None)
+
+    start = time.perf_counter()
+    classifier = StyleClassifier(features=features, C=C, min_positives=min_positives)
+    classifier.fit(*take(train_idx))
+    logger.info(f"🏋️ Trained on {len(train_idx)} products in {time.perf_counter() - start:.1f}s")
+
+    test_texts, test_labels, test_embeddings = take(test_idx)
+    report = evaluate(classifier, test_texts, test_labels, test_embeddings, thresholds)
+    report.update({"features": features, "split": split, "train_size": len(train_idx), "styles": classifier.styles})
+
+    print(f"\n=== Style classifier ({features}) vs LLM labels, {report['test_size']} held-out products ({split} split) ===")
+    print(f"top-1 accuracy {report['top1_accuracy']:.3f}  jaccard {report['jaccard']:.3f}  "
+          f"exact match {report['exact_match']:.3f}  ECE {report['ece']:.3f}")
+    print(f"latency {report['latency_ms_per_item']:.2f} ms/item "
+          f"({report['latency_ms_per_item_batched']:.3f} ms/item batched)")
+    print(f"\n{'threshold':>9} | {'LLM calls avoided':>17} | {'accuracy':>8} | {'jaccard':>7}")
+    for row in report["by_threshold"]:
+        accuracy = f"{row['accuracy_on_classified']:.3f}" if row["accuracy_on_classified"] is not None else "-"
+        jaccard = f"{row['jaccard_on_classified']:.3f}" if row["jaccard_on_classified"] is not None else "-"
+        print(f"{row['threshold']:>9.2f} | {row['llm_calls_avoided']:>16.1%} | {accuracy:>8} | {jaccard:>7}")
+
+    # 評估後以全部資料重新訓練再存檔
+    classifier = StyleClassifier(features=features, C=C, min_positives=min_positives).fit(texts, labels, embeddings)
+    classifier.save(output, report)
+    with open(f"{os.path.splitext(output)[0]}_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"💾 Saved style classifier to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train a local multi-label style classifier on the LLM-labelled product CSV')
+    parser.add_argument('--csv', default=DEFAULT_CSV,
+                      help='Products CSV with predicted_style labels')
+    parser.add_argument('--output', default=STYLE_CLASSIFIER_PATH or "models/style_classifier.joblib",
+                      help='Where to save the trained classifier (default: STYLE_CLASSIFIER_PATH)')
+    parser.add_argument('--features', choices=["text", "image", "both"], default="text",
+                      help='text = name/description/category, image = DINOv2 embeddings from Neo4j, both = concatenated')
+    parser.add_argument('--test_size', type=float, default=0.2,
+                      help='Held-out share used for the accuracy report')
+    parser.add_argument('--split', choices=["group", "contiguous"], default="group",
+                      help='group = random split by base product name, contiguous = newest products in the CSV held out')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=DEFAULT_THRESHOLDS,
+                      help='Confidence thresholds to report LLM calls avoided for')
+    parser.add_argument('--C', type=float, default=4.0,
+                      help='Inverse regularization strength of the logistic regressions')
+    parser.add_argument('--min_positives', type=int, default=5,
+                      help='Styles with fewer labelled examples are not predicted')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for the train / test split')
+
+    args = parser.parse_args()
+    main(args.csv, args.output, args.features, args.test_size, args.thresholds,
+         args.C, args.min_positives, args.seed, args.split)
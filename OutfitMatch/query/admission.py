@@ -0,0 +1,249 @@
+"""
+Admission Control
+限制同時執行的搜尋數與等待佇列長度：
+- 佇列已滿或等待超過 deadline 時立即拒絕（503 + Retry-After），不讓執行緒堆積到全部 timeout
+- 排隊時間超過門檻時進入降級模式，跳過圖片推論只做文字搜尋
+AsyncAdmissionController 為 server_async.py 使用的 asyncio 版本，排隊時不佔用執行緒，上限另外設定
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import math
+import threading
+import time
+import logging
+from typing import Dict
+from config.settings import (
+    ADMISSION_CONTROL,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_DEGRADE_QUEUE_MS,
+    ASYNC_ADMISSION_MAX_CONCURRENCY,
+    ASYNC_ADMISSION_MAX_QUEUE,
+    ASYNC_ADMISSION_QUEUE_TIMEOUT_MS,
+    ASYNC_ADMISSION_DEGRADE_QUEUE_MS
+)
+from query.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 排隊時間與執行時間的指數移動平均權重
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """超出容量，retry_after 為建議的重試秒數"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """admit() 取得的執行名額；release() 可重複呼叫"""
+
+    def __init__(self, controller, queue_wait: float, degraded: bool):
+        self.controller = controller
+        self.queue_wait = queue_wait
+        self.degraded = degraded
+        self.started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(time.perf_counter() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    用法：
+        with admission.admit() as ticket:   # 超出容量時 raise Overloaded
+            result = user_query(..., degraded=ticket.degraded)
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout_ms: float,
+                 degrade_queue_ms: float, enabled: bool = True, name: str = "search"):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self.degrade_queue = degrade_queue_ms / 1000.0
+        self.enabled = enabled
+        self.name = name
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._queue_wait_ewma = 0.0
+        self._service_ewma = 0.0
+
+        # 統計資料
+        self.admitted = 0
+        self.degraded = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+
+    def admit(self) -> Ticket:
+        if not self.enabled:
+            return Ticket(self, 0.0, False)
+
+        enqueued = time.perf_counter()
+        with self._cond:
+            if self._active >= self.max_concurrency:
+                if self._queued >= self.max_queue:
+                    self._reject("queue_full")
+                self._queued += 1
+                self._update_gauges()
+                deadline = enqueued + self.queue_timeout
+                try:
+                    while self._active >= self.max_concurrency:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self._reject("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._active += 1
+            queue_wait, degraded = self._record_admission(enqueued)
+        return self._ticket(queue_wait, degraded)
+
+    def _record_admission(self, enqueued: float):
+        """取得名額後的統計；回傳 (排隊時間, 是否降級)"""
+        queue_wait = time.perf_counter() - enqueued
+        self._queue_wait_ewma += EWMA_ALPHA * (queue_wait - self._queue_wait_ewma)
+        degraded = self.degrade_queue > 0 and max(queue_wait, self._queue_wait_ewma) >= self.degrade_queue
+        self.admitted += 1
+        if degraded:
+            self.degraded += 1
+        self._update_gauges()
+        return queue_wait, degraded
+
+    def _ticket(self, queue_wait: float, degraded: bool) -> Ticket:
+        registry.observe("outfitmatch_admission_queue_wait_seconds", queue_wait, {"controller": self.name},
+                         help_text="Time spent waiting for an admission slot")
+        registry.inc("outfitmatch_admission_total", 1,
+                     {"controller": self.name, "result": "degraded" if degraded else "admitted"},
+                     help_text="Admission decisions by outcome")
+        if degraded:
+            logger.warning(f"⚠️ Queue wait {queue_wait * 1000:.0f}ms "
+                           f"(avg {self._queue_wait_ewma * 1000:.0f}ms), serving degraded text-only search")
+        return Ticket(self, queue_wait, degraded)
+
+    def _reject(self, reason: str):
+        """呼叫時需持有 self._cond（async 版本在 event loop 中呼叫）"""
+        self.rejected[reason] += 1
+        retry_after = self._retry_after()
+        registry.inc("outfitmatch_admission_total", 1, {"controller": self.name, "result": f"rejected_{reason}"},
+                     help_text="Admission decisions by outcome")
+        logger.warning(f"🚫 Rejected {self.name} request ({reason}): "
+                       f"{self._active} active, {self._queued} queued")
+        raise Overloaded(reason, retry_after)
+
+    def _retry_after(self) -> int:
+        """預估排在前面的請求全部做完所需的秒數"""
+        backlog = (self._queued + self._active) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(backlog * self._service_ewma))
+
+    def _release(self, service_time: float):
+        with self._cond:
+            self._active -= 1
+            self._service_ewma += EWMA_ALPHA * (service_time - self._service_ewma)
+            self._update_gauges()
+            self._cond.notify()
+
+    def _update_gauges(self):
+        registry.set("outfitmatch_admission_active", self._active, {"controller": self.name},
+                     help_text="Requests currently executing")
+        registry.set("outfitmatch_admission_queued", self._queued, {"controller": self.name},
+                     help_text="Requests waiting for an admission slot")
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_timeout_ms": self.queue_timeout * 1000,
+                "degrade_queue_ms": self.degrade_queue * 1000,
+                "active": self._active,
+                "queued": self._queued,
+                "avg_queue_wait_ms": self._queue_wait_ewma * 1000,
+                "avg_service_ms": self._service_ewma * 1000,
+                "admitted": self.admitted,
+                "degraded": self.degraded,
+                "rejected": dict(self.rejected),
+            }
+
+
+class AsyncAdmissionController(AdmissionController):
+    """
+    asyncio 版本：以 asyncio.Semaphore 限制同時執行數，排隊的請求只是等待中的 coroutine
+    用法：
+        with await admission.admit() as ticket:   # 超出容量時 raise Overloaded
+            result = await user_query(..., degraded=ticket.degraded)
+    所有方法都在同一個 event loop 中呼叫
+    """
+
+    def __init__(self, *args, name: str = "async_search", **kwargs):
+        super().__init__(*args, name=name, **kwargs)
+        # 在第一次 admit() 時建立，綁定 server 的 event loop
+        self._semaphore = None
+
+    async def admit(self) -> Ticket:
+        if not self.enabled:
+            return Ticket(self, 0.0, False)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        enqueued = time.perf_counter()
+        if self._semaphore.locked():
+            if self._queued >= self.max_queue:
+                self._reject("queue_full")
+            self._queued += 1
+            self._update_gauges()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("timeout")
+            finally:
+                self._queued -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self._active += 1
+        queue_wait, degraded = self._record_admission(enqueued)
+        return self._ticket(queue_wait, degraded)
+
+    def _release(self, service_time: float):
+        if not self.enabled:
+            return
+        self._active -= 1
+        self._service_ewma += EWMA_ALPHA * (service_time - self._service_ewma)
+        self._update_gauges()
+        self._semaphore.release()
+
+
+search_admission = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout_ms=ADMISSION_QUEUE_TIMEOUT_MS,
+    degrade_queue_ms=ADMISSION_DEGRADE_QUEUE_MS,
+    enabled=ADMISSION_CONTROL
+)
+
+async_search_admission = AsyncAdmissionController(
+    max_concurrency=ASYNC_ADMISSION_MAX_CONCURRENCY,
+    max_queue=ASYNC_ADMISSION_MAX_QUEUE,
+    queue_timeout_ms=ASYNC_ADMISSION_QUEUE_TIMEOUT_MS,
+    degrade_queue_ms=ASYNC_ADMISSION_DEGRADE_QUEUE_MS,
+    enabled=ADMISSION_CONTROL
+)
@@ -0,0 +1,88 @@
+"""
+Cascade Embedding Search
+第一階段：dinov2-small embedding 在 post_image_small_index 召回候選貼文
+第二階段：只用 dinov2-base 計算查詢圖片 embedding，與候選貼文已存的 base embedding 重新排序
+排序後的前 STYLE_VOTE_K 篇貼文一併回傳，供 style_voting 投票
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+from config.settings import CASCADE_CANDIDATES, CASCADE_SKIP_MARGIN, STYLE_VOTE_K
+from query.profiling import forward_profiler
+from query.metrics import stage_timer
+from loader.instagram_neo4j import (
+    segment_and_crop_fashion,
+    get_image_embedding,
+    get_image_embedding_small
+)
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_QUERY = """
+CALL db.index.vector.queryNodes('post_image_small_index', $k, $embedding)
+YIELD node, score
+MATCH (node)-[r:HAS_STYLE]->(style:Style)
+RETURN node.id as post_id,
+       coalesce(node.img_embedding, node.img_emb) as base_embedding,
+       collect({name: style.name, confidence: r.confidence}) as styles,
+       score
+ORDER BY score DESC
+"""
+
+
+def fetch_small_candidates(session, small_emb: np.ndarray, k: int = CASCADE_CANDIDATES) -> List[Dict]:
+    """用小模型 embedding 向量索引召回候選貼文（含已存的 base embedding）"""
+    with stage_timer("vector_query"):
+        result = session.run(CANDIDATE_QUERY, k=k, embedding=small_emb.tolist())
+        return [record.data() for record in result]
+
+
+def rerank_with_base(candidates: List[Dict], base_emb: np.ndarray) -> List[Dict]:
+    """以 base embedding 的 cosine similarity 重新排序候選貼文"""
+    usable = [c for c in candidates if c['base_embedding'] is not None]
+    if not usable:
+        return candidates
+
+    matrix = np.asarray([c['base_embedding'] for c in usable], dtype=np.float32)
+    query = base_emb.astype(np.float32)
+    scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+
+    order = np.argsort(-scores)
+    return [dict(usable[i], score=float(scores[i])) for i in order]
+
+
+def cascade_top_post(session, img, skip_margin: float = CASCADE_SKIP_MARGIN, k: int = STYLE_VOTE_K) -> Optional[Dict]:
+    """
+    回傳最相似的貼文 {'post_id', 'styles', 'score', 'tier', 'neighbors'}，neighbors 為排序後的前 k 篇貼文
+    小模型 top-1 領先 top-2 超過 skip_margin 時直接採用，不跑 base 模型
+    """
+    with stage_timer("segmentation"), forward_profiler("segmentation"):
+        seg_img = segment_and_crop_fashion(img)
+    with stage_timer("embedding"), forward_profiler("embedding"):
+        small_emb = get_image_embedding_small(seg_img)
+    candidates = fetch_small_candidates(session, small_emb)
+    if not candidates:
+        return None
+
+    margin = candidates[0]['score'] - candidates[1]['score'] if len(candidates) > 1 else 1.0
+    if skip_margin > 0 and margin >= skip_margin:
+        ranked, tier = candidates, 'small'
+    else:
+        with stage_timer("embedding"), forward_profiler("embedding"):
+            base_emb = get_image_embedding(seg_img)
+        ranked, tier = rerank_with_base(candidates, base_emb), 'base'
+    top = ranked[0]
+
+    logger.info(f"🪜 Cascade picked post {top['post_id']} via {tier} tier "
+                f"({len(candidates)} candidates, margin {margin:.3f})")
+    return {
+        'post_id': top['post_id'],
+        'styles': [style['name'] for style in top['styles']],
+        'score': top['score'],
+        'tier': tier,
+        'neighbors': [{'post_id': c['post_id'], 'score': c['score'], 'styles': c['styles']} for c in ranked[:k]],
+    }
@@ -0,0 +1,221 @@
+"""
+Micro-batching Inference Worker
+把同時進來的查詢圖片集中成一個 batch，只做一次 SegFormer + DINOv2 forward
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import queue
+import time
+import logging
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+from config.settings import (
+    INFERENCE_BATCHING,
+    INFERENCE_MAX_BATCH_SIZE,
+    INFERENCE_MAX_WAIT_MS
+)
+from query.profiling import forward_profiler
+from query.metrics import stage_timer, registry
+from loader.instagram_neo4j import (
+    segment_and_crop_fashion,
+    segment_and_crop_fashion_batch,
+    get_image_embedding,
+    get_image_embeddings_batch
+)
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBatcher:
+    """
+    背景執行緒從 queue 收集請求：
+    等到湊滿 max_batch_size 或第一筆請求已等待 max_wait_ms 就執行一次 batch_fn
+    batch_fn 接收 list 並回傳等長 list，元素若為 Exception 則只讓該請求失敗
+    """
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 8,
+                 max_wait_ms: float = 5.0, name: str = "inference"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 統計資料
+        self._batch_sizes = Counter()
+        self._recent_waits = deque(maxlen=1000)
+        self._total_requests = 0
+        self._total_batches = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-batcher", daemon=True
+                )
+                self._thread.start()
+                logger.info(f"🚀 Started {self.name} batcher "
+                            f"(max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait * 1000:.1f})")
+
+    def submit(self, item) -> Future:
+        """提交一筆請求，回傳可等待結果的 Future"""
+        self.start()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect_batch(self) -> List:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            self._record(batch, started)
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} batch_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.error(f"Error in {self.name} batch of {len(items)}: {e}")
+                results = [e] * len(items)
+
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _record(self, batch: List, started: float):
+        with self._lock:
+            self._total_batches += 1
+            self._batch_sizes[len(batch)] += 1
+            for _, _, enqueued in batch:
+                wait = started - enqueued
+                self._total_requests += 1
+                self._total_wait += wait
+                self._max_wait_seen = max(self._max_wait_seen, wait)
+                self._recent_waits.append(wait)
+        registry.observe("outfitmatch_inference_batch_wait_seconds", started - batch[0][2],
+                         {"batcher": self.name}, help_text="Time the oldest request waited for its batch")
+        registry.inc("outfitmatch_inference_batches_total", 1, {"batcher": self.name, "size": len(batch)},
+                     help_text="Inference batches run, by batch size")
+        registry.set("outfitmatch_inference_queue_depth", self._queue.qsize(), {"batcher": self.name},
+                     help_text="Requests waiting in the inference queue")
+
+    def stats(self) -> Dict:
+        """目前 queue 深度、batch 大小分佈與等待時間"""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            p50 = waits[len(waits) // 2] if waits else 0.0
+            p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+            return {
+                "name": self.name,
+                "queue_depth": self._queue.qsize(),
+                "total_requests": self._total_requests,
+                "total_batches": self._total_batches,
+                "avg_batch_size": self._total_requests / self._total_batches if self._total_batches else 0.0,
+                "batch_size_distribution": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "wait_ms": {
+                    "avg": self._total_wait / self._total_requests * 1000 if self._total_requests else 0.0,
+                    "p50": p50 * 1000,
+                    "p95": p95 * 1000,
+                    "max": self._max_wait_seen * 1000,
+                },
+            }
+
+
+def _segment_and_embed_one(img):
+    """單張圖片的分割 + embedding，失敗時回傳例外物件"""
+    try:
+        with stage_timer("segmentation"), forward_profiler("segmentation"):
+            seg_img = segment_and_crop_fashion(img)
+        with stage_timer("embedding"), forward_profiler("embedding"):
+            return get_image_embedding(seg_img)
+    except Exception as e:
+        return e
+
+
+def _segment_and_embed_batch(images: List) -> List:
+    """
+    分割 + embedding 的 batch 版本，分割失敗的圖片不影響其他圖片
+    整批 forward 失敗時（例如某張圖片的格式讓 processor 出錯）改為逐張重試，只有出錯的圖片回傳例外
+    """
+    try:
+        return _segment_and_embed_all(images)
+    except Exception as e:
+        if len(images) == 1:
+            raise
+        logger.warning(f"⚠️ Batched segment/embed of {len(images)} images failed ({e}), retrying one by one")
+        return [_segment_and_embed_one(img) for img in images]
+
+
+def _segment_and_embed_all(images: List) -> List:
+    with stage_timer("segmentation"), forward_profiler("segmentation"):
+        crops = segment_and_crop_fashion_batch(images)
+    ok_idx = [i for i, crop in enumerate(crops) if not isinstance(crop, Exception)]
+    results = list(crops)
+    if ok_idx:
+        with stage_timer("embedding"), forward_profiler("embedding"):
+            embeddings = get_image_embeddings_batch([crops[i] for i in ok_idx])
+        for row, i in enumerate(ok_idx):
+            results[i] = embeddings[row]
+    return results
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> InferenceBatcher:
+    """取得共用的查詢圖片 batcher（lazy 建立）"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = InferenceBatcher(
+                _segment_and_embed_batch,
+                max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                name="segment_embed"
+            )
+        return _embedder
+
+
+def embed_query_image(img):
+    """
+    查詢圖片 → 分割 → embedding
+    INFERENCE_BATCHING 開啟時交給 batcher，否則在目前執行緒直接推論
+    """
+    if INFERENCE_BATCHING:
+        return get_embedder().submit(img).result()
+    with stage_timer("segmentation"), forward_profiler("segmentation"):
+        seg_img = segment_and_crop_fashion(img)
+    with stage_timer("embedding"), forward_profiler("embedding"):
+        return get_image_embedding(seg_img)
+
+
+def inference_stats() -> Dict:
+    """供 API 使用的 batcher 統計"""
+    if _embedder is None:
+        return {"enabled": INFERENCE_BATCHING, "batchers": []}
+    return {"enabled": INFERENCE_BATCHING, "batchers": [_embedder.stats()]}
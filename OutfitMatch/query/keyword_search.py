@@ -0,0 +1,314 @@
+"""
+Keyword Search
+關鍵字型的查詢（「坑條 短版」、「2000元以下 韓系 上衣」）不經過 LLM 翻譯：
+- 以規則解析價格、類別、品牌、風格與顏色，剩下的詞當作全文關鍵字
+- 顏色詞（「黑色」、「米白」）對應到主色節點，以 HAS_COLOR 過濾（loader/extract_colors.py）；
+  資料庫中還沒有任何 HAS_COLOR（尚未執行主色計算）時，改把顏色詞當作全文關鍵字
+- 有關鍵字時以 product_search 全文索引召回，價格 / 類別 / 品牌條件在同一個查詢中過濾，
+  排序為全文分數（除以最高分正規化）與風格重疊比例的加權和
+- 沒有關鍵字時（只有結構化條件）直接依條件與風格重疊排序
+含有「適合」、「推薦」、問句等自然語言意圖的查詢不算關鍵字型，仍交給 LLM
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from config.settings import KEYWORD_SEARCH_CANDIDATES, KEYWORD_SEARCH_STYLE_WEIGHT
+from loader.color_palette import parse_color_words
+
+# 與 loader/shop_neo4j.py 的 STYLE_LIST 相同
+STYLE_NAMES = ["日系", "韓系", "歐美", "街頭", "簡約", "運動風", "復古", "休閒",
+               "工裝", "優雅", "戶外", "都會", "甜美", "性感", "正裝", "華麗"]
+
+# 品項關鍵字 -> Category.name（比對時長的詞優先，「帽T」不會被當成配件）
+CATEGORY_WORDS = {
+    "上衣": "上衣", "T恤": "上衣", "t恤": "上衣", "帽T": "上衣", "帽t": "上衣", "襯衫": "上衣", "背心": "上衣",
+    "毛衣": "上衣", "針織衫": "上衣", "外套": "上衣", "風衣": "上衣", "衛衣": "上衣", "罩衫": "上衣",
+    "下身": "下身", "褲子": "下身", "長褲": "下身", "短褲": "下身", "褲": "下身",
+    "裙子": "下身", "短裙": "下身", "長裙": "下身", "半身裙": "下身",
+    "連身": "連身", "洋裝": "連身", "連身裙": "連身", "連身褲": "連身",
+    "配件": "配件", "包包": "配件", "帽子": "配件", "鞋子": "配件", "鞋": "配件", "襪子": "配件",
+    "襪": "配件", "飾品": "配件", "項鍊": "配件", "耳環": "配件",
+}
+
+# 只代表類別、不描述品項的通稱：與類別名稱一樣從關鍵字中移除（「褲子」不要求商品名稱含「褲子」）；
+# 「寬褲」、「牛仔褲」、「洋裝」等具體品項仍留作全文關鍵字
+GENERIC_CATEGORY_WORDS = {"上衣", "下身", "連身", "配件", "褲子", "裙子", "包包", "帽子", "鞋子", "襪子", "飾品"}
+# 單字的通稱只有獨立成詞時才移除（「寬褲」中的「褲」不算）
+GENERIC_CATEGORY_CHARS = {"褲", "鞋", "襪"}
+KEYWORD_SEPARATORS = r"\s,，、。.!！/"
+
+# 出現這些詞代表是自然語言需求，交給 LLM 翻譯
+INTENT_WORDS = ["適合", "推薦", "搭配", "怎麼", "什麼", "哪", "想要", "可以", "場合", "約會", "上班", "婚禮",
+                "面試", "旅行", "嗎", "呢", "幫我", "便宜", "好看", "?", "？"]
+
+# 不當作全文關鍵字的填充詞
+FILLER_WORDS = ["我要", "想找", "有沒有", "一些", "商品", "的", "款", "風格", "系列", "找"]
+
+MAX_PRICE_PATTERNS = [
+    r"(\d+)\s*(?:元|塊)?\s*(?:以下|以內|之內|內|有找)",
+    r"(?:低於|少於|不超過|小於|under|<=?)\s*(\d+)\s*(?:元|塊)?",
+]
+MIN_PRICE_PATTERNS = [
+    r"(\d+)\s*(?:元|塊)?\s*(?:以上|起)",
+    r"(?:高於|超過|大於|over|>=?)\s*(\d+)\s*(?:元|塊)?",
+]
+RANGE_PRICE_PATTERN = r"(\d+)\s*(?:元|塊)?\s*(?:-|~|到|至)\s*(\d+)\s*(?:元|塊)?"
+
+# 關鍵字型查詢的上限
+MAX_KEYWORDS = 4
+MAX_KEYWORD_LENGTH = 8
+
+LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+@dataclass
+class KeywordQuery:
+    keywords: List[str] = field(default_factory=list)
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[str] = None
+    brand: Optional[str] = None
+    styles: List[str] = field(default_factory=list)
+    colors: List[str] = field(default_factory=list)
+    # 查詢中原本的顏色詞（沒有主色資料時改當全文關鍵字）
+    color_words: List[str] = field(default_factory=list)
+
+    def without_colors(self) -> "KeywordQuery":
+        """不以 HAS_COLOR 過濾、顏色詞改為全文關鍵字的版本"""
+        return replace(self, keywords=self.keywords + self.color_words, colors=[], color_words=[])
+
+    def describe(self) -> str:
+        """串流搜尋 conditions 事件的內容（取代 LLM 產生的 Cypher 條件）"""
+        return ", ".join(f"{name}={value}" for name, value in asdict(self).items() if value)
+
+    def lucene(self) -> str:
+        """每個關鍵字為一個 phrase（標準 analyzer 把中文切成單字，phrase 要求字相鄰）"""
+        return " ".join('"' + LUCENE_SPECIAL.sub(r"\\\1", keyword) + '"' for keyword in self.keywords)
+
+    def params(self, styles: List[str] = None) -> Dict:
+        return {
+            "lucene": self.lucene(),
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "category": self.category,
+            "brand": self.brand,
+            "styles": sorted(set(self.styles) | set(styles or [])),
+            "colors": self.colors,
+            "style_weight": KEYWORD_SEARCH_STYLE_WEIGHT,
+            "candidates": KEYWORD_SEARCH_CANDIDATES,
+        }
+
+
+def _take(pattern: str, text: str) -> Tuple[Optional[re.Match], str]:
+    match = re.search(pattern, text)
+    if not match:
+        return None, text
+    return match, text[:match.start()] + " " + text[match.end():]
+
+
+def parse_keyword_query(query_text: str, brands: Set[str] = frozenset()) -> Optional[KeywordQuery]:
+    """關鍵字型查詢回傳解析結果，自然語言需求或無法解析時回傳 None"""
+    text = unicodedata.normalize("NFKC", query_text or "").strip()
+    if not text or any(word in text for word in INTENT_WORDS):
+        return None
+
+    parsed = KeywordQuery()
+    match, text = _take(RANGE_PRICE_PATTERN, text)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        parsed.min_price, parsed.max_price = low, high
+    for pattern in MAX_PRICE_PATTERNS:
+        match, text = _take(pattern, text)
+        if match:
+            parsed.max_price = float(match.group(1))
+    for pattern in MIN_PRICE_PATTERNS:
+        match, text = _take(pattern, text)
+        if match:
+            parsed.min_price = float(match.group(1))
+
+    parsed.colors, parsed.color_words, text = parse_color_words(text)
+    for style in STYLE_NAMES:
+        if style in text:
+            parsed.styles.append(style)
+            # 「簡約風」、「街頭風格」的「風」/「風格」也屬於風格名稱
+            text = re.sub(rf"{style}(?:風格|風)?", " ", text)
+    for word in sorted(CATEGORY_WORDS, key=len, reverse=True):
+        if word in text:
+            if parsed.category not in (None, CATEGORY_WORDS[word]):
+                return None  # 同時要求兩種類別，交給 LLM
+            parsed.category = CATEGORY_WORDS[word]
+            # 類別名稱與通稱不是關鍵字；「寬褲」、「洋裝」等品項留在文字中一起做全文比對
+            if word in GENERIC_CATEGORY_WORDS:
+                text = text.replace(word, " ")
+            elif word in GENERIC_CATEGORY_CHARS:
+                text = re.sub(rf"(?<![^{KEYWORD_SEPARATORS}]){word}(?![^{KEYWORD_SEPARATORS}])", " ", text)
+    lowered = text.lower()
+    for brand in sorted(brands, key=len, reverse=True):
+        position = lowered.find(brand.lower())
+        if position >= 0:
+            parsed.brand = brand
+            text = text[:position] + " " + text[position + len(brand):]
+            lowered = text.lower()
+
+    for word in FILLER_WORDS:
+        text = text.replace(word, " ")
+    keywords = [token for token in re.split(rf"[{KEYWORD_SEPARATORS}]+", text) if token]
+    if len(keywords) > MAX_KEYWORDS or any(len(token) > MAX_KEYWORD_LENGTH for token in keywords):
+        return None
+    # 任何數字都應該被價格規則吃掉，剩下的數字代表無法解析的條件
+    if any(re.search(r"\d", token) for token in keywords):
+        return None
+    parsed.keywords = keywords
+    if not keywords and parsed.min_price is None and parsed.max_price is None \
+            and not parsed.category and not parsed.brand and not parsed.styles and not parsed.colors:
+        return None
+    return parsed
+
+
+# 結構化條件（與全文查詢共用）
+FILTERS = """
+MATCH (p)-[:OF_BRAND]->(b:Brand)
+MATCH (p)-[:IN_CATEGORY]->(c:Category)
+WHERE ($min_price IS NULL OR p.price >= $min_price)
+  AND ($max_price IS NULL OR p.price <= $max_price)
+  AND ($category IS NULL OR c.name = $category)
+  AND ($brand IS NULL OR toLower(b.name) = toLower($brand))
+  AND all(color IN $colors WHERE EXISTS { (p)-[:HAS_COLOR]->(:Color {name: color}) })
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+WITH p, b, c, text_score, collect(DISTINCT s.name) as product_styles
+"""
+
+# 全文分數正規化到 [0, 1] 後與風格重疊比例加權
+FULLTEXT_SEARCH_QUERY = """
+CALL db.index.fulltext.queryNodes('product_search', $lucene, {limit: $candidates})
+YIELD node as p, score as text_score
+""" + FILTERS + """
+WITH collect({p: p, b: b, c: c, text_score: text_score, product_styles: product_styles}) as rows,
+     max(text_score) as top_score
+UNWIND rows as row
+WITH row, row.text_score / top_score as text_score,
+     CASE WHEN size($styles) = 0 THEN 0.0
+          ELSE toFloat(size([x IN row.product_styles WHERE x IN $styles])) / size($styles) END as style_overlap
+WITH row, (1 - $style_weight) * text_score + $style_weight * style_overlap as rank_score
+RETURN row.p.id as id, row.p.name as name, row.p.description as description,
+       row.c.name as category, row.b.name as brand, row.p.price as price,
+       row.product_styles as predicted_style, row.p.image_url as image_url, rank_score
+ORDER BY rank_score DESC, price ASC, id ASC
+SKIP $skip
+LIMIT $limit
+"""
+
+# 沒有關鍵字時：只有結構化條件，依風格重疊與價格排序
+STRUCTURED_SEARCH_QUERY = """
+MATCH (p:Product)
+WITH p, 0.0 as text_score
+""" + FILTERS + """
+WITH p, b, c, product_styles, size([x IN product_styles WHERE x IN $styles]) as style_matches
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       product_styles as predicted_style, p.image_url as image_url, style_matches as rank_score
+ORDER BY rank_score DESC, price ASC, id ASC
+SKIP $skip
+LIMIT $limit
+"""
+
+BRANDS_QUERY = "MATCH (b:Brand) RETURN b.name as name"
+
+# 品牌名單的快取秒數
+BRANDS_TTL_SECONDS = 300
+
+_brands: Set[str] = set()
+_brands_loaded_at: Optional[float] = None
+_brands_lock = threading.Lock()
+
+
+def cached_brands() -> Optional[Set[str]]:
+    """快取中的品牌名稱，過期時回傳 None"""
+    with _brands_lock:
+        if _brands_loaded_at is None or time.monotonic() - _brands_loaded_at > BRANDS_TTL_SECONDS:
+            return None
+        return _brands
+
+
+def store_brands(names) -> Set[str]:
+    global _brands, _brands_loaded_at
+    with _brands_lock:
+        _brands = {name for name in names if name}
+        _brands_loaded_at = time.monotonic()
+        return _brands
+
+
+def known_brands(session) -> Set[str]:
+    """品牌名稱（解析品牌條件用），每 BRANDS_TTL_SECONDS 秒重新讀取"""
+    brands = cached_brands()
+    if brands is None:
+        brands = store_brands(record['name'] for record in session.run(BRANDS_QUERY))
+    return brands
+
+
+# 是否已有任何商品 / 貼文計算過主色（關聯數量由 count store 取得，不掃描）
+COLOR_DATA_QUERY = "MATCH ()-[:HAS_COLOR]->() RETURN count(*) > 0 as has_colors"
+
+_has_colors: Optional[bool] = None
+_colors_checked_at: Optional[float] = None
+
+
+def cached_has_colors() -> Optional[bool]:
+    """快取中的 HAS_COLOR 是否存在，過期時回傳 None（與品牌名單相同的 TTL）"""
+    with _brands_lock:
+        if _colors_checked_at is None or time.monotonic() - _colors_checked_at > BRANDS_TTL_SECONDS:
+            return None
+        return _has_colors
+
+
+def store_has_colors(value) -> bool:
+    global _has_colors, _colors_checked_at
+    with _brands_lock:
+        _has_colors = bool(value)
+        _colors_checked_at = time.monotonic()
+        return _has_colors
+
+
+def has_color_data(session) -> bool:
+    has_colors = cached_has_colors()
+    if has_colors is None:
+        has_colors = store_has_colors(session.run(COLOR_DATA_QUERY).single()['has_colors'])
+    return has_colors
+
+
+def with_color_data(parsed: Optional[KeywordQuery], has_colors: bool) -> Optional[KeywordQuery]:
+    """
+    還沒有任何主色資料時，顏色詞改為全文關鍵字（不以 HAS_COLOR 過濾）；
+    已有主色資料時一律以顏色過濾，沒有符合的商品就是沒有結果，分頁之間的條件也不會改變
+    """
+    if parsed is None or not parsed.colors or has_colors:
+        return parsed
+    return parsed.without_colors()
+
+
+def search_query_for(parsed: KeywordQuery) -> str:
+    return FULLTEXT_SEARCH_QUERY if parsed.keywords else STRUCTURED_SEARCH_QUERY
+
+
+def iter_keyword_search(session, parsed: KeywordQuery, styles: List[str] = None,
+                        limit: int = 10, skip: int = 0) -> Iterator[Tuple]:
+    """逐筆讀取同一個 result cursor 的 keyword_search（串流分頁用）"""
+    if parsed.colors:
+        parsed = with_color_data(parsed, has_color_data(session))
+    result = session.run(search_query_for(parsed), **parsed.params(styles), skip=skip, limit=limit)
+    for r in result:
+        yield (r['id'], r['name'], r['description'], r['category'],
+               r['brand'], r['price'], r['predicted_style'], r['image_url'])
+
+
+def keyword_search(session, parsed: KeywordQuery, styles: List[str] = None,
+                   limit: int = 10, skip: int = 0) -> List[Tuple]:
+    """回傳與 fetch_products 相同格式的商品 tuple"""
+    return list(iter_keyword_search(session, parsed, styles, limit, skip))
@@ -0,0 +1,153 @@
+"""
+Stage Metrics
+記錄查詢流程各階段的延遲 histogram 與 counter，輸出 Prometheus text format
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Dict[str, str] = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, labels: Dict[str, str] = None):
+        key = _label_key(labels or {})
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            for i, bound in enumerate(self.buckets):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': repr(bound)})} {series[i]}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+
+    def inc(self, value: float = 1, labels: Dict[str, str] = None):
+        key = _label_key(labels or {})
+        self._series[key] = self._series.get(key, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: Dict[str, str] = None):
+        self._series[_label_key(labels or {})] = value
+
+
+class MetricsRegistry:
+    """執行緒安全的 metric 集合"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name: str, help_text: str):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text)
+        return metric
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] = None, help_text: str = ""):
+        with self._lock:
+            self._get(Histogram, name, help_text).observe(value, labels)
+
+    def inc(self, name: str, value: float = 1, labels: Dict[str, str] = None, help_text: str = ""):
+        with self._lock:
+            self._get(Counter, name, help_text).inc(value, labels)
+
+    def set(self, name: str, value: float, labels: Dict[str, str] = None, help_text: str = ""):
+        with self._lock:
+            self._get(Gauge, name, help_text).set(value, labels)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def observe_stage(stage: str, seconds: float, error: bool = False):
+    """記錄一次階段執行的耗時"""
+    registry.observe("outfitmatch_stage_latency_seconds", seconds, {"stage": stage},
+                     help_text="Latency of each search pipeline stage")
+    registry.inc("outfitmatch_stage_calls_total", 1, {"stage": stage},
+                 help_text="Number of times each search pipeline stage ran")
+    if error:
+        registry.inc("outfitmatch_stage_errors_total", 1, {"stage": stage},
+                     help_text="Number of failed search pipeline stage runs")
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    階段名稱：decode, segmentation, embedding, vector_query,
+             llm_translation, product_search, serialization
+    用法：
+        with stage_timer("embedding"):
+            emb = get_image_embedding(img)
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, error)
+
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
@@ -0,0 +1,162 @@
+"""
+Outfit Bundles
+把 build_outfit_bundles.py 預先組合好的完整穿搭載入記憶體（key -> bundles），
+/api/products/<id>/outfits 與 /api/styles/<name>/outfits 只做一次 dict lookup；
+載入完成前直接以 key 查 (:OutfitBundles)，目錄版本改變後在背景重新載入
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from config.settings import CATALOG_VERSION_CHECK_SECONDS
+import query.query_neo4j as qn
+from query.metrics import registry
+from query.product_matches import PRODUCT_DETAILS_QUERY, DETAILS_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+ALL_BUNDLES_QUERY = """
+MATCH (b:OutfitBundles)
+RETURN b.key as key, b.bundles as bundles
+"""
+
+BUNDLE_BY_KEY_QUERY = """
+MATCH (b:OutfitBundles {key: $key})
+RETURN b.bundles as bundles
+"""
+
+
+def _fetch_products(session, ids) -> Dict[str, Tuple]:
+    ids = list(ids)
+    products = {}
+    for i in range(0, len(ids), DETAILS_BATCH_SIZE):
+        for r in session.run(PRODUCT_DETAILS_QUERY, ids=ids[i:i + DETAILS_BATCH_SIZE]):
+            products[r['id']] = (r['id'], r['name'], r['description'], r['category'],
+                                 r['brand'], r['price'], r['predicted_style'], r['image_url'])
+    return products
+
+
+class OutfitBundleTable:
+    """
+    bundles: key -> [{"items", "score", "price", "styles", "template"}, ...]
+    products: bundles 中出現的商品 tuple（與 fetch_products 相同格式）
+    """
+
+    def __init__(self, version_check_seconds: float):
+        self.version_check_seconds = version_check_seconds
+        self.bundles: Dict[str, List[Dict]] = {}
+        self.products: Dict[str, Tuple] = {}
+        self.version: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._loading = False
+
+    def load(self):
+        start = time.perf_counter()
+        qn.init_neo4j()
+        version = qn.current_catalog_version()
+
+        with qn.driver.session() as session:
+            bundles = {r['key']: json.loads(r['bundles']) for r in session.run(ALL_BUNDLES_QUERY)}
+            ids = {item for records in bundles.values() for bundle in records for item in bundle['items']}
+            products = _fetch_products(session, ids)
+
+        with self._lock:
+            self.bundles, self.products = bundles, products
+            self.version, self.loaded_at = version, time.time()
+
+        registry.set("outfitmatch_outfit_bundle_keys", len(bundles),
+                     help_text="Outfit bundle keys (products and styles) in memory")
+        logger.info(f"✅ Loaded {len(bundles)} outfit bundle records ({len(products)} products) "
+                    f"in {time.perf_counter() - start:.2f}s (catalog version {version})")
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Error loading outfit bundles: {e}")
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def start(self):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+            self._version_checked_at = time.time()
+        threading.Thread(target=self._load_in_background, name="outfit-bundles-loader", daemon=True).start()
+
+    def refresh_if_stale(self):
+        now = time.time()
+        with self._lock:
+            if self._loading or now - self._version_checked_at < self.version_check_seconds:
+                return
+            self._version_checked_at = now
+        try:
+            version = qn.current_catalog_version()
+        except Exception as e:
+            logger.error(f"Error reading catalog version: {e}")
+            return
+        if version != self.version:
+            logger.info(f"🔄 Catalog version changed ({self.version} -> {version}), reloading outfit bundles")
+            self.start()
+
+    def _lookup_neo4j(self, key: str) -> Tuple[List[Dict], Dict[str, Tuple]]:
+        """表尚未載入時直接以 key 查詢"""
+        qn.init_neo4j()
+        with qn.driver.session() as session:
+            record = session.run(BUNDLE_BY_KEY_QUERY, key=key).single()
+            if record is None:
+                return [], {}
+            bundles = json.loads(record['bundles'])
+            return bundles, _fetch_products(session, {i for b in bundles for i in b['items']})
+
+    def get(self, key: str, limit: int) -> List[Dict]:
+        """回傳 [{"items": [商品 tuple, ...], "score", "price", "styles", "template"}, ...]"""
+        with self._lock:
+            loaded = self.loaded_at is not None
+            bundles, products = self.bundles.get(key, []), self.products
+        if not loaded:
+            bundles, products = self._lookup_neo4j(key)
+        return [
+            {**bundle, "items": [products[i] for i in bundle["items"] if i in products]}
+            for bundle in bundles[:limit]
+        ]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "keys": len(self.bundles),
+                "products": sum(1 for key in self.bundles if key.startswith("product:")),
+                "styles": sum(1 for key in self.bundles if key.startswith("style:")),
+                "product_details": len(self.products),
+                "catalog_version": self.version,
+                "loaded_at": self.loaded_at,
+                "loading": self._loading,
+            }
+
+
+bundle_table = OutfitBundleTable(CATALOG_VERSION_CHECK_SECONDS)
+
+
+def _get(key: str, limit: int) -> List[Dict]:
+    bundle_table.refresh_if_stale()
+    bundles = bundle_table.get(key, limit)
+    registry.inc("outfitmatch_outfit_bundle_lookups_total", 1, {"hit": str(bool(bundles)).lower()},
+                 help_text="Outfit bundle lookups by hit / miss")
+    return bundles
+
+
+def get_product_outfits(product_id: str, limit: int = 5) -> List[Dict]:
+    return _get(f"product:{product_id}", limit)
+
+
+def get_style_outfits(style: str, limit: int = 5) -> List[Dict]:
+    return _get(f"style:{style}", limit)
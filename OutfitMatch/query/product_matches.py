@@ -0,0 +1,162 @@
+"""
+Product Matches Table
+把 build_relationships.py 預先算好的 GOES_WITH 關係載入記憶體（每個商品依 score 保留 top-k），
+/api/products/<id>/matches 直接查表；目錄版本改變（重建關係、重新載入商品）後在背景重新載入
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from config.settings import PRODUCT_MATCHES_TOP_K, CATALOG_VERSION_CHECK_SECONDS
+import query.query_neo4j as qn
+from query.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TOP_K_MATCHES_QUERY = """
+MATCH (p:Product)-[r:GOES_WITH]->(m:Product)
+WITH p, r, m
+ORDER BY r.score DESC, m.price ASC
+WITH p, collect({id: m.id, score: r.score})[..$k] as matches
+RETURN p.id as id, matches
+"""
+
+PRODUCT_DETAILS_QUERY = """
+MATCH (p:Product)
+WHERE p.id IN $ids
+OPTIONAL MATCH (p)-[:OF_BRAND]->(b:Brand)
+OPTIONAL MATCH (p)-[:IN_CATEGORY]->(c:Category)
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       collect(DISTINCT s.name) as predicted_style, p.image_url as image_url
+"""
+
+# 商品細節分批讀取的大小
+DETAILS_BATCH_SIZE = 1000
+
+
+class ProductMatchTable:
+    """
+    products: product_id -> 商品 tuple（與 fetch_products 相同格式）
+    matches: product_id -> [(match_id, score), ...]（score 由高到低，最多 top_k 筆）
+    """
+
+    def __init__(self, top_k: int, version_check_seconds: float):
+        self.top_k = top_k
+        self.version_check_seconds = version_check_seconds
+        self.products: Dict[str, Tuple] = {}
+        self.matches: Dict[str, List[Tuple[str, float]]] = {}
+        self.version: Optional[int] = None
+        self.loaded_at: Optional[float] = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._loading = False
+
+    def load(self):
+        """從 Neo4j 讀出 top-k GOES_WITH 與相關商品細節，完成後一次替換"""
+        start = time.perf_counter()
+        qn.init_neo4j()
+        version = qn.current_catalog_version()
+
+        with qn.driver.session() as session:
+            matches = {
+                record['id']: [(m['id'], m['score'] or 0.0) for m in record['matches']]
+                for record in session.run(TOP_K_MATCHES_QUERY, k=self.top_k)
+            }
+            ids = set(matches)
+            for neighbors in matches.values():
+                ids.update(match_id for match_id, _ in neighbors)
+            ids = list(ids)
+
+            products = {}
+            for i in range(0, len(ids), DETAILS_BATCH_SIZE):
+                for r in session.run(PRODUCT_DETAILS_QUERY, ids=ids[i:i + DETAILS_BATCH_SIZE]):
+                    products[r['id']] = (r['id'], r['name'], r['description'], r['category'],
+                                         r['brand'], r['price'], r['predicted_style'], r['image_url'])
+
+        with self._lock:
+            self.matches, self.products = matches, products
+            self.version, self.loaded_at = version, time.time()
+
+        elapsed = time.perf_counter() - start
+        registry.set("outfitmatch_product_matches_products", len(matches),
+                     help_text="Products with precomputed GOES_WITH matches in memory")
+        logger.info(f"✅ Loaded top-{self.top_k} GOES_WITH matches for {len(matches)} products "
+                    f"({len(products)} product details) in {elapsed:.2f}s (catalog version {version})")
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Error loading product matches: {e}")
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def start(self):
+        """啟動時在背景載入；載入完成前的請求走即時查詢"""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+            self._version_checked_at = time.time()
+        threading.Thread(target=self._load_in_background, name="product-matches-loader", daemon=True).start()
+
+    def refresh_if_stale(self):
+        """每 version_check_seconds 秒最多檢查一次目錄版本，改變時在背景重新載入"""
+        now = time.time()
+        with self._lock:
+            if self._loading or now - self._version_checked_at < self.version_check_seconds:
+                return
+            self._version_checked_at = now
+        try:
+            version = qn.current_catalog_version()
+        except Exception as e:
+            logger.error(f"Error reading catalog version: {e}")
+            return
+        if version != self.version:
+            logger.info(f"🔄 Catalog version changed ({self.version} -> {version}), reloading product matches")
+            self.start()
+
+    def get(self, product_id: str, limit: int) -> Optional[List[Tuple[Tuple, float]]]:
+        """回傳 [(商品 tuple, score), ...]；沒有 GOES_WITH 的商品回傳 None"""
+        with self._lock:
+            neighbors = self.matches.get(product_id)
+            if not neighbors:
+                return None
+            products = self.products
+        return [(products[match_id], score) for match_id, score in neighbors[:limit] if match_id in products]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "top_k": self.top_k,
+                "products": len(self.matches),
+                "product_details": len(self.products),
+                "catalog_version": self.version,
+                "loaded_at": self.loaded_at,
+                "loading": self._loading,
+            }
+
+
+match_table = ProductMatchTable(PRODUCT_MATCHES_TOP_K, CATALOG_VERSION_CHECK_SECONDS)
+
+
+def get_product_matches(product_id: str, limit: int = 5) -> Dict:
+    """
+    先查記憶體中的 GOES_WITH top-k；只有沒有 GOES_WITH 的商品才即時走風格 / 類別關係
+    回傳 {"source": "goes_with" | "live", "products": [(商品 tuple, score), ...]}
+    """
+    match_table.refresh_if_stale()
+    matches = match_table.get(product_id, limit)
+    source = "goes_with" if matches is not None else "live"
+    if matches is None:
+        matches = [(product, None) for product in qn.get_matching_products_for_product(product_id, limit)]
+    registry.inc("outfitmatch_product_matches_total", 1, {"source": source},
+                 help_text="Product match lookups by source")
+    return {"source": source, "products": matches}
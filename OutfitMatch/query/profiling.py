@@ -0,0 +1,233 @@
+"""
+On-demand Request Profiling
+對被抽樣（或帶 X-Profile header）的請求做低開銷的統計式 profiling，
+輸出 collapsed stack / speedscope 檔案，並在模型 forward 期間啟動 torch profiler
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import random
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.settings import (
+    PROFILE_DIR,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_INTERVAL_MS,
+    PROFILE_FORMAT,
+    PROFILE_KEEP
+)
+
+logger = logging.getLogger(__name__)
+
+# 正在 profiling 的請求數；大於 0 時模型 forward 會同時啟動 torch profiler
+_active_profiles = 0
+_active_lock = threading.Lock()
+# 同一時間只 profile 一個請求、只啟動一個 torch profiler（torch profiler 不能重複啟動）
+_profile_lock = threading.Lock()
+_forward_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    背景執行緒每隔 interval 讀取目標執行緒的 stack（sys._current_frames），
+    以 collapsed stack 字串計數，不需要 instrument 被測程式碼
+    """
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+
+def write_collapsed(path: str, samples: Counter):
+    """Brendan Gregg collapsed stack 格式，可直接給 flamegraph.pl / speedscope"""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def write_speedscope(path: str, samples: Counter, interval_ms: float, name: str):
+    frames = []
+    frame_index = {}
+    stacks = []
+    weights = []
+    for stack, count in samples.items():
+        indices = []
+        for frame_name in stack.split(";"):
+            if frame_name not in frame_index:
+                frame_index[frame_name] = len(frames)
+                frames.append({"name": frame_name})
+            indices.append(frame_index[frame_name])
+        stacks.append(indices)
+        weights.append(count * interval_ms)
+
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "outfitmatch",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False)
+
+
+def should_profile(header_value: Optional[str], authorized: bool = False) -> bool:
+    """X-Profile header 為真值且請求帶有正確的 admin token，或依 PROFILE_SAMPLE_RATE 抽中"""
+    if authorized and header_value and header_value.lower() in ("1", "true", "yes"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _profile_name(label: str) -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{label}"
+
+
+def _prune_profiles():
+    """只保留最近 PROFILE_KEEP 個檔案"""
+    files = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for path in files[PROFILE_KEEP:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile_request(label: str = "user_query"):
+    """
+    用法：
+        with profile_request("user_query") as info:
+            result = user_query(...)
+        info['path']  # 寫出的 profile 檔案；已有其他請求在 profiling 時不 profile，path 為 None
+    """
+    info = {"name": _profile_name(label), "path": None}
+    if not _profile_lock.acquire(blocking=False):
+        logger.info(f"Another request is being profiled, skipping profile of {label}")
+        yield info
+        return
+    try:
+        with _profiled(label, info):
+            yield info
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def _profiled(label: str, info: Dict):
+    global _active_profiles
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler = SamplingProfiler(threading.get_ident())
+    with _active_lock:
+        _active_profiles += 1
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield info
+    finally:
+        samples = profiler.stop()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _active_lock:
+            _active_profiles -= 1
+
+        try:
+            if PROFILE_FORMAT == "speedscope":
+                path = os.path.join(PROFILE_DIR, info["name"] + ".speedscope.json")
+                write_speedscope(path, samples, profiler.interval * 1000, info["name"])
+            else:
+                path = os.path.join(PROFILE_DIR, info["name"] + ".collapsed")
+                write_collapsed(path, samples)
+            info["path"] = path
+            _prune_profiles()
+            logger.info(f"🔬 Profiled {label} in {elapsed_ms:.1f}ms "
+                        f"({sum(samples.values())} samples) -> {path}")
+        except Exception as e:
+            logger.error(f"Error writing profile {info['name']}: {e}")
+
+
+@contextmanager
+def forward_profiler(stage: str):
+    """
+    有請求正在 profiling 時，以 torch profiler 包住模型 forward 並輸出 chrome trace
+    batch 推論時同一份 trace 涵蓋整個 batch
+    """
+    if _active_profiles == 0 or not _forward_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        import torch
+        from torch.profiler import profile, ProfilerActivity
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+
+        with profile(activities=activities, record_shapes=True) as prof:
+            yield
+    finally:
+        _forward_lock.release()
+
+    try:
+        path = os.path.join(PROFILE_DIR, _profile_name(stage) + ".torch.json")
+        prof.export_chrome_trace(path)
+        _prune_profiles()
+    except Exception as e:
+        logger.error(f"Error writing torch trace for {stage}: {e}")
+
+
+def list_profiles() -> List[Dict]:
+    """最近的 profile 檔案（新到舊）"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        stat = os.stat(path)
+        profiles.append({
+            "name": name,
+            "size_bytes": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        })
+    return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
@@ -4,7 +4,6 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import openai
 import psycopg2
-import ast
 from PIL import Image
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
@@ -12,19 +11,22 @@ import base64
 from io import BytesIO
 from config.settings import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     POSTGRES_HOST,
     POSTGRES_DB,
     POSTGRES_USER,
-    POSTGRES_PASSWORD
+    POSTGRES_PASSWORD,
+    STYLE_VOTE_K
 )
 from loader.instagram_neo4j import (
     segment_and_crop_fashion,
     get_image_embedding,
     fetch_all_post_embeddings_and_info
 )
+from query.style_voting import vote_styles
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client（OPENAI_BASE_URL 可指向本機 stub）
+client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 # Initialize database connection
 conn = None
@@ -96,38 +98,6 @@ def get_topk_similar_posts(query_img, k=3):
     top_k_indices = np.argsort(scores)[::-1][:k]
     return [posts[i] for i in top_k_indices], [scores[i] for i in top_k_indices]
 
-def predict_style_for_posts(posts):
-    style_results = []
-    style_list = "日系、韓系、歐美、街頭、簡約、運動風、復古、休閒、工裝、優雅、戶外、都會、甜美、性感、正裝、華麗"
-    prompt_template = """
-    你是一個時尚穿搭風格專家。根據以下資訊，請判斷這篇 IG 穿搭貼文最符合的 1~2 個風格（從下列風格選，最多2個），只回傳 Python list 格式，不需解釋、不需補充。
-    
-    可選風格有：{style_list}
-    
-    請用 ['風格1', '風格2'] 或 ['風格1'] 格式回傳，不要有多餘文字。
-    
-    ---
-    穿搭描述：{desc}
-    商品資訊：{items}
-    標籤：{tags}
-    ---
-    """
-    for post in posts:
-        desc = post.get('description', '') or ''
-        items = post.get('caption', '') or ''
-        tags = ''
-        prompt = prompt_template.format(style_list=style_list, desc=desc, items=items, tags=tags)
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "你是時尚風格專家"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-        )
-        style_results.append(response.choices[0].message.content.strip())
-    return style_results
-
 def image_to_styles(query_image):
     try:
         print(f"Received image type: {type(query_image)}")
@@ -167,14 +137,15 @@ def image_to_styles(query_image):
             raise ValueError(f"Invalid image input. Must be a base64 string or PIL Image or file path. Got type {type(query_image)}")
 
         print("Getting similar posts...")
-        top_posts, top_scores = get_topk_similar_posts(img, k=1)
-        print("Predicting styles...")
-        style_results = predict_style_for_posts(top_posts)
-            
-        #TODO: 整合多篇貼文預測風格
-        result = ast.literal_eval(style_results[0])
-        print(f"Predicted styles: {result}")
-        return result
+        top_posts, top_scores = get_topk_similar_posts(img, k=STYLE_VOTE_K)
+
+        # 貼文風格在寫入時已預測為 HAS_STYLE（loader/post_styles.py），查詢時不呼叫 LLM；k 篇貼文依相似度加權投票
+        resolved = vote_styles([{'post_id': post['id'], 'score': float(score), 'styles': post.get('styles')}
+                                for post, score in zip(top_posts, top_scores)])
+        if not resolved['posts']:
+            print("Similar posts have no HAS_STYLE yet (run loader/post_styles.py), using default style")
+        print(f"Voted styles: {resolved['styles']} (confidence {resolved['confidence']:.2f})")
+        return resolved['styles']
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         print(f"Error type: {type(e)}")
@@ -13,28 +13,52 @@ from PIL import Image
 import base64
 from io import BytesIO
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Optional
 from config.settings import (
     OPENAI_API_KEY,
+    OPENAI_BASE_URL,
     NEO4J_URI,
     NEO4J_USER,
     NEO4J_PASSWORD,
-    NL2CYPHER_MODEL
-)
-from loader.instagram_neo4j import (
-    segment_and_crop_fashion,
-    get_image_embedding
+    NL2CYPHER_MODEL,
+    CASCADE_EMBEDDING,
+    STYLE_VOTE_K,
+    STREAM_STAGE_WORKERS,
+    STREAM_BATCH_SIZE,
+    ENABLE_QUERY_CACHE,
+    CACHE_TTL_SECONDS,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_MAX_ENTRIES,
+    CATALOG_VERSION_CHECK_SECONDS,
+    KEYWORD_SEARCH,
+    IMAGE_SEARCH_MODE,
+    VISUAL_SEARCH_STYLE_WEIGHT
 )
+from query.inference_worker import embed_query_image
+from query.cascade import cascade_top_post
+from query.style_voting import vote_styles, DEFAULT_STYLES
+from query.keyword_search import KeywordQuery, parse_keyword_query, known_brands, keyword_search, iter_keyword_search
+from query.visual_search import visual_search, to_product
+from query.metrics import stage_timer, observe_stage
+from query.result_cache import create_result_cache, normalize_query_text, image_content_hash
+from query.single_flight import SingleFlight
+from database.catalog_version import get_catalog_version
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client（OPENAI_BASE_URL 可指向本機 stub）
+client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 # Neo4j driver (use connection pool)
 driver = None
 
+# 串流查詢用的共用執行緒池：LLM 翻譯與圖片推論並行執行
+_stage_executor = ThreadPoolExecutor(max_workers=STREAM_STAGE_WORKERS, thread_name_prefix="query-stage")
+
 
 def init_neo4j():
     """初始化 Neo4j 連線池"""
@@ -58,12 +82,29 @@ def close_neo4j():
         logger.info("🔌 Disconnected from Neo4j")
 
 
-def nl_to_cypher_conditions(nl_query: str) -> str:
-    """
-    將自然語言轉換為 Cypher WHERE 條件
-    使用 LLM 進行轉換
-    """
-    prompt_template = """
+def current_catalog_version() -> int:
+    init_neo4j()
+    return get_catalog_version(driver)
+
+
+# 整體搜尋結果快取：同樣的文字 + 圖片 + 目錄版本直接回傳先前的結果
+result_cache = create_result_cache(
+    current_catalog_version,
+    enabled=ENABLE_QUERY_CACHE,
+    ttl=CACHE_TTL_SECONDS,
+    backend=RESULT_CACHE_BACKEND,
+    path=RESULT_CACHE_PATH,
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    version_check_seconds=CATALOG_VERSION_CHECK_SECONDS
+)
+
+# 相同查詢同時進來時只計算一次（整體查詢、LLM 翻譯、圖片推論各自合併）
+_query_flight = SingleFlight("user_query")
+_translation_flight = SingleFlight("llm_translation")
+_image_flight = SingleFlight("image_to_styles")
+
+
+NL2CYPHER_PROMPT = """
 你是一個 Neo4j Cypher 專家。根據下列圖資料庫結構，將用戶的自然語言問題轉換成 Cypher 的 WHERE 條件。
 
 圖資料庫結構：
@@ -99,94 +140,219 @@ Style 風格: 日系、韓系、歐美、街頭、簡約、運動風、復古、
 問題：{query}
 答案：
 """
-    
-    full_prompt = prompt_template.format(query=nl_query)
-    
+
+
+def build_nl2cypher_messages(nl_query: str) -> List[Dict]:
+    """NL → Cypher 的 chat messages（同步與 async 版本共用）"""
+    return [
+        {"role": "system", "content": "你是 Neo4j Cypher 查詢專家"},
+        {"role": "user", "content": NL2CYPHER_PROMPT.format(query=nl_query)}
+    ]
+
+
+def clean_cypher_conditions(content: str) -> str:
+    """移除 LLM 回覆中可能的 markdown 標記"""
+    return content.strip().replace('```', '').replace('cypher', '').strip()
+
+
+class FallbackConditions(str):
+    """LLM 翻譯失敗時的後備條件，以型別與 LLM 正常回傳的 TRUE 區分"""
+
+
+FALLBACK_CONDITIONS = FallbackConditions("TRUE")
+
+
+def is_fallback(cypher_conditions: Optional[str] = None, resolved: Optional[Dict] = None) -> bool:
+    """LLM 翻譯失敗或圖片推論失敗（沒有相似貼文、使用預設風格）時為 True；這類降級結果不進快取"""
+    return isinstance(cypher_conditions, FallbackConditions) or (resolved is not None and not resolved['posts'])
+
+
+def nl_to_cypher_conditions(nl_query: str) -> str:
+    """
+    將自然語言轉換為 Cypher WHERE 條件
+    使用 LLM 進行轉換；同時進來的相同文字只呼叫一次 LLM
+    """
+    return _translation_flight.do(normalize_query_text(nl_query), _nl_to_cypher_conditions, nl_query)
+
+
+def _nl_to_cypher_conditions(nl_query: str) -> str:
     try:
-        resp = client.chat.completions.create(
-            model=NL2CYPHER_MODEL,
-            messages=[
-                {"role": "system", "content": "你是 Neo4j Cypher 查詢專家"},
-                {"role": "user", "content": full_prompt}
-            ],
-            temperature=0.1
-        )
-        conditions = resp.choices[0].message.content.strip()
-        # 移除可能的 markdown 標記
-        conditions = conditions.replace('```', '').replace('cypher', '').strip()
+        with stage_timer("llm_translation"):
+            resp = client.chat.completions.create(
+                model=NL2CYPHER_MODEL,
+                messages=build_nl2cypher_messages(nl_query),
+                temperature=0.1
+            )
+        conditions = clean_cypher_conditions(resp.choices[0].message.content)
         logger.info(f"📝 NL to Cypher: {nl_query} -> {conditions}")
         return conditions
     except Exception as e:
         logger.error(f"Error in NL to Cypher conversion: {e}")
-        return "TRUE"  # 返回總是為真的條件作為後備
+        return FALLBACK_CONDITIONS  # 返回總是為真的條件作為後備
+
+
+def decode_query_image(query_image) -> Image.Image:
+    """
+    將 base64 字串、檔案路徑或 PIL Image 轉成 RGB 的 PIL Image
+    （灰階、RGBA、調色盤圖片直接送進 processor 會出錯，batch 推論時會拖累同批的其他請求）
+    """
+    if isinstance(query_image, str):
+        if query_image.startswith('data:image') or query_image.startswith('/9j/') or query_image.startswith('iVBOR'):
+            # Base64 編碼的圖片
+            base64_data = query_image.split(',')[1] if ',' in query_image else query_image
+            img_data = base64.b64decode(base64_data)
+            return Image.open(BytesIO(img_data)).convert("RGB")
+        elif os.path.isfile(query_image):
+            # 文件路徑
+            return Image.open(query_image).convert("RGB")
+        else:
+            raise ValueError(f"Invalid image string format")
+    elif isinstance(query_image, Image.Image):
+        return query_image.convert("RGB")
+    else:
+        raise ValueError(f"Invalid image type: {type(query_image)}")
+
+
+# 最相似的 k 篇有風格標籤的貼文與其 HAS_STYLE confidence（一次查詢，投票在記憶體中進行）
+NEAREST_POST_QUERY = """
+CALL db.index.vector.queryNodes('post_image_index', $k, $embedding)
+YIELD node, score
+MATCH (node)-[r:HAS_STYLE]->(style:Style)
+RETURN node.id as post_id, 
+       node.description as description,
+       collect({name: style.name, confidence: r.confidence}) as styles,
+       score
+ORDER BY score DESC
+"""
+
+
+def nearest_posts(session, query_emb, k: int = STYLE_VOTE_K) -> List[Dict]:
+    with stage_timer("vector_query"):
+        result = session.run(NEAREST_POST_QUERY, k=k, embedding=query_emb.tolist())
+        return [record.data() for record in result]
+
+
+def nearest_post_styles(session, img, k: int = STYLE_VOTE_K) -> Optional[Dict]:
+    """在 post_image_index 找最相似的 k 篇貼文，回傳投票結果（含 top-1 貼文的 post_id 與 score）"""
+    # 分割時尚區域並生成 embedding（同時進來的請求會合併成一個 batch）
+    query_emb = embed_query_image(img)
+    logger.info(f"Generated embedding: shape {query_emb.shape}")
+
+    neighbors = nearest_posts(session, query_emb, k)
+    return vote_styles(neighbors) if neighbors else None
 
 
 def image_to_styles(query_image) -> List[str]:
     """
     從上傳的圖片推測風格
-    1. 在 Neo4j 中找最相似的 Instagram 貼文
-    2. 獲取該貼文的風格標籤
+    1. 在 Neo4j 中找最相似的 k 篇 Instagram 貼文（CASCADE_EMBEDDING 時先用小模型召回）
+    2. 依相似度加權投票決定風格（query/style_voting.py）
+    同時進來的相同圖片只做一次分割、embedding 與向量查詢
     """
+    return resolve_image_styles(query_image)['styles']
+
+
+def resolve_image_styles(query_image) -> Dict:
+    """image_to_styles 的完整結果：{'styles', 'confidence', 'votes', 'posts', 'post_id', 'score'}"""
+    return _image_flight.do(image_content_hash(query_image), _resolve_image_styles, query_image)
+
+
+def _default_styles() -> Dict:
+    return vote_styles([])
+
+
+def _resolve_image_styles(query_image) -> Dict:
     try:
         init_neo4j()
         
         logger.info(f"Processing image type: {type(query_image)}")
-        
-        # 處理不同格式的圖片輸入
-        if isinstance(query_image, str):
-            if query_image.startswith('data:image') or query_image.startswith('/9j/') or query_image.startswith('iVBOR'):
-                # Base64 編碼的圖片
-                base64_data = query_image.split(',')[1] if ',' in query_image else query_image
-                img_data = base64.b64decode(base64_data)
-                img = Image.open(BytesIO(img_data))
-            elif os.path.isfile(query_image):
-                # 文件路徑
-                img = Image.open(query_image)
-            else:
-                raise ValueError(f"Invalid image string format")
-        elif isinstance(query_image, Image.Image):
-            img = query_image
-        else:
-            raise ValueError(f"Invalid image type: {type(query_image)}")
-        
+        with stage_timer("decode"):
+            img = decode_query_image(query_image)
         logger.info(f"Image loaded: {img.size} {img.mode}")
         
-        # 分割時尚區域並生成 embedding
-        seg_img = segment_and_crop_fashion(img)
-        query_emb = get_image_embedding(seg_img)
-        
-        logger.info(f"Generated embedding: shape {query_emb.shape}")
-        
-        # 在 Neo4j 中找相似的貼文
+        # 在 Neo4j 中找相似的貼文並投票
         with driver.session() as session:
-            # 使用向量索引搜尋
-            result = session.run("""
-                CALL db.index.vector.queryNodes('post_image_index', 3, $embedding)
-                YIELD node, score
-                MATCH (node)-[:HAS_STYLE]->(style:Style)
-                RETURN node.id as post_id, 
-                       node.description as description,
-                       collect(DISTINCT style.name) as styles,
-                       score
-                ORDER BY score DESC
-                LIMIT 1
-            """, embedding=query_emb.tolist())
-            
-            record = result.single()
+            if CASCADE_EMBEDDING:
+                top = cascade_top_post(session, img)
+                resolved = vote_styles(top['neighbors']) if top else None
+            else:
+                resolved = nearest_post_styles(session, img)
             
-            if record:
-                styles = record['styles']
-                logger.info(f"🎨 Found similar post with styles: {styles} (similarity: {record['score']:.3f})")
-                return styles if styles else ['休閒']
+            if resolved and resolved['posts']:
+                logger.info(f"🎨 Voted styles {resolved['styles']} from {resolved['posts']} similar posts "
+                            f"(confidence: {resolved['confidence']:.2f}, top similarity: {resolved['score']:.3f})")
+                return resolved
             else:
-                logger.warning("No similar posts found, using default style")
-                return ['休閒']
+                logger.warning(f"No similar posts found, using default style {DEFAULT_STYLES}")
+                return _default_styles()
                 
     except Exception as e:
         logger.error(f"Error in image_to_styles: {e}")
         import traceback
         logger.error(traceback.format_exc())
-        return ['休閒']  # 返回預設風格
+        return _default_styles()  # 返回預設風格
+
+
+# 精確匹配：所有風格都符合
+EXACT_MATCH_QUERY = """
+MATCH (p:Product)-[:HAS_STYLE]->(s:Style)
+WHERE s.name IN $styles
+MATCH (p)-[:OF_BRAND]->(b:Brand)
+MATCH (p)-[:IN_CATEGORY]->(c:Category)
+WHERE {conditions}
+WITH p, b, c, collect(DISTINCT s.name) as product_styles
+WHERE size(product_styles) = size($styles)
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       product_styles as predicted_style, p.image_url as image_url
+ORDER BY p.price ASC, p.id ASC
+SKIP $skip
+LIMIT $limit
+"""
+
+# 部分匹配：至少有一個風格符合
+PARTIAL_MATCH_QUERY = """
+MATCH (p:Product)-[:HAS_STYLE]->(s:Style)
+WHERE s.name IN $styles
+MATCH (p)-[:OF_BRAND]->(b:Brand)
+MATCH (p)-[:IN_CATEGORY]->(c:Category)
+WHERE {conditions}
+WITH p, b, c, collect(DISTINCT s.name) as product_styles, count(s) as style_matches
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       product_styles as predicted_style, p.image_url as image_url
+ORDER BY style_matches DESC, p.price ASC, p.id ASC
+SKIP $skip
+LIMIT $limit
+"""
+
+# 降級模式（跳過圖片推論）：只依文字條件搜尋
+TEXT_ONLY_QUERY = """
+MATCH (p:Product)-[:OF_BRAND]->(b:Brand)
+MATCH (p)-[:IN_CATEGORY]->(c:Category)
+WHERE {conditions}
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+WITH p, b, c, collect(DISTINCT s.name) as product_styles
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       product_styles as predicted_style, p.image_url as image_url
+ORDER BY p.price ASC, p.id ASC
+SKIP $skip
+LIMIT $limit
+"""
+
+DEGRADED_RESPONSE_TEXT = "目前查詢量較大，暫時略過圖片分析，以下是僅依文字條件找到的商品："
+
+# 搜尋模式：style 為 圖片 → 相似貼文風格 → 商品，visual 為商品圖片的向量相似度
+SEARCH_MODES = ("style", "visual")
+
+
+def fetch_products(session, query_template: str, styles: List[str], cypher_conditions: str,
+                   limit: int = 10, skip: int = 0) -> List[Tuple]:
+    """執行商品查詢模板，回傳 (id, name, description, category, brand, price, styles, image_url)"""
+    result = session.run(query_template.format(conditions=cypher_conditions),
+                         styles=styles, skip=skip, limit=limit)
+    return [to_product(r) for r in result]
 
 
 def search_products_by_style_and_conditions(
@@ -196,59 +362,30 @@ def search_products_by_style_and_conditions(
 ) -> List[Tuple]:
     """
     基於風格和條件搜尋商品（使用圖關係）
+    styles 為空（降級模式）時只依文字條件搜尋
     """
     init_neo4j()
     
     with driver.session() as session:
-        # 精確匹配：所有風格都符合
-        exact_query = f"""
-        MATCH (p:Product)-[:HAS_STYLE]->(s:Style)
-        WHERE s.name IN $styles
-        MATCH (p)-[:OF_BRAND]->(b:Brand)
-        MATCH (p)-[:IN_CATEGORY]->(c:Category)
-        WHERE {cypher_conditions}
-        WITH p, b, c, collect(DISTINCT s.name) as product_styles
-        WHERE size(product_styles) = size($styles)
-        RETURN p.id as id, p.name as name, p.description as description,
-               c.name as category, b.name as brand, p.price as price,
-               product_styles as predicted_style, p.image_url as image_url
-        ORDER BY p.price ASC
-        LIMIT $limit
-        """
-        
+        if not styles:
+            try:
+                products = fetch_products(session, TEXT_ONLY_QUERY, styles, cypher_conditions, limit)
+                logger.info(f"✅ Found {len(products)} products with text-only conditions")
+                return products
+            except Exception as e:
+                logger.error(f"Error in text-only query: {e}")
+                return []
+
         try:
-            result = session.run(exact_query, styles=styles, limit=limit)
-            products = [(r['id'], r['name'], r['description'], r['category'], 
-                        r['brand'], r['price'], r['predicted_style'], r['image_url']) 
-                       for r in result]
-            
+            products = fetch_products(session, EXACT_MATCH_QUERY, styles, cypher_conditions, limit)
             if products:
                 logger.info(f"✅ Found {len(products)} products with exact style match")
                 return products
         except Exception as e:
             logger.error(f"Error in exact match query: {e}")
         
-        # 部分匹配：至少有一個風格符合
-        partial_query = f"""
-        MATCH (p:Product)-[:HAS_STYLE]->(s:Style)
-        WHERE s.name IN $styles
-        MATCH (p)-[:OF_BRAND]->(b:Brand)
-        MATCH (p)-[:IN_CATEGORY]->(c:Category)
-        WHERE {cypher_conditions}
-        WITH p, b, c, collect(DISTINCT s.name) as product_styles, count(s) as style_matches
-        RETURN p.id as id, p.name as name, p.description as description,
-               c.name as category, b.name as brand, p.price as price,
-               product_styles as predicted_style, p.image_url as image_url
-        ORDER BY style_matches DESC, p.price ASC
-        LIMIT $limit
-        """
-        
         try:
-            result = session.run(partial_query, styles=styles, limit=limit)
-            products = [(r['id'], r['name'], r['description'], r['category'], 
-                        r['brand'], r['price'], r['predicted_style'], r['image_url']) 
-                       for r in result]
-            
+            products = fetch_products(session, PARTIAL_MATCH_QUERY, styles, cypher_conditions, limit)
             logger.info(f"✅ Found {len(products)} products with partial style match")
             return products
         except Exception as e:
@@ -256,6 +393,77 @@ def search_products_by_style_and_conditions(
             return []
 
 
+def _batched(products, batch_size: int):
+    page = []
+    for product in products:
+        page.append(product)
+        if len(page) == batch_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def iter_product_batches(styles: List[str], cypher_conditions: Optional[str],
+                         limit: int = 10, batch_size: int = 5, parsed: Optional[KeywordQuery] = None):
+    """
+    分頁版的 search_products_by_style_and_conditions，每收到 batch_size 筆就 yield
+    與非串流版本相同：有精確匹配時只回傳精確匹配，否則改用部分匹配
+    每個模板只執行一次查詢，從同一個 result cursor 依序讀取（不以 SKIP 重跑整個聚合查詢）
+    parsed 指定時改為分頁版的 search_products_by_keywords
+    """
+    init_neo4j()
+
+    if parsed is not None:
+        with driver.session() as session:
+            try:
+                yield from _batched(iter_keyword_search(session, parsed, styles, limit), batch_size)
+            except Exception as e:
+                logger.error(f"Error in keyword batch query: {e}")
+        return
+
+    templates = (EXACT_MATCH_QUERY, PARTIAL_MATCH_QUERY) if styles else (TEXT_ONLY_QUERY,)
+    with driver.session() as session:
+        for template in templates:
+            sent = 0
+            try:
+                result = session.run(template.format(conditions=cypher_conditions),
+                                     styles=styles, skip=0, limit=limit)
+                for page in _batched((to_product(record) for record in result), batch_size):
+                    sent += len(page)
+                    yield page
+            except Exception as e:
+                logger.error(f"Error in product batch query: {e}")
+            if sent:
+                return
+
+
+# 相同風格、不同類別的搭配商品（沒有預先計算的 GOES_WITH 時使用）
+MATCHING_PRODUCTS_QUERY = """
+MATCH (selected:Product {id: $product_id})
+MATCH (selected)-[:HAS_STYLE]->(style:Style)
+MATCH (selected)-[:IN_CATEGORY]->(selected_cat:Category)
+
+// 找相同風格但不同類別的商品
+MATCH (match:Product)-[:HAS_STYLE]->(style)
+MATCH (match)-[:IN_CATEGORY]->(match_cat:Category)
+WHERE match.id <> selected.id 
+  AND match_cat.name <> selected_cat.name
+
+MATCH (match)-[:OF_BRAND]->(b:Brand)
+
+WITH match, b, match_cat, 
+     collect(DISTINCT style.name) as styles,
+     count(DISTINCT style) as common_styles
+
+RETURN match.id as id, match.name as name, match.description as description,
+       match_cat.name as category, b.name as brand, match.price as price,
+       styles as predicted_style, match.image_url as image_url
+ORDER BY common_styles DESC, match.price ASC
+LIMIT $limit
+"""
+
+
 def get_matching_products_for_product(product_id: str, limit: int = 5) -> List[Tuple]:
     """
     為指定商品推薦搭配商品
@@ -264,31 +472,7 @@ def get_matching_products_for_product(product_id: str, limit: int = 5) -> List[T
     init_neo4j()
     
     with driver.session() as session:
-        query = """
-        MATCH (selected:Product {id: $product_id})
-        MATCH (selected)-[:HAS_STYLE]->(style:Style)
-        MATCH (selected)-[:IN_CATEGORY]->(selected_cat:Category)
-        
-        // 找相同風格但不同類別的商品
-        MATCH (match:Product)-[:HAS_STYLE]->(style)
-        MATCH (match)-[:IN_CATEGORY]->(match_cat:Category)
-        WHERE match.id <> selected.id 
-          AND match_cat.name <> selected_cat.name
-        
-        MATCH (match)-[:OF_BRAND]->(b:Brand)
-        
-        WITH match, b, match_cat, 
-             collect(DISTINCT style.name) as styles,
-             count(DISTINCT style) as common_styles
-        
-        RETURN match.id as id, match.name as name, match.description as description,
-               match_cat.name as category, b.name as brand, match.price as price,
-               styles as predicted_style, match.image_url as image_url
-        ORDER BY common_styles DESC, match.price ASC
-        LIMIT $limit
-        """
-        
-        result = session.run(query, product_id=product_id, limit=limit)
+        result = session.run(MATCHING_PRODUCTS_QUERY, product_id=product_id, limit=limit)
         products = [(r['id'], r['name'], r['description'], r['category'], 
                     r['brand'], r['price'], r['predicted_style'], r['image_url']) 
                    for r in result]
@@ -297,31 +481,116 @@ def get_matching_products_for_product(product_id: str, limit: int = 5) -> List[T
         return products
 
 
-def user_query(query_text: str, query_image) -> Dict:
+def parse_keyword(query_text: str) -> Optional[KeywordQuery]:
+    """關鍵字型查詢的解析結果；不是關鍵字型（或關閉 KEYWORD_SEARCH）時回傳 None，改走 LLM 翻譯"""
+    if not KEYWORD_SEARCH:
+        return None
+    init_neo4j()
+    try:
+        with driver.session() as session:
+            return parse_keyword_query(query_text, known_brands(session))
+    except Exception as e:
+        logger.error(f"Error parsing keyword query: {e}")
+        return None
+
+
+def search_products_by_keywords(parsed: KeywordQuery, styles: List[str], limit: int = 10) -> List[Tuple]:
+    """全文索引 + 結構化條件搜尋，依全文分數與風格重疊排序"""
+    init_neo4j()
+
+    with driver.session() as session:
+        try:
+            products = keyword_search(session, parsed, styles, limit)
+            logger.info(f"✅ Found {len(products)} products with keyword search")
+            return products
+        except Exception as e:
+            logger.error(f"Error in keyword search: {e}")
+            return []
+
+
+def serialize_product(product):
+    """將查詢結果的 tuple 轉為前端使用的 dict"""
+    return {
+        'id': product[0],
+        'name': product[1],
+        'description': product[2],
+        'category': product[3],
+        'brand': product[4],
+        'price': str(product[5]) if product[5] is not None else "N/A",
+        'predicted_style': product[6] if len(product) > 6 else [],
+        'imageUrl': product[7] if len(product) > 7 and product[7] else None,
+        'shop': product[4],
+        'link': None
+    }
+
+
+def cache_result(cache_key: Optional[str], result: Dict, elapsed: float):
+    """降級結果（result['fallback']）不快取，下一個相同的請求重新查詢"""
+    if result.get('fallback'):
+        logger.warning("⚠️ Fallback result (LLM or image inference failed), not cached")
+        return
+    result_cache.set(cache_key, result, elapsed)
+
+
+def user_query(query_text: str, query_image, degraded: bool = False, mode: str = None) -> Dict:
     """
     用戶查詢的主入口
     結合自然語言 + 圖片進行智能推薦
+    degraded=True 時（系統過載）跳過圖片推論，只依文字條件搜尋
+    mode 為 SEARCH_MODES 之一，未指定時使用 IMAGE_SEARCH_MODE
     """
+    if degraded:
+        return text_only_query(query_text)
+
+    mode = mode or IMAGE_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    run = _run_visual_query if mode == "visual" else _run_user_query
+
+    key = result_cache.make_key(query_text, query_image, mode)
+    cached = result_cache.get(key)
+    if cached is not None:
+        logger.info("⚡ Result cache hit")
+        return cached
+
+    flight_key = (normalize_query_text(query_text), image_content_hash(query_image), mode)
+    return _query_flight.do(flight_key, run, query_text, query_image, key)
+
+
+def _run_user_query(query_text: str, query_image, cache_key: Optional[str]) -> Dict:
+    start = time.perf_counter()
     try:
-        # 1. 將自然語言轉換為 Cypher 條件
-        cypher_conditions = nl_to_cypher_conditions(query_text)
+        # 1. 關鍵字型查詢直接解析條件，其餘將自然語言轉換為 Cypher 條件
+        parsed = parse_keyword(query_text)
+        cypher_conditions = nl_to_cypher_conditions(query_text) if parsed is None else None
         
-        # 2. 從圖片推測風格
-        styles = image_to_styles(query_image)
+        # 2. 從圖片推測風格（k 篇相似貼文投票）
+        resolved = resolve_image_styles(query_image)
+        styles = resolved['styles']
         
         # 3. 基於風格和條件搜尋商品
-        products = search_products_by_style_and_conditions(styles, cypher_conditions, limit=10)
+        with stage_timer("product_search"):
+            if parsed is not None:
+                products = search_products_by_keywords(parsed, styles, limit=10)
+            else:
+                products = search_products_by_style_and_conditions(styles, cypher_conditions, limit=10)
         
         if products:
             response_text = f"您上傳的圖片最接近 {' + '.join(styles)} 風格，以下是符合您條件的商品："
         else:
             response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
         
-        return {
+        result = {
             "text": response_text,
             "products": products,
-            "detected_styles": styles
+            "detected_styles": styles,
+            "style_confidence": resolved['confidence'],
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "image_mode": "style",
+            "fallback": is_fallback(cypher_conditions, resolved)
         }
+        cache_result(cache_key, result, time.perf_counter() - start)
+        return result
         
     except Exception as e:
         logger.error(f"Error in user_query: {e}")
@@ -334,6 +603,178 @@ def user_query(query_text: str, query_image) -> Dict:
         }
 
 
+def _run_visual_query(query_text: str, query_image, cache_key: Optional[str]) -> Dict:
+    """以查詢圖片的 embedding 直接查商品圖片索引，文字只用來產生過濾條件"""
+    start = time.perf_counter()
+    try:
+        # 1. 關鍵字型查詢直接解析條件，其餘在背景將自然語言轉換為 Cypher 條件
+        parsed = parse_keyword(query_text)
+        conditions_future = _stage_executor.submit(nl_to_cypher_conditions, query_text) if parsed is None else None
+
+        # 2. 查詢圖片的 embedding（與貼文 / 商品相同的分割 + DINOv2），與 LLM 翻譯並行
+        init_neo4j()
+        with stage_timer("decode"):
+            img = decode_query_image(query_image)
+        query_emb = embed_query_image(img)
+        cypher_conditions = conditions_future.result() if conditions_future else "TRUE"
+
+        with driver.session() as session:
+            # 3. 需要混合風格重疊時，以同一個 embedding 查相似貼文投票（不重新推論）
+            resolved = None
+            if VISUAL_SEARCH_STYLE_WEIGHT > 0:
+                resolved = vote_styles(nearest_posts(session, query_emb))
+            styles = resolved['styles'] if resolved else []
+
+            # 4. 過濾後的 kNN 商品搜尋
+            with stage_timer("product_search"):
+                products, stats = visual_search(session, query_emb, cypher_conditions, parsed, styles, limit=10)
+        logger.info(f"✅ Found {len(products)} visually similar products "
+                    f"({stats['rounds']} vector queries, {stats['candidates']} candidates)")
+
+        if products:
+            response_text = "以下是外觀與您上傳的圖片最相似、且符合您條件的商品："
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+
+        result = {
+            "text": response_text,
+            "products": products,
+            "detected_styles": styles,
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "image_mode": "visual",
+            "visual_score": stats['top_score'],
+            "fallback": is_fallback(cypher_conditions, resolved)
+        }
+        if resolved:
+            result["style_confidence"] = resolved['confidence']
+        cache_result(cache_key, result, time.perf_counter() - start)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error in visual query: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        return {
+            "text": f"查詢時發生錯誤：{str(e)}",
+            "products": [],
+            "detected_styles": []
+        }
+
+
+def text_only_query(query_text: str) -> Dict:
+    """降級模式：不做圖片推論，只用關鍵字解析或 LLM 翻譯的條件搜尋（結果不進快取）"""
+    try:
+        parsed = parse_keyword(query_text)
+        cypher_conditions = nl_to_cypher_conditions(query_text) if parsed is None else None
+        with stage_timer("product_search"):
+            if parsed is not None:
+                products = search_products_by_keywords(parsed, [], limit=10)
+            else:
+                products = search_products_by_style_and_conditions([], cypher_conditions, limit=10)
+
+        if products:
+            response_text = DEGRADED_RESPONSE_TEXT
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+
+        return {
+            "text": response_text,
+            "products": products,
+            "detected_styles": [],
+            "degraded": True,
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "fallback": is_fallback(cypher_conditions)
+        }
+
+    except Exception as e:
+        logger.error(f"Error in text_only_query: {e}")
+        return {
+            "text": f"查詢時發生錯誤：{str(e)}",
+            "products": [],
+            "detected_styles": [],
+            "degraded": True
+        }
+
+
+def _visual_query_stream(query_text: str, query_image, batch_size: int):
+    """visual 模式的串流：kNN 商品搜尋沒有分頁，與 user_query 共用快取與 single-flight，完成後分批送出商品"""
+    result = user_query(query_text, query_image, mode="visual")
+    if "search_mode" not in result:
+        # _run_visual_query 的錯誤回覆
+        yield "error", {"text": result["text"]}
+        return
+    yield "styles", result["detected_styles"]
+    products = result["products"]
+    for i in range(0, len(products), batch_size):
+        yield "products", products[i:i + batch_size]
+    yield "done", {"text": result["text"], "total": len(products), "degraded": False,
+                   "search_mode": result["search_mode"], "image_mode": "visual",
+                   "fallback": result["fallback"]}
+
+
+def user_query_stream(query_text: str, query_image, limit: int = 10,
+                      batch_size: int = STREAM_BATCH_SIZE, degraded: bool = False, mode: str = None):
+    """
+    串流版 user_query，依序 yield (event, payload)：
+    1. styles / conditions：LLM 翻譯與圖片推論並行，先完成的先送出
+       （degraded 時不做圖片推論，styles 為空；關鍵字型查詢不呼叫 LLM，conditions 為解析結果）
+    2. products：每取得一頁商品送出一次
+    3. done：最終回覆文字
+    mode 與 user_query 相同（未指定時使用 IMAGE_SEARCH_MODE）；visual 模式見 _visual_query_stream
+    """
+    try:
+        mode = mode or IMAGE_SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if mode == "visual" and not degraded:
+            yield from _visual_query_stream(query_text, query_image, batch_size)
+            return
+
+        parsed = parse_keyword(query_text)
+        futures = {}
+        if parsed is None:
+            futures[_stage_executor.submit(nl_to_cypher_conditions, query_text)] = "conditions"
+        else:
+            yield "conditions", parsed.describe()
+        if degraded:
+            yield "styles", []
+        else:
+            futures[_stage_executor.submit(image_to_styles, query_image)] = "styles"
+        results = {"styles": [], "conditions": None}
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            yield name, results[name]
+
+        styles = results["styles"]
+        batches = iter_product_batches(styles, results["conditions"], limit, batch_size, parsed)
+        total = 0
+        while True:
+            start = time.perf_counter()
+            page = next(batches, None)
+            observe_stage("product_search", time.perf_counter() - start)
+            if page is None:
+                break
+            total += len(page)
+            yield "products", page
+
+        if total and degraded:
+            response_text = DEGRADED_RESPONSE_TEXT
+        elif total:
+            response_text = f"您上傳的圖片最接近 {' + '.join(styles)} 風格，以下是符合您條件的商品："
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+        yield "done", {"text": response_text, "total": total, "degraded": degraded,
+                       "search_mode": "keyword" if parsed is not None else "llm", "image_mode": "style",
+                       "fallback": is_fallback(results["conditions"])}
+
+    except Exception as e:
+        logger.error(f"Error in user_query_stream: {e}")
+        import traceback
+        logger.error(traceback.format_exc())
+        yield "error", {"text": f"查詢時發生錯誤：{str(e)}"}
+
+
 # 初始化連線
 init_neo4j()
 
@@ -0,0 +1,474 @@
+"""
+Async Neo4j Query Engine
+query_neo4j 的 asyncio 版本：Neo4j 與 LLM 等待網路 I/O 時不佔用 OS 執行緒，
+CPU 推論交給 executor（或 micro-batching worker）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import openai
+from neo4j import AsyncGraphDatabase
+from config.settings import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    NEO4J_URI,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    NL2CYPHER_MODEL,
+    CASCADE_EMBEDDING,
+    STYLE_VOTE_K,
+    INFERENCE_BATCHING,
+    ASYNC_INFERENCE_WORKERS,
+    KEYWORD_SEARCH,
+    IMAGE_SEARCH_MODE,
+    VISUAL_SEARCH_STYLE_WEIGHT
+)
+from query.query_neo4j import (
+    build_nl2cypher_messages,
+    clean_cypher_conditions,
+    decode_query_image,
+    resolve_image_styles as resolve_image_styles_sync,
+    NEAREST_POST_QUERY,
+    EXACT_MATCH_QUERY,
+    PARTIAL_MATCH_QUERY,
+    TEXT_ONLY_QUERY,
+    SEARCH_MODES,
+    DEGRADED_RESPONSE_TEXT,
+    FALLBACK_CONDITIONS,
+    is_fallback,
+    cache_result,
+    result_cache
+)
+from query.inference_worker import embed_query_image, get_embedder
+from query.metrics import observe_stage
+from query.result_cache import normalize_query_text, image_content_hash
+from query.single_flight import AsyncSingleFlight
+from query.style_voting import vote_styles, DEFAULT_STYLES
+from query.keyword_search import (
+    KeywordQuery,
+    BRANDS_QUERY,
+    cached_brands,
+    store_brands,
+    COLOR_DATA_QUERY,
+    cached_has_colors,
+    store_has_colors,
+    with_color_data,
+    parse_keyword_query,
+    search_query_for
+)
+from query.visual_search import (
+    VISUAL_SEARCH_QUERY,
+    initial_candidates,
+    next_candidates,
+    search_params,
+    to_product
+)
+
+logger = logging.getLogger(__name__)
+
+# Async OpenAI client
+client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
+
+# Async Neo4j driver（在 event loop 中初始化）
+driver = None
+
+# CPU 推論（圖片解碼、非 batch 模式的 forward）專用的小型執行緒池
+_inference_executor = ThreadPoolExecutor(max_workers=ASYNC_INFERENCE_WORKERS, thread_name_prefix="async-inference")
+
+# 相同查詢同時進來時只計算一次
+_query_flight = AsyncSingleFlight("async_user_query")
+_translation_flight = AsyncSingleFlight("async_llm_translation")
+_image_flight = AsyncSingleFlight("async_image_to_styles")
+
+
+async def init_neo4j():
+    """初始化 async Neo4j 連線池"""
+    global driver
+    if driver is None:
+        driver = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(NEO4J_USER, NEO4J_PASSWORD),
+            max_connection_lifetime=3600,
+            max_connection_pool_size=100
+        )
+        logger.info("✅ Connected to Neo4j with async connection pool")
+
+
+async def close_neo4j():
+    """關閉 async Neo4j 連線"""
+    global driver
+    if driver is not None:
+        await driver.close()
+        driver = None
+        logger.info("🔌 Disconnected from async Neo4j")
+
+
+async def _run_in_executor(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_inference_executor, fn, *args)
+
+
+async def _timed(stage: str, awaitable):
+    start = time.perf_counter()
+    error = False
+    try:
+        return await awaitable
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, error)
+
+
+async def nl_to_cypher_conditions(nl_query: str) -> str:
+    """將自然語言轉換為 Cypher WHERE 條件（async LLM 呼叫，相同文字同時只呼叫一次）"""
+    return await _translation_flight.do(normalize_query_text(nl_query), _nl_to_cypher_conditions, nl_query)
+
+
+async def _nl_to_cypher_conditions(nl_query: str) -> str:
+    try:
+        resp = await _timed("llm_translation", client.chat.completions.create(
+            model=NL2CYPHER_MODEL,
+            messages=build_nl2cypher_messages(nl_query),
+            temperature=0.1
+        ))
+        conditions = clean_cypher_conditions(resp.choices[0].message.content)
+        logger.info(f"📝 NL to Cypher: {nl_query} -> {conditions}")
+        return conditions
+    except Exception as e:
+        logger.error(f"Error in NL to Cypher conversion: {e}")
+        return FALLBACK_CONDITIONS  # 返回總是為真的條件作為後備
+
+
+async def _embed(img):
+    """batch 模式直接等待 batcher 的 Future，不佔用 executor 執行緒"""
+    if INFERENCE_BATCHING:
+        return await asyncio.wrap_future(get_embedder().submit(img))
+    return await _run_in_executor(embed_query_image, img)
+
+
+async def image_to_styles(query_image) -> List[str]:
+    """從上傳的圖片推測風格（async 版本，相同圖片同時只推論一次）"""
+    return (await resolve_image_styles(query_image))['styles']
+
+
+async def resolve_image_styles(query_image) -> Dict:
+    """k 篇相似貼文投票的完整結果，語意同 query_neo4j.resolve_image_styles"""
+    return await _image_flight.do(image_content_hash(query_image), _resolve_image_styles, query_image)
+
+
+async def _resolve_image_styles(query_image) -> Dict:
+    if CASCADE_EMBEDDING:
+        # cascade 目前只有同步實作，整段交給 executor
+        return await _run_in_executor(resolve_image_styles_sync, query_image)
+
+    try:
+        await init_neo4j()
+        img = await _timed("decode", _run_in_executor(decode_query_image, query_image))
+        query_emb = await _embed(img)
+
+        async with driver.session() as session:
+            async def vector_query():
+                result = await session.run(NEAREST_POST_QUERY, k=STYLE_VOTE_K, embedding=query_emb.tolist())
+                return [record.data() async for record in result]
+            neighbors = await _timed("vector_query", vector_query())
+
+        resolved = vote_styles(neighbors)
+        if resolved['posts']:
+            logger.info(f"🎨 Voted styles {resolved['styles']} from {resolved['posts']} similar posts "
+                        f"(confidence: {resolved['confidence']:.2f}, top similarity: {resolved['score']:.3f})")
+        else:
+            logger.warning(f"No similar posts found, using default style {DEFAULT_STYLES}")
+        return resolved
+
+    except Exception as e:
+        logger.error(f"Error in image_to_styles: {e}")
+        return vote_styles([])  # 返回預設風格
+
+
+async def _fetch_products(session, query_template: str, styles: List[str],
+                          cypher_conditions: str, limit: int) -> List[Tuple]:
+    result = await session.run(query_template.format(conditions=cypher_conditions),
+                               styles=styles, skip=0, limit=limit)
+    return [(r['id'], r['name'], r['description'], r['category'],
+             r['brand'], r['price'], r['predicted_style'], r['image_url'])
+            async for r in result]
+
+
+async def search_products_by_style_and_conditions(
+    styles: List[str],
+    cypher_conditions: str,
+    limit: int = 10
+) -> List[Tuple]:
+    """
+    基於風格和條件搜尋商品（async 版本，語意同 query_neo4j）
+    styles 為空（降級模式）時只依文字條件搜尋
+    """
+    await init_neo4j()
+
+    async with driver.session() as session:
+        if not styles:
+            try:
+                products = await _fetch_products(session, TEXT_ONLY_QUERY, styles, cypher_conditions, limit)
+                logger.info(f"✅ Found {len(products)} products with text-only conditions")
+                return products
+            except Exception as e:
+                logger.error(f"Error in text-only query: {e}")
+                return []
+
+        try:
+            products = await _fetch_products(session, EXACT_MATCH_QUERY, styles, cypher_conditions, limit)
+            if products:
+                logger.info(f"✅ Found {len(products)} products with exact style match")
+                return products
+        except Exception as e:
+            logger.error(f"Error in exact match query: {e}")
+
+        try:
+            products = await _fetch_products(session, PARTIAL_MATCH_QUERY, styles, cypher_conditions, limit)
+            logger.info(f"✅ Found {len(products)} products with partial style match")
+            return products
+        except Exception as e:
+            logger.error(f"Error in partial match query: {e}")
+            return []
+
+
+async def parse_keyword(query_text: str) -> Optional[KeywordQuery]:
+    """關鍵字型查詢的解析結果（async 版本，語意同 query_neo4j.parse_keyword）"""
+    if not KEYWORD_SEARCH:
+        return None
+    try:
+        brands = cached_brands()
+        if brands is None:
+            await init_neo4j()
+            async with driver.session() as session:
+                result = await session.run(BRANDS_QUERY)
+                brands = store_brands([record['name'] async for record in result])
+        return parse_keyword_query(query_text, brands)
+    except Exception as e:
+        logger.error(f"Error parsing keyword query: {e}")
+        return None
+
+
+async def _with_color_data(session, parsed: Optional[KeywordQuery]) -> Optional[KeywordQuery]:
+    """語意同 keyword_search.with_color_data：還沒有任何 HAS_COLOR 時顏色詞改為全文關鍵字"""
+    if parsed is None or not parsed.colors:
+        return parsed
+    has_colors = cached_has_colors()
+    if has_colors is None:
+        result = await session.run(COLOR_DATA_QUERY)
+        has_colors = store_has_colors((await result.single())['has_colors'])
+    return with_color_data(parsed, has_colors)
+
+
+async def search_products_by_keywords(parsed: KeywordQuery, styles: List[str], limit: int = 10) -> List[Tuple]:
+    """全文索引 + 結構化條件搜尋（async 版本，語意同 query_neo4j）"""
+    await init_neo4j()
+
+    async with driver.session() as session:
+        try:
+            parsed = await _with_color_data(session, parsed)
+            result = await session.run(search_query_for(parsed), **parsed.params(styles), skip=0, limit=limit)
+            products = [to_product(record) async for record in result]
+            logger.info(f"✅ Found {len(products)} products with keyword search")
+            return products
+        except Exception as e:
+            logger.error(f"Error in keyword search: {e}")
+            return []
+
+
+async def visual_search(query_emb, cypher_conditions: str, parsed: Optional[KeywordQuery],
+                        styles: List[str], limit: int = 10) -> Tuple[List[Tuple], Dict]:
+    """過濾後的 kNN 商品搜尋（async 版本，語意同 query/visual_search.py）"""
+    await init_neo4j()
+
+    query = VISUAL_SEARCH_QUERY.format(conditions=cypher_conditions or "TRUE")
+    candidates = initial_candidates(limit)
+    rounds = 0
+    async with driver.session() as session:
+        parsed = await _with_color_data(session, parsed)
+        while True:
+            rounds += 1
+            result = await session.run(query, **search_params(query_emb, parsed, styles, limit, candidates))
+            records = [record async for record in result]
+            following = next_candidates(candidates, len(records), limit)
+            if following is None:
+                break
+            candidates = following
+
+    stats = {
+        "candidates": candidates,
+        "rounds": rounds,
+        "top_score": records[0]['visual_score'] if records else None,
+    }
+    return [to_product(record) for record in records], stats
+
+
+async def user_query(query_text: str, query_image, mode: str = None, degraded: bool = False) -> Dict:
+    """
+    用戶查詢的 async 主入口
+    LLM 翻譯與圖片推論同時進行；mode、degraded 語意同 query_neo4j.user_query
+    """
+    if degraded:
+        return await text_only_query(query_text)
+
+    mode = mode or IMAGE_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    run = _run_visual_query if mode == "visual" else _run_user_query
+
+    # 目錄版本檢查走同步 driver，交給 executor 避免卡住 event loop
+    key = await _run_in_executor(result_cache.make_key, query_text, query_image, mode)
+    cached = result_cache.get(key)
+    if cached is not None:
+        logger.info("⚡ Result cache hit")
+        return cached
+
+    flight_key = (normalize_query_text(query_text), image_content_hash(query_image), mode)
+    return await _query_flight.do(flight_key, run, query_text, query_image, key)
+
+
+async def _run_user_query(query_text: str, query_image, cache_key) -> Dict:
+    start = time.perf_counter()
+    try:
+        # 關鍵字型查詢不呼叫 LLM，只需等待圖片推論
+        parsed = await parse_keyword(query_text)
+        cypher_conditions = None
+        if parsed is not None:
+            resolved = await resolve_image_styles(query_image)
+            search = search_products_by_keywords(parsed, resolved['styles'], limit=10)
+        else:
+            cypher_conditions, resolved = await asyncio.gather(
+                nl_to_cypher_conditions(query_text),
+                resolve_image_styles(query_image)
+            )
+            search = search_products_by_style_and_conditions(resolved['styles'], cypher_conditions, limit=10)
+        styles = resolved['styles']
+
+        products = await _timed("product_search", search)
+
+        if products:
+            response_text = f"您上傳的圖片最接近 {' + '.join(styles)} 風格，以下是符合您條件的商品："
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+
+        result = {
+            "text": response_text,
+            "products": products,
+            "detected_styles": styles,
+            "style_confidence": resolved['confidence'],
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "image_mode": "style",
+            "fallback": is_fallback(cypher_conditions, resolved)
+        }
+        cache_result(cache_key, result, time.perf_counter() - start)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error in user_query: {e}")
+        return {
+            "text": f"查詢時發生錯誤：{str(e)}",
+            "products": [],
+            "detected_styles": []
+        }
+
+
+async def text_only_query(query_text: str) -> Dict:
+    """降級模式（async 版本，語意同 query_neo4j.text_only_query）：不做圖片推論，結果不進快取"""
+    try:
+        parsed = await parse_keyword(query_text)
+        cypher_conditions = None
+        if parsed is not None:
+            search = search_products_by_keywords(parsed, [], limit=10)
+        else:
+            cypher_conditions = await nl_to_cypher_conditions(query_text)
+            search = search_products_by_style_and_conditions([], cypher_conditions, limit=10)
+        products = await _timed("product_search", search)
+
+        if products:
+            response_text = DEGRADED_RESPONSE_TEXT
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+
+        return {
+            "text": response_text,
+            "products": products,
+            "detected_styles": [],
+            "degraded": True,
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "fallback": is_fallback(cypher_conditions)
+        }
+
+    except Exception as e:
+        logger.error(f"Error in text_only_query: {e}")
+        return {
+            "text": f"查詢時發生錯誤：{str(e)}",
+            "products": [],
+            "detected_styles": [],
+            "degraded": True
+        }
+
+
+async def _embed_query(query_image):
+    img = await _timed("decode", _run_in_executor(decode_query_image, query_image))
+    return await _embed(img)
+
+
+async def _conditions_for(query_text: str, parsed: Optional[KeywordQuery]) -> str:
+    return "TRUE" if parsed is not None else await nl_to_cypher_conditions(query_text)
+
+
+async def _run_visual_query(query_text: str, query_image, cache_key) -> Dict:
+    start = time.perf_counter()
+    try:
+        # LLM 翻譯（非關鍵字型查詢）與圖片推論同時進行
+        parsed = await parse_keyword(query_text)
+        cypher_conditions, query_emb = await asyncio.gather(
+            _conditions_for(query_text, parsed),
+            _embed_query(query_image)
+        )
+
+        resolved = None
+        if VISUAL_SEARCH_STYLE_WEIGHT > 0:
+            await init_neo4j()
+            async with driver.session() as session:
+                result = await session.run(NEAREST_POST_QUERY, k=STYLE_VOTE_K, embedding=query_emb.tolist())
+                neighbors = [record.data() async for record in result]
+            resolved = vote_styles(neighbors)
+        styles = resolved['styles'] if resolved else []
+
+        products, stats = await _timed("product_search",
+                                       visual_search(query_emb, cypher_conditions, parsed, styles, limit=10))
+
+        if products:
+            response_text = "以下是外觀與您上傳的圖片最相似、且符合您條件的商品："
+        else:
+            response_text = "抱歉，找不到符合條件的商品。試試放寬條件或更換圖片吧！"
+
+        result = {
+            "text": response_text,
+            "products": products,
+            "detected_styles": styles,
+            "search_mode": "keyword" if parsed is not None else "llm",
+            "image_mode": "visual",
+            "visual_score": stats['top_score'],
+            "fallback": is_fallback(cypher_conditions, resolved)
+        }
+        if resolved:
+            result["style_confidence"] = resolved['confidence']
+        cache_result(cache_key, result, time.perf_counter() - start)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error in visual query: {e}")
+        return {
+            "text": f"查詢時發生錯誤：{str(e)}",
+            "products": [],
+            "detected_styles": []
+        }
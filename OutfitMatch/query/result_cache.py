@@ -0,0 +1,259 @@
+"""
+Search Result Cache
+user_query 前的整體結果快取，key 為 (正規化查詢文字, 圖片內容 hash, 目錄版本[, 搜尋模式])
+- memory：單一 process 內的 LRU + TTL
+- sqlite：本機共用檔案，多個 worker process 共享
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import copy
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from PIL import Image
+from query.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query_text(text: str) -> str:
+    """全形轉半形、小寫、合併空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower().strip()
+    return re.sub(r"\s+", " ", text)
+
+
+def image_content_hash(query_image) -> str:
+    """圖片內容 hash：base64 字串去掉 data URL 前綴、檔案讀內容、PIL Image 用像素"""
+    digest = hashlib.sha256()
+    if isinstance(query_image, Image.Image):
+        digest.update(query_image.mode.encode())
+        digest.update(str(query_image.size).encode())
+        digest.update(query_image.tobytes())
+    elif isinstance(query_image, str) and query_image and os.path.isfile(query_image):
+        with open(query_image, "rb") as f:
+            digest.update(f.read())
+    elif isinstance(query_image, str):
+        digest.update((query_image.split(",", 1)[1] if query_image.startswith("data:") else query_image).encode())
+    else:
+        digest.update(repr(query_image).encode())
+    return digest.hexdigest()
+
+
+class MemoryBackend:
+    """LRU + TTL，容量以筆數限制"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, compute_seconds, version)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry[1]), entry[2]
+
+    def set(self, key: str, value: Dict, ttl: float, compute_seconds: float, version: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, copy.deepcopy(value), compute_seconds, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, keep_version: int = None):
+        with self._lock:
+            if keep_version is None:
+                self._entries.clear()
+                return
+            for key in [k for k, entry in self._entries.items() if entry[3] != keep_version]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """本機 sqlite 檔案，多個 worker process 共用；以 last_access 做 LRU 淘汰"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                compute_seconds REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at, compute_seconds FROM results WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        return json.loads(row[0]), row[2]
+
+    def set(self, key: str, value: Dict, ttl: float, compute_seconds: float, version: int):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False, default=str), version,
+                      now + ttl, now, compute_seconds))
+        conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+        conn.commit()
+
+    def clear(self, keep_version: int = None):
+        conn = self._conn()
+        if keep_version is None:
+            conn.execute("DELETE FROM results")
+        else:
+            conn.execute("DELETE FROM results WHERE version <> ?", (keep_version,))
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    """
+    用法：
+        key = cache.make_key(query_text, query_image)
+        hit = cache.get(key)
+        if hit is None:
+            result = compute()
+            cache.set(key, result, compute_seconds)
+    """
+
+    def __init__(self, backend, version_fn: Callable[[], int], ttl: float,
+                 version_check_seconds: float = 5.0, enabled: bool = True):
+        self.backend = backend
+        self.version_fn = version_fn
+        self.ttl = ttl
+        self.version_check_seconds = version_check_seconds
+        self.enabled = enabled
+        self._version = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def catalog_version(self) -> int:
+        """每 version_check_seconds 秒最多查一次 Neo4j；版本改變時清掉舊版本的結果"""
+        now = time.time()
+        with self._lock:
+            if self._version is not None and now - self._version_checked_at < self.version_check_seconds:
+                return self._version
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            logger.error(f"Error reading catalog version: {e}")
+            version = self._version if self._version is not None else 0
+        with self._lock:
+            changed = self._version is not None and version != self._version
+            self._version, self._version_checked_at = version, now
+        if changed:
+            logger.info(f"🧹 Catalog version changed to {version}, invalidating result cache")
+            self.backend.clear(keep_version=version)
+        return version
+
+    def make_key(self, query_text: str, query_image, mode: str = "style") -> Optional[str]:
+        if not self.enabled:
+            return None
+        parts = [normalize_query_text(query_text), image_content_hash(query_image), self.catalog_version()]
+        # 預設模式維持原本的 key，其他搜尋模式的結果分開快取
+        if mode != "style":
+            parts.append(mode)
+        raw = json.dumps(parts)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict]:
+        if key is None:
+            return None
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += entry[1]
+        registry.inc("outfitmatch_result_cache_requests_total", 1,
+                     {"result": "miss" if entry is None else "hit"},
+                     help_text="Result cache lookups by outcome")
+        if entry is None:
+            return None
+        registry.inc("outfitmatch_result_cache_saved_seconds_total", entry[1],
+                     help_text="Pipeline latency avoided by result cache hits")
+        return entry[0]
+
+    def set(self, key: Optional[str], result: Dict, compute_seconds: float):
+        if key is None:
+            return
+        try:
+            self.backend.set(key, result, self.ttl, compute_seconds, self._version or 0)
+        except Exception as e:
+            logger.error(f"Error writing result cache: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": type(self.backend).__name__,
+                "entries": len(self.backend),
+                "catalog_version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+def create_result_cache(version_fn: Callable[[], int], enabled: bool, ttl: float, backend: str,
+                        path: str, max_entries: int, version_check_seconds: float) -> ResultCache:
+    if backend == "sqlite":
+        store = SqliteBackend(path, max_entries)
+    else:
+        store = MemoryBackend(max_entries)
+    return ResultCache(store, version_fn, ttl, version_check_seconds, enabled)
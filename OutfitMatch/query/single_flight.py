@@ -0,0 +1,123 @@
+"""
+Single-flight Coalescing
+相同 key 的請求同時進來時只執行一次計算，其餘請求等待並共用結果
+（例如促銷期間大量用戶上傳同一張網紅照片）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import copy
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List
+from query.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 所有 SingleFlight 實例，供 single_flight_stats() 彙整
+_flights: List = []
+
+
+class SingleFlight:
+    """
+    用法：
+        flight = SingleFlight("user_query")
+        result = flight.do(key, compute, *args)
+    第一個進來的請求（leader）執行 compute，同時間相同 key 的請求（follower）等待 leader 的結果；
+    結果以 deepcopy 交給每個 follower，呼叫端修改回傳值不會互相影響
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        _flights.append(self)
+
+    def do(self, key: Hashable, fn: Callable, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        self._record(leader)
+
+        if not leader:
+            logger.info(f"🔗 Coalesced concurrent {self.name} call")
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(copy.deepcopy(result))
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _record(self, leader: bool):
+        registry.inc("outfitmatch_singleflight_calls_total", 1,
+                     {"stage": self.name, "role": "leader" if leader else "coalesced"},
+                     help_text="Single-flight calls by stage; coalesced calls reused an in-flight computation")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_ratio": self.coalesced / total if total else 0.0,
+            }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """asyncio 版本：follower 以 await 等待 leader，不佔用執行緒（只能在同一個 event loop 使用）"""
+
+    async def do(self, key: Hashable, fn: Callable, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = asyncio.get_running_loop().create_future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        self._record(leader)
+
+        if not leader:
+            logger.info(f"🔗 Coalesced concurrent {self.name} call")
+            return copy.deepcopy(await asyncio.shield(future))
+
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 沒有 follower 時避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(copy.deepcopy(result))
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def single_flight_stats() -> Dict:
+    return {flight.name: flight.stats() for flight in _flights}
@@ -0,0 +1,75 @@
+"""
+Style Voting
+以最相似的 k 篇貼文投票決定查詢圖片的風格，取代只看 top-1 貼文：
+- 每篇貼文的權重為 exp((score - top_score) / temperature)，越接近最相似的貼文權重越高
+- 貼文的權重依 HAS_STYLE.confidence 分配給它的風格（沒有 confidence 時平均分配）
+- 票數最高的風格必選，其餘風格票數佔比 >= min_share 時加入（最多 max_styles 個）
+- confidence 為選出的風格佔總票數的比例（k 篇貼文都同意時為 1）
+回傳的風格依名稱排序，相近的圖片得到相同的風格 list，下游以風格為參數的查詢與快取可以共用
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import math
+from collections import defaultdict
+from typing import Dict, List
+from config.settings import (
+    STYLE_VOTE_MAX_STYLES,
+    STYLE_VOTE_MIN_SHARE,
+    STYLE_VOTE_TEMPERATURE
+)
+
+DEFAULT_STYLES = ['休閒']
+
+
+def _style_entries(styles) -> List[Dict]:
+    """貼文的風格可以是名稱 list 或 [{'name', 'confidence'}]"""
+    entries = []
+    for style in styles or []:
+        if isinstance(style, dict):
+            if style.get('name'):
+                entries.append({'name': style['name'], 'confidence': style.get('confidence')})
+        elif style:
+            entries.append({'name': style, 'confidence': None})
+    return entries
+
+
+def vote_styles(neighbors: List[Dict], max_styles: int = STYLE_VOTE_MAX_STYLES,
+                min_share: float = STYLE_VOTE_MIN_SHARE, temperature: float = STYLE_VOTE_TEMPERATURE) -> Dict:
+    """
+    neighbors: [{'post_id', 'score', 'styles'}]，依相似度由高到低
+    回傳 {'styles', 'confidence', 'votes', 'posts', 'post_id', 'score'}；沒有可用的貼文時為預設風格、confidence 0
+    """
+    neighbors = [n for n in neighbors if _style_entries(n.get('styles'))]
+    if not neighbors:
+        return {'styles': list(DEFAULT_STYLES), 'confidence': 0.0, 'votes': {}, 'posts': 0,
+                'post_id': None, 'score': None}
+
+    top_score = max(n['score'] for n in neighbors)
+    votes = defaultdict(float)
+    for neighbor in neighbors:
+        weight = math.exp((neighbor['score'] - top_score) / temperature) if temperature > 0 else \
+            float(neighbor['score'] == top_score)
+        entries = _style_entries(neighbor['styles'])
+        confidences = [max(float(e['confidence']), 0.0) if e['confidence'] is not None else 1.0 for e in entries]
+        if sum(confidences) <= 0:
+            confidences = [1.0] * len(entries)
+        total = sum(confidences)
+        for entry, confidence in zip(entries, confidences):
+            votes[entry['name']] += weight * confidence / total
+
+    total_votes = sum(votes.values())
+    shares = {name: vote / total_votes for name, vote in votes.items()}
+    ranked = sorted(shares, key=lambda name: (-shares[name], name))
+    selected = ranked[:1] + [name for name in ranked[1:max_styles] if shares[name] >= min_share]
+
+    top = max(neighbors, key=lambda n: n['score'])
+    return {
+        'styles': sorted(selected),
+        'confidence': round(sum(shares[name] for name in selected), 3),
+        'votes': {name: round(shares[name], 3) for name in ranked},
+        'posts': len(neighbors),
+        'post_id': top.get('post_id'),
+        'score': top['score'],
+    }
@@ -0,0 +1,119 @@
+"""
+Visual Search
+以查詢圖片的 embedding 直接查 product_image_index，取代 圖片 → 最相似貼文 → 風格 → 商品 的間接路徑：
+- 類別 / 價格 / 品牌 / 顏色條件（關鍵字解析或 LLM 翻譯的 Cypher 條件）在向量查詢後的同一個 Cypher 中過濾
+- 過濾會減少結果，向量索引先召回 limit × VISUAL_SEARCH_OVERSAMPLE 個候選；過濾後仍不足 limit 時
+  候選數加倍重查，直到 VISUAL_SEARCH_MAX_CANDIDATES
+- VISUAL_SEARCH_STYLE_WEIGHT > 0 時，排序為視覺相似度與風格重疊比例的加權和（預設只看視覺相似度）
+沒有 img_embedding 的商品（尚未執行 loader/backfill_product_embeddings.py）不會出現在結果中
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+from typing import Dict, List, Optional, Tuple
+from config.settings import (
+    VISUAL_SEARCH_OVERSAMPLE,
+    VISUAL_SEARCH_MAX_CANDIDATES,
+    VISUAL_SEARCH_STYLE_WEIGHT
+)
+from query.keyword_search import KeywordQuery, has_color_data, with_color_data
+
+logger = logging.getLogger(__name__)
+
+# {conditions} 為 LLM 翻譯的條件（關鍵字解析時為 TRUE，改用參數過濾）；條件可能引用 s.name，
+# 先以每個風格一列過濾，再重新收集商品的完整風格
+VISUAL_SEARCH_QUERY = """
+CALL db.index.vector.queryNodes('product_image_index', $candidates, $embedding)
+YIELD node as p, score as visual_score
+MATCH (p)-[:OF_BRAND]->(b:Brand)
+MATCH (p)-[:IN_CATEGORY]->(c:Category)
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(s:Style)
+WITH p, b, c, s, visual_score
+WHERE ({conditions})
+  AND ($min_price IS NULL OR p.price >= $min_price)
+  AND ($max_price IS NULL OR p.price <= $max_price)
+  AND ($category IS NULL OR c.name = $category)
+  AND ($brand IS NULL OR toLower(b.name) = toLower($brand))
+  AND all(color IN $colors WHERE EXISTS {{ (p)-[:HAS_COLOR]->(:Color {{name: color}}) }})
+WITH DISTINCT p, b, c, visual_score
+OPTIONAL MATCH (p)-[:HAS_STYLE]->(style:Style)
+WITH p, b, c, visual_score, collect(DISTINCT style.name) as product_styles
+WITH p, b, c, visual_score, product_styles,
+     CASE WHEN size($styles) = 0 THEN 0.0
+          ELSE toFloat(size([x IN product_styles WHERE x IN $styles])) / size($styles) END as style_overlap
+WITH p, b, c, visual_score, product_styles,
+     (1 - $style_weight) * visual_score + $style_weight * style_overlap as rank_score
+RETURN p.id as id, p.name as name, p.description as description,
+       c.name as category, b.name as brand, p.price as price,
+       product_styles as predicted_style, p.image_url as image_url, visual_score, rank_score
+ORDER BY rank_score DESC, visual_score DESC
+LIMIT $limit
+"""
+
+
+def initial_candidates(limit: int, oversample: int = VISUAL_SEARCH_OVERSAMPLE,
+                       max_candidates: int = VISUAL_SEARCH_MAX_CANDIDATES) -> int:
+    return min(max(limit * oversample, limit), max_candidates)
+
+
+def next_candidates(candidates: int, found: int, limit: int,
+                    max_candidates: int = VISUAL_SEARCH_MAX_CANDIDATES) -> Optional[int]:
+    """過濾後不足 limit 時加倍召回數；已足夠或已達上限時回傳 None"""
+    if found >= limit or candidates >= max_candidates:
+        return None
+    return min(candidates * 2, max_candidates)
+
+
+def search_params(query_emb, parsed: Optional[KeywordQuery], styles: List[str], limit: int,
+                  candidates: int, style_weight: float = VISUAL_SEARCH_STYLE_WEIGHT) -> Dict:
+    """parsed 為 None（LLM 條件）時參數過濾全部為 NULL"""
+    return {
+        "embedding": query_emb.tolist(),
+        "candidates": candidates,
+        "limit": limit,
+        "min_price": parsed.min_price if parsed else None,
+        "max_price": parsed.max_price if parsed else None,
+        "category": parsed.category if parsed else None,
+        "brand": parsed.brand if parsed else None,
+        "colors": parsed.colors if parsed else [],
+        "styles": sorted(set(styles or []) | set(parsed.styles if parsed else [])),
+        "style_weight": style_weight if style_weight > 0 else 0.0,
+    }
+
+
+def to_product(record) -> Tuple:
+    """與 fetch_products 相同格式的商品 tuple"""
+    return (record['id'], record['name'], record['description'], record['category'],
+            record['brand'], record['price'], record['predicted_style'], record['image_url'])
+
+
+def visual_search(session, query_emb, cypher_conditions: str = "TRUE", parsed: Optional[KeywordQuery] = None,
+                  styles: List[str] = None, limit: int = 10,
+                  style_weight: float = VISUAL_SEARCH_STYLE_WEIGHT) -> Tuple[List[Tuple], Dict]:
+    """
+    過濾後的 kNN 商品搜尋，回傳 (products, stats)
+    stats: {'candidates': 最後一次召回數, 'rounds': 查詢次數, 'top_score': 最高視覺相似度}
+    """
+    if parsed is not None and parsed.colors:
+        parsed = with_color_data(parsed, has_color_data(session))
+    query = VISUAL_SEARCH_QUERY.format(conditions=cypher_conditions or "TRUE")
+    candidates = initial_candidates(limit)
+    rounds = 0
+    while True:
+        rounds += 1
+        records = session.run(query, **search_params(query_emb, parsed, styles, limit, candidates, style_weight)).data()
+        following = next_candidates(candidates, len(records), limit)
+        if following is None:
+            break
+        logger.info(f"🔁 Only {len(records)}/{limit} products left after filtering {candidates} candidates, "
+                    f"retrying with {following}")
+        candidates = following
+
+    stats = {
+        "candidates": candidates,
+        "rounds": rounds,
+        "top_score": records[0]['visual_score'] if records else None,
+    }
+    return [to_product(record) for record in records], stats
@@ -1,12 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, send_from_directory, abort, stream_with_context
 from flask_cors import CORS
-from query.query_neo4j import user_query, close_neo4j
+from query.query_neo4j import user_query, user_query_stream, serialize_product, close_neo4j, result_cache, SEARCH_MODES
+from query.inference_worker import inference_stats
+from query.single_flight import single_flight_stats
+from query.admission import search_admission, Overloaded
+from query.product_matches import match_table, get_product_matches
+from query.outfit_bundles import bundle_table, get_product_outfits, get_style_outfits
+from query.metrics import stage_timer, registry, render_prometheus
+from query.profiling import should_profile, profile_request, list_profiles
 import traceback
 import logging
 import sys
 import datetime
 import socket
-from config.settings import SERVER_PORT
+import json
+import random
+import hmac
+import time
+import os
+from config.settings import (
+    SERVER_PORT,
+    LOG_LEVEL,
+    REQUEST_LOG_SAMPLE_RATE,
+    REQUEST_LOG_HEADERS,
+    PROFILE_DIR,
+    ADMIN_TOKEN
+)
 
 # Force immediate output flush
 sys.stdout.reconfigure(line_buffering=True)
@@ -36,11 +55,12 @@ print(f"Found available port: {PORT}")
 
 # Configure logging to output immediately
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
-    ]
+    ],
+    force=True  # query modules call basicConfig on import
 )
 logger = logging.getLogger(__name__)
 
@@ -51,99 +71,125 @@ CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "X-Profile", "X-Admin-Token"],
+        "expose_headers": ["Retry-After"]
     }
 })
 
-# Log all requests, before any processing
+# Sample request logs instead of printing every request
 @app.before_request
 def log_request_info():
-    print("-------------------")
-    print("New request received")
-    print(f"Path: {request.path}")
-    print(f"Method: {request.method}")
-    print(f"Headers: {dict(request.headers)}")
-    print("-------------------")
+    g.request_start = time.perf_counter()
+    g.log_request = random.random() < REQUEST_LOG_SAMPLE_RATE
+    if g.log_request:
+        logger.info(f"➡️  {request.method} {request.path} ({request.content_length or 0} bytes)")
+        if REQUEST_LOG_HEADERS:
+            logger.info(f"Headers: {dict(request.headers)}")
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        labels = {"endpoint": request.endpoint or "unknown", "status": response.status_code}
+        registry.observe("outfitmatch_request_latency_seconds", elapsed, labels,
+                         help_text="End-to-end HTTP request latency")
+        registry.inc("outfitmatch_requests_total", 1, labels,
+                     help_text="HTTP requests served")
+        if g.get('log_request'):
+            logger.info(f"⬅️  {request.method} {request.path} {response.status_code} in {elapsed * 1000:.1f}ms")
+    return response
 
 # Increase maximum content length to 16MB
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
 print("Flask app configured...")
 
+# 背景載入 GOES_WITH top-k 表（載入完成前 /api/products/<id>/matches 走即時查詢）
+match_table.start()
+# 背景載入預先組合的完整穿搭（載入完成前直接以 key 查 Neo4j）
+bundle_table.start()
+
+def parse_search_request():
+    """驗證搜尋請求，回傳 (query_text, image_base64, error_response)"""
+    data = request.json
+    
+    if not data:
+        logger.error("No JSON data received")
+        return None, None, (jsonify({
+            'error': 'No JSON data received'
+        }), 400)
+    
+    if 'query_text' not in data:
+        logger.error("Missing query_text field")
+        return None, None, (jsonify({
+            'error': 'Missing required field: query_text'
+        }), 400)
+        
+    if 'image_base64' not in data:
+        logger.error("Missing image_base64 field")
+        return None, None, (jsonify({
+            'error': 'Missing required field: image_base64'
+        }), 400)
+
+    query_text = data['query_text']
+    image_base64 = data['image_base64']
+    
+    logger.debug(f"Query text: {query_text} (image base64 length: {len(image_base64 or '')})")
+    
+    if not query_text.strip():
+        logger.error("Empty query_text")
+        return None, None, (jsonify({
+            'error': 'query_text cannot be empty'
+        }), 400)
+
+    return query_text, image_base64, None
+
+def overloaded_response(e):
+    """超出容量時快速回 503，讓 client 依 Retry-After 重試"""
+    response = jsonify({
+        'error': 'Server overloaded',
+        'message': str(e),
+        'retry_after': e.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/api/search', methods=['POST'])
 def search():
-    logger.debug("Received request to /api/search")
-    logger.debug(f"Request headers: {dict(request.headers)}")
-    logger.debug(f"Request method: {request.method}")
-    
     try:
-        # Log raw request data
-        logger.debug(f"Request content type: {request.content_type}")
-        logger.debug(f"Request content length: {request.content_length}")
-        
-        data = request.json
-        logger.debug("Successfully parsed JSON data")
-        
-        if not data:
-            logger.error("No JSON data received")
-            return jsonify({
-                'error': 'No JSON data received'
-            }), 400
-            
-        logger.debug(f"Received data keys: {data.keys()}")
-        
-        if 'query_text' not in data:
-            logger.error("Missing query_text field")
-            return jsonify({
-                'error': 'Missing required field: query_text'
-            }), 400
-            
-        if 'image_base64' not in data:
-            logger.error("Missing image_base64 field")
-            return jsonify({
-                'error': 'Missing required field: image_base64'
-            }), 400
+        query_text, image_base64, error_response = parse_search_request()
+        if error_response:
+            return error_response
 
-        query_text = data['query_text']
-        image_base64 = data['image_base64']
-        
-        logger.debug(f"Query text: {query_text}")
-        if image_base64:
-            logger.debug(f"Image base64 starts with: {image_base64[:100]}...")
-            logger.debug(f"Image base64 length: {len(image_base64)}")
-        
-        if not query_text.strip():
-            logger.error("Empty query_text")
+        # 可選的搜尋模式：style（相似貼文的風格）或 visual（商品圖片相似度）
+        mode = request.json.get('mode')
+        if mode is not None and mode not in SEARCH_MODES:
             return jsonify({
-                'error': 'query_text cannot be empty'
+                'error': f"mode must be one of: {', '.join(SEARCH_MODES)}"
             }), 400
 
-        # Call the query function
-        logger.debug("Calling user_query function")
-        result = user_query(query_text, image_base64)
-        logger.debug("user_query function returned successfully")
+        try:
+            ticket = search_admission.admit()
+        except Overloaded as e:
+            return overloaded_response(e)
+
+        with ticket:
+            # Call the query function (profiled when requested or sampled)
+            if should_profile(request.headers.get('X-Profile'), is_admin()):
+                with profile_request("user_query") as profile_info:
+                    result = user_query(query_text, image_base64, degraded=ticket.degraded, mode=mode)
+                result['profile'] = os.path.basename(profile_info['path']) if profile_info['path'] else None
+            else:
+                result = user_query(query_text, image_base64, degraded=ticket.degraded, mode=mode)
 
         # Convert products to list of dicts for JSON serialization
-        if result.get('products'):
-            products_list = []
-            for product in result['products']:
-                products_list.append({
-                    'id': product[0],
-                    'name': product[1],
-                    'description': product[2],
-                    'category': product[3],
-                    'brand': product[4],
-                    'price': str(product[5]) if product[5] is not None else "N/A",
-                    'predicted_style': product[6] if len(product) > 6 else [],
-                    'imageUrl': product[7] if len(product) > 7 and product[7] else None,
-                    'shop': product[4],
-                    'link': None
-                })
-            result['products'] = products_list
-            logger.debug(f"Processed {len(products_list)} products")
-
-        logger.debug("Sending response back to client")
-        return jsonify(result)
+        with stage_timer("serialization"):
+            if result.get('products'):
+                result['products'] = [serialize_product(product) for product in result['products']]
+                logger.debug(f"Processed {len(result['products'])} products")
+            return jsonify(result)
 
     except Exception as e:
         logger.error(f"Error in search endpoint: {str(e)}")
@@ -152,9 +198,120 @@ def search():
             'error': 'Internal server error',
             'message': str(e)
         }), 500
-    finally:
-        logger.debug("Request completed")
-        # Note: Don't close Neo4j connection here - using connection pool
+
+def sse_event(event, payload):
+    """Server-Sent Events 格式"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/search/stream', methods=['POST'])
+def search_stream():
+    """
+    串流版搜尋：styles / conditions → products（分批）→ done
+    """
+    try:
+        query_text, image_base64, error_response = parse_search_request()
+    except Exception as e:
+        logger.error(f"Error in search stream endpoint: {str(e)}")
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+    if error_response:
+        return error_response
+
+    # 與 /api/search 相同的搜尋模式
+    mode = request.json.get('mode')
+    if mode is not None and mode not in SEARCH_MODES:
+        return jsonify({
+            'error': f"mode must be one of: {', '.join(SEARCH_MODES)}"
+        }), 400
+
+    # 在開始串流前決定是否接受，過載時仍能回 503
+    try:
+        ticket = search_admission.admit()
+    except Overloaded as e:
+        return overloaded_response(e)
+
+    def generate():
+        try:
+            for event, payload in user_query_stream(query_text, image_base64, degraded=ticket.degraded, mode=mode):
+                if event == 'products':
+                    with stage_timer("serialization"):
+                        payload = [serialize_product(product) for product in payload]
+                yield sse_event(event, payload)
+        finally:
+            ticket.release()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 避免反向代理緩衝整個回應
+    })
+    # generator 沒被執行（client 提早斷線）時 finally 不會跑，關閉回應時也釋放名額
+    response.call_on_close(ticket.release)
+    return response
+
+@app.route('/api/products/<product_id>/matches', methods=['GET'])
+def product_matches(product_id):
+    """搭配推薦：預先計算的 GOES_WITH top-k，沒有關係的商品才即時查詢"""
+    try:
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+        with stage_timer("product_matches"):
+            result = get_product_matches(product_id, limit)
+        return jsonify({
+            'product_id': product_id,
+            'source': result['source'],
+            'products': [{**serialize_product(product), 'score': score} for product, score in result['products']]
+        })
+    except Exception as e:
+        logger.error(f"Error in product matches endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/products/matches/stats', methods=['GET'])
+def product_matches_stats():
+    return jsonify(match_table.stats())
+
+def serialize_bundles(bundles):
+    return [{**bundle, 'items': [serialize_product(product) for product in bundle['items']]} for bundle in bundles]
+
+@app.route('/api/products/<product_id>/outfits', methods=['GET'])
+def product_outfits(product_id):
+    """完整穿搭：build_outfit_bundles.py 預先組合、以商品為 key 的 top-N"""
+    try:
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+        with stage_timer("product_outfits"):
+            bundles = get_product_outfits(product_id, limit)
+        return jsonify({'product_id': product_id, 'outfits': serialize_bundles(bundles)})
+    except Exception as e:
+        logger.error(f"Error in product outfits endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/styles/<style>/outfits', methods=['GET'])
+def style_outfits(style):
+    """某個風格分數最高的完整穿搭"""
+    try:
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+        with stage_timer("style_outfits"):
+            bundles = get_style_outfits(style, limit)
+        return jsonify({'style': style, 'outfits': serialize_bundles(bundles)})
+    except Exception as e:
+        logger.error(f"Error in style outfits endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({
+            'error': 'Internal server error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/outfits/stats', methods=['GET'])
+def outfit_bundle_stats():
+    return jsonify(bundle_table.stats())
 
 @app.route('/api/test', methods=['POST'])
 def test():
@@ -174,12 +331,47 @@ def test():
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    print("Health check endpoint called")
+    logger.debug("Health check endpoint called")
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.datetime.now().isoformat()
     })
 
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats_endpoint():
+    return jsonify(inference_stats())
+
+@app.route('/api/admission/stats', methods=['GET'])
+def admission_stats():
+    return jsonify(search_admission.stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({**result_cache.stats(), 'single_flight': single_flight_stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def is_admin() -> bool:
+    """未設定 ADMIN_TOKEN 時 admin 功能（endpoint 與 X-Profile）一律停用"""
+    token = request.headers.get('X-Admin-Token') or ''
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def require_admin():
+    if not is_admin():
+        abort(403)
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def admin_list_profiles():
+    require_admin()
+    return jsonify({'profiles': list_profiles()})
+
+@app.route('/api/admin/profiles/<path:name>', methods=['GET'])
+def admin_get_profile(name):
+    require_admin()
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
 if __name__ == '__main__':
     print("=== Starting Flask development server ===")
     print(f"Debug mode: ON")
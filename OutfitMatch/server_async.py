@@ -0,0 +1,141 @@
+"""
+Async API Server
+以 aiohttp 提供與 server.py 相同的 /api/search，
+請求在等待 Neo4j / LLM 時不佔用執行緒，少量執行緒即可同時處理大量慢請求
+以 async_search_admission（asyncio 版本，上限另外設定）限制同時執行數：超出容量時回 503，排隊過久時改為純文字搜尋
+
+用法：
+    python server_async.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import datetime
+import logging
+import threading
+import traceback
+from aiohttp import web
+from query.query_neo4j_async import user_query, init_neo4j, close_neo4j
+from query.query_neo4j import serialize_product, result_cache, SEARCH_MODES
+from query.admission import async_search_admission, Overloaded
+from query.metrics import stage_timer, render_prometheus
+from query.single_flight import single_flight_stats
+from config.settings import SERVER_HOST, SERVER_PORT, LOG_LEVEL
+
+logging.basicConfig(
+    level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    force=True  # query modules call basicConfig on import
+)
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    if request.method == 'OPTIONS':
+        return web.Response(headers=CORS_HEADERS)
+    response = await handler(request)
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+def overloaded_response(e):
+    """超出容量時快速回 503，讓 client 依 Retry-After 重試"""
+    return web.json_response({
+        'error': 'Server overloaded',
+        'message': str(e),
+        'retry_after': e.retry_after
+    }, status=503, headers={'Retry-After': str(e.retry_after)})
+
+
+async def search(request):
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+
+        if not data:
+            return web.json_response({'error': 'No JSON data received'}, status=400)
+        if 'query_text' not in data:
+            return web.json_response({'error': 'Missing required field: query_text'}, status=400)
+        if 'image_base64' not in data:
+            return web.json_response({'error': 'Missing required field: image_base64'}, status=400)
+        if not data['query_text'].strip():
+            return web.json_response({'error': 'query_text cannot be empty'}, status=400)
+        if data.get('mode') is not None and data['mode'] not in SEARCH_MODES:
+            return web.json_response({'error': f"mode must be one of: {', '.join(SEARCH_MODES)}"}, status=400)
+
+        try:
+            ticket = await async_search_admission.admit()
+        except Overloaded as e:
+            return overloaded_response(e)
+
+        with ticket:
+            result = await user_query(data['query_text'], data['image_base64'], mode=data.get('mode'),
+                                      degraded=ticket.degraded)
+
+        with stage_timer("serialization"):
+            if result.get('products'):
+                result['products'] = [serialize_product(product) for product in result['products']]
+            return web.json_response(result)
+
+    except Exception as e:
+        logger.error(f"Error in search endpoint: {str(e)}")
+        logger.error(traceback.format_exc())
+        return web.json_response({
+            'error': 'Internal server error',
+            'message': str(e)
+        }, status=500)
+
+
+async def health_check(request):
+    return web.json_response({
+        'status': 'healthy',
+        'timestamp': datetime.datetime.now().isoformat(),
+        'threads': threading.active_count()
+    })
+
+
+async def cache_stats(request):
+    return web.json_response({**result_cache.stats(), 'single_flight': single_flight_stats()})
+
+
+async def admission_stats(request):
+    return web.json_response(async_search_admission.stats())
+
+
+async def metrics(request):
+    return web.Response(text=render_prometheus(), content_type='text/plain')
+
+
+async def on_startup(app):
+    await init_neo4j()
+
+
+async def on_cleanup(app):
+    await close_neo4j()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware], client_max_size=16 * 1024 * 1024)
+    app.router.add_post('/api/search', search)
+    app.router.add_get('/api/health', health_check)
+    app.router.add_get('/api/cache/stats', cache_stats)
+    app.router.add_get('/api/metrics', metrics)
+    app.router.add_get('/api/admission/stats', admission_stats)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    logger.info(f"=== Starting async server on {SERVER_HOST}:{SERVER_PORT} ===")
+    web.run_app(create_app(), host=SERVER_HOST, port=SERVER_PORT)
@@ -0,0 +1,72 @@
+"""
+增量維護與完整重建的比對（不需要資料庫）
+在合成圖上分別修改、新增、刪除商品與貼文，以 simulate_incremental 套用增量規則，
+結果需與新圖的完整建立完全相同；涵蓋 Cypher 全組合、--partitioned 與 --sparse --top_k 三種模式
+
+用法：
+    python -m pytest test/test_incremental_relationships.py -q
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from database.sparse_engine import synthetic_graph
+from database.incremental_relationships import drop_nodes, synthetic_changes, simulate_incremental
+
+N_PRODUCTS = 1000
+
+# (GOES_WITH top-k, 每篇貼文 INSPIRED_BY top-k)，與 run_incremental_check 相同
+MODES = {
+    "all_pairs": (None, None),
+    "partitioned": (20, None),
+    "sparse_top_k": (5, 5),
+}
+
+# (修改, 新增, 刪除) 的商品數；貼文為其 1/10
+CHANGES = {
+    "update": (40, 0, 0),
+    "insert": (0, 40, 0),
+    "delete": (0, 0, 40),
+    "mixed": (20, 20, 20),
+}
+
+
+@pytest.fixture(scope="module")
+def graph():
+    graph = synthetic_graph(N_PRODUCTS, seed=3)
+    # 類別 0 / 1 命名為上衣 / 下身，讓上下身搭配也納入比對
+    graph.catalog.category_names[:2] = ['上衣', '下身']
+    return graph
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("change", CHANGES)
+def test_incremental_matches_full_rebuild(graph, mode, change):
+    n_changed, n_new, n_deleted = CHANGES[change]
+    new_graph, product_ids, post_ids = synthetic_changes(graph, n_changed, n_new, n_deleted, seed=4)
+    assert product_ids and post_ids
+
+    report = simulate_incremental(graph, new_graph, product_ids, post_ids, *MODES[mode])
+
+    for name, diff in report.items():
+        assert (diff['missing'], diff['extra'], diff['mismatched']) == (0, 0, 0), (name, diff)
+    assert report['GOES_WITH']['expected'] and report['top_bottom']['expected']
+    assert report['INSPIRED_BY']['expected'] and report['CO_OCCURS']['expected']
+
+
+def test_synthetic_changes_deletes_nodes(graph):
+    new_graph, product_ids, post_ids = synthetic_changes(graph, 0, 0, 40, seed=4)
+    assert len(new_graph.catalog) == N_PRODUCTS - 40
+    assert len(new_graph.post_ids) == len(graph.post_ids) - 4
+    remaining = set(new_graph.catalog.ids) | set(new_graph.post_ids)
+    assert not remaining & (set(product_ids) | set(post_ids))
+
+
+def test_drop_nodes_keeps_other_rows(graph):
+    dropped = drop_nodes(graph, graph.catalog.ids[:3], graph.post_ids[:1])
+    assert dropped.catalog.ids == graph.catalog.ids[3:]
+    assert dropped.post_ids == graph.post_ids[1:]
+    assert (dropped.catalog.styles == graph.catalog.styles[3:]).all()
+    assert (dropped.post_styles == graph.post_styles[1:]).all()
+    assert (dropped.catalog.prices == graph.catalog.prices[3:]).all()
@@ -8,7 +8,7 @@ import { ImagePlus, Send, ArrowLeft, X, ExternalLink } from "lucide-react";
 import { useNavigate } from "react-router-dom";
 import { CHAT_MODE, MOCK_DELAYS, DEMO_MODE } from "@/config/chat";
 import { createMockBotMessage } from "@/mocks/chatResponses";
-import { sendChatMessage } from "@/services/chatService";
+import { streamSearch } from "@/services/chatService";
 import { toast } from "@/components/ui/use-toast";
 
 export default function ChatPage() {
@@ -97,36 +97,51 @@ export default function ChatPage() {
         };
         console.log("Sending request with payload length:", JSON.stringify(payload).length);
 
-        const response = await fetch('http://localhost:8000/api/search', {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify(payload)
-        });
-
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.error || 'Server error');
-        }
-
-        const data = await response.json();
-        
-        if (data.error) {
-          throw new Error(data.error);
-        }
-
-        botMessage = {
-          id: uuidv4(),
+        // 先顯示空的回覆，串流事件到達時逐步更新
+        const botMessageId = uuidv4();
+        setMessages(prev => [...prev, {
+          id: botMessageId,
           role: "assistant",
-          content: data.text,
+          content: "分析中...",
           timestamp: new Date(),
-          products: data.products?.map((p: any) => ({
-            ...p,
-            shop: p.brand,  // Map brand to shop for frontend display
-            link: null  // Add any product link if available
-          }))
+          products: []
+        }]);
+        scrollToBottom();
+
+        const updateBotMessage = (update: (message: Message) => Message) => {
+          setMessages(prev => prev.map(m => (m.id === botMessageId ? update(m) : m)));
         };
+
+        try {
+          await streamSearch(payload, {
+            onStyles: (styles) => updateBotMessage(m => ({
+              ...m,
+              content: `偵測到的風格：${styles.join(' + ')}，正在搜尋商品...`
+            })),
+            onProducts: (products) => updateBotMessage(m => ({
+              ...m,
+              products: [
+                ...(m.products || []),
+                ...products.map((p: any) => ({
+                  ...p,
+                  shop: p.brand,  // Map brand to shop for frontend display
+                  link: null  // Add any product link if available
+                }))
+              ]
+            })),
+            onDone: (text) => updateBotMessage(m => ({ ...m, content: text }))
+          });
+        } catch (error) {
+          // 以錯誤訊息取代「分析中...」，已收到的商品保留
+          updateBotMessage(m => ({
+            ...m,
+            content: error instanceof Error ? error.message : "搜尋時發生錯誤，請再試一次"
+          }));
+          throw error;
+        }
+        setIsLoading(false);
+        scrollToBottom();
+        return;
       }
 
       setMessages(prev => [...prev, botMessage]);
@@ -7,6 +7,7 @@ export const API_CONFIG = {
   BASE_URL: 'http://localhost:8000', // Updated to match server.py port
   ENDPOINTS: {
     SEARCH: '/api/search',
+    SEARCH_STREAM: '/api/search/stream',
   }
 };
 
@@ -1,4 +1,4 @@
-import type { Message } from "@/types/chat";
+import type { Message, Product } from "@/types/chat";
 import { API_CONFIG } from "@/config/chat";
 
 export const sendChatMessage = async (message: Message): Promise<Message> => {
@@ -25,4 +25,77 @@ export const sendChatMessage = async (message: Message): Promise<Message> => {
     console.error('Error sending chat message:', error);
     throw error;
   }
-}; 
\ No newline at end of file
+}; 
+
+export interface SearchPayload {
+  query_text: string;
+  image_base64: string;
+}
+
+export interface SearchStreamHandlers {
+  onStyles?: (styles: string[]) => void;
+  onConditions?: (conditions: string) => void;
+  onProducts?: (products: Product[]) => void;
+  onDone?: (text: string) => void;
+}
+
+// POST 無法使用 EventSource，改用 fetch 讀取 Server-Sent Events
+export const streamSearch = async (
+  payload: SearchPayload,
+  handlers: SearchStreamHandlers
+): Promise<void> => {
+  const response = await fetch(`${API_CONFIG.BASE_URL}${API_CONFIG.ENDPOINTS.SEARCH_STREAM}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(payload),
+  });
+
+  if (!response.ok || !response.body) {
+    const errorData = await response.json().catch(() => ({}));
+    throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      const parsed = data ? JSON.parse(data) : null;
+
+      switch (event) {
+        case 'styles':
+          handlers.onStyles?.(parsed);
+          break;
+        case 'conditions':
+          handlers.onConditions?.(parsed);
+          break;
+        case 'products':
+          handlers.onProducts?.(parsed);
+          break;
+        case 'done':
+          handlers.onDone?.(parsed.text);
+          break;
+        case 'error':
+          throw new Error(parsed.text);
+      }
+    }
+  }
+};